@@ -7,6 +7,7 @@ __version__ = '0.1.0'
 # Import key components for easier access
 from .server import PowerMeterHTTPServer
 from .endpoints import PowerMeterHTTPHandler
+from .modbus_server import ModbusTCPServer
 
 # Define package exports
-__all__ = ['PowerMeterHTTPServer', 'PowerMeterHTTPHandler']
\ No newline at end of file
+__all__ = ['PowerMeterHTTPServer', 'PowerMeterHTTPHandler', 'ModbusTCPServer']
\ No newline at end of file
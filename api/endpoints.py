@@ -8,14 +8,64 @@ import logging
 import os
 import time
 from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, unquote
 from functools import wraps
 
 from modbus.protocol import parse_response
 from core.auth import AuthenticationManager
+from telemetry.metrics import REGISTRY
+from telemetry.tracing import TRACER, chrome_trace
+from telemetry.profiler import MEMORY, ProfilerBusy, StackSampler, collapsed, top_frames
 
 logger = logging.getLogger('powermeter.api.endpoints')
 
+HTTP_REQUESTS = REGISTRY.counter('powermeter_http_requests_total', 'HTTP requests by method, route and status',
+                                 ('method', 'route', 'status'))
+HTTP_SECONDS = REGISTRY.histogram('powermeter_http_request_seconds', 'Time to handle an HTTP request',
+                                  ('method', 'route'))
+
+# Routes reported as they are; anything else is grouped so labels stay bounded
+METRIC_ROUTES = {
+    '/', '/index.html', '/monitor.html', '/login.html', '/metrics',
+    '/api/power', '/api/read_registers', '/api/modbus_command', '/api/history', '/api/pipeline',
+    '/api/buses', '/api/meters', '/api/auth/login', '/api/auth/logout', '/api/auth/change_password',
+    '/api/auth/validate', '/api/auth/sessions', '/api/debug/traces',
+    '/api/debug/profile', '/api/debug/memory'
+}
+
+def route_label(path):
+    """Route of a request path for metric labels, without IDs or query strings"""
+    path = urlparse(path).path
+    if path in METRIC_ROUTES:
+        return path
+    if path.startswith('/api/register/'):
+        return '/api/register/{register}'
+    if path.startswith('/api/meters/') and path.endswith('/power'):
+        return '/api/meters/{meter}/power'
+    if path.startswith('/css/'):
+        return '/css/{file}'
+    if path.startswith('/js/'):
+        return '/js/{file}'
+    return 'other'
+
+def instrumented(func):
+    """Decorator counting, timing and tracing the requests a do_* method handles"""
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        self.status_code = None
+        method = self.command
+        route = route_label(self.path)
+        trace = TRACER.trace('http', method=method, route=route)
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            trace.set(status=self.status_code or 500)
+            trace.end()
+            HTTP_SECONDS.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, self.status_code or 500).inc()
+    return wrapper
+
 # Global authentication manager
 auth_manager = AuthenticationManager()
 
@@ -57,6 +107,12 @@ class PowerMeterHTTPHandler(BaseHTTPRequestHandler):
     # This will be set by the server
     data_manager = None
     current_user = None
+    status_code = None
+    
+    def send_response(self, code, message=None):
+        """Send the response line, remembering the status for metrics"""
+        self.status_code = code
+        super().send_response(code, message)
     
     def send_auth_error(self, message):
         """Send authentication error response"""
@@ -76,6 +132,7 @@ class PowerMeterHTTPHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(json.dumps(data).encode('utf-8'))
     
+    @instrumented
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
@@ -84,6 +141,7 @@ class PowerMeterHTTPHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self.end_headers()
     
+    @instrumented
     def do_POST(self):
         """Handle POST requests"""
         if self.path == '/api/auth/login':
@@ -97,6 +155,7 @@ class PowerMeterHTTPHandler(BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(b'Not found')
     
+    @instrumented
     def do_GET(self):
         """Handle GET requests"""
         if self.path == '/api/power':
@@ -124,10 +183,35 @@ class PowerMeterHTTPHandler(BaseHTTPRequestHandler):
             
             command_hex = params.get('command', [''])[0]
             self.handle_modbus_command(command_hex)
+        elif self.path.startswith('/api/history'):
+            # Parse query string
+            parsed_url = urlparse(self.path)
+            params = parse_qs(parsed_url.query)
+            self.handle_history_request(params)
+        elif self.path == '/api/pipeline':
+            self.handle_pipeline_stats()
+        elif self.path == '/api/buses':
+            self.handle_bus_usage()
+        elif self.path == '/api/meters':
+            self.handle_meters_request()
+        elif self.path.startswith('/api/meters/') and self.path.endswith('/power'):
+            meter_id = unquote(self.path[len('/api/meters/'):-len('/power')])
+            self.handle_meter_power(meter_id)
+        elif self.path == '/metrics':
+            self.handle_metrics()
         elif self.path == '/api/auth/validate':
             self.handle_validate_session()
         elif self.path == '/api/auth/sessions':
             self.handle_get_sessions()
+        elif self.path.startswith('/api/debug/traces'):
+            params = parse_qs(urlparse(self.path).query)
+            self.handle_traces(params)
+        elif self.path.startswith('/api/debug/profile'):
+            params = parse_qs(urlparse(self.path).query)
+            self.handle_profile(params)
+        elif self.path.startswith('/api/debug/memory'):
+            params = parse_qs(urlparse(self.path).query)
+            self.handle_memory(params)
         elif self.path == '/' or self.path == '/index.html':
             # Redirect root to login page
             self.send_response(302)
@@ -261,6 +345,105 @@ class PowerMeterHTTPHandler(BaseHTTPRequestHandler):
             logger.error(f"Get sessions error: {str(e)}")
             self.send_json_response({'error': f'Server error: {str(e)}'}, 500)
     
+    @require_auth('admin')
+    def handle_traces(self, params):
+        """
+        Handle a request for recent poll and request traces (admin only)
+        
+        Query parameters: limit, name ('poll' or 'http'), min_ms to keep only
+        slow traces, and format=chrome for a file chrome://tracing can load.
+        """
+        try:
+            limit = int(params.get('limit', ['50'])[0])
+            name = params.get('name', [None])[0]
+            min_ms = float(params['min_ms'][0]) if 'min_ms' in params else None
+        except ValueError:
+            self.send_json_response({'error': 'Invalid trace query parameters'}, 400)
+            return
+        
+        traces = TRACER.traces(name, None if min_ms is None else min_ms / 1000, limit)
+        if params.get('format', [''])[0] == 'chrome':
+            self.send_json_response(chrome_trace(reversed(traces)))
+            return
+        self.send_json_response({
+            'enabled': TRACER.enabled,
+            'capacity': TRACER.capacity,
+            'finished': TRACER.finished,
+            'traces': [trace.to_dict() for trace in traces]
+        })
+    
+    @require_auth('admin')
+    def handle_profile(self, params):
+        """
+        Handle a request to sample the stacks of the process's threads (admin only)
+        
+        Query parameters: seconds (default 5), interval_ms (default 10),
+        threads (comma-separated parts of thread names, e.g. meter-poll,bus-),
+        lines=1 to tell frames apart by line, and format=collapsed for
+        flamegraph.pl / speedscope input instead of JSON.
+        """
+        from config.settings import CONFIG
+        
+        try:
+            seconds = float(params.get('seconds', ['5'])[0])
+            interval = float(params.get('interval_ms', ['10'])[0]) / 1000
+            threads = [t for t in params.get('threads', [''])[0].split(',') if t]
+            lines = params.get('lines', ['0'])[0] in ('1', 'true')
+        except ValueError:
+            self.send_json_response({'error': 'Invalid profile query parameters'}, 400)
+            return
+        max_seconds = CONFIG.get('PROFILE_MAX_SECONDS', 30)
+        if not 0 < seconds <= max_seconds or not 0.001 <= interval <= seconds:
+            self.send_json_response({'error': f'seconds must be between 0 and {max_seconds}, '
+                                              'interval_ms at least 1 and at most the duration'}, 400)
+            return
+        
+        try:
+            profile = StackSampler(interval, threads, lines).run(seconds)
+        except ProfilerBusy as e:
+            self.send_json_response({'error': str(e)}, 409)
+            return
+        
+        if params.get('format', [''])[0] == 'collapsed':
+            body = collapsed(profile['stacks']).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_json_response({
+            'duration': profile['duration'],
+            'interval_ms': profile['interval'] * 1000,
+            'samples': profile['samples'],
+            'threads': profile['threads'],
+            'top': top_frames(profile['stacks']),
+            'stacks': dict(profile['stacks'].most_common())
+        })
+    
+    @require_auth('admin')
+    def handle_memory(self, params):
+        """
+        Handle a request for a memory snapshot (admin only)
+        
+        The first request starts tracemalloc; each later one returns the top
+        allocation sites and the change since the previous request. Query
+        parameters: top (default 20), group (lineno, filename or traceback)
+        and stop=1 to stop tracing again.
+        """
+        if params.get('stop', ['0'])[0] in ('1', 'true'):
+            MEMORY.stop()
+            self.send_json_response({'tracing': False})
+            return
+        
+        try:
+            top = int(params.get('top', ['20'])[0])
+            result = MEMORY.snapshot(top, params.get('group', ['lineno'])[0])
+        except ValueError as e:
+            self.send_json_response({'error': f'Invalid memory query parameters: {str(e)}'}, 400)
+            return
+        self.send_json_response(result)
+    
     @require_auth()
     def handle_change_password(self):
         """Handle password change"""
@@ -303,6 +486,8 @@ class PowerMeterHTTPHandler(BaseHTTPRequestHandler):
         try:
             # Get the latest data from the data manager
             data = self.data_manager.get_data() if self.data_manager else {}
+            # Copy so the user info below doesn't leak into the shared snapshot
+            data = dict(data)
             
             # Add user info to response
             data['authenticated'] = True
@@ -389,6 +574,155 @@ class PowerMeterHTTPHandler(BaseHTTPRequestHandler):
             logger.error(f"Error reading registers {start}-{start+count-1}: {str(e)}")
             self.send_json_response({'error': f'Server error: {str(e)}'}, 500)
     
+    @require_auth('read')
+    def handle_history_request(self, params):
+        """
+        Handle a request for stored history in a time range
+        
+        Raw samples come from the history store. When max_points or resolution
+        is given (or no history store is configured) the rollup tiers are used.
+        In multi-meter mode the meter parameter selects the meter; it may be
+        left out when only one meter is configured.
+        """
+        history = getattr(self.data_manager, 'history', None) if self.data_manager else None
+        rollups = getattr(self.data_manager, 'rollups', None) if self.data_manager else None
+        use_rollups = rollups is not None and (
+            history is None or 'max_points' in params or 'resolution' in params
+        )
+        if history is None and not use_rollups:
+            self.send_json_response({'error': 'History storage is not enabled'}, 404)
+            return
+        
+        try:
+            end = float(params.get('end', [time.time()])[0])
+            start = float(params.get('start', [end - 3600])[0])
+            fields = [f for f in params.get('fields', [''])[0].split(',') if f]
+            limit = int(params.get('limit', ['10000'])[0])
+            max_points = int(params.get('max_points', ['500'])[0])
+            resolution = int(params['resolution'][0]) if 'resolution' in params else None
+        except ValueError:
+            self.send_json_response({'error': 'Invalid history query parameters'}, 400)
+            return
+        
+        meter = params.get('meter', [None])[0]
+        meters = getattr(self.data_manager, 'meters', None)
+        if meters is not None:
+            if meter is None and len(meters) == 1:
+                meter = next(iter(meters))
+            if meter is None:
+                self.send_json_response({'error': 'A meter is required in multi-meter mode'}, 400)
+                return
+            if meter not in meters:
+                self.send_json_response({'error': f'Unknown meter: {meter}'}, 404)
+                return
+        # Only stores keyed by meter take the parameter
+        by_meter = {'meter': meter} if meter is not None else {}
+        
+        try:
+            if use_rollups:
+                result = rollups.query(start, end, fields or None,
+                                       max_points=max_points, resolution=resolution, **by_meter)
+            else:
+                result = history.query(start, end, fields or None, limit=min(limit, 100000), **by_meter)
+            result['start'] = start
+            result['end'] = end
+            if meter is not None:
+                result['meter'] = meter
+            self.send_json_response(result)
+        except Exception as e:
+            logger.error(f"Error querying history: {str(e)}")
+            self.send_json_response({'error': f'Server error: {str(e)}'}, 500)
+    
+    @require_auth('read')
+    def handle_pipeline_stats(self):
+        """Handle a request for per-sink pipeline metrics"""
+        if self.data_manager is None or not hasattr(self.data_manager, 'get_pipeline_stats'):
+            self.send_json_response({'error': 'Data manager not available'}, 503)
+            return
+        self.send_json_response({'sinks': self.data_manager.get_pipeline_stats()})
+    
+    @require_auth('read')
+    def handle_bus_usage(self):
+        """Handle a request for serial line utilization and poll capacity"""
+        if self.data_manager is None or not hasattr(self.data_manager, 'get_bus_usage'):
+            self.send_json_response({'error': 'Data manager not available'}, 503)
+            return
+        self.send_json_response({'buses': self.data_manager.get_bus_usage()})
+    
+    @require_auth('read')
+    def handle_meters_request(self):
+        """Handle a request for the list of meters and their poll health"""
+        if self.data_manager is None:
+            self.send_json_response({'error': 'Data manager not available'}, 503)
+            return
+        
+        if hasattr(self.data_manager, 'get_meters'):
+            meters = self.data_manager.get_meters()
+            buses = self.data_manager.get_bus_status()
+        else:
+            # Single-meter mode
+            from config.settings import CONFIG
+            data = self.data_manager.get_data()
+            meters = [{
+                'id': str(CONFIG.get('MODBUS_ADDRESS', 1)),
+                'name': 'Power Meter',
+                'bus': CONFIG.get('SERIAL_PORT'),
+                'unit_id': CONFIG.get('MODBUS_ADDRESS', 1),
+                'profile': 'detailed' if CONFIG.get('DETAILED_DATA', False) else 'basic',
+                'poll_interval': self.data_manager.poll_interval,
+                'online': bool(data) and not data.get('stale', False),
+                'last_success': data.get('timestamp')
+            }]
+            client = getattr(self.data_manager.reader, 'modbus_client', None)
+            buses = {client.port: client.unit_status()} if hasattr(client, 'unit_status') else {}
+        self.send_json_response({'meters': meters, 'buses': buses})
+    
+    @require_auth('read')
+    def handle_meter_power(self, meter_id):
+        """Handle a power data request for one meter"""
+        if self.data_manager is None:
+            self.send_json_response({'error': 'Data manager not available'}, 503)
+            return
+        
+        if hasattr(self.data_manager, 'get_meter_data'):
+            data = self.data_manager.get_meter_data(meter_id)
+        else:
+            from config.settings import CONFIG
+            data = self.data_manager.get_data() if meter_id == str(CONFIG.get('MODBUS_ADDRESS', 1)) else None
+        
+        if data is None:
+            self.send_json_response({'error': f'Unknown meter: {meter_id}'}, 404)
+            return
+        
+        data = dict(data)
+        data['meter_id'] = meter_id
+        self.send_json_response(data)
+    
+    def handle_metrics(self):
+        """Handle a scrape of the metrics in Prometheus text format"""
+        from config.settings import CONFIG
+        
+        if not CONFIG.get('METRICS_ENABLED', True):
+            self.send_response(404)
+            self.end_headers()
+            self.wfile.write(b'Not found')
+            return
+        if CONFIG.get('METRICS_AUTH', True):
+            self.send_protected_metrics()
+        else:
+            self.send_metrics()
+    
+    def send_metrics(self):
+        """Send the metrics of the process"""
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    send_protected_metrics = require_auth('read')(send_metrics)
+    
     @require_auth('write')
     def handle_modbus_command(self, command_hex):
         """Handle a request to send a raw Modbus command"""
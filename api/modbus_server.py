@@ -0,0 +1,334 @@
+"""
+Modbus TCP server that serves the meters' cached register images to SCADA clients
+"""
+import logging
+import queue
+import socket
+import socketserver
+import struct
+import threading
+
+logger = logging.getLogger('powermeter.api.modbus_server')
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+SERVER_DEVICE_FAILURE = 0x04
+SERVER_DEVICE_BUSY = 0x06
+GATEWAY_PATH_UNAVAILABLE = 0x0A
+GATEWAY_TARGET_FAILED = 0x0B
+
+# Unit IDs that many TCP clients send; they address the primary meter
+PRIMARY_UNITS = (0, 255)
+
+# Seconds a connection may stay silent before it is closed
+IDLE_TIMEOUT = 300
+
+# Register addresses in requests are offsets from 40001 (holding) and 30001
+# (input); both function codes are served from the holding register image
+IMAGE_BASE = 40001
+
+class _Write:
+    """A client write waiting for its turn on the serial line"""
+    
+    def __init__(self, reader, address, values):
+        self.reader = reader
+        self.address = address
+        self.values = values
+        self.result = None
+        self.done = threading.Event()
+
+class WriteForwarder:
+    """Forwards client writes to the serial line one at a time, between polls"""
+    
+    def __init__(self, queue_size=16, timeout=5.0):
+        """
+        Initialize the forwarder
+        
+        Parameters:
+        - queue_size: Writes that may wait before clients are told the server is busy
+        - timeout: Seconds a client waits for its write before getting an exception
+        """
+        self.timeout = timeout
+        self.forwarded = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+    
+    def start(self):
+        """Start the forwarding thread"""
+        self._thread = threading.Thread(target=self._run, name='modbus-tcp-writes')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the forwarding thread after the current write"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=self.timeout)
+            self._thread = None
+    
+    def submit(self, reader, address, values):
+        """
+        Queue a write and wait for it to complete
+        
+        Parameters:
+        - reader: PowerMeterReader of the target meter
+        - address: First register address (4xxxx format)
+        - values: Register values
+        
+        Returns:
+        - None on success, otherwise the Modbus exception code for the client
+        """
+        write = _Write(reader, address, values)
+        try:
+            self._queue.put_nowait(write)
+        except queue.Full:
+            return SERVER_DEVICE_BUSY
+        if not write.done.wait(self.timeout):
+            return GATEWAY_TARGET_FAILED
+        return None if write.result else SERVER_DEVICE_FAILURE
+    
+    def _run(self):
+        """Background thread performing the queued writes"""
+        while True:
+            write = self._queue.get()
+            if write is None:
+                return
+            try:
+                client = write.reader.modbus_client
+                unit = write.reader.device_address
+                if len(write.values) == 1:
+                    write.result = client.write_register(write.address, write.values[0], unit=unit)
+                else:
+                    write.result = client.write_registers(write.address, write.values, unit=unit)
+            except Exception as e:
+                logger.error(f"Error forwarding write to register {write.address}: {str(e)}")
+                write.result = False
+            if write.result:
+                self.forwarded += 1
+            else:
+                self.failed += 1
+            write.done.set()
+
+class _ModbusTCPHandler(socketserver.BaseRequestHandler):
+    """One client connection, answering MBAP-framed requests in order"""
+    
+    def handle(self):
+        gateway = self.server.gateway
+        gateway._connection_opened()
+        self.request.settimeout(IDLE_TIMEOUT)
+        try:
+            while True:
+                header = self._receive(7)
+                if header is None:
+                    return
+                transaction_id, protocol_id, length, unit = struct.unpack('>HHHB', header)
+                if protocol_id != 0 or not 2 <= length <= 254:
+                    logger.warning(f"Closing Modbus TCP connection from {self.client_address[0]}: bad header")
+                    return
+                pdu = self._receive(length - 1)
+                if pdu is None:
+                    return
+                response = gateway.process(unit, pdu)
+                self.request.sendall(struct.pack('>HHHB', transaction_id, 0, len(response) + 1, unit) + response)
+        except (OSError, socket.timeout):
+            pass
+        finally:
+            gateway._connection_closed()
+    
+    def _receive(self, size):
+        """Read exactly size bytes, or None when the client goes away"""
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class ModbusTCPServer:
+    """
+    Modbus TCP server backed by the readers' register images
+    
+    Reads (FC3 and FC4) are answered from the latest registers each reader
+    has polled and never touch the serial line, so any number of clients
+    can read without adding bus traffic. Writes (FC6 and FC16), if allowed,
+    are queued and forwarded to the meter one at a time.
+    """
+    
+    def __init__(self, port, data_manager, host='', allow_writes=False, write_queue_size=16):
+        """
+        Initialize the Modbus TCP server
+        
+        Parameters:
+        - port: TCP port to listen on
+        - data_manager: PowerMeterDataManager or MeterFleetManager whose readers are served
+        - host: Interface to bind ('' for all)
+        - allow_writes: Forward FC6/FC16 writes to the meters
+        - write_queue_size: Writes that may wait for the serial line
+        """
+        self.port = port
+        self.host = host
+        self.data_manager = data_manager
+        self.allow_writes = allow_writes
+        self.writes = WriteForwarder(write_queue_size)
+        self.server = None
+        self.requests = 0
+        self.exceptions = 0
+        self.connections = 0
+        self._units = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_config(cls, data_manager):
+        """Create a server from the MODBUS_TCP_* settings"""
+        from config.settings import CONFIG
+        
+        return cls(CONFIG.get('MODBUS_TCP_PORT', 5020), data_manager,
+                   host=CONFIG.get('MODBUS_TCP_HOST', ''),
+                   allow_writes=CONFIG.get('MODBUS_TCP_ALLOW_WRITES', False),
+                   write_queue_size=CONFIG.get('MODBUS_TCP_WRITE_QUEUE', 16))
+    
+    def _map_units(self):
+        """Map unit IDs to readers; in multi-meter mode each meter keeps its own unit ID"""
+        units = {}
+        meters = getattr(self.data_manager, 'meters', None)
+        if meters:
+            for meter in meters.values():
+                unit = meter.definition.unit_id
+                if unit in units:
+                    logger.warning(f"Unit ID {unit} is used on several buses; Modbus TCP serves "
+                                   f"the first meter with it")
+                    continue
+                units[unit] = meter.reader
+        else:
+            reader = self.data_manager.reader
+            units[reader.device_address] = reader
+        return units
+    
+    def _reader_for(self, unit):
+        """Get the reader addressed by a unit ID"""
+        if unit in PRIMARY_UNITS:
+            return self.data_manager.reader
+        return self._units.get(unit)
+    
+    def process(self, unit, pdu):
+        """
+        Answer one request
+        
+        Parameters:
+        - unit: Unit ID from the MBAP header
+        - pdu: Request PDU (function code and data)
+        
+        Returns:
+        - Response PDU
+        """
+        with self._lock:
+            self.requests += 1
+        function = pdu[0]
+        reader = self._reader_for(unit)
+        if function in (3, 4):
+            code, response = self._read(reader, pdu)
+        elif function in (6, 16):
+            code, response = self._write(reader, pdu)
+        else:
+            code, response = ILLEGAL_FUNCTION, None
+        if code is not None:
+            with self._lock:
+                self.exceptions += 1
+            return bytes([function | 0x80, code])
+        return response
+    
+    def _read(self, reader, pdu):
+        """Serve FC3/FC4 from the register image"""
+        if len(pdu) != 5:
+            return ILLEGAL_DATA_VALUE, None
+        address, count = struct.unpack('>HH', pdu[1:5])
+        if not 1 <= count <= 125:
+            return ILLEGAL_DATA_VALUE, None
+        if reader is None:
+            return GATEWAY_PATH_UNAVAILABLE, None
+        image = reader.register_image
+        if not image:
+            # Nothing polled from this meter yet
+            return GATEWAY_TARGET_FAILED, None
+        values = [image.get(IMAGE_BASE + address + i) for i in range(count)]
+        if None in values:
+            return ILLEGAL_DATA_ADDRESS, None
+        return None, bytes([pdu[0], 2 * count]) + struct.pack(f'>{count}H', *values)
+    
+    def _write(self, reader, pdu):
+        """Forward FC6/FC16 through the write queue"""
+        if not self.allow_writes:
+            return ILLEGAL_FUNCTION, None
+        if pdu[0] == 6:
+            if len(pdu) != 5:
+                return ILLEGAL_DATA_VALUE, None
+            address, value = struct.unpack('>HH', pdu[1:5])
+            values = [value]
+            response = bytes(pdu)
+        else:
+            if len(pdu) < 6:
+                return ILLEGAL_DATA_VALUE, None
+            address, count, byte_count = struct.unpack('>HHB', pdu[1:6])
+            if not 1 <= count <= 123 or byte_count != 2 * count or len(pdu) != 6 + byte_count:
+                return ILLEGAL_DATA_VALUE, None
+            values = list(struct.unpack(f'>{count}H', pdu[6:]))
+            response = bytes(pdu[:5])
+        if reader is None:
+            return GATEWAY_PATH_UNAVAILABLE, None
+        code = self.writes.submit(reader, IMAGE_BASE + address, values)
+        return code, response
+    
+    def _connection_opened(self):
+        with self._lock:
+            self.connections += 1
+    
+    def _connection_closed(self):
+        with self._lock:
+            self.connections -= 1
+    
+    def stats(self):
+        """
+        Get request counters
+        
+        Returns:
+        - Dictionary with open connections, requests, exception responses and forwarded writes
+        """
+        with self._lock:
+            return {
+                'port': self.port,
+                'connections': self.connections,
+                'requests': self.requests,
+                'exceptions': self.exceptions,
+                'writes_forwarded': self.writes.forwarded,
+                'writes_failed': self.writes.failed
+            }
+    
+    def start(self):
+        """Start the Modbus TCP server"""
+        self._units = self._map_units()
+        self.server = _ThreadingTCPServer((self.host, self.port), _ModbusTCPHandler)
+        self.server.gateway = self
+        if self.allow_writes:
+            self.writes.start()
+        server_thread = threading.Thread(target=self.server.serve_forever, name='modbus-tcp')
+        server_thread.daemon = True
+        server_thread.start()
+        logger.info(f"Modbus TCP server started on port {self.server.server_address[1]} "
+                    f"(writes {'forwarded' if self.allow_writes else 'disabled'})")
+    
+    def stop(self):
+        """Stop the Modbus TCP server"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            self.writes.stop()
+            logger.info("Modbus TCP server stopped")
\ No newline at end of file
@@ -31,7 +31,7 @@ class PowerMeterHTTPServer:
         
         # Create and start the server
         self.server = ThreadingHTTPServer(('', self.port), PowerMeterHTTPHandler)
-        server_thread = threading.Thread(target=self.server.serve_forever)
+        server_thread = threading.Thread(target=self.server.serve_forever, name='http-api')
         server_thread.daemon = True
         server_thread.start()
         logger.info(f"HTTP server started on port {self.port}")
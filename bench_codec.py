@@ -0,0 +1,83 @@
+"""
+Benchmark for the Gorilla chunk codec on simulator output
+
+Reports compression ratio, encode time and decode throughput.
+Usage: python bench_codec.py [samples] [chunk_size]
+"""
+
+import sys
+import os
+import time
+import random
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from core.simulator import PowerMeterSimulator
+from storage.fields import HISTORY_FIELDS, extract_fields
+from storage import gorilla
+
+def generate_samples(count):
+    """Generate simulator snapshots at a 1-second cadence with poll jitter"""
+    simulator = PowerMeterSimulator(seed=0)
+    base = time.time() - count
+    timestamps = []
+    rows = []
+    for i in range(count):
+        data = simulator.read_detailed_data()
+        timestamps.append(base + i + random.uniform(-0.005, 0.005))
+        rows.append(extract_fields(data, HISTORY_FIELDS))
+    return timestamps, rows
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 3600
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 900
+    
+    print("Gorilla Codec Benchmark")
+    print("=" * 40)
+    print(f"Samples: {samples}, fields: {len(HISTORY_FIELDS)}, chunk size: {chunk_size}")
+    print(f"Vectorized decode: {'NumPy' if gorilla.np is not None else 'array/itertools fallback'}")
+    
+    timestamps, rows = generate_samples(samples)
+    
+    # Encode in chunks
+    chunks = []
+    started = time.perf_counter()
+    for i in range(0, samples, chunk_size):
+        block = rows[i:i + chunk_size]
+        columns = [list(column) for column in zip(*block)]
+        chunks.append(gorilla.encode_chunk(timestamps[i:i + chunk_size], columns, HISTORY_FIELDS))
+    encode_seconds = time.perf_counter() - started
+    
+    raw_bytes = samples * 8 * (len(HISTORY_FIELDS) + 1)
+    stored_bytes = sum(len(chunk) + 4 for chunk in chunks)
+    
+    # Decode everything
+    started = time.perf_counter()
+    for chunk in chunks:
+        gorilla.decode_chunk(chunk, HISTORY_FIELDS)
+    decode_all_seconds = time.perf_counter() - started
+    
+    # Decode a single column, as a chart query would
+    started = time.perf_counter()
+    for chunk in chunks:
+        gorilla.decode_chunk(chunk, HISTORY_FIELDS, {'system.power_kw'})
+    decode_one_seconds = time.perf_counter() - started
+    
+    bytes_per_sample = stored_bytes / samples
+    years_in_32gb = 32e9 / (bytes_per_sample * 86400 * 365)
+    
+    print(f"Raw size:          {raw_bytes / 1024:.1f} KiB ({raw_bytes / samples:.0f} B/sample)")
+    print(f"Compressed size:   {stored_bytes / 1024:.1f} KiB ({bytes_per_sample:.0f} B/sample)")
+    print(f"Compression ratio: {raw_bytes / stored_bytes:.2f}x")
+    print(f"Encode:            {samples / encode_seconds:,.0f} samples/s")
+    print(f"Decode all fields: {samples / decode_all_seconds:,.0f} samples/s "
+          f"({samples * len(HISTORY_FIELDS) / decode_all_seconds:,.0f} values/s)")
+    print(f"Decode one field:  {samples / decode_one_seconds:,.0f} samples/s")
+    print(f"1-second history in 32 GB: {years_in_32gb:.1f} years")
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
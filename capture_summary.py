@@ -0,0 +1,69 @@
+"""
+Summarize a Modbus wire capture
+
+Prints transaction outcomes, round-trip percentiles and a latency histogram
+for a capture written with MODBUS_CAPTURE_PATH, overall and per unit. The
+rotated files of the capture are included.
+Usage: python capture_summary.py <capture file> [--json]
+"""
+
+import sys
+import os
+import json
+from datetime import datetime
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from modbus.capture import read_capture, summarize
+
+def format_latency(latency):
+    """One-line latency percentiles"""
+    if latency is None:
+        return "no responses"
+    return (f"p50 {latency['p50']:.1f} ms, p90 {latency['p90']:.1f} ms, "
+            f"p99 {latency['p99']:.1f} ms, max {latency['max']:.1f} ms")
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) != 1:
+        print(__doc__)
+        return 1
+    
+    summary = summarize(read_capture(args[0]))
+    if '--json' in sys.argv:
+        print(json.dumps(summary, indent=2))
+        return 0
+    
+    print("Modbus Capture Summary")
+    print("=" * 40)
+    if not summary['transactions']:
+        print("No transactions captured")
+        return 0
+    
+    start = datetime.fromtimestamp(summary['start']).isoformat(sep=' ', timespec='seconds')
+    end = datetime.fromtimestamp(summary['end']).isoformat(sep=' ', timespec='seconds')
+    print(f"Transactions:  {summary['transactions']} from {start} to {end}")
+    print("Outcomes:      " + ", ".join(f"{name} {count}" for name, count in summary['outcomes'].items()))
+    print(f"Error rate:    {summary['error_rate']:.2%}")
+    print(f"Latency:       {format_latency(summary['latency_ms'])}")
+    
+    print("\nLatency histogram")
+    answered = sum(bucket['count'] for bucket in summary['histogram']) or 1
+    for bucket in summary['histogram']:
+        label = f"<= {bucket['le_ms']} ms" if bucket['le_ms'] is not None else "slower"
+        bar = '#' * round(bucket['count'] / answered * 40)
+        print(f"  {label:>12} {bucket['count']:>8}  {bar}")
+    
+    print("\nPer unit")
+    for unit, status in summary['units'].items():
+        failed = status['transactions'] - status['outcomes']['ok']
+        print(f"  unit {unit:>3}: {status['transactions']} transactions, {failed} not ok "
+              f"({', '.join(f'{name} {count}' for name, count in status['outcomes'].items() if count)}); "
+              f"{format_latency(status['latency_ms'])}")
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""
+Logging setup: background log writing, rate limiting and JSON output
+
+Log records are put on a queue by the thread that logs them and written to
+the log file and console by a listener thread, so a slow disk (an SD card
+on an edge device) never stalls a poll. Repeated messages are rate-limited
+per logger and message template, with a count of what was suppressed, and
+records can be written as one JSON object per line for log shippers.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# LogRecord attributes that are not extra fields
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects"""
+    
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        # Anything passed with extra={...} becomes a field of its own
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through a burst of each repeated message per interval
+    
+    Messages are told apart by logger, level and message template, so
+    lazily formatted messages ("Read %d registers", count) count as
+    repeats whatever their arguments. When a suppressed message comes
+    through again in a new interval, it carries the number of copies
+    suppressed since the last one.
+    """
+    
+    def __init__(self, burst=5, interval=60.0, max_keys=1000):
+        """
+        Initialize the filter
+        
+        Parameters:
+        - burst: Copies of a message let through per interval
+        - interval: Length of an interval in seconds
+        - max_keys: Distinct messages tracked before the oldest are forgotten
+        """
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_keys = max_keys
+        self.suppressed_total = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+    
+    def filter(self, record):
+        # Several handlers may share the filter; decide once per record
+        decided = getattr(record, '_rate_limit_passed', None)
+        if decided is not None:
+            return decided
+        record._rate_limit_passed = passed = self._check(record)
+        return passed
+    
+    def _check(self, record):
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                if window is None and len(self._windows) >= self.max_keys:
+                    # Forget the message seen longest ago
+                    del self._windows[next(iter(self._windows))]
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                    record.msg = f"{record.msg} (suppressed {suppressed} similar messages)"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.suppressed_total += 1
+            return False
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread"""
+    
+    def prepare(self, record):
+        # Merge the arguments now, since they may change once the caller moves
+        # on, but leave timestamps and layout to the listener's formatters
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _stop_listener(listener):
+    """Write out queued records at exit, unless the listener was stopped already"""
+    if listener._thread is not None:
+        listener.stop()
+
+def make_formatter(log_format):
+    """
+    Create the formatter of a log format
+    
+    Parameters:
+    - log_format: 'text' or 'json'
+    
+    Returns:
+    - logging.Formatter
+    """
+    if log_format == 'json':
+        return JsonFormatter()
+    if log_format == 'text':
+        return logging.Formatter(TEXT_FORMAT)
+    raise ValueError(f"Unknown log format: {log_format}")
+
+def setup_logging(config, log_file, force=False):
+    """
+    Configure the root logger from CONFIG
+    
+    Like logging.basicConfig, nothing is changed if the root logger already
+    has handlers, unless force is set.
+    
+    Parameters:
+    - config: Configuration with the LOG_* settings
+    - log_file: Log file used when LOG_FILE is not set
+    - force: Replace existing root handlers
+    
+    Returns:
+    - The QueueListener writing the records, or None if records are written
+      on the logging thread or nothing was configured
+    """
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return None
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    
+    formatter = make_formatter(config.get('LOG_FORMAT', 'text'))
+    handlers = [logging.FileHandler(config.get('LOG_FILE') or log_file), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    listener = None
+    if config.get('LOG_QUEUE', True):
+        listener = logging.handlers.QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+        handlers = [_DeferredQueueHandler(listener.queue)]
+        listener.start()
+        atexit.register(_stop_listener, listener)
+    
+    burst = config.get('LOG_RATE_LIMIT', 5)
+    if burst:
+        rate_limit = RateLimitFilter(burst, config.get('LOG_RATE_INTERVAL', 60))
+        for handler in handlers:
+            handler.addFilter(rate_limit)
+    
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+    return listener
\ No newline at end of file
@@ -1,20 +1,11 @@
-import logging
 import os
 
+from config.log_setup import setup_logging
+
 # Ensure log directory exists
 log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
 os.makedirs(log_dir, exist_ok=True)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, "powermeter.log")),
-        logging.StreamHandler()
-    ]
-)
-
 # Power Meter Configuration
 CONFIG = {
     # Serial port settings
@@ -26,6 +17,11 @@ CONFIG = {
     # Server settings
     'HTTP_PORT': 8080,         # Port for the HTTP API server
     'WEB_PORT': 8000,          # Port for the web interface
+    'MODBUS_TCP_ENABLED': False,  # Serve the polled registers to SCADA clients over Modbus TCP
+    'MODBUS_TCP_HOST': '',     # Interface for the Modbus TCP server ('' for all)
+    'MODBUS_TCP_PORT': 5020,   # Port for the Modbus TCP server (502 needs root)
+    'MODBUS_TCP_ALLOW_WRITES': False,  # Forward FC6/FC16 writes from TCP clients to the meters
+    'MODBUS_TCP_WRITE_QUEUE': 16,  # Forwarded writes that may wait for the serial line
     
     # Operation settings
     'POLL_INTERVAL': 5,        # Seconds between meter readings
@@ -51,6 +47,75 @@ CONFIG = {
     'SERIAL_DSRDTR': False,    # No hardware (DSR/DTR) flow control
     
     # Modbus settings
-    'MODBUS_TIMEOUT': 1,       # Timeout for Modbus operations
+    'MODBUS_TIMEOUT': 3,       # Seconds after which a failing transaction is not retried again
     'MODBUS_RETRIES': 3,       # Number of retries for failed Modbus operations
-}
\ No newline at end of file
+    'MODBUS_RETRY_BACKOFF': 0.05,  # Delay before the second retry, doubled for each further one
+    'MODBUS_ADAPTIVE_TIMEOUT': True,  # Learn response times per device; TIMEOUT becomes the ceiling
+    'MODBUS_TIMEOUT_FLOOR': 0.02,  # Smallest margin in seconds over the frames' wire time
+    'MODBUS_TIMEOUT_FACTOR': 2.0,  # Timeout margin as a multiple of the learned 99th percentile
+    
+    # Multi-meter settings. None polls the single meter above; otherwise a list like
+    # [{'id': 'main', 'port': 'COM3', 'unit_id': 1, 'profile': 'detailed', 'poll_interval': 5},
+    #  {'id': 'pump', 'gateway': '10.0.0.5:4001', 'unit_id': 7, 'profile': 'basic'}]
+    # Meters sharing a port or gateway are polled in order by one worker per bus.
+    'METERS': None,
+    'SERIAL_ENGINE': 'pyserial',        # 'pyserial', or 'termios' to drive every bus from one thread (Linux)
+    'MODBUS_TURNAROUND': None,          # Gap between frames in seconds (None uses t3.5 for the baud rate)
+    'MODBUS_QUARANTINE_AFTER': 3,       # Failed transactions before a unit's circuit opens (it is quarantined)
+    'MODBUS_QUARANTINE_BACKOFF': 5,     # Seconds until a quarantined unit is first probed again
+    'MODBUS_QUARANTINE_MAX_BACKOFF': 300,  # Upper limit of the doubling probe backoff
+    'MODBUS_MAX_BLOCK': 125,            # Largest register block to try; smaller limits are learned per device
+    'MODBUS_CAPTURE_PATH': None,        # Binary capture of every transaction, e.g. 'logs/modbus.cap' (None disables)
+    'MODBUS_CAPTURE_MAX_BYTES': 10 * 1024 * 1024,  # Capture file size at which it is rotated
+    'MODBUS_CAPTURE_BACKUPS': 3,        # Rotated capture files kept
+    
+    # History settings
+    'HISTORY_BACKEND': 'segments',   # 'segments', 'gorilla' (compressed), 'raw' (raw registers), 'sqlite' or None
+    'HISTORY_DIR': None,             # Directory for history files (None uses ./data)
+    'HISTORY_SEGMENT_SECONDS': 3600, # Time span covered by each segment file
+    'HISTORY_RETENTION_DAYS': 90,    # Drop history older than this many days (None keeps everything)
+    'HISTORY_CHUNK_SIZE': 900,       # Samples per compressed chunk for the 'gorilla' backend
+    'HISTORY_RAW_CAPACITY': 100000,  # Raw register frames kept by the 'raw' backend (138 bytes each)
+    'HISTORY_BATCH_SIZE': 200,       # Rows per SQLite insert transaction
+    'HISTORY_FLUSH_INTERVAL': 2.0,   # Max seconds a snapshot waits before the SQLite writer commits it
+    
+    # Rollup settings (min/max/mean/last per interval for long-range charts)
+    'ROLLUPS_ENABLED': True,   # Keep multi-resolution rollups of published snapshots
+    'ROLLUP_TIERS': None,      # List of (bucket seconds, buckets kept); None uses 1 s/1 min/15 min/1 h
+    'ROLLUP_FIELDS': None,     # Fields to roll up; None uses the default chart fields
+    
+    # Sink pipeline settings (history and rollups are written behind the poll loop)
+    'SINK_QUEUE_SIZE': 1000,           # Snapshots queued per sink before the policy applies
+    'SINK_BATCH_SIZE': 50,             # Maximum snapshots handed to a sink at once
+    'SINK_FLUSH_INTERVAL': 1.0,        # Max seconds a snapshot waits for its batch to fill
+    'SINK_QUEUE_POLICY': 'drop_oldest',  # 'drop_oldest' or 'block' (poll waits for the sink)
+    
+    # Warm restart settings
+    'CHECKPOINT_ENABLED': True,    # Save the last known state and serve it (marked stale) after a restart
+    'CHECKPOINT_PATH': None,       # Checkpoint file (None uses ./data/state.json)
+    'CHECKPOINT_INTERVAL': 10,     # Minimum seconds between checkpoint writes
+    
+    # Metrics settings
+    'METRICS_ENABLED': True,   # Serve counters, gauges and histograms in Prometheus format on /metrics
+    'METRICS_AUTH': True,      # Require a bearer token with 'read' permission to scrape /metrics (off: anyone sees ports and meter IDs)
+    
+    # Tracing settings
+    'TRACING_ENABLED': True,   # Record per-stage timings of each poll and API request
+    'TRACE_BUFFER': 200,       # Finished traces kept for /api/debug/traces
+    'TRACE_MAX_SPANS': 500,    # Spans recorded per trace before further ones are dropped
+    
+    # Profiling settings
+    'PROFILE_MAX_SECONDS': 30, # Longest sampling run /api/debug/profile accepts
+    'TRACEMALLOC_FRAMES': 1,   # Traceback frames stored per allocation once memory tracing starts
+    
+    # Logging settings
+    'LOG_LEVEL': 'INFO',       # Level of the root logger
+    'LOG_FORMAT': 'text',      # 'text', or 'json' for one JSON object per line
+    'LOG_FILE': None,          # Log file (None uses ./logs/powermeter.log)
+    'LOG_QUEUE': True,         # Write log records from a background thread instead of the logging thread
+    'LOG_RATE_LIMIT': 5,       # Copies of a repeated message logged per interval (None logs all)
+    'LOG_RATE_INTERVAL': 60,   # Seconds in a rate limit interval
+}
+
+# Configure logging
+setup_logging(CONFIG, os.path.join(log_dir, "powermeter.log"))
\ No newline at end of file
@@ -6,8 +6,14 @@ __version__ = '0.1.0'
 
 # Import key components for easier access
 from .data_manager import PowerMeterDataManager
+from .pipeline import SinkPipeline
+from .checkpoint import StateCheckpoint
+from .fleet import MeterFleetManager, MeterDefinition
 from .reader import PowerMeterReader
 from .simulator import PowerMeterSimulator
+from .fleet_simulator import FleetSimulator
+from .clock import SystemClock, SimulatedClock
+from .replay import TraceReplayClient
 
 # Import authentication components
 from .auth import User, Session, AuthenticationManager
@@ -15,8 +21,16 @@ from .auth import User, Session, AuthenticationManager
 # Define package exports
 __all__ = [
     'PowerMeterDataManager', 
+    'SinkPipeline',
+    'StateCheckpoint',
+    'MeterFleetManager',
+    'MeterDefinition',
     'PowerMeterReader', 
     'PowerMeterSimulator',
+    'FleetSimulator',
+    'SystemClock',
+    'SimulatedClock',
+    'TraceReplayClient',
     'User',
     'Session', 
     'AuthenticationManager'
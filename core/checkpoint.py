@@ -0,0 +1,136 @@
+"""
+Checkpoint of the last known meter state for fast warm restarts
+"""
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger('powermeter.core.checkpoint')
+
+CHECKPOINT_VERSION = 1
+
+class StateCheckpoint:
+    """Small on-disk checkpoint of the latest snapshot, data scalar and history index"""
+    
+    def __init__(self, path, interval=10.0):
+        """
+        Initialize the checkpoint
+        
+        Parameters:
+        - path: Checkpoint file path
+        - interval: Minimum seconds between checkpoint writes
+        """
+        self.path = path
+        self.interval = interval
+        self.reader = None
+        self.history = None
+        self.saves = 0
+        # The first state is saved at once, however long the host has been up
+        self._last_save = float('-inf')
+        self._latest = None
+    
+    def bind(self, reader=None, history=None):
+        """
+        Set the reader and history store whose state is checkpointed
+        
+        Parameters:
+        - reader: PowerMeterReader providing the data scalar
+        - history: History store, checkpointed if it has index_state()
+        """
+        self.reader = reader
+        self.history = history
+    
+    def load(self):
+        """
+        Read the checkpoint
+        
+        Returns:
+        - Dictionary with 'snapshot', 'data_scalar', 'history_index' and
+          'saved_at', or None if there is no usable checkpoint
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.path}: {str(e)}")
+            return None
+        
+        if not isinstance(state, dict) or state.get('version') != CHECKPOINT_VERSION:
+            logger.warning(f"Ignoring checkpoint with unknown format: {self.path}")
+            return None
+        return state
+    
+    def save(self, state):
+        """
+        Write a checkpoint atomically
+        
+        Parameters:
+        - state: Dictionary with 'snapshot' and 'data_scalar'
+        """
+        # The history index is taken now rather than at capture time, since
+        # the history store is written by its own worker and may lag behind
+        index_state = getattr(self.history, 'index_state', None)
+        state = dict(state, version=CHECKPOINT_VERSION, saved_at=time.time(),
+                     history_index=index_state() if index_state is not None else None)
+        tmp_path = self.path + '.tmp'
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            # The rename is atomic, so a crash never leaves a torn checkpoint
+            os.replace(tmp_path, self.path)
+            self.saves += 1
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Error writing checkpoint {self.path}: {str(e)}")
+    
+    def capture(self, data):
+        """
+        Collect the state to checkpoint for a published snapshot
+        
+        Called by the sink pipeline on the poll thread so the data scalar
+        matches the snapshot.
+        
+        Parameters:
+        - data: Snapshot published by the data manager
+        
+        Returns:
+        - State dictionary
+        """
+        return {
+            'snapshot': data,
+            'data_scalar': getattr(self.reader, 'data_scalar', None)
+        }
+    
+    def write(self, state):
+        """
+        Checkpoint the latest state, at most once per interval
+        
+        Parameters:
+        - state: State dictionary from capture()
+        """
+        self._latest = state
+        now = time.monotonic()
+        if now - self._last_save >= self.interval:
+            self._last_save = now
+            self.save(state)
+    
+    def write_batch(self, states):
+        """Checkpoint only the newest state of a batch"""
+        if states:
+            self.write(states[-1])
+    
+    def close(self):
+        """
+        Write the latest state once more on shutdown
+        
+        This also covers a state that was saved while the history store
+        was still behind, so the checkpoint carries its final index.
+        """
+        if self._latest is not None:
+            self.save(self._latest)
+            self._latest = None
\ No newline at end of file
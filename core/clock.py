@@ -0,0 +1,142 @@
+"""
+Clocks for the poll loops: the system clock, or simulated time for tests
+
+Everything that schedules polls or stamps snapshots takes its time from a
+clock object, so the same loops can run against simulated time - N times
+faster than real time, or as fast as the code can go.
+"""
+import threading
+import time
+
+class SystemClock:
+    """Real time"""
+    
+    simulated = False
+    
+    def time(self):
+        """Seconds since the epoch"""
+        return time.time()
+    
+    def monotonic(self):
+        """Seconds on a clock that never goes backwards"""
+        return time.monotonic()
+    
+    def sleep(self, seconds):
+        """Block for a number of seconds"""
+        if seconds > 0:
+            time.sleep(seconds)
+    
+    def wait(self, event, seconds):
+        """
+        Block until an event is set or the time has passed
+        
+        Returns:
+        - True if the event is set
+        """
+        return event.wait(max(0.0, seconds))
+
+class SimulatedClock:
+    """
+    Simulated time, running at a multiple of real time or as fast as possible
+    
+    At a speed of N, a simulated second passes in 1/N real seconds. With
+    speed=None, sleeping advances the clock to the end of the sleep at once,
+    so a loop that polls every second covers an hour of simulated time in
+    however long 3600 polls take. When several threads sleep, the clock only
+    moves forward: it jumps to the latest wake-up time asked for, and
+    threads whose wake-up time has passed continue immediately.
+    
+    An as-fast-as-possible clock can be given an end time it never moves
+    past. The thread whose sleep reaches the end runs the on_end callback
+    before it wakes, so a loop can be stopped at exactly the end of a
+    simulated window however fast it goes.
+    """
+    
+    simulated = True
+    
+    def __init__(self, start=None, speed=None, end=None, on_end=None):
+        """
+        Initialize the clock
+        
+        Parameters:
+        - start: Simulated epoch time at creation (defaults to the current time)
+        - speed: Simulated seconds per real second, or None to run as fast as possible
+        - end: Simulated epoch time the clock stops at (as-fast-as-possible clocks only)
+        - on_end: Optional callable run once when the clock reaches the end
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError("Clock speed must be positive")
+        if speed is not None and end is not None:
+            raise ValueError("Only an as-fast-as-possible clock can have an end time")
+        self.speed = speed
+        self._start = time.time() if start is None else float(start)
+        self._real_start = time.monotonic()
+        self._elapsed = 0.0
+        self._lock = threading.Lock()
+        self.end = None if end is None else float(end)
+        self.on_end = on_end
+        self.ended = threading.Event()
+    
+    def elapsed(self):
+        """Simulated seconds since the clock was created"""
+        if self.speed is None:
+            return self._elapsed
+        return (time.monotonic() - self._real_start) * self.speed
+    
+    def time(self):
+        """Simulated seconds since the epoch"""
+        return self._start + self.elapsed()
+    
+    def monotonic(self):
+        """Simulated monotonic seconds"""
+        return self.elapsed()
+    
+    def advance(self, seconds):
+        """
+        Move an as-fast-as-possible clock forward
+        
+        Parameters:
+        - seconds: Simulated seconds to add
+        """
+        if self.speed is not None:
+            raise RuntimeError("Only an as-fast-as-possible clock can be advanced by hand")
+        self._advance_to(by=max(0.0, seconds))
+    
+    def _advance_to(self, elapsed=None, by=0.0):
+        with self._lock:
+            if elapsed is None:
+                elapsed = self._elapsed + by
+            if self.end is not None:
+                elapsed = min(elapsed, self.end - self._start)
+            if elapsed > self._elapsed:
+                self._elapsed = elapsed
+            reached = (self.end is not None and not self.ended.is_set()
+                       and self._start + self._elapsed >= self.end)
+            if reached:
+                self.ended.set()
+        if reached and self.on_end is not None:
+            self.on_end()
+    
+    def sleep(self, seconds):
+        """Block for a number of simulated seconds"""
+        if seconds <= 0:
+            return
+        if self.speed is None:
+            self._advance_to(self.elapsed() + seconds)
+            # Let other threads run at the new time
+            time.sleep(0)
+        else:
+            time.sleep(seconds / self.speed)
+    
+    def wait(self, event, seconds):
+        """
+        Block until an event is set or the simulated time has passed
+        
+        Returns:
+        - True if the event is set
+        """
+        if self.speed is not None:
+            return event.wait(max(0.0, seconds) / self.speed)
+        if not event.is_set():
+            self.sleep(seconds)
+        return event.is_set()
\ No newline at end of file
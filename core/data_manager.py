@@ -5,24 +5,116 @@ import time
 import threading
 import logging
 
+from .clock import SystemClock
+from .pipeline import SinkPipeline
+from modbus.utilization import CapacityWatch
+from telemetry.metrics import REGISTRY
+from telemetry.tracing import TRACER
+
 logger = logging.getLogger('powermeter.core.data_manager')
 
+POLLS = REGISTRY.counter('powermeter_polls_total', 'Polls of the data manager by result', ('port', 'result'))
+POLL_SECONDS = REGISTRY.histogram('powermeter_poll_seconds', 'Time taken by a poll', ('port',))
+SAMPLE_AGE = REGISTRY.gauge('powermeter_sample_age_seconds', 'Age of the latest served snapshot', ('port',))
+LAST_SUCCESS = REGISTRY.gauge('powermeter_last_success_timestamp_seconds',
+                              'Time of the latest successful poll', ('port',))
+
 class PowerMeterDataManager:
     """Manager for collecting and storing power meter data"""
     
-    def __init__(self, reader, poll_interval=5):
+    def __init__(self, reader, poll_interval=5, history=None, rollups=None, pipeline=None,
+                 checkpoint=None, clock=None):
         """
         Initialize the data manager
         
         Parameters:
         - reader: PowerMeterReader instance
         - poll_interval: Time between data collections in seconds
+        - history: Optional history store that receives every snapshot
+        - rollups: Optional RollupEngine that receives every snapshot
+        - pipeline: Optional SinkPipeline (defaults to one built from CONFIG)
+        - checkpoint: Optional StateCheckpoint restored now and updated as snapshots arrive
+        - clock: Clock that schedules the polls (defaults to the system clock); pass
+          the same clock to the reader so snapshots are stamped with its time
         """
         self.reader = reader
         self.poll_interval = poll_interval
+        self.clock = clock or SystemClock()
+        self.capacity = CapacityWatch(getattr(reader, 'port', 'serial line'))
         self.meter_data = {}
+        # Poll attempts and the ones that produced no snapshot
+        self.polls = 0
+        self.failed_polls = 0
+        self._port = port = getattr(reader, 'port', 'simulator')
+        self._poll_ok = POLLS.labels(port, 'ok')
+        self._poll_failed = POLLS.labels(port, 'failed')
+        self._poll_seconds = POLL_SECONDS.labels(port)
+        self._sample_age = SAMPLE_AGE.labels(port)
+        self._last_success = LAST_SUCCESS.labels(port)
+        REGISTRY.register_collector(self._collect_metrics)
         self.running = False
         self._thread = None
+        self.history = history
+        self.rollups = rollups
+        self.pipeline = pipeline or SinkPipeline.from_config()
+        if history is not None:
+            self.add_sink(history)
+        if rollups is not None:
+            self.add_sink(rollups)
+        
+        self.checkpoint = checkpoint
+        if checkpoint is not None:
+            checkpoint.bind(reader, history)
+            self._restore(checkpoint.load())
+            self.add_sink(checkpoint, name='checkpoint')
+    
+    def _restore(self, state):
+        """
+        Serve the last known state until the first successful poll
+        
+        Parameters:
+        - state: Checkpoint dictionary from StateCheckpoint.load(), or None
+        """
+        if not state:
+            return
+        
+        snapshot = state.get('snapshot')
+        if isinstance(snapshot, dict) and snapshot:
+            # Marked stale so clients can tell it apart from a live reading
+            self.meter_data = dict(snapshot, stale=True, restored_at=self.clock.time())
+        
+        scalar = state.get('data_scalar')
+        if scalar is not None and self.reader is not None and getattr(self.reader, 'data_scalar', None) is None:
+            self.reader.data_scalar = scalar
+        
+        index = state.get('history_index')
+        restore_index = getattr(self.history, 'restore_index', None)
+        if index and restore_index is not None:
+            restore_index(index)
+        
+        logger.info(f"Restored last known state from {time.ctime(state.get('saved_at', 0))}")
+    
+    def add_sink(self, sink, **options):
+        """
+        Register a sink that receives every published snapshot
+        
+        Sinks are fed by a write-behind worker, so their I/O never runs on
+        the poll thread.
+        
+        Parameters:
+        - sink: Object with a write(data) method and optionally close()
+        - options: Per-sink pipeline overrides (queue_size, batch_size,
+          flush_interval, policy)
+        
+        Returns:
+        - Name of the sink in pipeline metrics
+        """
+        return self.pipeline.add_sink(sink, **options)
+    
+    @property
+    def sinks(self):
+        """Registered sinks"""
+        return self.pipeline.sinks
     
     def get_data(self):
         """
@@ -33,28 +125,91 @@ class PowerMeterDataManager:
         """
         return self.meter_data
     
+    def _publish(self, data):
+        """
+        Make a new snapshot current and queue it for the registered sinks
+        
+        Parameters:
+        - data: Snapshot returned by the reader
+        """
+        self.meter_data = data
+        with TRACER.span('publish'):
+            self.pipeline.publish(data)
+    
+    def get_pipeline_stats(self):
+        """
+        Get per-sink lag, drops and flush latency
+        
+        Returns:
+        - Dictionary mapping sink name to its pipeline metrics
+        """
+        return self.pipeline.stats()
+    
+    def get_bus_usage(self):
+        """
+        Get line utilization and poll capacity of the meter's serial line
+        
+        Returns:
+        - Dictionary mapping the port to its 'usage' and 'capacity'
+        """
+        client = getattr(self.reader, 'modbus_client', None)
+        return {self.capacity.bus: {
+            'usage': client.usage.stats() if hasattr(client, 'usage') else None,
+            'capacity': self.capacity.capacity
+        }}
+    
+    def _collect_metrics(self):
+        """Update the sample age gauge before a metrics scrape"""
+        timestamp = self.meter_data.get('timestamp') if self.meter_data else None
+        self._sample_age.set(self.clock.time() - timestamp if timestamp else float('nan'))
+    
     def _read_meter_loop(self):
         """Background thread for continuously reading meter data"""
         from config.settings import CONFIG
         
+        clock = self.clock
+        next_poll = clock.monotonic()
         while self.running:
+            self.polls += 1
+            started = time.perf_counter()
+            poll = TRACER.trace('poll', port=self._port)
             try:
                 # Use detailed data if configured, otherwise use basic data
-                if CONFIG.get('DETAILED_DATA', False):
+                detailed = CONFIG.get('DETAILED_DATA', False)
+                if detailed:
                     data = self.reader.read_detailed_data()
                 else:
                     data = self.reader.read_basic_data()
+                if hasattr(self.reader, 'poll_time'):
+                    self.capacity.update([(self.reader.poll_time(detailed), self.poll_interval)])
                     
-                if data is not None:
-                    self.meter_data = data
+                self._poll_seconds.observe(time.perf_counter() - started)
+                if data is None:
+                    self.failed_polls += 1
+                    self._poll_failed.inc()
+                else:
+                    self._poll_ok.inc()
+                    self._last_success.set(data.get('timestamp', clock.time()))
+                    self._publish(data)
                     # Log a summary of the data
                     power = data.get('system', {}).get('power_kw', data.get('power_kw', 'N/A'))
-                    logger.info(f"Updated readings: Power={power}kW")
+                    logger.info("Updated readings: Power=%skW", power)
             except Exception as e:
+                self.failed_polls += 1
+                self._poll_failed.inc()
                 logger.error(f"Error in meter reading loop: {str(e)}")
+            finally:
+                poll.end()
                 
-            # Sleep until next reading
-            time.sleep(self.poll_interval)
+            # Sleep until the next reading is due, so the schedule doesn't
+            # drift by however long the read took
+            next_poll += self.poll_interval
+            delay = next_poll - clock.monotonic()
+            if delay < 0:
+                # Overran the interval - start again from now instead of bursting
+                next_poll = clock.monotonic()
+                delay = 0
+            clock.sleep(delay)
     
     def start(self):
         """Start collecting data"""
@@ -63,7 +218,7 @@ class PowerMeterDataManager:
             return
             
         self.running = True
-        self._thread = threading.Thread(target=self._read_meter_loop)
+        self._thread = threading.Thread(target=self._read_meter_loop, name='meter-poll')
         self._thread.daemon = True
         self._thread.start()
         logger.info("Data manager started")
@@ -74,4 +229,7 @@ class PowerMeterDataManager:
         if self._thread is not None:
             self._thread.join(timeout=10)
             self._thread = None
+        
+        # Drain the sink queues and close sinks so buffered history reaches disk
+        self.pipeline.close()
         logger.info("Data manager stopped")
\ No newline at end of file
@@ -0,0 +1,394 @@
+"""
+Multi-meter data manager with one polling worker per physical bus
+"""
+import threading
+import logging
+
+from .clock import SystemClock
+from .pipeline import SinkPipeline
+from .reader import PowerMeterReader
+from modbus.utilization import CapacityWatch
+from telemetry.tracing import TRACER
+
+logger = logging.getLogger('powermeter.core.fleet')
+
+PROFILES = ('basic', 'detailed')
+
+class MeterDefinition:
+    """Connection and polling settings for one meter"""
+    
+    def __init__(self, meter_id, port=None, gateway=None, unit_id=1, profile='detailed',
+                 poll_interval=5, baud_rate=None, timeout=None, name=None):
+        """
+        Initialize a meter definition
+        
+        Parameters:
+        - meter_id: Unique meter identifier used in the API
+        - port: Serial port of the RS-485 bus (e.g., 'COM3')
+        - gateway: 'host:port' of an RS-485 gateway in RTU-over-TCP mode (instead of port)
+        - unit_id: Modbus unit ID on the bus
+        - profile: 'basic' or 'detailed' reads
+        - poll_interval: Seconds between polls of this meter
+        - baud_rate: Serial baud rate (defaults to BAUD_RATE)
+        - timeout: Response timeout in seconds (defaults to TIMEOUT)
+        - name: Display name (defaults to the meter ID)
+        """
+        from config.settings import CONFIG
+        
+        if not port and not gateway:
+            raise ValueError(f"Meter {meter_id} needs a port or a gateway")
+        if profile not in PROFILES:
+            raise ValueError(f"Meter {meter_id} has unknown profile: {profile}")
+        
+        self.meter_id = str(meter_id)
+        self.port = port
+        self.gateway = gateway
+        self.unit_id = int(unit_id)
+        self.profile = profile
+        self.poll_interval = float(poll_interval)
+        self.baud_rate = baud_rate or CONFIG.get('BAUD_RATE', 9600)
+        self.timeout = timeout if timeout is not None else CONFIG.get('TIMEOUT', 1)
+        self.name = name or self.meter_id
+    
+    @classmethod
+    def from_dict(cls, entry):
+        """Create a definition from a METERS configuration entry"""
+        entry = dict(entry)
+        return cls(entry.pop('id'), **entry)
+    
+    @property
+    def bus(self):
+        """Address of the physical bus the meter is on"""
+        return f"socket://{self.gateway}" if self.gateway else self.port
+    
+    def to_dict(self):
+        """Convert to a dictionary for the API"""
+        return {
+            'id': self.meter_id,
+            'name': self.name,
+            'bus': self.bus,
+            'unit_id': self.unit_id,
+            'profile': self.profile,
+            'poll_interval': self.poll_interval
+        }
+
+class _MeterState:
+    """Reader, latest snapshot and poll statistics for one meter"""
+    
+    def __init__(self, definition, reader):
+        self.definition = definition
+        self.reader = reader
+        self.data = {}
+        self.next_poll = 0.0
+        self.last_success = None
+        self.last_error = None
+        self.polls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+    
+    @property
+    def quarantined(self):
+        """True while the bus client holds the meter's unit ID in quarantine"""
+        is_quarantined = getattr(getattr(self.reader, 'modbus_client', None), 'is_quarantined', None)
+        return bool(is_quarantined and is_quarantined(self.definition.unit_id))
+    
+    def status(self, now):
+        """Summarize the meter's poll health"""
+        age = now - self.last_success if self.last_success is not None else None
+        return dict(
+            self.definition.to_dict(),
+            online=age is not None and age <= 3 * self.definition.poll_interval,
+            quarantined=self.quarantined,
+            last_success=self.last_success,
+            age_seconds=age,
+            polls=self.polls,
+            failures=self.failures,
+            consecutive_failures=self.consecutive_failures,
+            last_error=self.last_error
+        )
+
+class _BusWorker:
+    """Thread that polls every meter on one bus, in order"""
+    
+    def __init__(self, bus, meters, publish, clock=None):
+        self.bus = bus
+        self.meters = meters
+        self.publish = publish
+        self.clock = clock or SystemClock()
+        self.cycles = 0
+        self.capacity = CapacityWatch(bus)
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start the polling thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll_loop, name=f'bus-{self.bus}')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self, timeout=10):
+        """Stop the polling thread after the current poll"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+    
+    def poll_due(self, now=None):
+        """
+        Poll every meter whose interval has elapsed
+        
+        Returns:
+        - Monotonic time at which the next meter is due
+        """
+        clock = self.clock
+        for meter in self.meters:
+            if self._stop.is_set():
+                break
+            if (now if now is not None else clock.monotonic()) < meter.next_poll:
+                continue
+            self._poll(meter)
+            # Keep a fixed schedule, but don't try to catch up on missed polls
+            interval = meter.definition.poll_interval
+            meter.next_poll += interval
+            if meter.next_poll <= clock.monotonic():
+                meter.next_poll = clock.monotonic() + interval
+        self.cycles += 1
+        self._update_capacity()
+        return min(meter.next_poll for meter in self.meters)
+    
+    def _update_capacity(self):
+        """Check the configured intervals against what the line can carry"""
+        meters = [(meter.reader.poll_time(meter.definition.profile == 'detailed'), meter.definition.poll_interval)
+                  for meter in self.meters if hasattr(meter.reader, 'poll_time')]
+        if meters:
+            self.capacity.update(meters)
+    
+    def _poll(self, meter):
+        """Read one meter and publish its snapshot"""
+        definition = meter.definition
+        if meter.quarantined:
+            # Skip without touching the bus until the unit is due for a probe
+            meter.last_error = 'Quarantined'
+            return
+        meter.polls += 1
+        data = None
+        error = None
+        with TRACER.trace('poll', meter=definition.meter_id, bus=self.bus) as poll:
+            try:
+                if definition.profile == 'detailed':
+                    data = meter.reader.read_detailed_data()
+                else:
+                    data = meter.reader.read_basic_data()
+            except Exception as e:
+                error = str(e)
+                logger.error(f"Error polling meter {definition.meter_id}: {str(e)}")
+        
+            if data is None:
+                meter.failures += 1
+                meter.consecutive_failures += 1
+                meter.last_error = error or 'No response'
+                poll.set(error=meter.last_error)
+                return
+        
+            data['meter_id'] = definition.meter_id
+            meter.data = data
+            meter.last_success = self.clock.time()
+            meter.consecutive_failures = 0
+            meter.last_error = None
+            with TRACER.span('publish'):
+                self.publish(data)
+    
+    def _poll_loop(self):
+        """Background thread for polling the bus"""
+        while not self._stop.is_set():
+            try:
+                next_due = self.poll_due()
+            except Exception as e:
+                logger.error(f"Error in bus loop for {self.bus}: {str(e)}")
+                next_due = self.clock.monotonic() + 1
+            self.clock.wait(self._stop, next_due - self.clock.monotonic())
+
+class MeterFleetManager:
+    """Manager for polling many meters across several buses"""
+    
+    def __init__(self, meters, pipeline=None, reader_factory=None, clock=None, history=None, rollups=None):
+        """
+        Initialize the fleet manager
+        
+        Parameters:
+        - meters: List of MeterDefinition objects or METERS configuration dictionaries
+        - pipeline: Optional SinkPipeline for published snapshots
+        - reader_factory: Optional callable(definition, shared_client) returning a
+          reader; by default meters on the same bus share one ModbusClient
+        - clock: Clock that schedules the polls (defaults to the system clock)
+        - history: Optional history store keyed by meter (such as SQLiteHistoryStore)
+          that receives every snapshot and serves /api/history
+        - rollups: Optional MeterRollups that receives every snapshot
+        """
+        definitions = [m if isinstance(m, MeterDefinition) else MeterDefinition.from_dict(m)
+                       for m in meters]
+        if not definitions:
+            raise ValueError("At least one meter must be defined")
+        ids = [d.meter_id for d in definitions]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Meter IDs must be unique")
+        
+        self.pipeline = pipeline or SinkPipeline.from_config()
+        self.meters = {}
+        self.buses = {}
+        self.history = history
+        self.rollups = rollups
+        if history is not None:
+            self.add_sink(history)
+        if rollups is not None:
+            self.add_sink(rollups)
+        self.clock = clock or SystemClock()
+        self._reader_factory = reader_factory or self._create_reader
+        self._clients = {}
+        self._engine = None
+        
+        grouped = {}
+        for definition in definitions:
+            state = _MeterState(definition, self._reader_factory(definition, self._shared_client(definition)))
+            self.meters[definition.meter_id] = state
+            grouped.setdefault(definition.bus, []).append(state)
+        for bus, states in grouped.items():
+            self.buses[bus] = _BusWorker(bus, states, self._publish, self.clock)
+        
+        logger.info(f"Fleet of {len(self.meters)} meters on {len(self.buses)} buses")
+    
+    def _shared_client(self, definition):
+        """Get the client shared by every meter on a bus"""
+        from config.settings import CONFIG
+        from modbus.bus import SharedBusClient
+        
+        client = self._clients.get(definition.bus)
+        if client is None:
+            client = SharedBusClient(
+                definition.bus, definition.baud_rate, definition.unit_id, definition.timeout,
+                quarantine_after=CONFIG.get('MODBUS_QUARANTINE_AFTER', 3),
+                backoff=CONFIG.get('MODBUS_QUARANTINE_BACKOFF', 5),
+                max_backoff=CONFIG.get('MODBUS_QUARANTINE_MAX_BACKOFF', 300),
+                engine=self._serial_engine(definition)
+            )
+            self._clients[definition.bus] = client
+        return client
+    
+    def _serial_engine(self, definition):
+        """Get the shared termios engine if configured and usable for a bus"""
+        from config.settings import CONFIG
+        
+        if CONFIG.get('SERIAL_ENGINE', 'pyserial') != 'termios' or definition.gateway:
+            return None
+        if self._engine is None:
+            from modbus.serial_engine import SerialEngine
+            
+            self._engine = SerialEngine()
+            self._engine.start()
+        return self._engine
+    
+    def _create_reader(self, definition, client):
+        """Create a reader for a meter on a shared bus client"""
+        return PowerMeterReader(definition.bus, definition.baud_rate, definition.timeout,
+                                device_address=definition.unit_id, modbus_client=client, clock=self.clock)
+    
+    def add_sink(self, sink, **options):
+        """
+        Register a sink that receives every meter's snapshots (tagged with 'meter_id')
+        
+        Returns:
+        - Name of the sink in pipeline metrics
+        """
+        return self.pipeline.add_sink(sink, **options)
+    
+    def _publish(self, data):
+        """Queue a meter snapshot for the sinks"""
+        self.pipeline.publish(data)
+    
+    @property
+    def primary(self):
+        """The first configured meter, served by the single-meter API routes"""
+        return next(iter(self.meters.values()))
+    
+    @property
+    def reader(self):
+        """Reader of the primary meter"""
+        return self.primary.reader
+    
+    def get_data(self):
+        """
+        Get the latest data of the primary meter
+        
+        Returns:
+        - Dictionary of the latest meter data
+        """
+        return self.primary.data
+    
+    def get_meter_data(self, meter_id):
+        """
+        Get the latest data of one meter
+        
+        Returns:
+        - Dictionary of the latest meter data, or None for an unknown meter
+        """
+        meter = self.meters.get(str(meter_id))
+        return meter.data if meter is not None else None
+    
+    def get_meters(self):
+        """
+        Get the definition and poll health of every meter
+        
+        Returns:
+        - List of meter status dictionaries
+        """
+        now = self.clock.time()
+        return [meter.status(now) for meter in self.meters.values()]
+    
+    def get_pipeline_stats(self):
+        """Get per-sink lag, drops and flush latency"""
+        return self.pipeline.stats()
+    
+    def get_bus_status(self):
+        """
+        Get per-unit response statistics and quarantine state of every bus
+        
+        Returns:
+        - Dictionary mapping bus address to a list of unit status dictionaries
+        """
+        return {bus: client.unit_status() for bus, client in self._clients.items()
+                if hasattr(client, 'unit_status')}
+    
+    def get_bus_usage(self):
+        """
+        Get line utilization and poll capacity of every bus
+        
+        Returns:
+        - Dictionary mapping bus address to its 'usage' (time on the line by
+          category) and 'capacity' (estimated from the read plans)
+        """
+        usage = {}
+        for bus, worker in self.buses.items():
+            client = self._clients.get(bus)
+            usage[bus] = {
+                'usage': client.usage.stats() if hasattr(client, 'usage') else None,
+                'capacity': worker.capacity.capacity
+            }
+        return usage
+    
+    def start(self):
+        """Start one polling thread per bus"""
+        for worker in self.buses.values():
+            worker.start()
+        logger.info(f"Fleet manager started with {len(self.buses)} bus workers")
+    
+    def stop(self):
+        """Stop polling, close the sinks and the bus connections"""
+        for worker in self.buses.values():
+            worker.stop()
+        self.pipeline.close()
+        for client in self._clients.values():
+            client.disconnect()
+        if self._engine is not None:
+            self._engine.stop()
+        logger.info("Fleet manager stopped")
\ No newline at end of file
@@ -0,0 +1,339 @@
+"""
+Vectorized simulator for fleets of thousands of power meters
+
+All meters advance together in NumPy arrays: per-meter load profiles,
+phase imbalance, power factor and voltage, with energy integrated over the
+simulated time step. Each tick encodes the whole fleet into one (meters x 64)
+register array of the detailed block. Meters are read through ordinary
+PowerMeterReader objects whose Modbus client serves that meter's row, so
+anything that polls real meters can poll a simulated fleet.
+"""
+import logging
+import math
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional - only the fleet simulator needs it
+    np = None
+
+from core.clock import SystemClock
+from core.reader import PowerMeterReader
+from modbus.protocol import character_bits, inter_frame_delay
+from modbus.registers import REGISTERS, DETAILED_BLOCK_START, DETAILED_BLOCK_SIZE, DETAILED_LAYOUT
+
+logger = logging.getLogger('powermeter.core.fleet_simulator')
+
+# Seconds between fleet updates when registers are read without ticking
+TICK_INTERVAL = 1.0
+
+# Modbus exception code returned for registers outside the image
+ILLEGAL_DATA_ADDRESS = 0x02
+
+# Hourly load factors (local time 00:00-23:00) of each load profile
+LOAD_PROFILES = {
+    'residential': [0.35, 0.30, 0.28, 0.27, 0.28, 0.35, 0.55, 0.70, 0.60, 0.50, 0.48, 0.50,
+                    0.52, 0.50, 0.50, 0.55, 0.65, 0.85, 1.00, 0.98, 0.90, 0.75, 0.55, 0.42],
+    'commercial': [0.30, 0.28, 0.28, 0.28, 0.30, 0.35, 0.50, 0.75, 0.92, 1.00, 1.00, 1.00,
+                   0.98, 1.00, 1.00, 0.98, 0.92, 0.80, 0.60, 0.45, 0.38, 0.35, 0.32, 0.30],
+    'industrial': [0.80, 0.80, 0.78, 0.78, 0.80, 0.85, 0.95, 1.00, 1.00, 1.00, 1.00, 0.98,
+                   0.95, 1.00, 1.00, 1.00, 0.98, 0.95, 0.90, 0.88, 0.85, 0.82, 0.80, 0.80],
+}
+
+# Time constant of the rolling demand average (a 15-minute demand interval)
+DEMAND_SECONDS = 900
+
+class _MeterClient:
+    """Modbus client stand-in serving one meter's row of the fleet's registers"""
+    
+    def __init__(self, fleet, index, baud_rate):
+        self.fleet = fleet
+        self.index = index
+        self.port = f"simulated://{index}"
+        self.last_exception = None
+        self.char_time = character_bits() / baud_rate
+        self.inter_frame_delay = inter_frame_delay(baud_rate, character_bits())
+    
+    def connect(self):
+        return True
+    
+    def disconnect(self):
+        pass
+    
+    def read_registers(self, register_address, register_count=1, unit=None):
+        registers = self.fleet.read_registers(self.index, register_address, register_count)
+        self.last_exception = None if registers is not None else ILLEGAL_DATA_ADDRESS
+        return registers
+
+class FleetSimulator:
+    """Simulated fleet of meters advanced together in array form"""
+    
+    def __init__(self, count, seed=None, scalar=3, profiles=None, voltage_ln=265.0,
+                 start_time=None, utc_offset_hours=0.0, clock=None):
+        """
+        Initialize the fleet
+        
+        Parameters:
+        - count: Number of meters
+        - seed: Random seed for a reproducible fleet and sequence of readings
+        - scalar: Data scalar the registers are encoded with
+        - profiles: Load profile names to assign round-robin (defaults to all of LOAD_PROFILES)
+        - voltage_ln: Nominal line-neutral voltage
+        - start_time: Simulated epoch time of the first tick (defaults to the clock's time)
+        - utc_offset_hours: Offset of the meters' local time, which drives the load profiles
+        - clock: Clock driving automatic ticks and snapshot timestamps (defaults to the system clock)
+        """
+        if np is None:
+            raise RuntimeError("FleetSimulator requires NumPy")
+        
+        self.count = count
+        self.data_scalar = scalar
+        self.clock = clock or SystemClock()
+        self.timestamp = self.clock.time() if start_time is None else float(start_time)
+        self.utc_offset = utc_offset_hours * 3600
+        self.tick_count = 0
+        self.time_since_reset = 0.0
+        self._rng = rng = np.random.default_rng(seed)
+        self._last_tick = self.clock.monotonic()
+        self._lock = threading.Lock()
+        self._assigned = {}
+        
+        # Fixed characteristics of each meter
+        names = list(profiles or LOAD_PROFILES)
+        self.profile_names = names
+        self.profile_index = np.arange(count) % len(names)
+        self._profile_curves = np.array([LOAD_PROFILES[name] + LOAD_PROFILES[name][:1] for name in names])
+        self.base_kw = rng.lognormal(math.log(150), 0.6, count).clip(5, 1500)
+        self.phase_share = rng.uniform(0.94, 1.06, (count, 3))
+        self.phase_share *= 3 / self.phase_share.sum(axis=1, keepdims=True)
+        self.pf = rng.uniform(0.85, 0.99, count)
+        self.nominal_v = voltage_ln * rng.uniform(0.98, 1.02, (count, 3))
+        
+        # Integrated state
+        self.energy_kwh = rng.uniform(1e4, 1e6, (count, 1)) * self.phase_share / 3
+        self.reactive_energy_kvarh = self.energy_kwh * 0.3
+        self.apparent_energy_kvah = self.energy_kwh * 1.05
+        self.demand_kw = None
+        self.demand_kw_max = None
+        self.power_kw_max = None
+        self.power_kw_min = None
+        
+        # Multipliers of the active scalar, exactly as the reader decodes them
+        self._decoder = PowerMeterReader('SIMULATOR', 9600, device_address=1,
+                                         modbus_client=_MeterClient(self, 0, 9600))
+        self._multipliers = self._decoder._get_scalar_multipliers(scalar)
+        
+        # Replaced as a whole on every tick so readers never see a half-updated fleet
+        self.registers = None
+        self.tick(0.0)
+    
+    def load_factor(self, timestamp=None):
+        """
+        Load profile factor of every meter at a simulated time
+        
+        Parameters:
+        - timestamp: Simulated epoch time (defaults to the fleet's current time)
+        
+        Returns:
+        - Array of factors, one per meter
+        """
+        timestamp = self.timestamp if timestamp is None else timestamp
+        hour = ((timestamp + self.utc_offset) % 86400) / 3600
+        whole = int(hour)
+        fraction = hour - whole
+        curves = self._profile_curves[:, whole] * (1 - fraction) + self._profile_curves[:, whole + 1] * fraction
+        return curves[self.profile_index]
+    
+    def tick(self, seconds=None):
+        """
+        Advance every meter and re-encode the fleet's registers
+        
+        Parameters:
+        - seconds: Simulated time step (defaults to the clock time since the last tick)
+        
+        Returns:
+        - Register array of shape (meters, 64)
+        """
+        now = self.clock.monotonic()
+        with self._lock:
+            if seconds is None:
+                seconds = max(0.0, now - self._last_tick)
+            self._last_tick = now
+            self.timestamp += seconds
+            registers = self._encode(self._advance(seconds))
+            self.registers = registers
+            return registers
+    
+    def _advance(self, seconds):
+        """
+        Advance the physical model by one time step
+        
+        Returns:
+        - Dictionary of detailed field path -> array with one value per meter
+        """
+        rng = self._rng
+        n = self.count
+        
+        load = self.base_kw * self.load_factor() * rng.normal(1.0, 0.02, n)
+        phase_kw = (load / 3)[:, None] * self.phase_share * rng.normal(1.0, 0.01, (n, 3))
+        pf = (self.pf + rng.normal(0.0, 0.003, n)).clip(0.5, 1.0)[:, None]
+        voltage_ln = self.nominal_v * rng.normal(1.0, 0.002, (n, 3))
+        phase_kva = phase_kw / pf
+        phase_kvar = np.sqrt(np.maximum(phase_kva ** 2 - phase_kw ** 2, 0.0))
+        current = phase_kva * 1000 / voltage_ln
+        
+        # Energy integrates the power over the step
+        hours = seconds / 3600
+        self.energy_kwh += phase_kw * hours
+        self.reactive_energy_kvarh += phase_kvar * hours
+        self.apparent_energy_kvah += phase_kva * hours
+        
+        system_kw = phase_kw.sum(axis=1)
+        if self.demand_kw is None:
+            self.demand_kw = system_kw.copy()
+            self.demand_kw_max = system_kw.copy()
+            self.power_kw_max = system_kw.copy()
+            self.power_kw_min = system_kw.copy()
+        else:
+            self.demand_kw += (system_kw - self.demand_kw) * min(1.0, seconds / DEMAND_SECONDS)
+            np.maximum(self.demand_kw_max, self.demand_kw, out=self.demand_kw_max)
+            np.maximum(self.power_kw_max, system_kw, out=self.power_kw_max)
+            np.minimum(self.power_kw_min, system_kw, out=self.power_kw_min)
+        
+        # One grid frequency for the fleet, with a little measurement noise per meter
+        frequency = 60.0 + rng.normal(0.0, 0.02) + rng.normal(0.0, 0.002, n)
+        
+        self.tick_count = (self.tick_count + 1) & 0xFFFF
+        self.time_since_reset += seconds
+        
+        system_kva = phase_kva.sum(axis=1)
+        values = {
+            'system.energy_kwh': self.energy_kwh.sum(axis=1),
+            'system.power_kw': system_kw,
+            'system.demand_kw_max': self.demand_kw_max,
+            'system.demand_kw_now': self.demand_kw,
+            'system.power_kw_max': self.power_kw_max,
+            'system.power_kw_min': self.power_kw_min,
+            'system.reactive_energy_kvarh': self.reactive_energy_kvarh.sum(axis=1),
+            'system.reactive_power_kvar': phase_kvar.sum(axis=1),
+            'system.apparent_energy_kvah': self.apparent_energy_kvah.sum(axis=1),
+            'system.apparent_power_kva': system_kva,
+            'system.displacement_pf': pf[:, 0],
+            'system.apparent_pf': system_kw / system_kva,
+            'system.current_avg': current.mean(axis=1),
+            'system.voltage_ll_avg': voltage_ln.mean(axis=1) * math.sqrt(3),
+            'system.voltage_ln_avg': voltage_ln.mean(axis=1),
+            'voltages.l1_l2': (voltage_ln[:, 0] + voltage_ln[:, 1]) / 2 * math.sqrt(3),
+            'voltages.l2_l3': (voltage_ln[:, 1] + voltage_ln[:, 2]) / 2 * math.sqrt(3),
+            'voltages.l1_l3': (voltage_ln[:, 0] + voltage_ln[:, 2]) / 2 * math.sqrt(3),
+            'frequency': frequency,
+            'time_since_reset': np.full(n, int(self.time_since_reset)),
+            'data_tick_counter': np.full(n, self.tick_count),
+        }
+        for phase in range(3):
+            prefix = f"phase_{phase + 1}."
+            values.update({
+                prefix + 'energy_kwh': self.energy_kwh[:, phase],
+                prefix + 'power_kw': phase_kw[:, phase],
+                prefix + 'reactive_energy_kvarh': self.reactive_energy_kvarh[:, phase],
+                prefix + 'reactive_power_kvar': phase_kvar[:, phase],
+                prefix + 'apparent_energy_kvah': self.apparent_energy_kvah[:, phase],
+                prefix + 'apparent_power_kva': phase_kva[:, phase],
+                prefix + 'displacement_pf': pf[:, 0],
+                prefix + 'apparent_pf': pf[:, 0],
+                prefix + 'current': current[:, phase],
+                prefix + 'voltage_ln': voltage_ln[:, phase],
+            })
+        return values
+    
+    def _encode(self, values):
+        """
+        Encode engineering values into the detailed block of every meter
+        
+        Returns:
+        - uint16 array of shape (meters, 64)
+        """
+        registers = np.zeros((self.count, DETAILED_BLOCK_SIZE), dtype=np.uint16)
+        for path, (lsw, msw, kind) in DETAILED_LAYOUT.items():
+            value = values[path]
+            raw = np.rint(value / self._multipliers[kind]) if kind else value
+            if msw is None:
+                registers[:, lsw] = np.clip(raw, 0, 0xFFFF)
+            else:
+                raw = raw.astype(np.int64) & 0xFFFFFFFF
+                registers[:, lsw] = raw & 0xFFFF
+                registers[:, msw] = raw >> 16
+        return registers
+    
+    def current_registers(self):
+        """Get the register array, ticking once per TICK_INTERVAL of clock time"""
+        if self.clock.monotonic() - self._last_tick >= TICK_INTERVAL:
+            return self.tick()
+        return self.registers
+    
+    def read_registers(self, index, register_address, register_count=1):
+        """
+        Read registers of one meter
+        
+        Parameters:
+        - index: Meter index in the fleet
+        - register_address: Starting register address
+        - register_count: Number of registers to read
+        
+        Returns:
+        - List of register values, or None if any register is outside the image
+        """
+        if register_address == REGISTERS['DATA_SCALAR'] and register_count == 1:
+            return [self.data_scalar]
+        offset = register_address - DETAILED_BLOCK_START
+        if offset < 0 or offset + register_count > DETAILED_BLOCK_SIZE:
+            return None
+        return self.current_registers()[index, offset:offset + register_count].tolist()
+    
+    def image(self, index):
+        """
+        Register image of one meter
+        
+        Usable as a callable image for RTUSlaveEmulator, e.g. lambda: fleet.image(3).
+        
+        Returns:
+        - Dictionary of 4xxxx address -> register value
+        """
+        row = self.current_registers()[index].tolist()
+        image = dict(zip(range(DETAILED_BLOCK_START, DETAILED_BLOCK_START + DETAILED_BLOCK_SIZE), row))
+        image[REGISTERS['DATA_SCALAR']] = self.data_scalar
+        return image
+    
+    def reader(self, index, device_address=1, baud_rate=9600):
+        """
+        Create a PowerMeterReader for one meter
+        
+        Parameters:
+        - index: Meter index in the fleet
+        - device_address: Unit ID the reader reports
+        - baud_rate: Line speed used for poll time estimates
+        
+        Returns:
+        - PowerMeterReader reading the meter's registers
+        """
+        if not 0 <= index < self.count:
+            raise IndexError(f"Meter index {index} outside a fleet of {self.count}")
+        client = _MeterClient(self, index, baud_rate)
+        return PowerMeterReader(client.port, baud_rate, device_address=device_address, modbus_client=client,
+                                clock=self.clock)
+    
+    def reader_factory(self, definition, client):
+        """
+        Reader factory for MeterFleetManager that maps each meter to the next fleet index
+        
+        Parameters:
+        - definition: MeterDefinition of the meter
+        - client: Shared bus client (unused)
+        
+        Returns:
+        - PowerMeterReader of a simulated meter
+        """
+        index = self._assigned.get(definition.meter_id)
+        if index is None:
+            index = self._assigned[definition.meter_id] = len(self._assigned)
+        return self.reader(index, definition.unit_id, definition.baud_rate)
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""
+Write-behind publish pipeline for meter snapshots
+
+The poll thread only appends each snapshot to a bounded in-memory queue per
+sink. A worker thread per sink drains its queue in batches, so slow storage
+or forwarding never delays the next Modbus read.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger('powermeter.core.pipeline')
+
+# Queue policies when a sink falls behind
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+
+class _SinkWorker:
+    """Bounded queue and drain thread for a single sink"""
+    
+    def __init__(self, sink, name, queue_size, batch_size, flush_interval, policy):
+        self.sink = sink
+        self.name = name
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        
+        # Optional hook that captures sink-specific state on the publishing thread
+        self._capture = getattr(sink, 'capture', None)
+        self._write_batch = getattr(sink, 'write_batch', None)
+        
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._busy = False
+        
+        self.published = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.batches = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.last_written_at = None
+        
+        self._thread = threading.Thread(target=self._drain_loop, name=f'sink-{name}')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def put(self, data):
+        """Queue a snapshot, applying the queue policy when the sink is behind"""
+        if self._capture is not None:
+            try:
+                data = self._capture(data)
+            except Exception as e:
+                logger.error(f"Error capturing snapshot for {self.name}: {str(e)}")
+                return
+            if data is None:
+                return
+        
+        with self._cond:
+            if len(self._queue) >= self.queue_size:
+                if self.policy == BLOCK:
+                    while self._running and len(self._queue) >= self.queue_size:
+                        self._cond.wait()
+                else:
+                    self._queue.popleft()
+                    self.dropped += 1
+                    if self.dropped % 100 == 1:
+                        logger.warning(f"Sink {self.name} is behind, dropped {self.dropped} snapshots so far")
+            self._queue.append((time.time(), data))
+            self.published += 1
+            self._cond.notify_all()
+    
+    def _next_batch(self):
+        """Wait for a full batch or the flush interval, whichever comes first"""
+        with self._cond:
+            while self._running and not self._queue:
+                self._cond.wait()
+            if self._queue and len(self._queue) < self.batch_size and self._running:
+                deadline = self._queue[0][0] + self.flush_interval
+                while self._running and len(self._queue) < self.batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft()[1] for _ in range(count)]
+            self._busy = bool(batch)
+            # Wake publishers waiting for space under the block policy
+            self._cond.notify_all()
+            return batch
+    
+    def _drain_loop(self):
+        """Background thread that hands batches to the sink"""
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if not self._running:
+                    return
+                continue
+            
+            started = time.perf_counter()
+            try:
+                if self._write_batch is not None:
+                    self._write_batch(batch)
+                else:
+                    for data in batch:
+                        self.sink.write(data)
+                self.written += len(batch)
+                self.last_written_at = time.time()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error writing {len(batch)} snapshots to {self.name}: {str(e)}")
+            
+            elapsed = time.perf_counter() - started
+            with self._cond:
+                self.batches += 1
+                self.last_flush_seconds = elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+                self._busy = False
+                self._cond.notify_all()
+    
+    def wait_idle(self, timeout=None):
+        """Wait until the queue is empty and no batch is in flight"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+    
+    def stats(self):
+        """Get queue depth, lag, drops and flush latency for the sink"""
+        with self._cond:
+            oldest = self._queue[0][0] if self._queue else None
+            return {
+                'queued': len(self._queue),
+                'lag_seconds': time.time() - oldest if oldest is not None else 0.0,
+                'published': self.published,
+                'written': self.written,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'batches': self.batches,
+                'last_flush_seconds': self.last_flush_seconds,
+                'max_flush_seconds': self.max_flush_seconds,
+                'last_written_at': self.last_written_at
+            }
+    
+    def close(self, timeout=10):
+        """Drain the queue, stop the worker and close the sink"""
+        self.wait_idle(timeout)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout=timeout)
+        
+        close = getattr(self.sink, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                logger.error(f"Error closing {self.name}: {str(e)}")
+
+class SinkPipeline:
+    """Fan-out of published snapshots to write-behind sink workers"""
+    
+    def __init__(self, queue_size=1000, batch_size=50, flush_interval=1.0, policy=DROP_OLDEST):
+        """
+        Initialize the pipeline
+        
+        Parameters:
+        - queue_size: Maximum snapshots queued per sink
+        - batch_size: Maximum snapshots handed to a sink per batch
+        - flush_interval: Maximum seconds a snapshot waits for its batch to fill
+        - policy: DROP_OLDEST to discard the oldest queued snapshot when a sink
+          is full, or BLOCK to make the publisher wait for space
+        """
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"Unknown sink queue policy: {policy}")
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self._workers = []
+    
+    def add_sink(self, sink, name=None, **options):
+        """
+        Start a worker for a sink
+        
+        Parameters:
+        - sink: Object with write(data), and optionally write_batch(items),
+          capture(data) (called on the publishing thread) and close()
+        - name: Name used in logs and metrics (defaults to the class name)
+        - options: Per-sink overrides of queue_size, batch_size,
+          flush_interval and policy
+        """
+        name = name or type(sink).__name__
+        taken = {worker.name for worker in self._workers}
+        if name in taken:
+            suffix = 2
+            while f"{name}-{suffix}" in taken:
+                suffix += 1
+            name = f"{name}-{suffix}"
+        
+        worker = _SinkWorker(
+            sink, name,
+            options.get('queue_size', self.queue_size),
+            options.get('batch_size', self.batch_size),
+            options.get('flush_interval', self.flush_interval),
+            options.get('policy', self.policy)
+        )
+        self._workers.append(worker)
+        return name
+    
+    @classmethod
+    def from_config(cls, config=None):
+        """
+        Create a pipeline from the SINK_* settings
+        
+        Parameters:
+        - config: Configuration dictionary (defaults to CONFIG)
+        """
+        if config is None:
+            from config.settings import CONFIG
+            config = CONFIG
+        return cls(
+            queue_size=config.get('SINK_QUEUE_SIZE', 1000),
+            batch_size=config.get('SINK_BATCH_SIZE', 50),
+            flush_interval=config.get('SINK_FLUSH_INTERVAL', 1.0),
+            policy=config.get('SINK_QUEUE_POLICY', DROP_OLDEST)
+        )
+    
+    @property
+    def sinks(self):
+        """Registered sinks, in registration order"""
+        return [worker.sink for worker in self._workers]
+    
+    def publish(self, data):
+        """
+        Queue a snapshot for every sink
+        
+        Parameters:
+        - data: Snapshot returned by the reader
+        """
+        for worker in self._workers:
+            worker.put(data)
+    
+    def flush(self, timeout=None):
+        """
+        Wait until every sink has written its queued snapshots
+        
+        Returns:
+        - True if all queues drained before the timeout
+        """
+        return all(worker.wait_idle(timeout) for worker in self._workers)
+    
+    def stats(self):
+        """
+        Get per-sink pipeline metrics
+        
+        Returns:
+        - Dictionary mapping sink name to queue depth, lag, drops and flush latency
+        """
+        return {worker.name: worker.stats() for worker in self._workers}
+    
+    def close(self, timeout=10):
+        """Drain all queues, stop the workers and close the sinks"""
+        for worker in self._workers:
+            worker.close(timeout)
+        self._workers = []
\ No newline at end of file
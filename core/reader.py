@@ -2,17 +2,103 @@
 Power meter reader for communicating with the device and processing data
 """
 import logging
+import math
 import time
+from collections import namedtuple
+from functools import wraps
 from modbus.client import ModbusClient
-from modbus.registers import REGISTERS
+from core.clock import SystemClock
+from modbus.read_plan import AdaptiveBlockReader
+from modbus.utilization import read_time
+from modbus.registers import REGISTERS, DETAILED_BLOCK_START, DETAILED_BLOCK_SIZE, DETAILED_LAYOUT
 from config.settings import CONFIG
+from telemetry.metrics import REGISTRY
+from telemetry.tracing import TRACER
 
 logger = logging.getLogger('powermeter.core.reader')
 
+READS = REGISTRY.counter('powermeter_reads_total', 'Meter reads by kind and result', ('kind', 'result'))
+READ_SECONDS = REGISTRY.histogram('powermeter_read_seconds', 'Time to read and decode a meter', ('kind',))
+
+# Readings above these limits are taken to be scaled a power of ten too high
+# and are divided back down: field -> (limit, divisor). The phase entries
+# apply to each of phase_1, phase_2 and phase_3.
+VALUE_LIMITS = {
+    'system.power_kw': (10000, 10),
+    'system.energy_kwh': (1000000000, 100),
+    'phase.power_kw': (5000, 10),
+    'phase.energy_kwh': (1000000000, 100),
+}
+
+# Plausible line frequency in Hz, and the raw frequency register ranges that
+# are rescaled into it: (low, high, divisor)
+FREQUENCY_RANGE = (45, 65)
+FREQUENCY_FIXES = ((550, 650, 10), (5500, 6500, 100), (10000, math.inf, 200))
+
+def value_limit(name):
+    """
+    Get the plausibility limit of a dotted field name
+    
+    Returns:
+    - (limit, divisor) tuple, or None if the field isn't checked
+    """
+    group, _, field = name.partition('.')
+    if group.startswith('phase_'):
+        group = 'phase'
+    return VALUE_LIMITS.get(f'{group}.{field}')
+
+def fix_frequency(raw):
+    """
+    Rescale a raw frequency register value into a plausible frequency
+    
+    Returns:
+    - Frequency in Hz, or None if no rescaling fits
+    """
+    for low, high, divisor in FREQUENCY_FIXES:
+        if low < raw < high:
+            return raw / divisor
+    return None
+
+def instrumented_read(kind):
+    """Decorator counting a read method's results, timing it and tracing it as a span"""
+    def decorator(func):
+        ok = READS.labels(kind, 'ok')
+        failed = READS.labels(kind, 'failed')
+        seconds = READ_SECONDS.labels(kind)
+        name = f'read_{kind}'
+        
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with TRACER.span(name):
+                data = func(*args, **kwargs)
+            seconds.observe(time.perf_counter() - started)
+            (ok if data is not None else failed).inc()
+            return data
+        return wrapper
+    return decorator
+
+# Raw registers behind a detailed snapshot
+RegisterFrame = namedtuple('RegisterFrame', ['timestamp', 'scalar', 'registers'])
+
+# 32-bit values in the detailed block, which must be read in one transaction
+DETAILED_PAIRS = [DETAILED_BLOCK_START + lsw for lsw, msw, _ in DETAILED_LAYOUT.values()
+                  if msw == lsw + 1]
+
+# Registers behind the detailed snapshot's raw_values
+RAW_VALUE_OFFSETS = {
+    'frequency': 21,
+    'voltage_ll_avg': 16,
+    'voltage_ln_avg': 17,
+    'current_avg': 15,
+    'power': 2,
+    'pf': 13
+}
+
 class PowerMeterReader:
     """Reader for communicating with power meters and processing data"""
     
-    def __init__(self, port, baud_rate, timeout=1):
+    def __init__(self, port, baud_rate, timeout=1, device_address=None, modbus_client=None, clock=None):
         """
         Initialize the power meter reader
         
@@ -20,12 +106,25 @@ class PowerMeterReader:
         - port: Serial port name (e.g., 'COM3')
         - baud_rate: Serial port baud rate
         - timeout: Serial port timeout in seconds
+        - device_address: Modbus unit ID (defaults to MODBUS_ADDRESS)
+        - modbus_client: Existing ModbusClient to share with other meters on the same bus
+        - clock: Clock that timestamps snapshots (defaults to the system clock)
         """
         self.port = port
         self.baud_rate = baud_rate
         self.timeout = timeout
-        self.modbus_client = ModbusClient(port, baud_rate, CONFIG.get('MODBUS_ADDRESS', 1), timeout)
+        self.device_address = device_address or CONFIG.get('MODBUS_ADDRESS', 1)
+        self.modbus_client = modbus_client or ModbusClient(port, baud_rate, self.device_address, timeout)
+        self.clock = clock or SystemClock()
         self.data_scalar = None
+        self.last_frame = None
+        # Latest value of every register read so far (4xxxx address -> value),
+        # replaced as a whole so other threads always see a consistent image
+        self.register_image = {}
+        self.image_timestamp = None
+        # Learned block sizes and unreadable registers of this device
+        self.block_reader = AdaptiveBlockReader(self._read_block, CONFIG.get('MODBUS_MAX_BLOCK', 125),
+                                                pairs=DETAILED_PAIRS)
         
     def connect(self):
         """Connect to the power meter"""
@@ -45,7 +144,7 @@ class PowerMeterReader:
         Returns:
         - Register value or None if error
         """
-        registers = self.modbus_client.read_registers(register_address, 1)
+        registers = self.modbus_client.read_registers(register_address, 1, unit=self.device_address)
         if registers and len(registers) > 0:
             return registers[0]
         return None
@@ -61,7 +160,45 @@ class PowerMeterReader:
         Returns:
         - List of register values or None if error
         """
-        return self.modbus_client.read_registers(register_address, register_count)
+        return self.modbus_client.read_registers(register_address, register_count, unit=self.device_address)
+        
+    def poll_time(self, detailed=True):
+        """
+        Expected line time of one poll
+        
+        Parameters:
+        - detailed: True for read_detailed_data(), False for read_basic_data()
+        
+        Returns:
+        - Seconds, from the learned read plan and response times
+        """
+        if detailed:
+            counts = [length for _, length in self.block_reader.blocks(DETAILED_BLOCK_START, DETAILED_BLOCK_SIZE)]
+        else:
+            counts = [22]
+        return sum(read_time(self.modbus_client, self.device_address, count) for count in counts)
+    
+    def _update_image(self, register_address, values):
+        """
+        Merge freshly read registers into the register image
+        
+        Parameters:
+        - register_address: Address of the first value
+        - values: Register values, None for registers that could not be read
+        """
+        image = dict(self.register_image)
+        for offset, value in enumerate(values):
+            if value is not None:
+                image[register_address + offset] = value
+        self.register_image = image
+        self.image_timestamp = self.clock.time()
+    
+    def _read_block(self, register_address, register_count):
+        """Read a block for the block reader, with the exception code if the device refused it"""
+        registers = self.read_registers(register_address, register_count)
+        if registers is not None:
+            return registers, None
+        return None, getattr(self.modbus_client, 'last_exception', None)
         
     def read_data_scalar(self):
         """
@@ -72,7 +209,8 @@ class PowerMeterReader:
         """
         scalar = self.read_register(REGISTERS['DATA_SCALAR'])
         if scalar is not None:
-            logger.info(f"Read data scalar value: {scalar}")
+            logger.info("Read data scalar value: %s", scalar)
+            self._update_image(REGISTERS['DATA_SCALAR'], [scalar])
             self.data_scalar = scalar
             return scalar
         return None
@@ -91,7 +229,7 @@ class PowerMeterReader:
         if CONFIG.get('OVERRIDE_SCALING', False):
             # Use the scaling factors from config
             multipliers = CONFIG.get('SCALING_FACTORS', {})
-            logger.info(f"Using manual scaling overrides from config: {multipliers}")
+            logger.info("Using manual scaling overrides from config: %s", multipliers)
             return multipliers
             
         # Default multipliers in case we can't determine scalar
@@ -123,7 +261,7 @@ class PowerMeterReader:
                 'voltage': 0.1,   # Voltage scaling
                 'frequency': 0.005 # Frequency scaling
             }
-            logger.info(f"Using special multipliers for scalar value 15: {multipliers}")
+            logger.info("Using special multipliers for scalar value 15: %s", multipliers)
             return multipliers
         
         # For values ≥6 that aren't special cases, use scalar 6 values
@@ -135,7 +273,7 @@ class PowerMeterReader:
             multipliers = scalar_map[scalar_value]
             # Make sure frequency uses a multiplier that gives ~60Hz
             multipliers['frequency'] = 0.005
-            logger.info(f"Using scalar value {scalar_value} with multipliers: {multipliers}")
+            logger.info("Using scalar value %s with multipliers: %s", scalar_value, multipliers)
         else:
             logger.warning(f"Unknown scalar value: {scalar_value}, using default multipliers")
         
@@ -154,42 +292,26 @@ class PowerMeterReader:
         # Copy the data to avoid modifying the original
         filtered_data = data.copy()
         
-        # Check and fix system values
-        if 'system' in filtered_data:
-            sys = filtered_data['system']
+        # Fix unrealistically high power and energy values of the system and phases
+        for group in ['system', 'phase_1', 'phase_2', 'phase_3']:
+            if group in filtered_data:
+                values = filtered_data[group]
+                for field in ['power_kw', 'energy_kwh']:
+                    limit, divisor = value_limit(f'{group}.{field}')
+                    if values.get(field, 0) > limit:
+                        values[field] = values[field] / divisor
             
-            # Fix unrealistically high power values (over 10000 kW)
-            if sys.get('power_kw', 0) > 10000:
-                sys['power_kw'] = sys.get('power_kw', 0) / 10
-                
-            # Fix unrealistically high energy values (over 1 billion kWh)
-            if sys.get('energy_kwh', 0) > 1000000000:
-                sys['energy_kwh'] = sys.get('energy_kwh', 0) / 100
-        
-        # Fix phase readings
-        for phase in ['phase_1', 'phase_2', 'phase_3']:
-            if phase in filtered_data:
-                # Fix unrealistically high power values (over 5000 kW for a phase)
-                if filtered_data[phase].get('power_kw', 0) > 5000:
-                    filtered_data[phase]['power_kw'] = filtered_data[phase].get('power_kw', 0) / 10
-                
-                # Fix unrealistically high energy values
-                if filtered_data[phase].get('energy_kwh', 0) > 1000000000:
-                    filtered_data[phase]['energy_kwh'] = filtered_data[phase].get('energy_kwh', 0) / 100
-        
-        # Fix frequency if it's clearly wrong (typical range 45-65 Hz)
-        if 'frequency' in filtered_data and (filtered_data['frequency'] < 45 or filtered_data['frequency'] > 65):
-            raw_freq = filtered_data.get('raw_values', {}).get('frequency', 0)
-            # Try different multipliers to get a plausible value
-            if 550 < raw_freq < 650:
-                filtered_data['frequency'] = raw_freq / 10  # Might be around 60 Hz
-            elif 5500 < raw_freq < 6500:
-                filtered_data['frequency'] = raw_freq / 100  # Might be around 60 Hz
-            elif raw_freq > 10000:
-                filtered_data['frequency'] = raw_freq / 200  # For very large values
+        # Fix frequency if it's clearly wrong, trying different multipliers
+        # on the raw register to get a plausible value
+        low, high = FREQUENCY_RANGE
+        if 'frequency' in filtered_data and not low <= filtered_data['frequency'] <= high:
+            frequency = fix_frequency(filtered_data.get('raw_values', {}).get('frequency', 0))
+            if frequency is not None:
+                filtered_data['frequency'] = frequency
         
         return filtered_data
         
+    @instrumented_read('basic')
     def read_basic_data(self):
         """
         Read basic power meter data
@@ -200,7 +322,8 @@ class PowerMeterReader:
         try:
             # Make sure we have the data scalar
             if self.data_scalar is None:
-                self.data_scalar = self.read_data_scalar()
+                with TRACER.span('read_scalar'):
+                    self.data_scalar = self.read_data_scalar()
                 
             # If we still don't have it, use the default
             if self.data_scalar is None:
@@ -216,6 +339,8 @@ class PowerMeterReader:
             if not registers or len(registers) < 22:
                 logger.warning("Failed to read basic registers")
                 return None
+            decode = TRACER.span('decode')
+            self._update_image(44001, registers[:22])
                 
             # Extract and scale values
             energy_lsw = registers[0]
@@ -233,7 +358,7 @@ class PowerMeterReader:
             
             # Create result dictionary
             data = {
-                'timestamp': time.time(),
+                'timestamp': self.clock.time(),
                 'energy_kwh': energy,
                 'power_kw': power,
                 'reactive_power_kvar': reactive_power,
@@ -255,8 +380,11 @@ class PowerMeterReader:
                 'multipliers': multipliers
             }
             
+            decode.end()
+            
             # Filter out unrealistic values
-            filtered_data = self._filter_unrealistic_values(data)
+            with TRACER.span('filter'):
+                filtered_data = self._filter_unrealistic_values(data)
             
             return filtered_data
             
@@ -264,6 +392,7 @@ class PowerMeterReader:
             logger.error(f"Error reading basic data: {str(e)}")
             return None
             
+    @instrumented_read('detailed')
     def read_detailed_data(self):
         """
         Read detailed power meter data including per-phase information
@@ -274,7 +403,8 @@ class PowerMeterReader:
         try:
             # Make sure we have the data scalar
             if self.data_scalar is None:
-                self.data_scalar = self.read_data_scalar()
+                with TRACER.span('read_scalar'):
+                    self.data_scalar = self.read_data_scalar()
                 
             # If we still don't have it, use the default
             if self.data_scalar is None:
@@ -284,16 +414,28 @@ class PowerMeterReader:
             # Get scaling multipliers
             multipliers = self._get_scalar_multipliers(self.data_scalar)
             
-            # Read a larger block of registers
-            registers = self.read_registers(44001, 64)
+            # Read a larger block of registers, in as many pieces as the device needs
+            with TRACER.span('block_read', count=DETAILED_BLOCK_SIZE):
+                values = self.block_reader.read(DETAILED_BLOCK_START, DETAILED_BLOCK_SIZE)
             
-            if not registers or len(registers) < 64:
+            if values is None or all(value is None for value in values):
                 logger.warning("Failed to read detailed registers")
                 return None
                 
+            decode = TRACER.span('decode')
+            self._update_image(DETAILED_BLOCK_START, values)
+                
+            # Registers the device refuses decode as 0 and their fields are cleared below
+            missing = [offset for offset, value in enumerate(values) if value is None]
+            registers = [0 if value is None else value for value in values]
+            
+            # Keep the raw frame for raw-register history (only complete frames)
+            timestamp = self.clock.time()
+            self.last_frame = RegisterFrame(timestamp, self.data_scalar, registers) if not missing else None
+            
             # Build a comprehensive data structure
             data = {
-                'timestamp': time.time(),
+                'timestamp': timestamp,
                 'data_scalar': self.data_scalar,
                 'multipliers': multipliers,
                 'system': {
@@ -373,14 +515,41 @@ class PowerMeterReader:
                 'data_tick_counter': registers[63]
             }
             
+            decode.end()
+            
             # Filter out unrealistic values
-            filtered_data = self._filter_unrealistic_values(data)
+            with TRACER.span('filter'):
+                filtered_data = self._filter_unrealistic_values(data)
+            
+            if missing:
+                self._clear_missing(filtered_data, missing)
             
             return filtered_data
             
         except Exception as e:
             logger.error(f"Error reading detailed data: {str(e)}")
             return None
+    
+    def _clear_missing(self, data, missing):
+        """
+        Set fields backed by unreadable registers to None
+        
+        Parameters:
+        - data: Detailed data dictionary
+        - missing: Offsets of unreadable registers in the detailed block
+        """
+        missing = set(missing)
+        for path, (lsw, msw, _) in DETAILED_LAYOUT.items():
+            if lsw in missing or msw in missing:
+                *parents, name = path.split('.')
+                target = data
+                for parent in parents:
+                    target = target[parent]
+                target[name] = None
+        for name, offset in RAW_VALUE_OFFSETS.items():
+            if offset in missing:
+                data['raw_values'][name] = None
+        data['missing_registers'] = sorted(DETAILED_BLOCK_START + offset for offset in missing)
             
     def test_connection(self):
         """
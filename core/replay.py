@@ -0,0 +1,255 @@
+"""
+Deterministic replay of recorded register frames and CSV load profiles
+
+A TraceReplayClient stands in for the Modbus client of a PowerMeterReader
+and answers with whichever recorded frame is current on its clock. The
+reader decodes the frames exactly as it decodes a live meter. With a
+SimulatedClock running as fast as possible, a day of recorded data replays
+through the data manager, history and rollups in seconds.
+"""
+import bisect
+import csv
+import logging
+import math
+from datetime import datetime
+
+from core.clock import SystemClock
+from core.reader import PowerMeterReader
+from core.simulator import encode_registers
+from modbus.protocol import character_bits, inter_frame_delay
+from modbus.registers import REGISTERS, DETAILED_BLOCK_START, DETAILED_BLOCK_SIZE, DETAILED_LAYOUT
+
+logger = logging.getLogger('powermeter.core.replay')
+
+# Modbus exception code returned for registers outside the frames
+ILLEGAL_DATA_ADDRESS = 0x02
+
+def _parse_time(text):
+    """Seconds from a numeric timestamp or an ISO 8601 date and time"""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text.strip()).timestamp()
+
+def load_profile_frames(path, multipliers, scalar=3, voltage_ln=265.0, pf=0.99, frequency=60.0,
+                        energy_kwh=0.0):
+    """
+    Build register frames from a CSV load profile
+    
+    The CSV needs a 'timestamp' column (seconds or ISO 8601) and a
+    'power_kw' column. Every other value is derived from the power with
+    balanced phases at the given voltage and power factor, and energy
+    counters integrate the power from row to row. Columns named after a
+    detailed field (e.g. 'system.voltage_ln_avg' or 'frequency') override
+    the derived value.
+    
+    Parameters:
+    - path: CSV file
+    - multipliers: Multipliers of the scalar, as the reader decodes them
+    - scalar: Data scalar of the frames
+    - voltage_ln: Line-neutral voltage
+    - pf: Power factor
+    - frequency: Line frequency in Hz
+    - energy_kwh: Energy counter at the first row
+    
+    Returns:
+    - List of (timestamp, scalar, registers) tuples
+    """
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    
+    frames = []
+    energy = [energy_kwh, energy_kwh * 0.15, energy_kwh * 1.01]
+    previous = None
+    peak_demand = power_max = power_min = None
+    for index, row in enumerate(rows):
+        timestamp = _parse_time(row['timestamp'])
+        power = float(row.get('system.power_kw') or row['power_kw'])
+        apparent = power / pf
+        reactive = math.sqrt(max(apparent ** 2 - power ** 2, 0.0))
+        if previous is not None:
+            # Energy accumulated at the previous row's load until this row
+            hours = (timestamp - previous[0]) / 3600
+            energy = [total + rate * hours for total, rate in zip(energy, previous[1])]
+        previous = (timestamp, (power, reactive, apparent))
+        peak_demand = power if peak_demand is None else max(peak_demand, power)
+        power_max = power if power_max is None else max(power_max, power)
+        power_min = power if power_min is None else min(power_min, power)
+        
+        voltage_ll = voltage_ln * math.sqrt(3)
+        values = {
+            'system.energy_kwh': energy[0],
+            'system.power_kw': power,
+            'system.demand_kw_max': peak_demand,
+            'system.demand_kw_now': power,
+            'system.power_kw_max': power_max,
+            'system.power_kw_min': power_min,
+            'system.reactive_energy_kvarh': energy[1],
+            'system.reactive_power_kvar': reactive,
+            'system.apparent_energy_kvah': energy[2],
+            'system.apparent_power_kva': apparent,
+            'system.displacement_pf': pf,
+            'system.apparent_pf': pf,
+            'system.current_avg': apparent * 1000 / (3 * voltage_ln),
+            'system.voltage_ll_avg': voltage_ll,
+            'system.voltage_ln_avg': voltage_ln,
+            'voltages.l1_l2': voltage_ll,
+            'voltages.l2_l3': voltage_ll,
+            'voltages.l1_l3': voltage_ll,
+            'frequency': frequency,
+            'time_since_reset': timestamp - _parse_time(rows[0]['timestamp']),
+            'data_tick_counter': index & 0xFFFF,
+        }
+        for phase in range(1, 4):
+            values.update({
+                f'phase_{phase}.energy_kwh': energy[0] / 3,
+                f'phase_{phase}.power_kw': power / 3,
+                f'phase_{phase}.reactive_energy_kvarh': energy[1] / 3,
+                f'phase_{phase}.reactive_power_kvar': reactive / 3,
+                f'phase_{phase}.apparent_energy_kvah': energy[2] / 3,
+                f'phase_{phase}.apparent_power_kva': apparent / 3,
+                f'phase_{phase}.displacement_pf': pf,
+                f'phase_{phase}.apparent_pf': pf,
+                f'phase_{phase}.current': apparent * 1000 / (3 * voltage_ln),
+                f'phase_{phase}.voltage_ln': voltage_ln,
+            })
+        for name, text in row.items():
+            if name in DETAILED_LAYOUT and text not in (None, ''):
+                values[name] = float(text)
+        
+        image = encode_registers(values, multipliers, scalar)
+        registers = [image[DETAILED_BLOCK_START + offset] for offset in range(DETAILED_BLOCK_SIZE)]
+        frames.append((timestamp, scalar, registers))
+    return frames
+
+class TraceReplayClient:
+    """Modbus client stand-in that serves recorded register frames on a clock"""
+    
+    def __init__(self, frames, clock=None, start=None, loop=False, baud_rate=9600):
+        """
+        Initialize the replay
+        
+        Parameters:
+        - frames: List of (timestamp, scalar, registers) tuples, registers being
+          the DETAILED_BLOCK_SIZE registers of the detailed block
+        - clock: Clock that decides which frame is current (defaults to the system clock)
+        - start: Clock time at which the first frame plays (defaults to the clock's
+          time now); the recorded spacing of the frames is kept
+        - loop: Start again from the first frame after the last one
+        - baud_rate: Line speed used for poll time estimates
+        """
+        self.clock = clock or SystemClock()
+        self.frames = sorted(frames, key=lambda frame: frame[0])
+        self.loop = loop
+        self.start = self.clock.time() if start is None else float(start)
+        self.last_exception = None
+        self.port = 'replay'
+        self.baud_rate = baud_rate
+        self.char_time = character_bits() / baud_rate
+        self.inter_frame_delay = inter_frame_delay(baud_rate, character_bits())
+        self._offsets = [frame[0] - self.frames[0][0] for frame in self.frames] if self.frames else []
+        if len(self._offsets) > 1:
+            # The last frame lasts as long as the one before it
+            self.duration = self._offsets[-1] + (self._offsets[-1] - self._offsets[-2])
+        else:
+            self.duration = 0.0
+    
+    @classmethod
+    def from_raw_history(cls, path, **kwargs):
+        """
+        Replay the frames of a raw-register history file
+        
+        Parameters:
+        - path: File written by RawRegisterHistory
+        - kwargs: Arguments for the constructor
+        
+        Returns:
+        - TraceReplayClient
+        """
+        from storage.raw_history import iter_frames
+        
+        frames = list(iter_frames(path))
+        logger.info(f"Replaying {len(frames)} register frames from {path}")
+        return cls(frames, **kwargs)
+    
+    @classmethod
+    def from_csv(cls, path, scalar=3, voltage_ln=265.0, pf=0.99, frequency=60.0, energy_kwh=0.0, **kwargs):
+        """
+        Replay a CSV load profile
+        
+        Parameters:
+        - path: CSV file with 'timestamp' and 'power_kw' columns (see load_profile_frames)
+        - scalar: Data scalar the frames are encoded with
+        - voltage_ln, pf, frequency, energy_kwh: Values the rest of each frame is derived from
+        - kwargs: Arguments for the constructor
+        
+        Returns:
+        - TraceReplayClient
+        """
+        client = cls([], **kwargs)
+        multipliers = client.reader()._get_scalar_multipliers(scalar)
+        frames = load_profile_frames(path, multipliers, scalar, voltage_ln, pf, frequency, energy_kwh)
+        logger.info(f"Replaying {len(frames)} load profile rows from {path}")
+        return cls(frames, **kwargs)
+    
+    @property
+    def finished(self):
+        """True once the last frame has played (never for a looping replay)"""
+        if self.loop or not self.frames:
+            return not self.frames
+        return self.clock.time() - self.start >= self.duration
+    
+    def current_frame(self):
+        """
+        Get the frame that is current on the clock
+        
+        Returns:
+        - (timestamp, scalar, registers) tuple, or None before the first frame
+        """
+        if not self.frames:
+            return None
+        offset = self.clock.time() - self.start
+        if offset < 0:
+            return None
+        if self.loop and self.duration > 0:
+            offset %= self.duration
+        index = bisect.bisect_right(self._offsets, offset) - 1
+        return self.frames[index]
+    
+    def connect(self):
+        return True
+    
+    def disconnect(self):
+        pass
+    
+    def read_registers(self, register_address, register_count=1, unit=None):
+        """
+        Read registers of the current frame
+        
+        Returns:
+        - List of register values, or None (with last_exception set) outside the frame
+        """
+        frame = self.current_frame()
+        if frame is None:
+            # Nothing recorded yet at this time - like a meter that doesn't answer
+            self.last_exception = None
+            return None
+        if register_address == REGISTERS['DATA_SCALAR'] and register_count == 1:
+            self.last_exception = None
+            return [frame[1]]
+        offset = register_address - DETAILED_BLOCK_START
+        if offset < 0 or offset + register_count > DETAILED_BLOCK_SIZE:
+            self.last_exception = ILLEGAL_DATA_ADDRESS
+            return None
+        self.last_exception = None
+        return list(frame[2][offset:offset + register_count])
+    
+    def reader(self, device_address=1):
+        """
+        Create a PowerMeterReader for the replay
+        
+        Returns:
+        - PowerMeterReader reading the replayed frames, stamping snapshots with the replay's clock
+        """
+        return PowerMeterReader(self.port, self.baud_rate, device_address=device_address, modbus_client=self,
+                                clock=self.clock)
\ No newline at end of file
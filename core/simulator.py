@@ -1,22 +1,84 @@
 """
 Power meter simulator for testing without hardware
+
+The simulator keeps a register image of the detailed block (44001-44064)
+and the data scalar (44602), encoded from a simple physical model with the
+same layout and multipliers the reader decodes. Register reads are served
+from the image and decoded reads go through PowerMeterReader, so the two
+always agree and the reader's decode path is exercised.
 """
 import random
-import time
 import logging
 import math
 
+from core.clock import SystemClock
+from core.reader import PowerMeterReader
+from modbus.registers import REGISTERS, DETAILED_BLOCK_START, DETAILED_LAYOUT
+
 logger = logging.getLogger('powermeter.core.simulator')
 
+# Seconds between register updates when the image is read without ticking
+TICK_INTERVAL = 1.0
+
+# Modbus exception code returned for registers outside the image
+ILLEGAL_DATA_ADDRESS = 0x02
+
+def encode_registers(values, multipliers, scalar):
+    """
+    Encode engineering values into a register image of the detailed block
+    
+    Parameters:
+    - values: Dictionary mapping every DETAILED_LAYOUT field path to its value
+    - multipliers: Multipliers of the scalar, as the reader decodes them
+    - scalar: Data scalar stored at 44602
+    
+    Returns:
+    - Dictionary of 4xxxx address -> register value
+    """
+    image = {REGISTERS['DATA_SCALAR']: scalar}
+    for path, (lsw, msw, kind) in DETAILED_LAYOUT.items():
+        raw = int(round(values[path] / multipliers[kind])) if kind else int(values[path])
+        if msw is None:
+            image[DETAILED_BLOCK_START + lsw] = max(0, min(raw, 0xFFFF))
+        else:
+            raw &= 0xFFFFFFFF
+            image[DETAILED_BLOCK_START + lsw] = raw & 0xFFFF
+            image[DETAILED_BLOCK_START + msw] = raw >> 16
+    return image
+
 class PowerMeterSimulator:
     """Simulator that generates fake power meter data for testing"""
     
-    def __init__(self):
-        """Initialize the simulator"""
+    def __init__(self, seed=None, scalar=3, device_address=1, clock=None, faults=None):
+        """
+        Initialize the simulator
+        
+        Parameters:
+        - seed: Random seed for a reproducible sequence of readings
+        - scalar: Data scalar (44602) the image is encoded with
+        - device_address: Modbus unit ID reported by the simulator
+        - clock: Clock driving the model and snapshot timestamps (defaults to the system clock)
+        - faults: Optional FaultInjector applied to the decoded reads; give it the
+          same clock so stalls and latency pass in simulated time
+        """
         self.connected = False
+        self.device_address = device_address
+        self.data_scalar = scalar
+        self.clock = clock or SystemClock()
+        self.last_exception = None
+        self.tick_count = 0
+        self.time_since_reset = 0.0
+        self._random = random.Random(seed)
         self._energy_kwh = 1000000  # Starting energy value
-        self._last_timestamp = time.time()
-        self.device_address = 1  # Default Modbus device address
+        self._last_tick = self.clock.monotonic()
+        # Decodes the image exactly as a real meter's registers are decoded
+        client = faults.wrap_client(self) if faults is not None else self
+        self._decoder = PowerMeterReader('SIMULATOR', 9600, device_address=device_address,
+                                         modbus_client=client, clock=self.clock)
+        self._multipliers = self._decoder._get_scalar_multipliers(scalar)
+        # Replaced as a whole on every tick so readers never see a half-updated image
+        self.register_image = {}
+        self.tick(0.0)
         
     def connect(self):
         """Simulate connecting to a power meter"""
@@ -29,6 +91,44 @@ class PowerMeterSimulator:
         self.connected = False
         logger.info("Disconnected from simulated power meter")
     
+    def tick(self, seconds=None):
+        """
+        Advance the physical model and re-encode the register image
+        
+        Parameters:
+        - seconds: Simulated time step (defaults to the clock time since the last tick)
+        
+        Returns:
+        - The new register image
+        """
+        now = self.clock.monotonic()
+        if seconds is None:
+            seconds = max(0.0, now - self._last_tick)
+        self._last_tick = now
+        
+        values = self._simulate(seconds)
+        self.tick_count = (self.tick_count + 1) & 0xFFFF
+        self.time_since_reset += seconds
+        values['time_since_reset'] = int(self.time_since_reset)
+        values['data_tick_counter'] = self.tick_count
+        
+        image = encode_registers(values, self._multipliers, self.data_scalar)
+        self.register_image = image
+        return image
+    
+    def current_image(self):
+        """
+        Get the register image, ticking once per TICK_INTERVAL of clock time
+        
+        Usable as a callable image for RTUSlaveEmulator.
+        
+        Returns:
+        - Dictionary of 4xxxx address -> register value
+        """
+        if self.clock.monotonic() - self._last_tick >= TICK_INTERVAL:
+            return self.tick()
+        return self.register_image
+    
     def read_register(self, register_address):
         """
         Simulate reading a single register
@@ -37,30 +137,31 @@ class PowerMeterSimulator:
         - register_address: Register address to read
         
         Returns:
-        - Simulated register value
+        - Register value, or None for registers the meter doesn't have
         """
-        # Generate appropriate values for common registers
-        if register_address == 44602:  # Data Scalar
-            return 3  # Default scalar value
-        elif register_address == 44022:  # Frequency
-            return 6000  # 60.00 Hz with scalar 3 multiplier
-        elif register_address >= 44001 and register_address <= 44020:
-            return random.randint(1000, 9000)  # Random value for most registers
-        else:
-            return random.randint(0, 65535)  # Random value for unknown registers
+        registers = self.read_registers(register_address, 1)
+        return registers[0] if registers else None
     
-    def read_registers(self, register_address, register_count):
+    def read_registers(self, register_address, register_count=1, unit=None):
         """
         Simulate reading multiple registers
         
         Parameters:
         - register_address: Starting register address
         - register_count: Number of registers to read
+        - unit: Modbus unit ID (ignored)
         
         Returns:
-        - List of simulated register values
+        - List of register values, or None (with last_exception set) if any
+          register is outside the image
         """
-        return [self.read_register(register_address + i) for i in range(register_count)]
+        image = self.current_image()
+        values = [image.get(register_address + i) for i in range(register_count)]
+        if None in values:
+            self.last_exception = ILLEGAL_DATA_ADDRESS
+            return None
+        self.last_exception = None
+        return values
     
     def read_data_scalar(self):
         """
@@ -69,255 +170,117 @@ class PowerMeterSimulator:
         Returns:
         - Simulated scalar value
         """
-        return 3  # Default scalar value
+        return self.data_scalar
     
-    def _get_simulated_values(self):
+    def _simulate(self, seconds):
         """
-        Generate a set of realistic simulated values
+        Generate the engineering values of one update
+        
+        Parameters:
+        - seconds: Simulated time since the previous update
         
         Returns:
-        - Dictionary of simulated values
+        - Dictionary keyed by detailed field path
         """
-        from config.settings import CONFIG
-        
-        # Get current timestamp
-        current_time = time.time()
+        rng = self._random
         
         # Generate realistic base values based on the ViewPoint screenshot
         voltage_ln_base = 265  # Line-neutral voltage (V)
-        current_base = random.uniform(650, 660)  # Current (A)
-        pf_base = 0.99  # Power factor
-        frequency = 60 + random.uniform(-0.1, 0.1)  # Frequency (Hz)
-        
-        # Calculate derived values for system
-        voltage_ll_base = voltage_ln_base * math.sqrt(3)  # Line-line voltage (V)
+        current_base = rng.uniform(650, 660)  # Current (A)
+        pf = 0.99  # Fixed PF for simulation
+        frequency = 60 + rng.uniform(-0.1, 0.1)  # Frequency (Hz)
         
         # Generate per-phase values with slight variations
         phase_variations = [
-            random.uniform(0.98, 1.02),
-            random.uniform(0.97, 1.03),
-            random.uniform(0.96, 1.04)
+            rng.uniform(0.98, 1.02),
+            rng.uniform(0.97, 1.03),
+            rng.uniform(0.96, 1.04)
         ]
         
-        # Calculate phase values to match ViewPoint values
+        values = {}
         phases = []
-        for i in range(3):
-            var = phase_variations[i]
-            voltage_ln = voltage_ln_base * var
-            current = current_base * var
-            pf = 0.99  # Fixed PF for simulation
-            
+        for i, var in enumerate(phase_variations):
             # Calculate power values - targeting around 172-174 kW
             power_kw = 173 * var
             apparent_power_kva = power_kw / pf
-            reactive_power_kvar = math.sqrt(apparent_power_kva**2 - power_kw**2)
-            
             phases.append({
-                'voltage_ln': round(voltage_ln, 1),
-                'current': round(current, 2),
-                'power_kw': round(power_kw, 2),
-                'apparent_power_kva': round(apparent_power_kva, 2),
-                'reactive_power_kvar': round(reactive_power_kvar, 2),
+                'voltage_ln': voltage_ln_base * var,
+                'current': current_base * var,
+                'power_kw': power_kw,
+                'apparent_power_kva': apparent_power_kva,
+                'reactive_power_kvar': math.sqrt(apparent_power_kva**2 - power_kw**2),
                 'displacement_pf': pf,
                 'apparent_pf': pf
             })
         
-        # Calculate system totals
+        # Update energy based on power and time elapsed
         system_power_kw = sum(phase['power_kw'] for phase in phases)
-        system_apparent_power_kva = sum(phase['apparent_power_kva'] for phase in phases)
-        system_reactive_power_kvar = sum(phase['reactive_power_kvar'] for phase in phases)
-        system_current_avg = sum(phase['current'] for phase in phases) / 3
+        self._energy_kwh += system_power_kw * seconds / 3600
         
-        # System power factor
-        system_pf = 0.99
-            
-        # Update energy based on power and time elapsed
-        time_diff_hours = (current_time - self._last_timestamp) / 3600
-        energy_increment = system_power_kw * time_diff_hours
-        self._energy_kwh += energy_increment
-        self._last_timestamp = current_time
+        for i, phase in enumerate(phases):
+            prefix = f"phase_{i + 1}."
+            for name, value in phase.items():
+                values[prefix + name] = value
+            values[prefix + 'energy_kwh'] = self._energy_kwh / 3
+            values[prefix + 'reactive_energy_kvarh'] = self._energy_kwh * 0.15 / 3
+            values[prefix + 'apparent_energy_kvah'] = self._energy_kwh * 1.01 / 3
         
-        # Voltage averages
         voltage_ln_avg = sum(phase['voltage_ln'] for phase in phases) / 3
         voltage_ll_avg = voltage_ln_avg * math.sqrt(3)
-        
-        # Convert real values to raw register values for simulation
-        # Using the scaling factors from the config
-        scaling = CONFIG.get('SCALING_FACTORS', {
-            'power': 0.1,
-            'current': 0.1,
-            'voltage': 0.1,
-            'pf': 0.01,
-            'frequency': 0.005
+        values.update({
+            'system.energy_kwh': self._energy_kwh,
+            'system.power_kw': system_power_kw,
+            'system.demand_kw_max': system_power_kw * 1.2,
+            'system.demand_kw_now': system_power_kw,
+            'system.power_kw_max': system_power_kw * 1.3,
+            'system.power_kw_min': system_power_kw * 0.7,
+            'system.reactive_energy_kvarh': self._energy_kwh * 0.15,
+            'system.reactive_power_kvar': sum(phase['reactive_power_kvar'] for phase in phases),
+            'system.apparent_energy_kvah': self._energy_kwh * 1.01,
+            'system.apparent_power_kva': sum(phase['apparent_power_kva'] for phase in phases),
+            'system.displacement_pf': pf,
+            'system.apparent_pf': pf,
+            'system.current_avg': sum(phase['current'] for phase in phases) / 3,
+            'system.voltage_ll_avg': voltage_ll_avg,
+            'system.voltage_ln_avg': voltage_ln_avg,
+            'voltages.l1_l2': voltage_ll_avg * 0.99,
+            'voltages.l2_l3': voltage_ll_avg * 1.01,
+            'voltages.l1_l3': voltage_ll_avg,
+            'frequency': frequency
         })
-        
-        # Calculate raw values
-        raw_frequency = int(frequency / scaling['frequency'])
-        raw_voltage_ll = int(voltage_ll_avg / scaling['voltage'])
-        raw_voltage_ln = int(voltage_ln_avg / scaling['voltage'])
-        raw_current = int(system_current_avg / scaling['current'])
-        raw_power = int(system_power_kw / scaling['power'])
-        raw_pf = int(system_pf / scaling['pf'])
-        
-        return {
-            'phases': phases,
-            'system_power_kw': system_power_kw,
-            'system_apparent_power_kva': system_apparent_power_kva,
-            'system_reactive_power_kvar': system_reactive_power_kvar,
-            'system_current_avg': system_current_avg,
-            'system_pf': system_pf,
-            'voltage_ln_avg': voltage_ln_avg,
-            'voltage_ll_avg': voltage_ll_avg,
-            'frequency': frequency,
-            'raw_frequency': raw_frequency,
-            'raw_voltage_ll': raw_voltage_ll,
-            'raw_voltage_ln': raw_voltage_ln,
-            'raw_current': raw_current,
-            'raw_power': raw_power,
-            'raw_pf': raw_pf
-        }
+        return values
     
     def read_basic_data(self):
         """
         Simulate reading basic meter data
         
         Returns:
-        - Dictionary of simulated basic meter data
+        - Dictionary of simulated basic meter data, decoded from a fresh register image
         """
         if not self.connected:
             self.connect()
             
-        # Generate simulated values
-        vals = self._get_simulated_values()
-        
-        # Return simulated data
-        return {
-            'timestamp': time.time(),
-            'energy_kwh': self._energy_kwh,
-            'power_kw': vals['system_power_kw'],
-            'reactive_power_kvar': vals['system_reactive_power_kvar'],
-            'apparent_power_kva': vals['system_apparent_power_kva'],
-            'power_factor': vals['system_pf'],
-            'current_avg': vals['system_current_avg'],
-            'voltage_ll_avg': vals['voltage_ll_avg'],
-            'voltage_ln_avg': vals['voltage_ln_avg'],
-            'frequency': vals['frequency'],
-            'data_scalar': 3,
-            'raw_values': {
-                'frequency': vals['raw_frequency'],
-                'voltage_ll': vals['raw_voltage_ll'],
-                'voltage_ln': vals['raw_voltage_ln'],
-                'current': vals['raw_current'],
-                'power': vals['raw_power'],
-                'pf': vals['raw_pf']
-            },
-            'multipliers': {
-                'power': 0.1,
-                'current': 0.1,
-                'voltage': 0.1,
-                'pf': 0.01,
-                'frequency': 0.005
-            },
-            'simulated': True
-        }
+        self.tick()
+        data = self._decoder.read_basic_data()
+        if data is not None:
+            data['simulated'] = True
+        return data
     
     def read_detailed_data(self):
         """
         Simulate reading detailed meter data
         
         Returns:
-        - Dictionary of simulated detailed meter data
+        - Dictionary of simulated detailed meter data, decoded from a fresh register image
         """
         if not self.connected:
             self.connect()
             
-        # Generate simulated values
-        vals = self._get_simulated_values()
-        phases = vals['phases']
-        
-        # Return simulated data
-        return {
-            'timestamp': time.time(),
-            'data_scalar': 3,
-            'multipliers': {
-                'power': 0.1,
-                'current': 0.1,
-                'voltage': 0.1,
-                'pf': 0.01,
-                'frequency': 0.005
-            },
-            'system': {
-                'energy_kwh': self._energy_kwh,
-                'power_kw': vals['system_power_kw'],
-                'demand_kw_max': vals['system_power_kw'] * 1.2,
-                'demand_kw_now': vals['system_power_kw'],
-                'power_kw_max': vals['system_power_kw'] * 1.3,
-                'power_kw_min': vals['system_power_kw'] * 0.7,
-                'reactive_energy_kvarh': self._energy_kwh * 0.15,
-                'reactive_power_kvar': vals['system_reactive_power_kvar'],
-                'apparent_energy_kvah': self._energy_kwh * 1.01,
-                'apparent_power_kva': vals['system_apparent_power_kva'],
-                'displacement_pf': vals['system_pf'],
-                'apparent_pf': vals['system_pf'],
-                'current_avg': vals['system_current_avg'],
-                'voltage_ll_avg': vals['voltage_ll_avg'],
-                'voltage_ln_avg': vals['voltage_ln_avg']
-            },
-            'voltages': {
-                'l1_l2': vals['voltage_ll_avg'] * 0.99,
-                'l2_l3': vals['voltage_ll_avg'] * 1.01,
-                'l1_l3': vals['voltage_ll_avg']
-            },
-            'frequency': vals['frequency'],
-            'raw_values': {
-                'frequency': vals['raw_frequency'],
-                'voltage_ll_avg': vals['raw_voltage_ll'],
-                'voltage_ln_avg': vals['raw_voltage_ln'],
-                'current_avg': vals['raw_current'],
-                'power': vals['raw_power'],
-                'pf': vals['raw_pf'],
-                'data_scalar': 3
-            },
-            'phase_1': {
-                'energy_kwh': self._energy_kwh / 3,
-                'power_kw': phases[0]['power_kw'],
-                'reactive_energy_kvarh': self._energy_kwh * 0.15 / 3,
-                'reactive_power_kvar': phases[0]['reactive_power_kvar'],
-                'apparent_energy_kvah': self._energy_kwh * 1.01 / 3,
-                'apparent_power_kva': phases[0]['apparent_power_kva'],
-                'displacement_pf': phases[0]['displacement_pf'],
-                'apparent_pf': phases[0]['apparent_pf'],
-                'current': phases[0]['current'],
-                'voltage_ln': phases[0]['voltage_ln']
-            },
-            'phase_2': {
-                'energy_kwh': self._energy_kwh / 3,
-                'power_kw': phases[1]['power_kw'],
-                'reactive_energy_kvarh': self._energy_kwh * 0.15 / 3,
-                'reactive_power_kvar': phases[1]['reactive_power_kvar'],
-                'apparent_energy_kvah': self._energy_kwh * 1.01 / 3,
-                'apparent_power_kva': phases[1]['apparent_power_kva'],
-                'displacement_pf': phases[1]['displacement_pf'],
-                'apparent_pf': phases[1]['apparent_pf'],
-                'current': phases[1]['current'],
-                'voltage_ln': phases[1]['voltage_ln']
-            },
-            'phase_3': {
-                'energy_kwh': self._energy_kwh / 3,
-                'power_kw': phases[2]['power_kw'],
-                'reactive_energy_kvarh': self._energy_kwh * 0.15 / 3,
-                'reactive_power_kvar': phases[2]['reactive_power_kvar'],
-                'apparent_energy_kvah': self._energy_kwh * 1.01 / 3,
-                'apparent_power_kva': phases[2]['apparent_power_kva'],
-                'displacement_pf': phases[2]['displacement_pf'],
-                'apparent_pf': phases[2]['apparent_pf'],
-                'current': phases[2]['current'],
-                'voltage_ln': phases[2]['voltage_ln']
-            },
-            'time_since_reset': int(time.time() % 100000),
-            'data_tick_counter': int(time.time() % 60),
-            'simulated': True
-        }
+        self.tick()
+        data = self._decoder.read_detailed_data()
+        if data is not None:
+            data['simulated'] = True
+        return data
         
     def read_data(self):
         """
@@ -3,14 +3,17 @@ import sys
 import time
 import logging
 import os
+import threading
 
 # Add project root to path to allow imports
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_root)
 
 from config import CONFIG
-from core import PowerMeterReader, PowerMeterDataManager, AuthenticationManager
-from api import PowerMeterHTTPServer
+from core import (PowerMeterReader, PowerMeterDataManager, AuthenticationManager, StateCheckpoint,
+                  MeterFleetManager, SinkPipeline)
+from api import PowerMeterHTTPServer, ModbusTCPServer
+from storage import create_history_store, create_rollup_engine
 from web.static_server import start_static_server
 
 logger = logging.getLogger('powermeter.main')
@@ -23,13 +26,24 @@ def signal_handler(sig, frame):
     global running
     running = False
 
-def main():
-    logger.info("Starting power meter monitoring application")
-    
-    # Create authentication manager
-    auth_manager = AuthenticationManager()
-    logger.info(f"Authentication system initialized with users: {list(auth_manager.users.keys())}")
+def connect_and_poll(reader, data_manager):
+    """Test the meter connection and start polling, off the main thread"""
+    logger.info("Testing connection to power meter...")
+    if reader.test_connection():
+        logger.info("Power meter connection test successful!")
+    else:
+        logger.error("Failed to communicate with power meter. Please check:")
+        logger.error(f"1. Is the power meter connected via USB to {CONFIG['SERIAL_PORT']}?")
+        logger.error(f"2. Is the baud rate set correctly ({CONFIG['BAUD_RATE']})?")
+        logger.error("3. Are other communication parameters correct (data bits, parity, etc.)?")
+        logger.error("Serving the last known readings and retrying every poll interval.")
     
+    # The poll loop keeps retrying, so start it even if the meter is not answering yet
+    if running:
+        data_manager.start()
+
+def create_single_meter_manager():
+    """Create the reader and data manager for the meter in SERIAL_PORT/MODBUS_ADDRESS"""
     # Create reader with configuration from settings
     reader = PowerMeterReader(
         CONFIG['SERIAL_PORT'],
@@ -40,43 +54,56 @@ def main():
     # Set additional reader properties from config
     reader.device_address = CONFIG.get('MODBUS_ADDRESS', 1)
     
-    # Test connection
-    logger.info("Testing connection to power meter...")
-    if not reader.test_connection():
-        logger.error("Failed to communicate with power meter. Please check:")
-        logger.error(f"1. Is the power meter connected via USB to {CONFIG['SERIAL_PORT']}?")
-        logger.error(f"2. Is the baud rate set correctly ({CONFIG['BAUD_RATE']})?")
-        logger.error("3. Are other communication parameters correct (data bits, parity, etc.)?")
-        logger.error("Exiting.")
-        return 1
+    # Create history store and rollups for published snapshots (None if disabled)
+    history = create_history_store(reader=reader)
+    rollups = create_rollup_engine()
     
-    logger.info("Power meter connection test successful!")
+    # Restore the last known state so dashboards have data before the first poll
+    checkpoint = None
+    if CONFIG.get('CHECKPOINT_ENABLED', True):
+        checkpoint_path = CONFIG.get('CHECKPOINT_PATH') or os.path.join(project_root, 'data', 'state.json')
+        checkpoint = StateCheckpoint(checkpoint_path, CONFIG.get('CHECKPOINT_INTERVAL', 10))
     
-    # Create custom data manager that uses the detailed data function if configured
-    class CustomPowerMeterDataManager(PowerMeterDataManager):
-        def _read_meter_loop(self):
-            """Continuously read from the meter"""
-            while self.running:
-                try:
-                    # Use detailed data if configured, otherwise use regular data
-                    if CONFIG.get('DETAILED_DATA', False):
-                        data = self.reader.read_detailed_data()
-                    else:
-                        data = self.reader.read_basic_data()
-                        
-                    if data is not None:
-                        self.meter_data = data
-                        logger.info(f"Updated readings: Power={data.get('system', {}).get('power_kw', data.get('power_kw', 'N/A'))}kW")
-                except Exception as e:
-                    logger.error(f"Error in meter reading loop: {str(e)}")
-                time.sleep(self.poll_interval)
+    # Create data manager (reads detailed data if configured)
+    data_manager = PowerMeterDataManager(reader, CONFIG['POLL_INTERVAL'],
+                                         history=history, rollups=rollups,
+                                         checkpoint=checkpoint)
+    return reader, data_manager
+
+def create_fleet_manager():
+    """Create the multi-meter manager for the meters in CONFIG['METERS']"""
+    # Only the SQLite backend keeps a meter column, so other backends would mix meters
+    backend = CONFIG.get('HISTORY_BACKEND')
+    history = None
+    if backend == 'sqlite':
+        history = create_history_store()
+    elif backend:
+        logger.warning(f"The {backend} history backend stores a single meter; "
+                       "use 'sqlite' to keep history in multi-meter mode")
     
-    # Create data manager
-    data_manager = CustomPowerMeterDataManager(reader, CONFIG['POLL_INTERVAL'])
+    return MeterFleetManager(CONFIG['METERS'], pipeline=SinkPipeline.from_config(),
+                             history=history, rollups=create_rollup_engine(per_meter=True))
+
+def main():
+    logger.info("Starting power meter monitoring application")
+    
+    # Create authentication manager
+    auth_manager = AuthenticationManager()
+    logger.info(f"Authentication system initialized with users: {list(auth_manager.users.keys())}")
+    
+    if CONFIG.get('METERS'):
+        # Poll every configured meter, with one worker per bus
+        reader = None
+        data_manager = create_fleet_manager()
+    else:
+        reader, data_manager = create_single_meter_manager()
     
     # Create HTTP server
     http_server = PowerMeterHTTPServer(CONFIG['HTTP_PORT'], data_manager)
     
+    # Optional Modbus TCP server fed from the polled registers
+    modbus_server = ModbusTCPServer.from_config(data_manager) if CONFIG.get('MODBUS_TCP_ENABLED') else None
+    
     try:
         # Start the web interface (suppress the individual server log message)
         web_port = CONFIG.get('WEB_PORT', 8000)
@@ -91,9 +118,17 @@ def main():
         # Restore original log level
         static_logger.setLevel(original_level)
         
-        # Start components
-        data_manager.start()
+        # Start components - the servers come up at once while the
+        # connection test and first poll run in the background
         http_server.start()
+        if modbus_server is not None:
+            modbus_server.start()
+        if reader is None:
+            data_manager.start()
+        else:
+            startup_thread = threading.Thread(target=connect_and_poll, args=(reader, data_manager))
+            startup_thread.daemon = True
+            startup_thread.start()
         
         # Single clean startup message
         logger.info("Power Monitor available at http://localhost:{}/".format(CONFIG['HTTP_PORT']))
@@ -115,8 +150,11 @@ def main():
     finally:
         # Clean shutdown
         http_server.stop()
+        if modbus_server is not None:
+            modbus_server.stop()
         data_manager.stop()
-        reader.disconnect()
+        if reader is not None:
+            reader.disconnect()
         logger.info("Application shut down")
     
     return 0
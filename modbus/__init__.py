@@ -5,8 +5,16 @@ Modbus protocol implementation package for power meter communication
 __version__ = '0.1.0'
 
 # Import key components for easier access
-from .protocol import calculate_crc, build_command, parse_response, get_expected_response_length
+from .protocol import calculate_crc, build_command, parse_response, get_expected_response_length, inter_frame_delay
 from .client import ModbusClient
+from .policy import TransactionPolicy, DeviceHealth
+from .timing import ResponseTimeEstimator
+from .bus import SharedBusClient
+from .serial_engine import SerialEngine
+from .read_plan import AdaptiveBlockReader
+from .emulator import RTUSlaveEmulator
+from .faults import FaultInjector, FaultProfile, FaultScenario
+from .capture import WireCapture, CaptureReplayTransport, read_capture
 from .registers import REGISTERS, REGISTER_GROUPS, get_register_name, get_register_group
 
 # Define package exports
@@ -15,7 +23,21 @@ __all__ = [
     'build_command', 
     'parse_response', 
     'get_expected_response_length',
+    'inter_frame_delay',
     'ModbusClient',
+    'TransactionPolicy',
+    'DeviceHealth',
+    'ResponseTimeEstimator',
+    'SharedBusClient',
+    'SerialEngine',
+    'AdaptiveBlockReader',
+    'RTUSlaveEmulator',
+    'FaultInjector',
+    'FaultProfile',
+    'FaultScenario',
+    'WireCapture',
+    'CaptureReplayTransport',
+    'read_capture',
     'REGISTERS', 
     'REGISTER_GROUPS', 
     'get_register_name', 
@@ -0,0 +1,40 @@
+"""
+Shared RS-485 bus client for polling many unit IDs on one serial port
+"""
+import logging
+
+from modbus.client import ModbusClient
+from modbus.policy import TransactionPolicy
+
+logger = logging.getLogger('powermeter.modbus.bus')
+
+class SharedBusClient(ModbusClient):
+    """
+    Modbus client for a multi-drop RS-485 bus
+    
+    One open port serves every unit ID on the bus. Requests go out
+    back-to-back with only the inter-frame gap between them. A unit that
+    stops answering is quarantined (its circuit opens): requests to it fail
+    immediately instead of waiting for the response timeout, and one request
+    is let through as a probe whenever its backoff expires.
+    """
+    
+    def __init__(self, port, baud_rate, device_address=1, timeout=1,
+                 quarantine_after=3, backoff=5.0, max_backoff=300.0, engine=None, policy=None):
+        """
+        Initialize the shared bus client
+        
+        Parameters:
+        - port: Serial port (or socket:// URL) of the bus
+        - baud_rate: Serial port baud rate
+        - device_address: Default unit ID for requests without one
+        - timeout: Response timeout in seconds
+        - quarantine_after: Consecutive failed transactions before a unit is quarantined
+        - backoff: Seconds until the first probe of a quarantined unit
+        - max_backoff: Upper limit of the doubling probe backoff
+        - engine: Optional SerialEngine that performs the I/O
+        - policy: TransactionPolicy to use instead of one built from the arguments
+        """
+        policy = policy or TransactionPolicy.from_config(
+            failure_threshold=quarantine_after, open_backoff=backoff, max_open_backoff=max_backoff)
+        super().__init__(port, baud_rate, device_address, timeout, engine, policy)
\ No newline at end of file
@@ -0,0 +1,398 @@
+"""
+Binary wire capture of Modbus transactions
+
+Every attempt a ModbusClient makes - request bytes, response bytes, when it
+was sent, how long the answer took and whether it was good, an exception,
+garbled or missing - is appended to a compact binary file that rotates at a
+size limit. Recording is a struct pack and a buffered write, cheap enough
+to leave on in production. summarize() turns a capture into latency and
+error distributions, and CaptureReplayTransport plays a capture back into
+an unmodified client and reader.
+"""
+import bisect
+import logging
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from modbus.timing import percentile
+
+logger = logging.getLogger('powermeter.modbus.capture')
+
+# Written at the start of every capture file
+MAGIC = b'MBCAP\x01'
+
+# Record header: send time, round trip (negative if unknown), unit, function,
+# outcome, request length, response length - followed by the two frames
+_HEADER = struct.Struct('<dfBBBHH')
+
+# Outcomes of a transaction attempt
+OK = 0
+EXCEPTION = 1
+TIMEOUT = 2
+INVALID = 3
+OUTCOMES = ('ok', 'exception', 'timeout', 'invalid')
+
+# Upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+CaptureRecord = namedtuple('CaptureRecord', 'timestamp rtt unit function outcome request response')
+
+class WireCapture:
+    """Rotating binary file of Modbus transaction attempts"""
+    
+    _shared = {}
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=3, flush_interval=1.0):
+        """
+        Initialize the capture
+        
+        Parameters:
+        - path: Capture file, appended to if it exists
+        - max_bytes: Size at which the file is rotated to path.1, path.2, ...
+        - backups: Number of rotated files kept (0 truncates instead)
+        - flush_interval: Seconds between flushes of the write buffer
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.records = 0
+        self.rotations = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self._open()
+    
+    @classmethod
+    def shared(cls, path, **kwargs):
+        """
+        Get the capture of a file, creating it on first use
+        
+        Clients of several ports can record into one file this way.
+        
+        Returns:
+        - WireCapture
+        """
+        with cls._shared_lock:
+            capture = cls._shared.get(path)
+            if capture is None or capture._file is None:
+                capture = cls._shared[path] = cls(path, **kwargs)
+            return capture
+    
+    @classmethod
+    def from_config(cls, config=None):
+        """
+        Get the capture configured in CONFIG
+        
+        Returns:
+        - Shared WireCapture, or None if capturing is off
+        """
+        if config is None:
+            from config.settings import CONFIG as config
+        path = config.get('MODBUS_CAPTURE_PATH')
+        if not path:
+            return None
+        return cls.shared(path, max_bytes=config.get('MODBUS_CAPTURE_MAX_BYTES', 10 * 1024 * 1024),
+                          backups=config.get('MODBUS_CAPTURE_BACKUPS', 3))
+    
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'ab', buffering=64 * 1024)
+        self._size = self._file.tell()
+        if self._size == 0:
+            self._file.write(MAGIC)
+            self._size = len(MAGIC)
+    
+    def _rotate(self):
+        """Move the current file to path.1 (shifting older ones) and start a new one"""
+        self._file.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+    
+    def record(self, request, response, rtt=None, valid=None):
+        """
+        Append one transaction attempt
+        
+        Parameters:
+        - request: Request frame sent
+        - response: Response bytes received (empty or None if nothing came)
+        - rtt: Seconds from sending the request to the end of the response
+        - valid: Whether the client accepted the response as a whole frame
+          with a good CRC (checked here when not given)
+        """
+        response = response or b''
+        if not response:
+            outcome = TIMEOUT
+        elif valid is False or (valid is None and len(response) < 5):
+            outcome = INVALID
+        elif response[1] & 0x80:
+            outcome = EXCEPTION
+        else:
+            outcome = OK
+        sent = time.time() - (rtt or 0.0)
+        header = _HEADER.pack(sent, -1.0 if rtt is None else rtt, request[0], request[1] & 0x7F,
+                              outcome, len(request), len(response))
+        size = len(header) + len(request) + len(response)
+        with self._lock:
+            if self._file is None:
+                return
+            if self._size + size > self.max_bytes and self._size > len(MAGIC):
+                self._rotate()
+            self._file.write(header)
+            self._file.write(request)
+            self._file.write(response)
+            self._size += size
+            self.records += 1
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+    
+    def flush(self):
+        """Write buffered records to the file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+    
+    def stats(self):
+        """
+        Get capture counters
+        
+        Returns:
+        - Dictionary with the path, records written, rotations and file size
+        """
+        with self._lock:
+            return {
+                'path': self.path,
+                'records': self.records,
+                'rotations': self.rotations,
+                'bytes': self._size
+            }
+    
+    def close(self):
+        """Flush and close the capture file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def capture_files(path):
+    """
+    Get a capture file and its rotated predecessors
+    
+    Returns:
+    - List of existing paths, oldest first
+    """
+    rotated = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        rotated.append(f"{path}.{index}")
+        index += 1
+    files = rotated[::-1]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+def read_capture(path, rotated=True):
+    """
+    Read the records of a capture
+    
+    Parameters:
+    - path: Capture file
+    - rotated: Also read the rotated files, oldest first
+    
+    Returns:
+    - Iterator of CaptureRecord tuples
+    """
+    for name in (capture_files(path) if rotated else [path]):
+        with open(name, 'rb') as f:
+            buf = f.read()
+        if not buf.startswith(MAGIC):
+            raise ValueError(f"{name} is not a Modbus capture file")
+        offset = len(MAGIC)
+        while offset + _HEADER.size <= len(buf):
+            sent, rtt, unit, function, outcome, request_length, response_length = \
+                _HEADER.unpack_from(buf, offset)
+            offset += _HEADER.size
+            end = offset + request_length + response_length
+            if end > len(buf):
+                # Partial record from a crash mid-write
+                break
+            request = buf[offset:offset + request_length]
+            response = buf[offset + request_length:end]
+            offset = end
+            yield CaptureRecord(sent, None if rtt < 0 else rtt, unit, function, outcome, request, response)
+
+def _latency_stats(latencies):
+    """Percentiles of round trips in milliseconds"""
+    ordered = sorted(latencies)
+    if not ordered:
+        return None
+    return {
+        'mean': sum(ordered) / len(ordered) * 1000,
+        'p50': percentile(ordered, 0.5) * 1000,
+        'p90': percentile(ordered, 0.9) * 1000,
+        'p99': percentile(ordered, 0.99) * 1000,
+        'max': ordered[-1] * 1000
+    }
+
+def summarize(records):
+    """
+    Summarize latency and error distributions of a capture
+    
+    Latency statistics cover attempts that got an answer (good or exception).
+    
+    Parameters:
+    - records: Iterable of CaptureRecord tuples
+    
+    Returns:
+    - Dictionary with overall and per-unit outcome counts, latency percentiles
+      and a latency histogram
+    """
+    outcomes = dict.fromkeys(OUTCOMES, 0)
+    histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    latencies = []
+    units = {}
+    first = last = None
+    for record in records:
+        name = OUTCOMES[record.outcome]
+        outcomes[name] += 1
+        first = record.timestamp if first is None else min(first, record.timestamp)
+        last = record.timestamp if last is None else max(last, record.timestamp)
+        unit = units.setdefault(record.unit, {'outcomes': dict.fromkeys(OUTCOMES, 0), 'latencies': []})
+        unit['outcomes'][name] += 1
+        if record.outcome in (OK, EXCEPTION) and record.rtt is not None:
+            latencies.append(record.rtt)
+            unit['latencies'].append(record.rtt)
+            histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, record.rtt * 1000)] += 1
+    
+    total = sum(outcomes.values())
+    return {
+        'transactions': total,
+        'start': first,
+        'end': last,
+        'outcomes': outcomes,
+        'error_rate': (total - outcomes['ok']) / total if total else None,
+        'latency_ms': _latency_stats(latencies),
+        'histogram': [{'le_ms': bound, 'count': count}
+                      for bound, count in zip(LATENCY_BUCKETS_MS + (None,), histogram)],
+        'units': {
+            unit_id: {
+                'transactions': sum(unit['outcomes'].values()),
+                'outcomes': unit['outcomes'],
+                'latency_ms': _latency_stats(unit['latencies'])
+            }
+            for unit_id, unit in sorted(units.items())
+        }
+    }
+
+class CaptureReplayTransport:
+    """
+    pyserial port stand-in that answers requests with the responses of a capture
+    
+    Each request is matched to the next captured attempt with the same
+    request bytes, so retries, timeouts and garbled frames replay in the
+    order they happened. Requests the capture has no answer for time out.
+    """
+    
+    def __init__(self, records, realtime=False, loop=False):
+        """
+        Initialize the replay
+        
+        Parameters:
+        - records: Iterable of CaptureRecord tuples
+        - realtime: Wait out each captured round trip before answering
+        - loop: Start again from the first record once the capture is used up
+        """
+        self.records = list(records)
+        self.realtime = realtime
+        self.loop = loop
+        self.is_open = True
+        self.timeout = None
+        self.replayed = 0
+        self.missed = 0
+        self._cursor = 0
+        self._response = b''
+    
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        Replay a capture file and its rotated predecessors
+        
+        Returns:
+        - CaptureReplayTransport
+        """
+        return cls(read_capture(path), **kwargs)
+    
+    def _find(self, request):
+        for index in range(self._cursor, len(self.records)):
+            if self.records[index].request == request:
+                return index
+        if self.loop:
+            for index in range(0, self._cursor):
+                if self.records[index].request == request:
+                    return index
+        return None
+    
+    def write(self, data):
+        request = bytes(data)
+        index = self._find(request)
+        if index is None:
+            self.missed += 1
+            self._response = b''
+            return len(request)
+        record = self.records[index]
+        self._cursor = index + 1
+        self.replayed += 1
+        self._response = record.response
+        if self.realtime and record.rtt:
+            time.sleep(record.rtt if self.timeout is None else min(record.rtt, self.timeout))
+        return len(request)
+    
+    def read(self, size):
+        response, self._response = self._response[:size], b''
+        if not response and self.realtime and self.timeout:
+            time.sleep(self.timeout)
+        return response
+    
+    def reset_input_buffer(self):
+        self._response = b''
+    
+    def close(self):
+        self.is_open = False
+    
+    def _wrap(self, port):
+        # Stands in for whatever port the client opened
+        port.close()
+        self.is_open = True
+        return self
+    
+    def client(self, baud_rate=9600, device_address=1, timeout=1):
+        """
+        Create a ModbusClient whose transactions are answered by the capture
+        
+        Returns:
+        - ModbusClient, usable as modbus_client of a PowerMeterReader
+        """
+        from modbus.client import ModbusClient
+        
+        client = ModbusClient('loop://', baud_rate, device_address=device_address, timeout=timeout)
+        client.transport_wrapper = self._wrap
+        # Replayed answers are not new measurements of the line
+        client.capture = None
+        return client
\ No newline at end of file
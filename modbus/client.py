@@ -4,20 +4,69 @@ Modbus client for communicating with power meters over serial connections
 import logging
 import time
 import binascii
+import threading
 import serial
-from modbus.protocol import build_command, parse_response, get_expected_response_length
+from modbus.protocol import (build_command, parse_response, get_expected_response_length,
+                             character_bits, inter_frame_delay, calculate_crc)
+from modbus.policy import DeviceHealth, TransactionPolicy
+from modbus.timing import ResponseTimeEstimator
+from modbus.utilization import BusUsage
+from modbus.capture import WireCapture
+from telemetry.metrics import REGISTRY
+from telemetry.tracing import TRACER
 
 logger = logging.getLogger('powermeter.modbus.client')
 
+TRANSACTIONS = REGISTRY.counter('powermeter_modbus_transactions_total',
+                                'Modbus request attempts by outcome', ('port', 'outcome'))
+RESPONSE_SECONDS = REGISTRY.histogram('powermeter_modbus_response_seconds',
+                                      'Round trip of answered Modbus request attempts', ('port',))
+SERIAL_ERRORS = REGISTRY.counter('powermeter_modbus_serial_errors_total',
+                                 'Serial I/O errors that dropped the connection', ('port',))
+
 class ModbusClient:
     """Modbus RTU client for communication with power meters"""
     
-    def __init__(self, port, baud_rate, device_address=1, timeout=1):
+    def __init__(self, port, baud_rate, device_address=1, timeout=1, engine=None, policy=None):
         self.port = port
         self.baud_rate = baud_rate
         self.device_address = device_address
         self.timeout = timeout
         self.serial = None
+        # Optional SerialEngine that performs the I/O instead of pyserial
+        self.engine = engine
+        # Serializes request/response transactions when several meters share the port
+        self._lock = threading.RLock()
+        # Silent interval required between frames (t3.5), updated on connect
+        self.inter_frame_delay = inter_frame_delay(baud_rate)
+        self._last_frame_end = 0.0
+        # Seconds per character on the wire, updated on connect
+        self.char_time = character_bits() / baud_rate
+        # Exception code of the last read answered with a Modbus exception
+        self.last_exception = None
+        # Retries, backoff and per-unit circuit breaker
+        self.policy = policy or TransactionPolicy.from_config()
+        self.reconnects = 0
+        self._units = {}
+        self._units_lock = threading.Lock()
+        # Learned response times; self.timeout becomes the ceiling
+        from config.settings import CONFIG
+        self.response_times = ResponseTimeEstimator(
+            timeout, CONFIG.get('MODBUS_TIMEOUT_FLOOR', 0.02), CONFIG.get('MODBUS_TIMEOUT_FACTOR', 2.0)
+        ) if CONFIG.get('MODBUS_ADAPTIVE_TIMEOUT', True) else None
+        self.last_rtt = None
+        self._attempt_timeout = None
+        # Time spent on the line, by category
+        self.usage = BusUsage()
+        # Optional callable that wraps each newly opened port (fault injection, replay)
+        self.transport_wrapper = None
+        # Binary record of every transaction attempt, if MODBUS_CAPTURE_PATH is set
+        self.capture = WireCapture.from_config(CONFIG)
+        # Metric series of the port, looked up once
+        self._transactions = {outcome: TRANSACTIONS.labels(port, outcome)
+                              for outcome in ('ok', 'exception', 'timeout', 'invalid')}
+        self._response_seconds = RESPONSE_SECONDS.labels(port)
+        self._serial_errors = SERIAL_ERRORS.labels(port)
         
     def connect(self):
         """Connect to the serial port"""
@@ -50,18 +99,40 @@ class ModbusClient:
             }
             stopbits = stopbits_map.get(CONFIG.get('SERIAL_STOPBITS', 1), serial.STOPBITS_ONE)
             
-            # Create serial connection with all settings
-            self.serial = serial.Serial(
-                port=self.port,
-                baudrate=self.baud_rate,
-                timeout=self.timeout,
-                bytesize=bytesize,
-                parity=parity,
-                stopbits=stopbits,
-                xonxoff=CONFIG.get('SERIAL_XONXOFF', False),
-                rtscts=CONFIG.get('SERIAL_RTSCTS', False),
-                dsrdtr=CONFIG.get('SERIAL_DSRDTR', False)
-            )
+            bits = character_bits(CONFIG.get('SERIAL_BYTESIZE', 8), CONFIG.get('SERIAL_PARITY', 'N'),
+                                  CONFIG.get('SERIAL_STOPBITS', 1))
+            self.char_time = bits / self.baud_rate
+            self.inter_frame_delay = CONFIG.get('MODBUS_TURNAROUND') or inter_frame_delay(self.baud_rate, bits)
+            
+            if self.engine is not None:
+                self.engine.open_port(
+                    self.port, self.port, self.baud_rate,
+                    bytesize=CONFIG.get('SERIAL_BYTESIZE', 8),
+                    parity=CONFIG.get('SERIAL_PARITY', 'N'),
+                    stopbits=CONFIG.get('SERIAL_STOPBITS', 1),
+                    gap=self.inter_frame_delay
+                )
+                return True
+            
+            settings = {
+                'baudrate': self.baud_rate,
+                'timeout': self.timeout,
+                'bytesize': bytesize,
+                'parity': parity,
+                'stopbits': stopbits,
+                'xonxoff': CONFIG.get('SERIAL_XONXOFF', False),
+                'rtscts': CONFIG.get('SERIAL_RTSCTS', False),
+                'dsrdtr': CONFIG.get('SERIAL_DSRDTR', False)
+            }
+            
+            # Create serial connection with all settings. URLs such as
+            # socket://host:port reach RS-485 gateways in RTU-over-TCP mode.
+            if '://' in str(self.port):
+                self.serial = serial.serial_for_url(self.port, **settings)
+            else:
+                self.serial = serial.Serial(port=self.port, **settings)
+            if self.transport_wrapper is not None:
+                self.serial = self.transport_wrapper(self.serial)
             
             logger.info(f"Successfully connected to {self.port}")
             return True
@@ -71,6 +142,9 @@ class ModbusClient:
             
     def disconnect(self):
         """Disconnect from the serial port"""
+        if self.engine is not None:
+            self.engine.close_port(self.port)
+            return
         if self.serial and self.serial.is_open:
             self.serial.close()
             logger.info("Serial connection closed")
@@ -85,53 +159,256 @@ class ModbusClient:
         Returns:
         - Response bytes or None if error
         """
-        if not self.serial or not self.serial.is_open:
-            if not self.connect():
-                return None
+        if self.engine is not None and self.engine.failed:
+            with self._lock:
+                if self.engine is not None:
+                    logger.warning(f"Serial engine failed ({self.engine.error}), using {self.port} directly")
+                    self.engine = None
+        if self.engine is not None:
+            return self._send_via_engine(command)
+        
+        with self._lock:
+            if not self.serial or not self.serial.is_open:
+                if not self.connect():
+                    return None
+            
+            try:
+                # Only wait out whatever is left of the inter-frame gap, so
+                # requests to different units go out back-to-back
+                remaining = self._last_frame_end + self.inter_frame_delay - time.monotonic()
+                if remaining > 0:
+                    with TRACER.span('line_wait'):
+                        time.sleep(remaining)
+                
+                # Clear any pending data
+                self.serial.reset_input_buffer()
+                
+                # Use the learned response timeout of this attempt, if any
+                timeout = self._attempt_timeout or self.timeout
+                if getattr(self.serial, 'timeout', timeout) != timeout:
+                    self.serial.timeout = timeout
+                
+                # Send the command
+                write_started = time.monotonic()
+                with TRACER.span('transmit', bytes=len(command)):
+                    self.serial.write(command)
                 
+                # Calculate expected response length
+                expected_length = get_expected_response_length(command)
+                
+                # Read response
+                with TRACER.span('receive', expected=expected_length) as receive:
+                    response = self.serial.read(expected_length)
+                    receive.set(bytes=len(response), timeout=timeout)
+                self._last_frame_end = time.monotonic()
+                self.last_rtt = self._last_frame_end - write_started
+                
+                # Log the response
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Received response: %s", binascii.hexlify(response).decode())
+                
+                return response
+            except Exception as e:
+                logger.error(f"Error sending command: {str(e)}")
+                self._drop_connection()
+                return None
+    
+    def _drop_connection(self):
+        """Close the port after an I/O error so the next attempt reconnects"""
+        self.reconnects += 1
+        self._serial_errors.inc()
         try:
-            # Clear any pending data
-            self.serial.reset_input_buffer()
-            
-            # Send the command
-            self.serial.write(command)
-            
-            # Calculate expected response length
-            expected_length = get_expected_response_length(command)
-            
-            # Read response
-            response = self.serial.read(expected_length)
-            
-            # Log the response
-            logger.debug(f"Received response: {binascii.hexlify(response).decode()}")
-            
-            return response
+            self.disconnect()
         except Exception as e:
-            logger.error(f"Error sending command: {str(e)}")
+            logger.debug(f"Error closing {self.port} after I/O error: {str(e)}")
+        self.serial = None
+    
+    def _health(self, unit):
+        """Get the health record of a unit"""
+        with self._units_lock:
+            health = self._units.get(unit)
+            if health is None:
+                health = self._units[unit] = DeviceHealth(unit)
+            return health
+    
+    def _transact(self, command):
+        """
+        Send a command under the transaction policy
+        
+        Requests with no usable response are retried, and requests to a unit
+        whose circuit is open fail immediately.
+        
+        Parameters:
+        - command: The command bytes to send
+        
+        Returns:
+        - Valid response frame (possibly a Modbus exception response), or None
+        """
+        policy = self.policy
+        unit = command[0]
+        health = self._health(unit)
+        expected_length = get_expected_response_length(command)
+        span = TRACER.span('transaction', unit=unit, function=command[1])
+        with self._lock, span:
+            started = time.monotonic()
+            if not policy.admit(health, started):
+                span.set(outcome='quarantined')
+                return None
+            timeouts = 0
+            try:
+                for attempt in range(policy.attempts(health)):
+                    if attempt:
+                        delay = policy.retry_delay(attempt)
+                        if policy.budget is not None and time.monotonic() + delay - started >= policy.budget:
+                            break
+                        if delay:
+                            with TRACER.span('retry_delay'):
+                                time.sleep(delay)
+                        health.retries += 1
+                    health.attempts += 1
+                    self._attempt_timeout = self._response_timeout(unit, command, expected_length, timeouts)
+                    self.last_rtt = None
+                    sent = time.monotonic()
+                    response = self.send_command(command)
+                    now = time.monotonic()
+                    rtt = self.last_rtt if self.last_rtt is not None else now - sent
+                    self.usage.record(len(command), len(response or b''), rtt,
+                                      self.char_time, self.inter_frame_delay)
+                    valid = self._valid_response(command, response)
+                    if self.capture is not None:
+                        self.capture.record(command, response, rtt, valid)
+                    if valid:
+                        self._transactions['exception' if response[1] & 0x80 else 'ok'].inc()
+                        self._response_seconds.observe(rtt)
+                        span.set(attempts=attempt + 1, outcome='exception' if response[1] & 0x80 else 'ok')
+                        if self.response_times is not None:
+                            self.response_times.record(unit, expected_length, rtt,
+                                                       (len(command) + len(response)) * self.char_time)
+                        if response[1] & 0x80:
+                            health.exceptions += 1
+                        policy.record(health, True, rtt, now, self.port)
+                        return response
+                    self._transactions['invalid' if response else 'timeout'].inc()
+                    if response:
+                        logger.warning("Discarding invalid response from unit %d: %s",
+                                       unit, binascii.hexlify(response).decode())
+                    else:
+                        timeouts += 1
+            finally:
+                self._attempt_timeout = None
+            span.set(outcome='failed')
+            policy.record(health, False, None, time.monotonic(), self.port)
             return None
     
-    def read_registers(self, register_address, register_count=1):
+    def _response_timeout(self, unit, command, expected_length, timeouts):
+        """
+        Response timeout for an attempt
+        
+        The learned timeout doubles after each timed-out attempt, so a device
+        that has become slower is not cut off on every retry.
+        
+        Returns:
+        - Timeout in seconds, or None to use the static timeout
+        """
+        if self.response_times is None:
+            return None
+        wire_time = (len(command) + expected_length) * self.char_time
+        timeout = self.response_times.timeout(unit, expected_length, wire_time)
+        return min(self.timeout, timeout * (2 ** timeouts))
+    
+    @staticmethod
+    def _valid_response(command, response):
+        """Check that a response is a whole frame from the addressed unit with a good CRC"""
+        if not response or len(response) < 5:
+            return False
+        if response[0] != command[0] or (response[1] & 0x7F) != command[1]:
+            return False
+        return calculate_crc(response[:-2]) == bytes(response[-2:])
+    
+    def is_quarantined(self, unit):
+        """
+        Check whether a unit's circuit is open and not yet due for a probe
+        
+        Parameters:
+        - unit: Modbus unit ID
+        """
+        health = self._health(unit)
+        return health.quarantined and time.monotonic() < health.quarantined_until
+    
+    def unit_status(self, unit=None):
+        """
+        Get per-unit success rate, latency and circuit state
+        
+        Parameters:
+        - unit: Unit ID, or None for every unit seen on the port
+        
+        Returns:
+        - Status dictionary for the unit, or a list for all units
+        """
+        now = time.monotonic()
+        if unit is not None:
+            return self._unit_dict(self._health(unit), now)
+        with self._units_lock:
+            units = list(self._units.values())
+        return [self._unit_dict(health, now) for health in units]
+    
+    def _unit_dict(self, health, now):
+        """Status of a unit including its learned response times"""
+        status = health.to_dict(now)
+        if self.response_times is not None:
+            status['response_times'] = self.response_times.stats(health.unit)
+        return status
+    
+    def _send_via_engine(self, command):
+        """Send a command through the serial engine, which handles turnaround and timeout"""
+        with self._lock:
+            if not self.engine.has_port(self.port) and not self.connect():
+                return None
+            try:
+                # The engine starts the response timeout once the request is written
+                timeout = self._attempt_timeout or self.timeout
+                timeout = max(0.0, timeout - len(command) * self.char_time)
+                with TRACER.span('engine', timeout=timeout):
+                    transaction = self.engine.submit(self.port, command,
+                                                     get_expected_response_length(command), timeout)
+                    response = transaction.wait(timeout + 5) or b''
+                if transaction.sent is not None and transaction.finished is not None:
+                    self.last_rtt = transaction.finished - transaction.sent
+                if transaction.error and transaction.error != 'timeout':
+                    raise OSError(transaction.error)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Received response: %s", binascii.hexlify(response).decode())
+                return response
+            except Exception as e:
+                logger.error(f"Error sending command: {str(e)}")
+                self._drop_connection()
+                return None
+                
+    def read_registers(self, register_address, register_count=1, unit=None):
         """
         Read holding registers from the device
         
         Parameters:
         - register_address: Starting register address
         - register_count: Number of registers to read
+        - unit: Modbus unit ID (defaults to device_address)
         
         Returns:
         - List of register values or None if error
         """
+        self.last_exception = None
         try:
             # Build the command
-            command = build_command(
-                self.device_address, 
-                3,  # Function code 3 = Read Holding Registers
-                register_address, 
-                register_count
-            )
+            with TRACER.span('build', address=register_address, count=register_count):
+                command = build_command(
+                    self.device_address if unit is None else unit, 
+                    3,  # Function code 3 = Read Holding Registers
+                    register_address, 
+                    register_count
+                )
             
             # Send the command
-            response = self.send_command(command)
+            response = self._transact(command)
             
             if not response or len(response) < 3:
                 logger.warning(f"Invalid response when reading registers from {register_address}")
@@ -140,6 +417,7 @@ class ModbusClient:
             # Check for Modbus error response
             if (response[1] & 0x80) != 0:
                 error_code = response[2]
+                self.last_exception = error_code
                 logger.error(f"Modbus error when reading registers: function={response[1]}, error={error_code}")
                 return None
                 
@@ -154,20 +432,21 @@ class ModbusClient:
                 value = (high_byte << 8) | low_byte
                 registers.append(value)
                 
-            logger.debug(f"Read {len(registers)} registers from {register_address}: {registers}")
+            logger.debug("Read %d registers from %d: %s", len(registers), register_address, registers)
             return registers
             
         except Exception as e:
             logger.error(f"Error reading registers from {register_address}: {str(e)}")
             return None
     
-    def write_register(self, register_address, value):
+    def write_register(self, register_address, value, unit=None):
         """
         Write a single register value
         
         Parameters:
         - register_address: Register address to write to
         - value: Value to write
+        - unit: Modbus unit ID (defaults to device_address)
         
         Returns:
         - True if successful, False otherwise
@@ -175,7 +454,7 @@ class ModbusClient:
         try:
             # Build the command
             command = build_command(
-                self.device_address,
+                self.device_address if unit is None else unit,
                 6,  # Function code 6 = Write Single Register
                 register_address,
                 1,  # Count is always 1 for single register write
@@ -183,7 +462,7 @@ class ModbusClient:
             )
             
             # Send the command
-            response = self.send_command(command)
+            response = self._transact(command)
             
             if not response or len(response) < 6:
                 logger.warning(f"Invalid response when writing to register {register_address}")
@@ -208,6 +487,53 @@ class ModbusClient:
             logger.error(f"Error writing to register {register_address}: {str(e)}")
             return False
     
+    def write_registers(self, register_address, values, unit=None):
+        """
+        Write consecutive register values in one request
+        
+        Parameters:
+        - register_address: First register address to write to
+        - values: List of values to write
+        - unit: Modbus unit ID (defaults to device_address)
+        
+        Returns:
+        - True if successful, False otherwise
+        """
+        try:
+            # Build the command
+            command = build_command(
+                self.device_address if unit is None else unit,
+                16,  # Function code 16 = Write Multiple Registers
+                register_address,
+                len(values),
+                list(values)
+            )
+            
+            # Send the command
+            response = self._transact(command)
+            
+            if not response or len(response) < 6:
+                logger.warning(f"Invalid response when writing to registers from {register_address}")
+                return False
+            
+            # Check for Modbus error response
+            if (response[1] & 0x80) != 0:
+                error_code = response[2]
+                logger.error(f"Modbus error when writing registers: function={response[1]}, error={error_code}")
+                return False
+            
+            # The response echoes the start address and register count
+            if response[2:6] != command[2:6]:
+                logger.warning(f"Response mismatch when writing to registers from {register_address}")
+                return False
+            
+            logger.info(f"Successfully wrote {len(values)} values to registers from {register_address}")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error writing to registers from {register_address}: {str(e)}")
+            return False
+    
     def execute_raw_command(self, command_bytes):
         """
         Execute a raw Modbus command and return the response
@@ -0,0 +1,359 @@
+"""
+Modbus RTU slave emulator on a pseudo-terminal, for end-to-end tests and benchmarks
+
+The emulator owns the master side of a pty pair; PowerMeterReader (or any
+ModbusClient) opens the slave side by path exactly as it would a USB
+adapter, so the real serial, framing, CRC and decode paths are exercised.
+Responses are held back for the time the frames would spend on the wire at
+the configured line settings, plus the t3.5 turnaround and a configurable
+device latency. The same RTU frames can optionally be served over TCP for
+clients using socket:// URLs.
+"""
+import logging
+import os
+import selectors
+import socket
+import threading
+import time
+
+try:
+    import tty
+except ImportError:  # pty support is POSIX only
+    tty = None
+
+from modbus.protocol import calculate_crc, character_bits, inter_frame_delay
+
+logger = logging.getLogger('powermeter.modbus.emulator')
+
+# Seconds an incomplete request may sit in a buffer before it is discarded
+PARTIAL_FRAME_TIMEOUT = 0.5
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+
+def request_length(buffer):
+    """
+    Length of the request frame at the start of a buffer
+    
+    Returns:
+    - Frame length, None if more bytes are needed to tell, or 0 for
+      function codes whose length is unknown (framed by silence instead)
+    """
+    if len(buffer) < 2:
+        return None
+    function = buffer[1]
+    if function in (3, 4, 6):
+        return 8
+    if function == 16:
+        return 9 + buffer[6] if len(buffer) >= 7 else None
+    return 0
+
+class _Channel:
+    """One byte stream the emulator answers on (the pty, or a TCP connection)"""
+    
+    def __init__(self, name, fd=None, sock=None):
+        self.name = name
+        self.fd = fd
+        self.sock = sock
+        self.buffer = bytearray()
+        self.last_received = 0.0
+        self.outgoing = bytearray()
+    
+    def fileno(self):
+        return self.sock.fileno() if self.sock is not None else self.fd
+    
+    def read(self):
+        if self.sock is not None:
+            return self.sock.recv(4096)
+        return os.read(self.fd, 4096)
+    
+    def write(self, data):
+        if self.sock is not None:
+            return self.sock.send(data)
+        return os.write(self.fd, data)
+
+class RTUSlaveEmulator:
+    """Emulated Modbus RTU slaves answering FC3/FC4/FC6/FC16 from register images"""
+    
+    def __init__(self, units, baud_rate=9600, latency=0.0, bytesize=8, parity='N', stopbits=1,
+                 tcp_port=None, tcp_host='127.0.0.1', on_write=None):
+        """
+        Initialize the emulator
+        
+        Parameters:
+        - units: Dictionary mapping unit ID to a register image (a dictionary of
+          4xxxx address -> value, or a callable returning one)
+        - baud_rate: Emulated line speed
+        - latency: Device processing time in seconds, or a callable(unit, request) returning it
+        - bytesize: Data bits of the emulated line
+        - parity: Parity of the emulated line ('N', 'E', 'O', 'M' or 'S')
+        - stopbits: Stop bits of the emulated line
+        - tcp_port: Also serve RTU frames on this TCP port (0 picks a free port)
+        - tcp_host: Interface for the TCP port
+        - on_write: Optional callable(unit, address, values) run for every accepted write
+        """
+        self.units = dict(units)
+        self.baud_rate = baud_rate
+        self.latency = latency
+        self.char_time = character_bits(bytesize, parity, stopbits) / baud_rate
+        self.turnaround = inter_frame_delay(baud_rate, character_bits(bytesize, parity, stopbits))
+        self.tcp_port = tcp_port
+        self.tcp_host = tcp_host
+        self.on_write = on_write
+        self.port = None
+        self.tcp_address = None
+        self.requests = 0
+        self.responses = 0
+        self.exceptions = 0
+        self.crc_errors = 0
+        self._master = None
+        self._slave = None
+        self._listener = None
+        self._selector = None
+        self._pending = []
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Open the pty (and TCP port) and start answering requests"""
+        if tty is None:
+            raise OSError("Pseudo-terminals are not available on this platform")
+        self._selector = selectors.DefaultSelector()
+        self._master, self._slave = os.openpty()
+        # Raw mode, so the line discipline neither echoes nor translates bytes
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._selector.register(self._master, selectors.EVENT_READ, _Channel('pty', fd=self._master))
+        
+        if self.tcp_port is not None:
+            self._listener = socket.create_server((self.tcp_host, self.tcp_port))
+            self._listener.setblocking(False)
+            self.tcp_address = self._listener.getsockname()[:2]
+            self._selector.register(self._listener, selectors.EVENT_READ, None)
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='rtu-emulator')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info(f"RTU slave emulator for units {sorted(self.units)} on {self.port}"
+                    + (f" and tcp {self.tcp_address[0]}:{self.tcp_address[1]}" if self.tcp_address else ""))
+    
+    def stop(self):
+        """Stop answering and close the pty and sockets"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._selector is not None:
+            for key in list(self._selector.get_map().values()):
+                if key.data is not None and key.data.sock is not None:
+                    key.data.sock.close()
+            self._selector.close()
+            self._selector = None
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+    
+    def stats(self):
+        """
+        Get request counters
+        
+        Returns:
+        - Dictionary with requests, responses, exception responses and CRC errors
+        """
+        return {
+            'requests': self.requests,
+            'responses': self.responses,
+            'exceptions': self.exceptions,
+            'crc_errors': self.crc_errors
+        }
+    
+    def _run(self):
+        """Event loop serving every channel"""
+        while not self._stop.is_set():
+            now = time.monotonic()
+            timeout = 0.05
+            if self._pending:
+                timeout = max(0.0, min(timeout, min(due for due, _, _ in self._pending) - now))
+            for key, events in self._selector.select(timeout):
+                if key.data is None:
+                    self._accept()
+                    continue
+                if events & selectors.EVENT_READ and not self._receive(key.data):
+                    continue
+                if events & selectors.EVENT_WRITE:
+                    self._flush(key.data)
+            now = time.monotonic()
+            self._frame_by_silence(now)
+            self._send_due(now)
+    
+    def _accept(self):
+        """Accept a TCP client"""
+        try:
+            sock, address = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        self._selector.register(sock, selectors.EVENT_READ, _Channel(f'tcp {address[0]}:{address[1]}', sock=sock))
+    
+    def _close(self, channel):
+        """Forget a TCP client that went away"""
+        self._selector.unregister(channel.sock)
+        channel.sock.close()
+        self._pending = [entry for entry in self._pending if entry[1] is not channel]
+    
+    def _receive(self, channel):
+        """
+        Read request bytes and answer every complete frame
+        
+        Returns:
+        - False if the channel was closed
+        """
+        try:
+            data = channel.read()
+        except BlockingIOError:
+            return True
+        except OSError:
+            # EIO on the pty master while no client has the slave open
+            data = None
+        if channel.sock is not None and not data:
+            self._close(channel)
+            return False
+        if not data:
+            return True
+        
+        now = time.monotonic()
+        if channel.buffer and now - channel.last_received > PARTIAL_FRAME_TIMEOUT:
+            channel.buffer.clear()
+        channel.buffer += data
+        channel.last_received = now
+        while channel.buffer:
+            length = request_length(channel.buffer)
+            if not length or len(channel.buffer) < length:
+                break
+            frame = bytes(channel.buffer[:length])
+            del channel.buffer[:length]
+            self._handle(channel, frame, now)
+        return True
+    
+    def _frame_by_silence(self, now):
+        """Treat buffered bytes of unknown length as a frame once the line is quiet"""
+        for key in self._selector.get_map().values():
+            channel = key.data
+            if (channel is not None and channel.buffer and request_length(channel.buffer) == 0
+                    and now - channel.last_received >= self.turnaround):
+                frame = bytes(channel.buffer)
+                channel.buffer.clear()
+                self._handle(channel, frame, channel.last_received)
+    
+    def _handle(self, channel, frame, received):
+        """Validate a request frame and schedule the response"""
+        if len(frame) < 4 or calculate_crc(frame[:-2]) != frame[-2:]:
+            # A real slave ignores frames with a bad CRC
+            self.crc_errors += 1
+            channel.buffer.clear()
+            return
+        unit = frame[0]
+        if unit != 0 and unit not in self.units:
+            return
+        self.requests += 1
+        pdu = self._process(unit, frame[1:-2])
+        if unit == 0 or pdu is None:
+            # Broadcasts are never answered
+            return
+        response = bytes([unit]) + pdu
+        response += calculate_crc(response)
+        latency = self.latency(unit, frame) if callable(self.latency) else self.latency
+        due = (received + len(frame) * self.char_time + self.turnaround + latency
+               + len(response) * self.char_time)
+        self._pending.append((due, channel, response))
+    
+    def _send_due(self, now):
+        """Write responses whose emulated wire time has passed"""
+        if not self._pending:
+            return
+        due = [entry for entry in self._pending if entry[0] <= now]
+        if not due:
+            return
+        self._pending = [entry for entry in self._pending if entry[0] > now]
+        for _, channel, response in sorted(due, key=lambda entry: entry[0]):
+            channel.outgoing += response
+            self.responses += 1
+            self._flush(channel)
+    
+    def _flush(self, channel):
+        """Write as much pending output as the channel accepts"""
+        try:
+            written = channel.write(bytes(channel.outgoing)) if channel.outgoing else 0
+        except BlockingIOError:
+            written = 0
+        except OSError:
+            channel.outgoing.clear()
+            return
+        del channel.outgoing[:written]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if channel.outgoing else 0)
+        self._selector.modify(channel.fileno(), events, channel)
+    
+    def _image(self, unit):
+        """Current register image of a unit"""
+        image = self.units[unit]
+        return image() if callable(image) else image
+    
+    def _exception(self, function, code):
+        self.exceptions += 1
+        return bytes([function | 0x80, code])
+    
+    def _process(self, unit, pdu):
+        """
+        Execute a request PDU
+        
+        Returns:
+        - Response PDU
+        """
+        function = pdu[0]
+        if function in (3, 4):
+            address = 40001 + ((pdu[1] << 8) | pdu[2])
+            count = (pdu[3] << 8) | pdu[4]
+            if not 1 <= count <= 125:
+                return self._exception(function, ILLEGAL_DATA_VALUE)
+            image = self._image(unit)
+            values = [image.get(address + i) for i in range(count)]
+            if None in values:
+                return self._exception(function, ILLEGAL_DATA_ADDRESS)
+            data = bytearray([function, count * 2])
+            for value in values:
+                data += bytes([(value >> 8) & 0xFF, value & 0xFF])
+            return bytes(data)
+        
+        if function == 6:
+            address = 40001 + ((pdu[1] << 8) | pdu[2])
+            self._write(unit, address, [(pdu[3] << 8) | pdu[4]])
+            return bytes(pdu)
+        
+        if function == 16:
+            address = 40001 + ((pdu[1] << 8) | pdu[2])
+            count = (pdu[3] << 8) | pdu[4]
+            if not 1 <= count <= 123 or pdu[5] != count * 2 or len(pdu) != 6 + count * 2:
+                return self._exception(function, ILLEGAL_DATA_VALUE)
+            values = [(pdu[6 + 2 * i] << 8) | pdu[7 + 2 * i] for i in range(count)]
+            self._write(unit, address, values)
+            return bytes(pdu[:5])
+        
+        return self._exception(function, ILLEGAL_FUNCTION)
+    
+    def _write(self, unit, address, values):
+        """Apply a write to one unit, or to every unit for a broadcast"""
+        for target in (sorted(self.units) if unit == 0 else [unit]):
+            image = self.units[target]
+            if isinstance(image, dict):
+                for offset, value in enumerate(values):
+                    image[address + offset] = value
+            if self.on_write is not None:
+                self.on_write(target, address, values)
\ No newline at end of file
@@ -0,0 +1,385 @@
+"""
+Fault injection for the serial transport and the simulators
+
+A FaultInjector decides, request by request, whether a transaction
+suffers a fault: a corrupted CRC, a truncated frame, an exception response,
+no response at all, a dropped connection, or extra device latency. The
+decisions come from a seeded random profile plus scripted scenarios such
+as "unit 3 stalls for 30 s after one minute". The same injector can wrap
+the pyserial port of a ModbusClient (so the real retry, timeout and
+reconnect logic runs against the faults) or a simulator's client
+stand-in (so faults play out on a simulated clock).
+"""
+import logging
+import math
+import random
+import threading
+import time
+
+import serial
+
+from modbus.protocol import calculate_crc
+
+logger = logging.getLogger('powermeter.modbus.faults')
+
+# Faults a transaction can suffer, in the order probabilities are applied
+FAULTS = ('disconnect', 'timeout', 'crc', 'truncate', 'exception')
+
+# Scenario faults that are another name for a transport fault
+FAULT_ALIASES = {'stall': 'timeout', 'unplug': 'disconnect'}
+
+# Exception code used for injected exception responses (server device busy)
+INJECTED_EXCEPTION = 0x06
+
+class FaultProfile:
+    """Probabilities of each fault and the distribution of added latency"""
+    
+    def __init__(self, name='custom', latency=None, **probabilities):
+        """
+        Initialize a profile
+        
+        Parameters:
+        - name: Name shown in reports
+        - latency: Added device latency as (kind, a, b): ('fixed', seconds),
+          ('uniform', low, high), ('exponential', mean) or ('lognormal', median, sigma)
+        - probabilities: Per-request probability of each fault in FAULTS
+        """
+        unknown = set(probabilities) - set(FAULTS)
+        if unknown:
+            raise ValueError(f"Unknown faults: {', '.join(sorted(unknown))}")
+        if sum(probabilities.values()) > 1:
+            raise ValueError("Fault probabilities add up to more than 1")
+        self.name = name
+        self.latency = latency
+        self.probabilities = {fault: probabilities.get(fault, 0.0) for fault in FAULTS}
+    
+    def sample_latency(self, rng):
+        """
+        Draw an added latency
+        
+        Parameters:
+        - rng: random.Random to draw from
+        
+        Returns:
+        - Seconds
+        """
+        if not self.latency:
+            return 0.0
+        kind, *args = self.latency
+        if kind == 'fixed':
+            return args[0]
+        if kind == 'uniform':
+            return rng.uniform(args[0], args[1])
+        if kind == 'exponential':
+            return rng.expovariate(1 / args[0])
+        if kind == 'lognormal':
+            return rng.lognormvariate(math.log(args[0]), args[1])
+        raise ValueError(f"Unknown latency distribution: {kind}")
+    
+    def to_dict(self):
+        """Convert to a dictionary for reports"""
+        return {'name': self.name, 'latency': self.latency, **self.probabilities}
+
+# Named profiles for benchmarks and tests
+PROFILES = {
+    'clean': FaultProfile('clean'),
+    'noisy_line': FaultProfile('noisy_line', crc=0.03, truncate=0.01),
+    'slow_meter': FaultProfile('slow_meter', latency=('lognormal', 0.03, 0.8), timeout=0.01),
+    'flaky_meter': FaultProfile('flaky_meter', latency=('exponential', 0.01), timeout=0.05,
+                                exception=0.02),
+    'usb_dropouts': FaultProfile('usb_dropouts', disconnect=0.02, timeout=0.01),
+}
+
+class FaultEvent:
+    """A scripted fault for a unit (or every unit) during a time window"""
+    
+    def __init__(self, at, duration, fault=None, unit=None, latency=0.0):
+        """
+        Initialize an event
+        
+        Parameters:
+        - at: Seconds after the injector starts
+        - duration: Seconds the event lasts
+        - fault: Fault from FAULTS or FAULT_ALIASES applied to every request, or None
+        - unit: Unit ID affected, or None for all units
+        - latency: Seconds of latency added to every request
+        """
+        fault = FAULT_ALIASES.get(fault, fault)
+        if fault is not None and fault not in FAULTS:
+            raise ValueError(f"Unknown fault: {fault}")
+        self.at = at
+        self.duration = duration
+        self.fault = fault
+        self.unit = unit
+        self.latency = latency
+    
+    def active(self, elapsed, unit):
+        """Check whether the event applies to a request"""
+        return (self.at <= elapsed < self.at + self.duration
+                and (self.unit is None or self.unit == unit))
+
+class FaultScenario:
+    """Scripted sequence of fault events"""
+    
+    def __init__(self, events=()):
+        self.events = list(events)
+    
+    @classmethod
+    def from_list(cls, entries):
+        """
+        Build a scenario from dictionaries, e.g. loaded from JSON
+        
+        Parameters:
+        - entries: List of {'at', 'for', 'fault', 'unit', 'latency'} dictionaries
+        
+        Returns:
+        - FaultScenario
+        """
+        return cls(FaultEvent(entry['at'], entry['for'], entry.get('fault'), entry.get('unit'),
+                              entry.get('latency', 0.0)) for entry in entries)
+    
+    def add(self, fault, at, duration, unit=None, latency=0.0):
+        """
+        Add an event, e.g. scenario.add('stall', at=60, duration=30, unit=3)
+        
+        Returns:
+        - The scenario, so calls can be chained
+        """
+        self.events.append(FaultEvent(at, duration, fault, unit, latency))
+        return self
+    
+    def active(self, elapsed, unit):
+        """
+        Get the events that apply to a request
+        
+        Returns:
+        - List of active FaultEvent objects
+        """
+        return [event for event in self.events if event.active(elapsed, unit)]
+
+class FaultInjector:
+    """Decides the fault of every transaction from a profile and a scenario"""
+    
+    def __init__(self, profile=None, scenario=None, seed=None, clock=None):
+        """
+        Initialize the injector
+        
+        Parameters:
+        - profile: FaultProfile or name from PROFILES (defaults to 'clean')
+        - scenario: Optional FaultScenario, timed from the injector's creation
+        - seed: Random seed for a reproducible sequence of faults
+        - clock: Clock with monotonic() and sleep() that times the scenario and,
+          in simulator mode, the injected delays (defaults to real time)
+        """
+        if isinstance(profile, str):
+            profile = PROFILES[profile]
+        self.profile = profile or PROFILES['clean']
+        self.scenario = scenario or FaultScenario()
+        self.clock = clock
+        self.requests = 0
+        self.injected = {fault: 0 for fault in FAULTS}
+        self.latency_total = 0.0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.started = self._now()
+    
+    def _now(self):
+        return self.clock.monotonic() if self.clock is not None else time.monotonic()
+    
+    def _sleep(self, seconds):
+        """Let time pass on the injector's clock (simulator mode)"""
+        if seconds > 0:
+            if self.clock is not None:
+                self.clock.sleep(seconds)
+            else:
+                time.sleep(seconds)
+    
+    def decide(self, unit):
+        """
+        Decide the fate of one request
+        
+        Parameters:
+        - unit: Unit ID the request is addressed to
+        
+        Returns:
+        - (fault or None, added latency in seconds)
+        """
+        with self._lock:
+            self.requests += 1
+            elapsed = self._now() - self.started
+            fault = None
+            latency = 0.0
+            for event in self.scenario.active(elapsed, unit):
+                fault = fault or event.fault
+                latency += event.latency
+            if fault is None:
+                draw = self._rng.random()
+                for name in FAULTS:
+                    draw -= self.profile.probabilities[name]
+                    if draw < 0:
+                        fault = name
+                        break
+            latency += self.profile.sample_latency(self._rng)
+            if fault is not None:
+                self.injected[fault] += 1
+            self.latency_total += latency
+            return fault, latency
+    
+    def corrupt(self, response):
+        """Flip one bit of a response"""
+        with self._lock:
+            position = self._rng.randrange(len(response))
+            bit = 1 << self._rng.randrange(8)
+        data = bytearray(response)
+        data[position] ^= bit
+        return bytes(data)
+    
+    def truncate(self, response):
+        """Cut a response short"""
+        with self._lock:
+            return response[:self._rng.randrange(1, len(response))] if len(response) > 1 else b''
+    
+    def stats(self):
+        """
+        Get injection counters
+        
+        Returns:
+        - Dictionary with the profile, requests seen and faults injected
+        """
+        with self._lock:
+            return {
+                'profile': self.profile.name,
+                'requests': self.requests,
+                'injected': dict(self.injected),
+                'avg_added_latency_ms': self.latency_total / self.requests * 1000 if self.requests else 0.0
+            }
+    
+    def attach(self, client):
+        """
+        Inject faults into a ModbusClient's serial port, from its next connection on
+        
+        Parameters:
+        - client: ModbusClient (or SharedBusClient) using pyserial
+        
+        Returns:
+        - The client
+        """
+        client.transport_wrapper = lambda port: FaultyTransport(port, self)
+        port = client.serial
+        if port is not None:
+            if isinstance(port, FaultyTransport):
+                # Replace an earlier injector rather than stacking faults
+                port = port.port
+            client.serial = FaultyTransport(port, self)
+        return client
+    
+    def wrap_client(self, client, timeout=1.0):
+        """
+        Inject faults into a simulator's client stand-in
+        
+        Parameters:
+        - client: Object with read_registers(address, count, unit), such as
+          PowerMeterSimulator or a TraceReplayClient
+        - timeout: Clock seconds a request without a response costs
+        
+        Returns:
+        - FaultyClient
+        """
+        return FaultyClient(client, self, timeout)
+
+def exception_response(request, code=INJECTED_EXCEPTION):
+    """Build the exception response a device would send to a request"""
+    frame = bytes([request[0], request[1] | 0x80, code])
+    return frame + calculate_crc(frame)
+
+class FaultyTransport:
+    """pyserial port wrapper that applies the injector's faults to each transaction"""
+    
+    def __init__(self, port, injector):
+        self.port = port
+        self.injector = injector
+        self._pending = None
+    
+    @property
+    def is_open(self):
+        return self.port.is_open
+    
+    @property
+    def timeout(self):
+        return self.port.timeout
+    
+    @timeout.setter
+    def timeout(self, value):
+        self.port.timeout = value
+    
+    def reset_input_buffer(self):
+        self.port.reset_input_buffer()
+    
+    def close(self):
+        self.port.close()
+    
+    def write(self, data):
+        fault, latency = self.injector.decide(data[0])
+        if fault == 'disconnect':
+            self._pending = None
+            raise serial.SerialException("Injected disconnect")
+        self._pending = (fault, latency, bytes(data))
+        return self.port.write(data)
+    
+    def read(self, size):
+        fault, latency, request = self._pending or (None, 0.0, None)
+        self._pending = None
+        started = time.monotonic()
+        response = self.port.read(size)
+        timeout = self.port.timeout
+        if fault == 'timeout' or (latency and time.monotonic() - started + latency >= timeout):
+            # The device never answers in time: the client waits out its timeout
+            time.sleep(max(0.0, timeout - (time.monotonic() - started)))
+            return b''
+        if latency:
+            time.sleep(latency)
+        if not response:
+            return response
+        if fault == 'crc':
+            return self.injector.corrupt(response)
+        if fault == 'truncate':
+            return self.injector.truncate(response)
+        if fault == 'exception':
+            return exception_response(request)
+        return response
+
+class FaultyClient:
+    """
+    Client stand-in wrapper applying faults at the register level
+    
+    There is no frame to corrupt here, so each fault becomes what the
+    ModbusClient would report after it: a failed read (None), with
+    last_exception set for exception responses. Timeouts and latency
+    pass on the injector's clock.
+    """
+    
+    def __init__(self, client, injector, timeout=1.0):
+        self.client = client
+        self.injector = injector
+        self.timeout = timeout
+        self.last_exception = None
+    
+    def __getattr__(self, name):
+        # Everything else (char_time, connect, ...) is the wrapped client's
+        return getattr(self.client, name)
+    
+    def read_registers(self, register_address, register_count=1, unit=None):
+        fault, latency = self.injector.decide(unit if unit is not None else getattr(self.client, 'device_address', 1))
+        self.last_exception = None
+        if fault in ('timeout', 'disconnect') or latency >= self.timeout:
+            self.injector._sleep(self.timeout)
+            return None
+        self.injector._sleep(latency)
+        if fault == 'exception':
+            self.last_exception = INJECTED_EXCEPTION
+            return None
+        if fault in ('crc', 'truncate'):
+            return None
+        registers = self.client.read_registers(register_address, register_count, unit=unit)
+        self.last_exception = getattr(self.client, 'last_exception', None)
+        return registers
\ No newline at end of file
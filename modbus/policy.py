@@ -0,0 +1,171 @@
+"""
+Retry, backoff and circuit breaker policy for Modbus transactions
+"""
+import logging
+
+logger = logging.getLogger('powermeter.modbus.policy')
+
+class DeviceHealth:
+    """Transaction statistics and circuit state for one unit ID"""
+    
+    def __init__(self, unit):
+        self.unit = unit
+        self.requests = 0
+        self.responses = 0
+        self.exceptions = 0
+        self.attempts = 0
+        self.retries = 0
+        self.skipped = 0
+        self.consecutive_failures = 0
+        self.quarantined_until = None
+        self.backoff = None
+        self.quarantines = 0
+        self.last_latency = None
+        self.max_latency = None
+        self._latency_total = 0.0
+    
+    @property
+    def quarantined(self):
+        """True while the unit's circuit is open"""
+        return self.quarantined_until is not None
+    
+    @property
+    def success_rate(self):
+        """Fraction of transactions that got a response, or None before the first one"""
+        return self.responses / self.requests if self.requests else None
+    
+    def to_dict(self, now):
+        """Convert to a dictionary for status reporting"""
+        return {
+            'unit': self.unit,
+            'requests': self.requests,
+            'responses': self.responses,
+            'exceptions': self.exceptions,
+            'attempts': self.attempts,
+            'retries': self.retries,
+            'skipped': self.skipped,
+            'success_rate': self.success_rate,
+            'latency_ms': {
+                'last': self.last_latency * 1000 if self.last_latency is not None else None,
+                'avg': self._latency_total / self.responses * 1000 if self.responses else None,
+                'max': self.max_latency * 1000 if self.max_latency is not None else None
+            },
+            'consecutive_failures': self.consecutive_failures,
+            'quarantined': self.quarantined,
+            'next_probe_in': max(0.0, self.quarantined_until - now) if self.quarantined else None,
+            'quarantines': self.quarantines
+        }
+
+class TransactionPolicy:
+    """
+    Decides how often a transaction is attempted and when a unit is left alone
+    
+    A transaction with no usable response is retried: the first retry goes
+    out immediately, later ones after an exponentially growing delay, until
+    the retries or the transaction's time budget run out. After a number of
+    consecutive failed transactions the unit's circuit opens: requests to it
+    fail immediately, and one request is let through as a probe whenever
+    the (doubling) open backoff expires.
+    """
+    
+    def __init__(self, retries=3, retry_backoff=0.05, budget=None,
+                 failure_threshold=3, open_backoff=5.0, max_open_backoff=300.0):
+        """
+        Initialize the policy
+        
+        Parameters:
+        - retries: Extra attempts after a transaction gets no usable response
+        - retry_backoff: Delay before the second retry, doubled for each further retry
+        - budget: Seconds after which no further retry is started (None for no limit)
+        - failure_threshold: Consecutive failed transactions before the circuit opens
+        - open_backoff: Seconds until the first probe of a unit with an open circuit
+        - max_open_backoff: Upper limit of the doubling probe backoff
+        """
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.budget = budget
+        self.failure_threshold = failure_threshold
+        self.open_backoff = open_backoff
+        self.max_open_backoff = max_open_backoff
+    
+    @classmethod
+    def from_config(cls, **overrides):
+        """Create a policy from the MODBUS_* settings"""
+        from config.settings import CONFIG
+        
+        options = {
+            'retries': CONFIG.get('MODBUS_RETRIES', 3),
+            'retry_backoff': CONFIG.get('MODBUS_RETRY_BACKOFF', 0.05),
+            'budget': CONFIG.get('MODBUS_TIMEOUT'),
+            'failure_threshold': CONFIG.get('MODBUS_QUARANTINE_AFTER', 3),
+            'open_backoff': CONFIG.get('MODBUS_QUARANTINE_BACKOFF', 5),
+            'max_open_backoff': CONFIG.get('MODBUS_QUARANTINE_MAX_BACKOFF', 300)
+        }
+        options.update(overrides)
+        return cls(**options)
+    
+    def attempts(self, health):
+        """Number of attempts for a transaction; a probe of an open circuit gets one"""
+        return 1 if health.quarantined else 1 + max(0, self.retries)
+    
+    def retry_delay(self, attempt):
+        """
+        Delay before an attempt
+        
+        Parameters:
+        - attempt: Attempt number, 0 for the first
+        
+        Returns:
+        - Seconds to wait
+        """
+        if attempt < 2:
+            return 0.0
+        return self.retry_backoff * (2 ** (attempt - 2))
+    
+    def admit(self, health, now):
+        """Decide whether a transaction to a unit goes on the wire"""
+        if not health.quarantined:
+            return True
+        if now < health.quarantined_until:
+            health.skipped += 1
+            return False
+        # Backoff expired - this transaction is the probe
+        logger.info(f"Probing unit {health.unit} with an open circuit")
+        return True
+    
+    def record(self, health, responded, latency, now, port=None):
+        """
+        Update a unit's health after a transaction
+        
+        Parameters:
+        - health: DeviceHealth of the unit
+        - responded: True if a valid frame (normal or exception) came back
+        - latency: Seconds from request to response of the successful attempt
+        - now: Monotonic time
+        - port: Port name for log messages
+        """
+        where = f" on {port}" if port else ""
+        health.requests += 1
+        if responded:
+            health.responses += 1
+            health.consecutive_failures = 0
+            health.last_latency = latency
+            health._latency_total += latency
+            health.max_latency = max(health.max_latency or 0.0, latency)
+            if health.quarantined:
+                logger.info(f"Unit {health.unit}{where} answered, closing its circuit")
+            health.quarantined_until = None
+            health.backoff = None
+            return
+        
+        health.consecutive_failures += 1
+        if health.quarantined:
+            # Failed probe - back off further
+            health.backoff = min(health.backoff * 2, self.max_open_backoff)
+            health.quarantined_until = now + health.backoff
+        elif health.consecutive_failures >= self.failure_threshold:
+            health.backoff = self.open_backoff
+            health.quarantined_until = now + health.backoff
+            health.quarantines += 1
+            logger.warning(f"Unit {health.unit}{where} not responding, "
+                           f"circuit open for {health.backoff:.0f}s")
\ No newline at end of file
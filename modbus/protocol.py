@@ -39,9 +39,13 @@ def build_command(device_address, function_code, register_address, register_coun
     if register_address >= 40001:
         register_address -= 40001
         
-    # Log the address conversion for debugging
-    logger.debug(f"Modbus command: Register {original_address} → Modbus address {register_address} (0x{register_address:04X})")
-    logger.debug(f"High byte: 0x{(register_address >> 8) & 0xFF:02X}, Low byte: 0x{register_address & 0xFF:02X}")
+    # Log the address conversion for debugging (built on every request, so
+    # only formatted when DEBUG is on)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Modbus command: Register %d → Modbus address %d (0x%04X)",
+                     original_address, register_address, register_address)
+        logger.debug("High byte: 0x%02X, Low byte: 0x%02X",
+                     (register_address >> 8) & 0xFF, register_address & 0xFF)
         
     # Start building the command
     command = bytearray([
@@ -95,7 +99,8 @@ def build_command(device_address, function_code, register_address, register_coun
     command.extend(crc)
     
     # Log the complete command for debugging
-    logger.debug(f"Complete command: {binascii.hexlify(command).decode()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Complete command: %s", binascii.hexlify(command).decode())
     
     return command
 
@@ -221,4 +226,34 @@ def get_expected_response_length(command):
         return 8
         
     # Default response size
-    return 256
\ No newline at end of file
+    return 256
+
+def character_bits(bytesize=8, parity='N', stopbits=1):
+    """
+    Number of bits on the wire for one serial character
+    
+    Parameters:
+    - bytesize: Data bits
+    - parity: Parity setting ('N', 'E', 'O', 'M' or 'S')
+    - stopbits: Stop bits
+    
+    Returns:
+    - Bits per character including start, parity and stop bits
+    """
+    return 1 + bytesize + (0 if parity == 'N' else 1) + stopbits
+
+def inter_frame_delay(baud_rate, bits_per_char=11):
+    """
+    Minimum silent interval between Modbus RTU frames (t3.5)
+    
+    Parameters:
+    - baud_rate: Serial baud rate
+    - bits_per_char: Bits on the wire per character
+    
+    Returns:
+    - Delay in seconds
+    """
+    # The spec fixes t3.5 at 1.75 ms above 19200 baud
+    if baud_rate > 19200:
+        return 0.00175
+    return 3.5 * bits_per_char / baud_rate
\ No newline at end of file
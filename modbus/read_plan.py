@@ -0,0 +1,210 @@
+"""
+Adaptive block reads that learn what a device can answer
+
+Some meter firmwares reject large register blocks, or have unmapped holes
+that make a whole block fail with Illegal Data Address. The block reader
+splits a failing range recursively until the failing registers are
+isolated, learns the largest block the device accepts and caches the
+resulting read plan per range, so later polls go straight to the ranges
+that work. Split points never separate the two halves of a 32-bit value.
+"""
+import logging
+
+logger = logging.getLogger('powermeter.modbus.read_plan')
+
+# Modbus exception codes that mean "this range can't be read this way"
+SPLITTABLE_EXCEPTIONS = (1, 2, 3, 4)
+
+# Returned by _execute when the cached plan no longer matches the device
+_RELEARN = object()
+
+class AdaptiveBlockReader:
+    """Reads register ranges through a learned, cached plan of working blocks"""
+    
+    def __init__(self, read_fn, max_block=125, pairs=()):
+        """
+        Initialize the block reader
+        
+        Parameters:
+        - read_fn: Callable(address, count) returning (registers or None,
+          Modbus exception code or None)
+        - max_block: Largest block to try (125 is the Modbus limit)
+        - pairs: Addresses of 32-bit LSW registers whose MSW follows them;
+          a pair is never split across two requests
+        """
+        self.read_fn = read_fn
+        self.max_block = max_block
+        self.pairs = set(pairs)
+        self.relearns = 0
+        self._plans = {}
+    
+    def read(self, start, count):
+        """
+        Read a register range
+        
+        Parameters:
+        - start: First register address
+        - count: Number of registers
+        
+        Returns:
+        - List of count values with None for registers the device refuses,
+          or None if the device did not respond
+        """
+        key = (start, count)
+        plan = self._plans.get(key)
+        if plan is not None:
+            values = self._execute(start, count, plan)
+            if values is not _RELEARN:
+                return values
+            logger.info(f"Read plan for {start}+{count} no longer works, relearning")
+            self.relearns += 1
+            del self._plans[key]
+        
+        plan = []
+        values = [None] * count
+        for offset, length in self._chunks(start, 0, count):
+            if not self._read_split(start, offset, length, plan, values):
+                return None
+        
+        plan = self._coalesce(start, sorted(plan), values)
+        self._plans[key] = plan
+        holes = [start + i for i, value in enumerate(values) if value is None]
+        if len(plan) > 1 or holes:
+            logger.info(f"Learned read plan for {start}+{count}: "
+                         f"{[(start + o, n) for o, n, ok in plan if ok]}"
+                         + (f", unreadable {holes}" if holes else ""))
+        return values
+    
+    def _execute(self, start, count, plan):
+        """Read a range through a cached plan"""
+        values = [None] * count
+        for offset, length, readable in plan:
+            if not readable:
+                continue
+            registers, error = self.read_fn(start + offset, length)
+            if registers is not None and len(registers) >= length:
+                values[offset:offset + length] = registers[:length]
+            elif error in SPLITTABLE_EXCEPTIONS:
+                return _RELEARN
+            else:
+                return None
+        return values
+    
+    def _read_split(self, start, offset, length, plan, values):
+        """
+        Read a block, splitting it recursively while the device rejects it
+        
+        Returns:
+        - False if the device stopped responding, True otherwise
+        """
+        registers, error = self.read_fn(start + offset, length)
+        if registers is not None and len(registers) >= length:
+            plan.append((offset, length, True))
+            values[offset:offset + length] = registers[:length]
+            return True
+        if error not in SPLITTABLE_EXCEPTIONS:
+            # No (or a garbled) response - splitting would only multiply timeouts
+            return False
+        
+        cut = self._split_point(start, offset, length)
+        if cut is None:
+            plan.append((offset, length, False))
+            return True
+        
+        before = len(plan)
+        if not self._read_split(start, offset, cut - offset, plan, values):
+            return False
+        if not self._read_split(start, cut, offset + length - cut, plan, values):
+            return False
+        
+        # Both halves worked in full, so the block was only too large
+        if all(readable for _, _, readable in plan[before:]):
+            largest = max(n for _, n, _ in plan[before:])
+            if largest < self.max_block:
+                logger.info(f"Device rejects blocks of {length} registers, limiting to {largest}")
+                self.max_block = largest
+        return True
+    
+    def _coalesce(self, start, plan, values):
+        """
+        Merge neighbouring readable blocks that fit within max_block
+        
+        Splitting leaves small blocks next to each hole. Each merged block is
+        read once to confirm the device accepts it before it enters the plan.
+        """
+        groups = []
+        for entry in plan:
+            offset, length, readable = entry
+            last = groups[-1] if groups else None
+            if (readable and last and last[-1][2] and last[-1][0] + last[-1][1] == offset
+                    and sum(n for _, n, _ in last) + length <= self.max_block):
+                last.append(entry)
+            else:
+                groups.append([entry])
+        
+        merged = []
+        for group in groups:
+            if len(group) == 1:
+                merged.extend(group)
+                continue
+            offset = group[0][0]
+            length = sum(n for _, n, _ in group)
+            registers, _ = self.read_fn(start + offset, length)
+            if registers is not None and len(registers) >= length:
+                merged.append((offset, length, True))
+                values[offset:offset + length] = registers[:length]
+            else:
+                merged.extend(group)
+        return merged
+    
+    def _split_point(self, start, offset, length):
+        """Pick a split point near the middle that keeps 32-bit pairs together"""
+        if length < 2:
+            return None
+        middle = offset + length // 2
+        for cut in (middle, middle + 1, middle - 1):
+            if offset < cut < offset + length and (start + cut - 1) not in self.pairs:
+                return cut
+        return None
+    
+    def _chunks(self, start, offset, count):
+        """Divide a range into blocks no larger than max_block"""
+        chunks = []
+        position = offset
+        while position < offset + count:
+            end = min(position + self.max_block, offset + count)
+            if end < offset + count and (start + end - 1) in self.pairs and end - 1 > position:
+                end -= 1
+            chunks.append((position, end - position))
+            position = end
+        return chunks
+    
+    def blocks(self, start, count):
+        """
+        Blocks a read of a range will request
+        
+        Returns:
+        - List of (address, length) from the learned plan, or the initial
+          split by max_block if the range hasn't been read yet
+        """
+        plan = self._plans.get((start, count))
+        if plan is None:
+            return [(start + offset, length) for offset, length in self._chunks(start, 0, count)]
+        return [(start + offset, length) for offset, length, readable in plan if readable]
+    
+    def plan_status(self):
+        """
+        Get the learned plans
+        
+        Returns:
+        - Dictionary with the block size limit and, per range, the blocks
+          read and the registers that can't be read
+        """
+        plans = {}
+        for (start, count), plan in self._plans.items():
+            plans[f"{start}+{count}"] = {
+                'blocks': [[start + offset, length] for offset, length, ok in plan if ok],
+                'unreadable': [start + offset + i for offset, length, ok in plan if not ok
+                               for i in range(length)]
+            }
+        return {'max_block': self.max_block, 'relearns': self.relearns, 'plans': plans}
\ No newline at end of file
@@ -85,4 +85,50 @@ def get_register_name(register_address):
 
 def get_register_group(group_name):
     """Get a list of registers in a group by name"""
-    return REGISTER_GROUPS.get(group_name.upper(), [])
\ No newline at end of file
+    return REGISTER_GROUPS.get(group_name.upper(), [])
+
+# Block read by read_detailed_data (44001-44064)
+DETAILED_BLOCK_START = 44001
+DETAILED_BLOCK_SIZE = 64
+
+# Where each detailed snapshot field lives in the detailed block:
+# field path -> (LSW offset, MSW offset or None, multiplier key or None)
+DETAILED_LAYOUT = {
+    'system.energy_kwh': (0, 1, 'power'),
+    'system.power_kw': (2, None, 'power'),
+    'system.demand_kw_max': (3, None, 'power'),
+    'system.demand_kw_now': (4, None, 'power'),
+    'system.power_kw_max': (5, None, 'power'),
+    'system.power_kw_min': (6, None, 'power'),
+    'system.reactive_energy_kvarh': (7, 8, 'power'),
+    'system.reactive_power_kvar': (9, None, 'power'),
+    'system.apparent_energy_kvah': (10, 11, 'power'),
+    'system.apparent_power_kva': (12, None, 'power'),
+    'system.displacement_pf': (13, None, 'pf'),
+    'system.apparent_pf': (14, None, 'pf'),
+    'system.current_avg': (15, None, 'current'),
+    'system.voltage_ll_avg': (16, None, 'voltage'),
+    'system.voltage_ln_avg': (17, None, 'voltage'),
+    'voltages.l1_l2': (18, None, 'voltage'),
+    'voltages.l2_l3': (19, None, 'voltage'),
+    'voltages.l1_l3': (20, None, 'voltage'),
+    'frequency': (21, None, 'frequency'),
+    'time_since_reset': (61, 62, None),
+    'data_tick_counter': (63, None, None),
+}
+
+# Per-phase values are laid out phase by phase within each quantity
+for _phase in range(3):
+    _prefix = f"phase_{_phase + 1}."
+    DETAILED_LAYOUT.update({
+        _prefix + 'energy_kwh': (22 + 2 * _phase, 23 + 2 * _phase, 'power'),
+        _prefix + 'power_kw': (28 + _phase, None, 'power'),
+        _prefix + 'reactive_energy_kvarh': (31 + 2 * _phase, 32 + 2 * _phase, 'power'),
+        _prefix + 'reactive_power_kvar': (37 + _phase, None, 'power'),
+        _prefix + 'apparent_energy_kvah': (40 + 2 * _phase, 41 + 2 * _phase, 'power'),
+        _prefix + 'apparent_power_kva': (46 + _phase, None, 'power'),
+        _prefix + 'displacement_pf': (49 + _phase, None, 'pf'),
+        _prefix + 'apparent_pf': (52 + _phase, None, 'pf'),
+        _prefix + 'current': (55 + _phase, None, 'current'),
+        _prefix + 'voltage_ln': (58 + _phase, None, 'voltage'),
+    })
\ No newline at end of file
@@ -0,0 +1,560 @@
+"""
+Selector-driven serial engine for driving many ports from one thread
+
+Ports are opened non-blocking in raw mode through termios (Linux/POSIX
+only) and multiplexed with selectors. Each port runs a small state
+machine - idle, turnaround, transmit, receive - so inter-frame gaps and
+response timeouts are enforced by the engine's own timers instead of
+blocking reads with a timeout on one thread per port.
+"""
+import errno
+import logging
+import os
+import selectors
+import struct
+import threading
+import time
+from collections import deque
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # Not available on Windows - use the pyserial backend there
+    fcntl = None
+    termios = None
+
+from modbus.protocol import character_bits, inter_frame_delay
+
+logger = logging.getLogger('powermeter.modbus.serial_engine')
+
+# linux/serial.h: struct serial_struct flags offset and ASYNC_LOW_LATENCY
+_TIOCGSERIAL = 0x541E
+_TIOCSSERIAL = 0x541F
+_SERIAL_STRUCT_SIZE = 72
+_SERIAL_FLAGS_OFFSET = 16
+_ASYNC_LOW_LATENCY = 1 << 13
+
+# Port states
+IDLE = 'idle'
+TURNAROUND = 'turnaround'
+TRANSMIT = 'transmit'
+RECEIVE = 'receive'
+
+def open_raw_port(path, baud_rate=9600, bytesize=8, parity='N', stopbits=1, low_latency=True):
+    """
+    Open a serial device non-blocking in raw mode
+    
+    Parameters:
+    - path: Device path (e.g., '/dev/ttyUSB0')
+    - baud_rate: Baud rate
+    - bytesize: Data bits (5-8)
+    - parity: 'N', 'E' or 'O'
+    - stopbits: 1 or 2
+    - low_latency: Request ASYNC_LOW_LATENCY from the driver (ignored if unsupported)
+    
+    Returns:
+    - File descriptor
+    """
+    if termios is None:
+        raise OSError("termios is not available on this platform")
+    
+    speed = getattr(termios, f'B{int(baud_rate)}', None)
+    if speed is None:
+        raise ValueError(f"Unsupported baud rate: {baud_rate}")
+    
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        iflag, oflag, cflag, lflag, _, _, cc = termios.tcgetattr(fd)
+        
+        # Equivalent of cfmakeraw: no line editing, echo, signals or translation
+        iflag &= ~(termios.IGNBRK | termios.BRKINT | termios.PARMRK | termios.ISTRIP |
+                   termios.INLCR | termios.IGNCR | termios.ICRNL | termios.IXON |
+                   termios.IXOFF | termios.IXANY)
+        oflag &= ~termios.OPOST
+        lflag &= ~(termios.ECHO | termios.ECHONL | termios.ICANON | termios.ISIG | termios.IEXTEN)
+        
+        sizes = {5: termios.CS5, 6: termios.CS6, 7: termios.CS7, 8: termios.CS8}
+        cflag &= ~(termios.CSIZE | termios.PARENB | termios.PARODD | termios.CSTOPB)
+        cflag |= sizes[bytesize] | termios.CREAD | termios.CLOCAL
+        if parity == 'E':
+            cflag |= termios.PARENB
+        elif parity == 'O':
+            cflag |= termios.PARENB | termios.PARODD
+        if stopbits == 2:
+            cflag |= termios.CSTOPB
+        if hasattr(termios, 'CRTSCTS'):
+            cflag &= ~termios.CRTSCTS
+        
+        # VMIN=0/VTIME=0: read() returns whatever is buffered immediately;
+        # the selector decides when to read and the engine times responses
+        cc[termios.VMIN] = 0
+        cc[termios.VTIME] = 0
+        
+        termios.tcsetattr(fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, speed, speed, cc])
+        termios.tcflush(fd, termios.TCIOFLUSH)
+        
+        if low_latency:
+            _set_low_latency(fd, path)
+        return fd
+    except Exception:
+        os.close(fd)
+        raise
+
+def _set_low_latency(fd, path):
+    """Ask the driver to push received bytes immediately (FTDI/USB adapters batch them otherwise)"""
+    try:
+        buf = bytearray(_SERIAL_STRUCT_SIZE)
+        fcntl.ioctl(fd, _TIOCGSERIAL, buf)
+        flags = struct.unpack_from('i', buf, _SERIAL_FLAGS_OFFSET)[0]
+        struct.pack_into('i', buf, _SERIAL_FLAGS_OFFSET, flags | _ASYNC_LOW_LATENCY)
+        fcntl.ioctl(fd, _TIOCSSERIAL, buf)
+        return True
+    except OSError:
+        # Pseudo-terminals and some drivers don't support serial_struct
+        logger.debug(f"Low-latency mode not supported on {path}")
+        return False
+
+class Transaction:
+    """A request/response exchange queued on an engine port"""
+    
+    def __init__(self, request, expected_length, timeout, callback=None):
+        self.request = bytes(request)
+        self.expected_length = expected_length
+        self.timeout = timeout
+        self.callback = callback
+        self.response = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.sent = None
+        self.finished = None
+        self._done = threading.Event()
+    
+    @property
+    def done(self):
+        """True once the transaction has completed or failed"""
+        return self._done.is_set()
+    
+    def wait(self, timeout=None):
+        """
+        Wait for the transaction to finish
+        
+        Returns:
+        - Response bytes (possibly partial after a timeout), or None if it never ran
+        """
+        self._done.wait(timeout)
+        return self.response
+    
+    def _finish(self, response, error=None):
+        self.response = response
+        self.error = error
+        self.finished = time.monotonic()
+        self._done.set()
+        if self.callback is not None:
+            try:
+                self.callback(self)
+            except Exception as e:
+                logger.error(f"Error in transaction callback: {str(e)}")
+
+class _EnginePort:
+    """State machine for one serial port"""
+    
+    def __init__(self, name, fd, gap, char_time):
+        self.name = name
+        self.fd = fd
+        self.gap = gap
+        self.char_time = char_time
+        self.queue = deque()
+        self.state = IDLE
+        self.current = None
+        self.outgoing = None
+        self.incoming = bytearray()
+        self.deadline = None
+        self.last_frame_end = 0.0
+        self.writing = False
+        
+        self.transactions = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+    
+    def stats(self):
+        """Get transaction and byte counters for the port"""
+        return {
+            'state': self.state,
+            'queued': len(self.queue),
+            'transactions': self.transactions,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in
+        }
+
+class SerialEngine:
+    """Drives many raw serial ports from a single selector thread"""
+    
+    def __init__(self):
+        """Initialize the engine (call start() to run it)"""
+        self._selector = selectors.DefaultSelector()
+        self._ports = {}
+        self._lock = threading.Lock()
+        self._commands = deque()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._running = False
+        self._thread = None
+        self.error = None
+    
+    @property
+    def failed(self):
+        """True once the engine thread has died; callers should use their ports directly"""
+        return self.error is not None
+    
+    def start(self):
+        """Start the engine thread"""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='serial-engine')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("Serial engine started")
+    
+    def stop(self):
+        """Stop the engine thread and close every port"""
+        self._running = False
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            ports = list(self._ports.values())
+            self._ports.clear()
+        for port in ports:
+            self._close(port)
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        logger.info("Serial engine stopped")
+    
+    def _wake(self):
+        """Interrupt select() so the engine picks up new work"""
+        try:
+            os.write(self._wake_w, b'\0')
+        except OSError:
+            pass
+    
+    def open_port(self, name, path, baud_rate=9600, bytesize=8, parity='N', stopbits=1,
+                  low_latency=True, gap=None):
+        """
+        Open a port and add it to the engine
+        
+        Parameters:
+        - name: Name used to submit transactions
+        - path: Device path
+        - baud_rate, bytesize, parity, stopbits: Serial framing
+        - low_latency: Request the driver's low-latency mode
+        - gap: Inter-frame gap in seconds (defaults to t3.5 for the framing)
+        """
+        if self.has_port(name):
+            return
+        bits = character_bits(bytesize, parity, stopbits)
+        fd = open_raw_port(path, baud_rate, bytesize, parity, stopbits, low_latency)
+        port = _EnginePort(name, fd, gap if gap is not None else inter_frame_delay(baud_rate, bits),
+                           bits / float(baud_rate))
+        with self._lock:
+            self._ports[name] = port
+            self._commands.append(('open', port))
+        self._wake()
+        logger.info(f"Opened {path} as {name} at {baud_rate} baud")
+    
+    def close_port(self, name):
+        """
+        Remove a port from the engine and close it
+        
+        Parameters:
+        - name: Port name given to open_port()
+        """
+        with self._lock:
+            port = self._ports.pop(name, None)
+            if port is not None:
+                self._commands.append(('close', port))
+        if port is not None:
+            self._wake()
+    
+    def has_port(self, name):
+        """Check whether a port is open in the engine"""
+        with self._lock:
+            return name in self._ports
+    
+    def submit(self, name, request, expected_length, timeout=1.0, callback=None):
+        """
+        Queue a request on a port
+        
+        Parameters:
+        - name: Port name
+        - request: Request frame bytes
+        - expected_length: Length of a normal response frame
+        - timeout: Seconds to wait for the response after the request is sent
+        - callback: Optional callable(transaction), run on the engine thread
+        
+        Returns:
+        - Transaction
+        """
+        transaction = Transaction(request, expected_length, timeout, callback)
+        with self._lock:
+            if self.error is not None:
+                raise OSError(f"Serial engine failed: {self.error}")
+            port = self._ports.get(name)
+            if port is None:
+                raise KeyError(f"Port {name} is not open")
+            self._commands.append(('submit', (port, transaction)))
+        self._wake()
+        return transaction
+    
+    def transact(self, name, request, expected_length, timeout=1.0):
+        """
+        Send a request and wait for its response
+        
+        Returns:
+        - Response bytes (possibly partial or empty after a timeout)
+        """
+        transaction = self.submit(name, request, expected_length, timeout)
+        # The engine enforces the timeout; the margin only guards against a stopped engine
+        response = transaction.wait(timeout + 5)
+        return response if response is not None else b''
+    
+    def stats(self):
+        """
+        Get per-port counters
+        
+        Returns:
+        - Dictionary mapping port name to its statistics
+        """
+        with self._lock:
+            return {name: port.stats() for name, port in self._ports.items()}
+    
+    def _run(self):
+        """Engine loop: wait for I/O or the next timer, then advance every port"""
+        while self._running:
+            try:
+                self._step()
+            except Exception as e:
+                # Without this the thread would die silently and every caller
+                # would wait out its timeout margin on transactions that never run
+                logger.exception(f"Serial engine failed: {str(e)}")
+                self._fail(str(e))
+                return
+    
+    def _step(self):
+        """One pass of the engine loop"""
+        timeout = self._next_timeout()
+        try:
+            events = self._selector.select(timeout)
+        except OSError as e:
+            logger.error(f"Serial engine select failed: {str(e)}")
+            time.sleep(0.01)
+            return
+        
+        for key, mask in events:
+            if key.data is None:
+                try:
+                    while os.read(self._wake_r, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                continue
+            port = key.data
+            if mask & selectors.EVENT_READ:
+                self._on_readable(port)
+            if mask & selectors.EVENT_WRITE and port.state == TRANSMIT:
+                self._transmit(port)
+        
+        self._run_commands()
+        now = time.monotonic()
+        for port in list(self._ports.values()):
+            self._advance(port, now)
+    
+    def _fail(self, reason):
+        """Mark the engine dead, close every port and fail every transaction"""
+        with self._lock:
+            self.error = reason
+            self._running = False
+            ports = list(self._ports.values())
+            self._ports.clear()
+            commands = list(self._commands)
+            self._commands.clear()
+        error = f'engine failed: {reason}'
+        for command, arg in commands:
+            if command == 'submit':
+                arg[1]._finish(None, error)
+            elif command == 'close':
+                ports.append(arg)
+        for port in ports:
+            try:
+                self._close(port, error)
+            except Exception as e:
+                logger.debug(f"Error closing {port.name}: {str(e)}")
+    
+    def _run_commands(self):
+        """Apply opens, closes and submissions from other threads"""
+        with self._lock:
+            commands = list(self._commands)
+            self._commands.clear()
+        for command, arg in commands:
+            if command == 'open':
+                self._selector.register(arg.fd, selectors.EVENT_READ, arg)
+            elif command == 'close':
+                self._close(arg)
+            elif command == 'submit':
+                port, transaction = arg
+                if port.fd is None:
+                    transaction._finish(None, 'port closed')
+                else:
+                    port.queue.append(transaction)
+    
+    def _close(self, port, error='port closed'):
+        """Unregister and close a port, failing its pending transactions"""
+        if port.fd is None:
+            return
+        try:
+            self._selector.unregister(port.fd)
+        except (KeyError, ValueError):
+            pass
+        os.close(port.fd)
+        port.fd = None
+        port.state = IDLE
+        port.outgoing = None
+        if port.current is not None:
+            port.current._finish(bytes(port.incoming), error)
+            port.current = None
+        while port.queue:
+            port.queue.popleft()._finish(None, error)
+    
+    def _drop(self, port, error):
+        """Remove a port whose device has gone away, so the next open starts afresh"""
+        logger.error(f"Serial port {port.name} lost: {error}")
+        with self._lock:
+            if self._ports.get(port.name) is port:
+                del self._ports[port.name]
+        self._close(port, error)
+    
+    def _next_timeout(self):
+        """Seconds until the earliest port timer, or None if nothing is pending"""
+        now = time.monotonic()
+        deadlines = []
+        for port in list(self._ports.values()):
+            if port.state in (TURNAROUND, RECEIVE):
+                deadlines.append(port.deadline)
+            elif port.state == IDLE and port.queue:
+                deadlines.append(port.last_frame_end + port.gap)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - now)
+    
+    def _set_writing(self, port, writing):
+        """Add or remove write interest for a port"""
+        if port.writing != writing and port.fd is not None:
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self._selector.modify(port.fd, events, port)
+            port.writing = writing
+    
+    def _advance(self, port, now):
+        """Run timer-driven state transitions for a port"""
+        if port.fd is None:
+            return
+        if port.state == RECEIVE and now >= port.deadline:
+            port.timeouts += 1
+            self._complete(port, 'timeout', now)
+        if port.state == TURNAROUND and now >= port.deadline:
+            self._start_transmit(port)
+        if port.state == IDLE and port.queue:
+            port.current = port.queue.popleft()
+            port.incoming = bytearray()
+            ready_at = port.last_frame_end + port.gap
+            if now >= ready_at:
+                self._start_transmit(port)
+            else:
+                port.state = TURNAROUND
+                port.deadline = ready_at
+    
+    def _start_transmit(self, port):
+        """Begin writing the current request"""
+        port.state = TRANSMIT
+        port.outgoing = memoryview(port.current.request)
+        port.current.sent = time.monotonic()
+        self._transmit(port)
+    
+    def _transmit(self, port):
+        """Write as much of the request as the port accepts"""
+        try:
+            written = os.write(port.fd, port.outgoing)
+        except BlockingIOError:
+            written = 0
+        except OSError as e:
+            port.errors += 1
+            self._complete(port, f'write failed: {e.strerror}', time.monotonic())
+            return
+        port.bytes_out += written
+        port.outgoing = port.outgoing[written:]
+        
+        if len(port.outgoing):
+            self._set_writing(port, True)
+            return
+        self._set_writing(port, False)
+        # The request is queued in the driver; allow for its time on the wire
+        now = time.monotonic()
+        port.state = RECEIVE
+        port.deadline = now + len(port.current.request) * port.char_time + port.current.timeout
+    
+    def _on_readable(self, port):
+        """Read available bytes, completing the transaction when the frame is whole"""
+        try:
+            data = os.read(port.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            port.errors += 1
+            if e.errno == errno.EIO:
+                # Unplugged adapter or closed pty: reads would fail forever
+                self._drop(port, f'read failed: {e.strerror}')
+            elif port.state == RECEIVE:
+                self._complete(port, f'read failed: {e.strerror}', time.monotonic())
+            return
+        if not data:
+            # End of file after a readable event means the device hung up;
+            # left registered, the selector would report it on every pass
+            port.errors += 1
+            self._drop(port, 'device closed')
+            return
+        
+        port.bytes_in += len(data)
+        if port.state != RECEIVE:
+            # Stray bytes between transactions are discarded, like reset_input_buffer()
+            return
+        
+        port.incoming += data
+        expected = port.current.expected_length
+        if len(port.incoming) >= 2 and port.incoming[1] & 0x80:
+            expected = 5  # Modbus exception response
+        if len(port.incoming) >= expected:
+            self._complete(port, None, time.monotonic())
+    
+    def _complete(self, port, error, now):
+        """Finish the current transaction and return the port to idle"""
+        transaction = port.current
+        port.current = None
+        port.outgoing = None
+        port.state = IDLE
+        port.deadline = None
+        port.last_frame_end = now
+        self._set_writing(port, False)
+        if transaction is not None:
+            port.transactions += 1
+            length = transaction.expected_length
+            if len(port.incoming) >= 2 and port.incoming[1] & 0x80:
+                length = 5
+            transaction._finish(bytes(port.incoming[:length]), error)
+        port.incoming = bytearray()
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+Response time learning and adaptive response timeouts
+"""
+import logging
+import math
+import threading
+from collections import deque
+
+logger = logging.getLogger('powermeter.modbus.timing')
+
+# Samples kept per device and response size
+WINDOW = 64
+
+# Samples needed before the learned timeout replaces the static one
+MIN_SAMPLES = 10
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+class _Window:
+    """Recent response margins for one device and response size"""
+    
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.count = 0
+        self.timeout = None
+        self.p50 = None
+        self.p95 = None
+        self.p99 = None
+
+class ResponseTimeEstimator:
+    """
+    Learns how long each device takes to answer and derives response timeouts
+    
+    Round-trip times are stored as the margin over the time the request and
+    response frames spend on the wire, so one device's samples stay
+    comparable across baud rates and request sizes. The timeout for a
+    request is the wire time of its expected frames plus a multiple of the
+    learned 99th percentile margin, kept between a floor margin and the
+    static timeout as ceiling.
+    """
+    
+    def __init__(self, ceiling, floor=0.02, factor=2.0):
+        """
+        Initialize the estimator
+        
+        Parameters:
+        - ceiling: Largest timeout in seconds, used until enough samples are learned
+        - floor: Smallest margin in seconds allowed over the wire time
+        - factor: Multiplier applied to the learned 99th percentile margin
+        """
+        self.ceiling = ceiling
+        self.floor = floor
+        self.factor = factor
+        self._windows = {}
+        self._lock = threading.Lock()
+    
+    def record(self, unit, expected_length, rtt, wire_time):
+        """
+        Add a response time sample
+        
+        Parameters:
+        - unit: Modbus unit ID
+        - expected_length: Expected response length of the request
+        - rtt: Seconds from the start of transmission to the last response byte
+        - wire_time: Seconds the request and response frames took on the wire
+        """
+        with self._lock:
+            window = self._windows.get((unit, expected_length))
+            if window is None:
+                window = self._windows[(unit, expected_length)] = _Window()
+            window.samples.append(max(0.0, rtt - wire_time))
+            window.count += 1
+            if len(window.samples) < MIN_SAMPLES:
+                return
+            ordered = sorted(window.samples)
+            window.p50 = percentile(ordered, 0.50)
+            window.p95 = percentile(ordered, 0.95)
+            window.p99 = percentile(ordered, 0.99)
+            window.timeout = max(self.floor, window.p99 * self.factor)
+    
+    def timeout(self, unit, expected_length, wire_time):
+        """
+        Get the response timeout for a request
+        
+        Parameters:
+        - unit: Modbus unit ID
+        - expected_length: Expected response length of the request
+        - wire_time: Seconds the request and response frames take on the wire
+        
+        Returns:
+        - Timeout in seconds
+        """
+        window = self._windows.get((unit, expected_length))
+        if window is None or window.timeout is None:
+            return self.ceiling
+        return min(self.ceiling, wire_time + window.timeout)
+    
+    def typical_margin(self, unit, expected_length):
+        """
+        Median response margin of a unit
+        
+        Parameters:
+        - unit: Modbus unit ID
+        - expected_length: Expected response length; other sizes of the unit are used if it has none
+        
+        Returns:
+        - Seconds, or None if nothing is learned for the unit
+        """
+        with self._lock:
+            window = self._windows.get((unit, expected_length))
+            if window is not None and window.p50 is not None:
+                return window.p50
+            medians = sorted(w.p50 for (u, _), w in self._windows.items() if u == unit and w.p50 is not None)
+        return medians[len(medians) // 2] if medians else None
+    
+    def stats(self, unit):
+        """
+        Get the learned response margins of a unit
+        
+        Returns:
+        - Dictionary mapping expected response length to sample count,
+          margin percentiles and timeout margin in milliseconds
+        """
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+        
+        with self._lock:
+            windows = [(length, window) for (u, length), window in self._windows.items() if u == unit]
+        return {
+            length: {
+                'samples': window.count,
+                'margin_p50_ms': ms(window.p50),
+                'margin_p95_ms': ms(window.p95),
+                'margin_p99_ms': ms(window.p99),
+                'timeout_margin_ms': ms(window.timeout)
+            }
+            for length, window in sorted(windows)
+        }
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Serial line utilization accounting and poll capacity estimates
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger('powermeter.modbus.utilization')
+
+# Device response latency assumed for units whose response times aren't learned yet
+DEFAULT_DEVICE_LATENCY = 0.02
+
+# Request frame of a read: unit, function, address (2), count (2), CRC (2)
+READ_REQUEST_LENGTH = 8
+
+class BusUsage:
+    """Where the time on one serial line goes"""
+    
+    def __init__(self):
+        self.since = time.monotonic()
+        self.transactions = 0
+        self.timeouts = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.wire_time = 0.0
+        self.turnaround_time = 0.0
+        self.device_time = 0.0
+        self.timeout_time = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, request_length, response_length, elapsed, char_time, gap):
+        """
+        Account for one request on the line
+        
+        Parameters:
+        - request_length: Bytes sent
+        - response_length: Bytes received (0 if the device did not answer)
+        - elapsed: Seconds from the start of transmission to the end of the attempt
+        - char_time: Seconds per character at the line settings
+        - gap: Silent interval the line needs between frames
+        """
+        wire = (request_length + response_length) * char_time
+        with self._lock:
+            self.transactions += 1
+            self.bytes_out += request_length
+            self.bytes_in += response_length
+            self.wire_time += wire
+            self.turnaround_time += gap
+            if response_length:
+                self.device_time += max(0.0, elapsed - wire)
+            else:
+                self.timeouts += 1
+                self.timeout_time += max(0.0, elapsed - request_length * char_time)
+    
+    def stats(self):
+        """
+        Get the accumulated usage
+        
+        Returns:
+        - Dictionary with byte counts, seconds per category and the share
+          of the elapsed time the line was busy
+        """
+        with self._lock:
+            elapsed = max(time.monotonic() - self.since, 1e-9)
+            busy = self.wire_time + self.turnaround_time + self.device_time + self.timeout_time
+            return {
+                'elapsed_seconds': elapsed,
+                'transactions': self.transactions,
+                'timeouts': self.timeouts,
+                'bytes_out': self.bytes_out,
+                'bytes_in': self.bytes_in,
+                'wire_seconds': self.wire_time,
+                'turnaround_seconds': self.turnaround_time,
+                'device_seconds': self.device_time,
+                'timeout_seconds': self.timeout_time,
+                'utilization': min(1.0, busy / elapsed),
+                'timeout_share': self.timeout_time / busy if busy else 0.0
+            }
+
+def read_time(client, unit, register_count):
+    """
+    Expected line time of one register read
+    
+    Parameters:
+    - client: ModbusClient of the line
+    - unit: Modbus unit ID
+    - register_count: Registers read
+    
+    Returns:
+    - Seconds of wire time, device latency and turnaround
+    """
+    response_length = 5 + 2 * register_count
+    latency = None
+    response_times = getattr(client, 'response_times', None)
+    if response_times is not None:
+        latency = response_times.typical_margin(unit, response_length)
+    if latency is None:
+        latency = DEFAULT_DEVICE_LATENCY
+    wire = (READ_REQUEST_LENGTH + response_length) * client.char_time
+    return wire + latency + client.inter_frame_delay
+
+def poll_capacity(meters):
+    """
+    Estimate how fast a line can poll its meters
+    
+    Parameters:
+    - meters: List of (seconds per poll, configured poll interval) for the
+      meters on the line
+    
+    Returns:
+    - Dictionary with the line time of one round over every meter, the
+      highest sustainable poll rate of that round, and the load the
+      configured intervals put on the line (above 1.0 can't be sustained)
+    """
+    cycle = sum(poll_time for poll_time, _ in meters)
+    load = sum(poll_time / interval for poll_time, interval in meters if interval > 0)
+    return {
+        'cycle_seconds': cycle,
+        'max_poll_rate': 1.0 / cycle if cycle > 0 else None,
+        'load': load,
+        'sustainable': load <= 1.0
+    }
+
+class CapacityWatch:
+    """Warns when the configured poll intervals ask more of a line than it can carry"""
+    
+    def __init__(self, bus):
+        self.bus = bus
+        self.overloaded = False
+        self.capacity = None
+    
+    def update(self, meters):
+        """
+        Re-estimate the line's capacity and log when it becomes (or stops being) overloaded
+        
+        Parameters:
+        - meters: List of (seconds per poll, configured poll interval)
+        
+        Returns:
+        - Capacity dictionary from poll_capacity()
+        """
+        capacity = self.capacity = poll_capacity(meters)
+        if capacity['load'] > 1.0 and not self.overloaded:
+            self.overloaded = True
+            logger.warning(f"Poll intervals on {self.bus} need {capacity['load']:.0%} of the line: "
+                           f"one round over its {len(meters)} meter(s) takes {capacity['cycle_seconds']:.3f}s, "
+                           f"so it sustains at most {capacity['max_poll_rate']:.2f} rounds per second")
+        elif capacity['load'] < 0.9 and self.overloaded:
+            # Some hysteresis so an estimate hovering around 100% doesn't flap
+            self.overloaded = False
+            logger.info(f"Poll intervals on {self.bus} fit the line again ({capacity['load']:.0%})")
+        return capacity
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+History storage package for persisting power meter snapshots
+"""
+
+__version__ = '0.1.0'
+
+import os
+import logging
+
+# Import key components for easier access
+from .fields import HISTORY_FIELDS, extract_fields
+from .segment_store import SegmentStore
+from .sqlite_store import SQLiteHistoryStore
+from .compressed_store import CompressedHistoryStore
+from .raw_history import RawRegisterHistory
+from .rollups import RollupEngine, MeterRollups, ROLLUP_FIELDS
+
+logger = logging.getLogger('powermeter.storage')
+
+def create_history_store(config=None, reader=None):
+    """
+    Create the history backend selected in the configuration
+    
+    Parameters:
+    - config: Configuration dictionary (defaults to CONFIG)
+    - reader: PowerMeterReader, required by the 'raw' backend
+    
+    Returns:
+    - History store instance, or None if history is disabled
+    """
+    if config is None:
+        from config.settings import CONFIG
+        config = CONFIG
+    
+    backend = config.get('HISTORY_BACKEND')
+    if not backend:
+        return None
+    
+    history_dir = config.get('HISTORY_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'
+    )
+    retention_days = config.get('HISTORY_RETENTION_DAYS')
+    retention_seconds = retention_days * 86400 if retention_days else None
+    
+    if backend == 'segments':
+        return SegmentStore(
+            os.path.join(history_dir, 'segments'),
+            segment_seconds=config.get('HISTORY_SEGMENT_SECONDS', 3600),
+            retention_seconds=retention_seconds
+        )
+    
+    if backend == 'raw':
+        if reader is None:
+            logger.error("The raw history backend needs a reader")
+            return None
+        os.makedirs(history_dir, exist_ok=True)
+        return RawRegisterHistory(
+            reader,
+            capacity=config.get('HISTORY_RAW_CAPACITY', 100000),
+            path=os.path.join(history_dir, 'raw_registers.dat')
+        )
+    
+    if backend == 'gorilla':
+        return CompressedHistoryStore(
+            os.path.join(history_dir, 'chunks'),
+            chunk_size=config.get('HISTORY_CHUNK_SIZE', 900),
+            retention_seconds=retention_seconds
+        )
+    
+    if backend == 'sqlite':
+        os.makedirs(history_dir, exist_ok=True)
+        return SQLiteHistoryStore(
+            os.path.join(history_dir, 'history.sqlite3'),
+            meter_id=config.get('MODBUS_ADDRESS', 1),
+            batch_size=config.get('HISTORY_BATCH_SIZE', 200),
+            flush_interval=config.get('HISTORY_FLUSH_INTERVAL', 2.0),
+            retention_seconds=retention_seconds
+        )
+    
+    logger.error(f"Unknown history backend: {backend}")
+    return None
+
+def create_rollup_engine(config=None, per_meter=False):
+    """
+    Create the rollup engine if enabled in the configuration
+    
+    Parameters:
+    - config: Configuration dictionary (defaults to CONFIG)
+    - per_meter: Keep separate rollups per 'meter_id' (multi-meter mode)
+    
+    Returns:
+    - RollupEngine (or MeterRollups) instance, or None if rollups are disabled
+    """
+    if config is None:
+        from config.settings import CONFIG
+        config = CONFIG
+    
+    if not config.get('ROLLUPS_ENABLED', False):
+        return None
+    if per_meter:
+        return MeterRollups(config.get('ROLLUP_TIERS'), config.get('ROLLUP_FIELDS'))
+    return RollupEngine(config.get('ROLLUP_TIERS'), config.get('ROLLUP_FIELDS'))
+
+# Define package exports
+__all__ = [
+    'HISTORY_FIELDS',
+    'extract_fields',
+    'SegmentStore',
+    'SQLiteHistoryStore',
+    'CompressedHistoryStore',
+    'RawRegisterHistory',
+    'RollupEngine',
+    'MeterRollups',
+    'ROLLUP_FIELDS',
+    'create_history_store',
+    'create_rollup_engine'
+]
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""
+Compressed history store built on the Gorilla chunk codec
+
+Snapshots are buffered in memory and encoded as one chunk every
+chunk_size samples or chunk_seconds, whichever comes first. Chunks are
+appended to daily files with a length prefix, so range queries read only
+chunk headers to skip chunks outside the requested time range and decode
+just the requested columns.
+"""
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import time
+
+from storage.fields import HISTORY_FIELDS, extract_fields, resolve_fields
+from storage.gorilla import encode_chunk, decode_chunk, read_chunk_header, header_size
+
+logger = logging.getLogger('powermeter.storage.compressed_store')
+
+_LENGTH = struct.Struct('<I')
+_FILE_NAME = re.compile(r'^chunks-(\d+)\.gor$')
+
+class CompressedHistoryStore:
+    """History store that keeps samples as Gorilla-compressed chunks"""
+    
+    def __init__(self, directory, chunk_size=900, chunk_seconds=900, file_seconds=86400,
+                 retention_seconds=None, fields=None):
+        """
+        Initialize the compressed history store
+        
+        Parameters:
+        - directory: Directory holding the chunk files (created if missing)
+        - chunk_size: Maximum samples per encoded chunk
+        - chunk_seconds: Maximum time span buffered before a chunk is written
+        - file_seconds: Time span covered by each chunk file
+        - retention_seconds: Drop files older than this (None keeps everything)
+        - fields: Dotted snapshot fields to store (defaults to HISTORY_FIELDS)
+        """
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.chunk_seconds = chunk_seconds
+        self.file_seconds = int(file_seconds)
+        self.retention_seconds = retention_seconds
+        self.fields = list(fields or HISTORY_FIELDS)
+        
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        
+        self._header_size = header_size(len(self.fields))
+        self._lock = threading.Lock()
+        self._timestamps = []
+        self._rows = []
+        self._file_start = None
+        
+        os.makedirs(self.directory, exist_ok=True)
+        files = self.list_files()
+        if files:
+            self._repair_tail(files[-1][1])
+    
+    def _repair_tail(self, path):
+        """Truncate a partial chunk left at the end of a file by a crash mid-write"""
+        size = os.path.getsize(path)
+        valid = 0
+        with open(path, 'rb') as f:
+            while True:
+                prefix = f.read(_LENGTH.size)
+                if len(prefix) < _LENGTH.size:
+                    break
+                length = _LENGTH.unpack(prefix)[0]
+                if valid + _LENGTH.size + length > size:
+                    break
+                valid += _LENGTH.size + length
+                f.seek(valid)
+        if valid != size:
+            logger.warning(f"Truncating partial chunk in {path}")
+            os.truncate(path, valid)
+    
+    def _file_path(self, start):
+        """Get the chunk file path for a file start time"""
+        return os.path.join(self.directory, f"chunks-{start:010d}.gor")
+    
+    def list_files(self):
+        """
+        List the chunk files on disk
+        
+        Returns:
+        - Sorted list of (start_time, path) tuples
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            match = _FILE_NAME.match(name)
+            if match:
+                files.append((int(match.group(1)), os.path.join(self.directory, name)))
+        files.sort()
+        return files
+    
+    def write(self, data):
+        """
+        Buffer a meter snapshot
+        
+        Parameters:
+        - data: Snapshot from read_basic_data or read_detailed_data
+        """
+        timestamp = data.get('timestamp') or time.time()
+        self.append(timestamp, extract_fields(data, self.fields))
+    
+    def append(self, timestamp, values):
+        """
+        Buffer a single record, encoding a chunk when the buffer is full
+        
+        Parameters:
+        - timestamp: Sample time in seconds since the epoch
+        - values: Float values in the store's field order
+        """
+        file_start = int(timestamp // self.file_seconds) * self.file_seconds
+        with self._lock:
+            if self._timestamps and timestamp < self._timestamps[-1]:
+                logger.debug(f"Dropping out-of-order sample at {timestamp}")
+                return
+            # A chunk never spans two files
+            if self._file_start is not None and file_start != self._file_start:
+                self._flush_locked()
+            self._file_start = file_start
+            self._timestamps.append(timestamp)
+            self._rows.append(values)
+            if (len(self._timestamps) >= self.chunk_size
+                    or timestamp - self._timestamps[0] >= self.chunk_seconds):
+                self._flush_locked()
+    
+    def flush(self):
+        """Encode and write any buffered samples"""
+        with self._lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        """Encode the buffer as one chunk and append it to its file"""
+        if not self._timestamps:
+            return
+        columns = [list(column) for column in zip(*self._rows)]
+        chunk = encode_chunk(self._timestamps, columns, self.fields)
+        path = self._file_path(self._file_start)
+        with open(path, 'ab') as f:
+            f.write(_LENGTH.pack(len(chunk)) + chunk)
+        
+        self.raw_bytes += len(self._timestamps) * 8 * (len(self.fields) + 1)
+        self.stored_bytes += len(chunk) + _LENGTH.size
+        self._timestamps = []
+        self._rows = []
+        self.enforce_retention(self._file_start)
+    
+    def _iter_chunks(self, path, start, end):
+        """Yield the chunks of a file that overlap a time range"""
+        with open(path, 'rb') as f:
+            while True:
+                prefix = f.read(_LENGTH.size)
+                if len(prefix) < _LENGTH.size:
+                    return
+                length = _LENGTH.unpack(prefix)[0]
+                head = f.read(self._header_size)
+                if len(head) < self._header_size:
+                    return
+                try:
+                    header = read_chunk_header(head)
+                except (ValueError, struct.error):
+                    logger.warning(f"Skipping unreadable chunk in {path}")
+                    f.seek(length - len(head), os.SEEK_CUR)
+                    continue
+                # Skip whole chunks using only the header
+                if header['end'] < start or header['start'] > end:
+                    f.seek(length - len(head), os.SEEK_CUR)
+                    continue
+                body = f.read(length - len(head))
+                if len(body) < length - len(head):
+                    return
+                yield head + body
+    
+    def query(self, start, end, fields=None, limit=None):
+        """
+        Read records in a time range
+        
+        Parameters:
+        - start: Range start in seconds since the epoch (inclusive)
+        - end: Range end in seconds since the epoch (inclusive)
+        - fields: Field names to return (defaults to all stored fields)
+        - limit: Maximum number of records to return
+        
+        Returns:
+        - Dictionary with 'timestamps' and per-field 'series' lists
+        """
+        names = [name for name in resolve_fields(fields) if name in self.fields]
+        timestamps = []
+        series = {name: [] for name in names}
+        
+        def collect(chunk_times, chunk_columns):
+            for i, t in enumerate(chunk_times):
+                if t < start or t > end:
+                    continue
+                if limit is not None and len(timestamps) >= limit:
+                    return
+                timestamps.append(float(t))
+                for name in names:
+                    value = float(chunk_columns[name][i])
+                    series[name].append(None if math.isnan(value) else value)
+        
+        for file_start, path in self.list_files():
+            if file_start + self.file_seconds <= start or file_start > end:
+                continue
+            try:
+                for chunk in self._iter_chunks(path, start, end):
+                    collect(*decode_chunk(chunk, self.fields, set(names)))
+            except FileNotFoundError:
+                continue
+        
+        # Samples not yet encoded
+        with self._lock:
+            pending_times = list(self._timestamps)
+            pending_rows = list(self._rows)
+        if pending_times:
+            positions = {name: i for i, name in enumerate(self.fields)}
+            collect(pending_times, {name: [row[positions[name]] for row in pending_rows]
+                                    for name in names})
+        
+        return {'timestamps': timestamps, 'series': series}
+    
+    def enforce_retention(self, now=None):
+        """
+        Drop chunk files that fall entirely outside the retention window
+        
+        Parameters:
+        - now: Reference time (defaults to the current time)
+        
+        Returns:
+        - Number of files removed
+        """
+        if not self.retention_seconds:
+            return 0
+        cutoff = (now if now is not None else time.time()) - self.retention_seconds
+        removed = 0
+        for file_start, path in self.list_files():
+            if file_start + self.file_seconds > cutoff:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                logger.info(f"Removed expired history file {path}")
+            except OSError as e:
+                logger.warning(f"Could not remove history file {path}: {str(e)}")
+        return removed
+    
+    def stats(self):
+        """
+        Get storage statistics
+        
+        Returns:
+        - Dictionary with file count, byte usage and compression ratio
+        """
+        files = self.list_files()
+        return {
+            'backend': 'gorilla',
+            'files': len(files),
+            'bytes': sum(os.path.getsize(path) for _, path in files),
+            'pending': len(self._timestamps),
+            'compression_ratio': self.raw_bytes / self.stored_bytes if self.stored_bytes else None
+        }
+    
+    def close(self):
+        """Write out any buffered samples"""
+        self.flush()
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Field layout shared by the history storage backends
+"""
+import math
+
+# Flattened snapshot fields persisted by the history backends, in record order.
+# Paths use dots to address the nested dictionaries built by read_detailed_data.
+HISTORY_FIELDS = [
+    # System totals
+    'system.energy_kwh',
+    'system.power_kw',
+    'system.demand_kw_max',
+    'system.demand_kw_now',
+    'system.power_kw_max',
+    'system.power_kw_min',
+    'system.reactive_energy_kvarh',
+    'system.reactive_power_kvar',
+    'system.apparent_energy_kvah',
+    'system.apparent_power_kva',
+    'system.displacement_pf',
+    'system.apparent_pf',
+    'system.current_avg',
+    'system.voltage_ll_avg',
+    'system.voltage_ln_avg',
+    
+    # Phase-to-phase voltages and frequency
+    'voltages.l1_l2',
+    'voltages.l2_l3',
+    'voltages.l1_l3',
+    'frequency',
+]
+
+# Per-phase values
+for _phase in ('phase_1', 'phase_2', 'phase_3'):
+    HISTORY_FIELDS.extend(f"{_phase}.{name}" for name in (
+        'energy_kwh',
+        'power_kw',
+        'reactive_energy_kvarh',
+        'reactive_power_kvar',
+        'apparent_energy_kvah',
+        'apparent_power_kva',
+        'displacement_pf',
+        'apparent_pf',
+        'current',
+        'voltage_ln',
+    ))
+
+# Counters and configuration
+HISTORY_FIELDS.extend([
+    'time_since_reset',
+    'data_tick_counter',
+    'data_scalar',
+])
+
+# Where the same quantities live in a read_basic_data snapshot
+BASIC_FIELD_ALIASES = {
+    'system.energy_kwh': 'energy_kwh',
+    'system.power_kw': 'power_kw',
+    'system.reactive_power_kvar': 'reactive_power_kvar',
+    'system.apparent_power_kva': 'apparent_power_kva',
+    'system.displacement_pf': 'power_factor',
+    'system.current_avg': 'current_avg',
+    'system.voltage_ll_avg': 'voltage_ll_avg',
+    'system.voltage_ln_avg': 'voltage_ln_avg',
+}
+
+def _lookup(data, path):
+    """Resolve a dotted path in a snapshot, returning None if it is missing"""
+    value = data
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+        if value is None:
+            return None
+    return value
+
+def extract_fields(data, fields=HISTORY_FIELDS):
+    """
+    Flatten a meter snapshot into a list of floats
+    
+    Parameters:
+    - data: Snapshot from read_basic_data or read_detailed_data
+    - fields: Dotted field paths to extract
+    
+    Returns:
+    - List of float values in field order (NaN where a field is missing)
+    """
+    values = []
+    for path in fields:
+        value = _lookup(data, path)
+        if value is None and path in BASIC_FIELD_ALIASES:
+            value = data.get(BASIC_FIELD_ALIASES[path])
+        try:
+            values.append(float(value) if value is not None else math.nan)
+        except (TypeError, ValueError):
+            values.append(math.nan)
+    return values
+
+def resolve_fields(requested):
+    """
+    Validate a list of requested field names
+    
+    Parameters:
+    - requested: Iterable of field names, or None for all fields
+    
+    Returns:
+    - List of known field names in the requested order
+    """
+    if not requested:
+        return list(HISTORY_FIELDS)
+    return [name for name in requested if name in HISTORY_FIELDS]
\ No newline at end of file
@@ -0,0 +1,296 @@
+"""
+Gorilla-style chunk codec for meter time series
+
+A chunk holds a block of samples in columnar form. Timestamps are stored
+as delta-of-delta millisecond values and each field as XOR-compressed
+float64 values. The chunk header records the time range and the min/max of
+every field, so readers can skip chunks without decoding them, and every
+column is a separate bit stream, so a query only decodes the fields it asks for.
+"""
+import itertools
+import math
+import operator
+import struct
+import zlib
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional - decoding falls back to array/itertools
+    np = None
+
+CHUNK_MAGIC = b'PMGC'
+CHUNK_VERSION = 1
+
+# Fixed chunk header: magic, version, field count, sample count,
+# first/last timestamp in milliseconds, CRC32 of the field layout,
+# timestamp stream length
+_CHUNK_HEADER = struct.Struct('<4sHHIqqII')
+# Per-field header: min, max, stream length
+_FIELD_HEADER = struct.Struct('<ddI')
+
+_DOUBLE = struct.Struct('<d')
+_BITS = struct.Struct('<Q')
+
+# Delta-of-delta buckets: (prefix value, prefix bits, value bits)
+_DOD_BUCKETS = (
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12),
+)
+
+def layout_crc(fields):
+    """Get the CRC32 identifying a field layout"""
+    return zlib.crc32(','.join(fields).encode('utf-8'))
+
+class _BitWriter:
+    """Append-only bit stream"""
+    
+    def __init__(self):
+        self.buf = bytearray()
+        self._acc = 0
+        self._bits = 0
+    
+    def write(self, value, bits):
+        """Append the low `bits` bits of value"""
+        self._acc = (self._acc << bits) | (value & ((1 << bits) - 1))
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self.buf.append((self._acc >> self._bits) & 0xFF)
+        self._acc &= (1 << self._bits) - 1
+    
+    def getvalue(self):
+        """Get the stream padded to a whole number of bytes"""
+        if self._bits:
+            return bytes(self.buf) + bytes([(self._acc << (8 - self._bits)) & 0xFF])
+        return bytes(self.buf)
+
+class _BitReader:
+    """Sequential reader for a bit stream"""
+    
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+    
+    def read_bit(self):
+        """Read a single bit"""
+        pos = self.pos
+        self.pos = pos + 1
+        return (self.data[pos >> 3] >> (7 - (pos & 7))) & 1
+    
+    def read(self, bits):
+        """Read an unsigned value of the given width"""
+        pos = self.pos
+        start = pos >> 3
+        offset = pos & 7
+        nbytes = (offset + bits + 7) >> 3
+        chunk = int.from_bytes(self.data[start:start + nbytes], 'big')
+        self.pos = pos + bits
+        return (chunk >> (nbytes * 8 - offset - bits)) & ((1 << bits) - 1)
+
+def _encode_timestamps(times_ms):
+    """Delta-of-delta encode millisecond timestamps after the first"""
+    writer = _BitWriter()
+    prev = times_ms[0]
+    prev_delta = 0
+    for t in itertools.islice(times_ms, 1, None):
+        delta = t - prev
+        dod = delta - prev_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+                limit = 1 << (value_bits - 1)
+                if -limit < dod <= limit:
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod + limit - 1, value_bits)
+                    break
+            else:
+                if not -(1 << 31) <= dod < (1 << 31):
+                    raise ValueError(f"Timestamp gap too large for one chunk: {dod} ms")
+                writer.write(0b1111, 4)
+                writer.write(dod, 32)
+        prev = t
+        prev_delta = delta
+    return writer.getvalue()
+
+def _encode_values(values):
+    """XOR encode float64 values"""
+    writer = _BitWriter()
+    prev = _BITS.unpack(_DOUBLE.pack(values[0]))[0]
+    writer.write(prev, 64)
+    prev_lead = prev_trail = None
+    for value in itertools.islice(values, 1, None):
+        bits = _BITS.unpack(_DOUBLE.pack(value))[0]
+        xor = bits ^ prev
+        if xor == 0:
+            writer.write(0, 1)
+        else:
+            lead = min(64 - xor.bit_length(), 31)
+            trail = (xor & -xor).bit_length() - 1
+            if prev_lead is not None and lead >= prev_lead and trail >= prev_trail:
+                # Meaningful bits fit in the previous window
+                writer.write(0b10, 2)
+                writer.write(xor >> prev_trail, 64 - prev_lead - prev_trail)
+            else:
+                significant = 64 - lead - trail
+                writer.write(0b11, 2)
+                writer.write(lead, 5)
+                writer.write(significant - 1, 6)
+                writer.write(xor >> trail, significant)
+                prev_lead, prev_trail = lead, trail
+        prev = bits
+    return writer.getvalue()
+
+def encode_chunk(timestamps, columns, fields):
+    """
+    Encode a block of samples
+    
+    Parameters:
+    - timestamps: Sample times in seconds since the epoch (non-decreasing)
+    - columns: One list of float values per field, each as long as timestamps
+    - fields: Field names, in column order
+    
+    Returns:
+    - Encoded chunk bytes
+    """
+    if not timestamps:
+        raise ValueError("Cannot encode an empty chunk")
+    
+    times_ms = [int(round(t * 1000)) for t in timestamps]
+    ts_stream = _encode_timestamps(times_ms)
+    
+    field_headers = []
+    streams = []
+    for column in columns:
+        present = [v for v in column if not math.isnan(v)]
+        low = min(present) if present else math.nan
+        high = max(present) if present else math.nan
+        stream = _encode_values(column)
+        field_headers.append(_FIELD_HEADER.pack(low, high, len(stream)))
+        streams.append(stream)
+    
+    header = _CHUNK_HEADER.pack(CHUNK_MAGIC, CHUNK_VERSION, len(fields), len(times_ms),
+                                times_ms[0], times_ms[-1], layout_crc(fields), len(ts_stream))
+    return b''.join([header] + field_headers + [ts_stream] + streams)
+
+def read_chunk_header(data):
+    """
+    Parse a chunk header without decoding any column
+    
+    Parameters:
+    - data: Chunk bytes (at least the header part)
+    
+    Returns:
+    - Dictionary with count, start/end times, layout CRC, per-field
+      min/max and the byte offsets of every stream
+    """
+    magic, version, field_count, count, first_ms, last_ms, crc, ts_len = _CHUNK_HEADER.unpack_from(data, 0)
+    if magic != CHUNK_MAGIC or version != CHUNK_VERSION:
+        raise ValueError("Not a chunk of a supported format")
+    
+    offset = _CHUNK_HEADER.size
+    mins, maxs, lengths = [], [], []
+    for _ in range(field_count):
+        low, high, length = _FIELD_HEADER.unpack_from(data, offset)
+        mins.append(low)
+        maxs.append(high)
+        lengths.append(length)
+        offset += _FIELD_HEADER.size
+    
+    stream_offsets = []
+    position = offset + ts_len
+    for length in lengths:
+        stream_offsets.append((position, length))
+        position += length
+    
+    return {
+        'count': count,
+        'start': first_ms / 1000.0,
+        'end': last_ms / 1000.0,
+        'first_ms': first_ms,
+        'layout_crc': crc,
+        'mins': mins,
+        'maxs': maxs,
+        'timestamp_stream': (offset, ts_len),
+        'streams': stream_offsets,
+        'size': position
+    }
+
+def header_size(field_count):
+    """Get the size of a chunk header for a given number of fields"""
+    return _CHUNK_HEADER.size + field_count * _FIELD_HEADER.size
+
+def _decode_timestamps(stream, first_ms, count):
+    """Decode a delta-of-delta stream into millisecond timestamps"""
+    reader = _BitReader(stream)
+    dods = [0] * count
+    for i in range(1, count):
+        if not reader.read_bit():
+            continue
+        for _, _, value_bits in _DOD_BUCKETS:
+            if not reader.read_bit():
+                dods[i] = reader.read(value_bits) - (1 << (value_bits - 1)) + 1
+                break
+        else:
+            dod = reader.read(32)
+            dods[i] = dod - (1 << 32) if dod & (1 << 31) else dod
+    
+    # Two prefix sums turn delta-of-deltas back into timestamps
+    if np is not None:
+        return (np.cumsum(np.cumsum(np.asarray(dods, dtype=np.int64))) + first_ms) / 1000.0
+    deltas = itertools.accumulate(dods)
+    return [(first_ms + t) / 1000.0 for t in itertools.accumulate(deltas)]
+
+def _decode_values(stream, count):
+    """Decode an XOR stream into float64 values"""
+    reader = _BitReader(stream)
+    xors = [0] * count
+    xors[0] = reader.read(64)
+    lead = trail = 0
+    for i in range(1, count):
+        if not reader.read_bit():
+            continue
+        if reader.read_bit():
+            lead = reader.read(5)
+            significant = reader.read(6) + 1
+            trail = 64 - lead - significant
+        xors[i] = reader.read(64 - lead - trail) << trail
+    
+    # Undo the XOR chain with a single prefix scan and reinterpret the bits
+    if np is not None:
+        bits = np.bitwise_xor.accumulate(np.asarray(xors, dtype=np.uint64))
+        return bits.view(np.float64)
+    values = array('d')
+    values.frombytes(array('Q', itertools.accumulate(xors, operator.xor)).tobytes())
+    return values
+
+def decode_chunk(data, fields, wanted=None):
+    """
+    Decode a chunk
+    
+    Parameters:
+    - data: Chunk bytes
+    - fields: Field names the chunk was encoded with
+    - wanted: Field names to decode (defaults to all)
+    
+    Returns:
+    - Tuple of (timestamps, {field: values}); arrays are NumPy arrays when
+      NumPy is installed, otherwise lists/array('d')
+    """
+    header = read_chunk_header(data)
+    if header['layout_crc'] != layout_crc(fields):
+        raise ValueError("Chunk was encoded with a different field layout")
+    
+    count = header['count']
+    offset, length = header['timestamp_stream']
+    timestamps = _decode_timestamps(data[offset:offset + length], header['first_ms'], count)
+    
+    columns = {}
+    for i, name in enumerate(fields):
+        if wanted is not None and name not in wanted:
+            continue
+        offset, length = header['streams'][i]
+        columns[name] = _decode_values(data[offset:offset + length], count)
+    return timestamps, columns
\ No newline at end of file
@@ -0,0 +1,317 @@
+"""
+Raw-register history with lazy decode at query time
+
+Instead of keeping decoded snapshots (dozens of boxed floats per sample),
+this history keeps the 64 raw registers of the detailed block, the data
+scalar and the timestamp - 138 bytes per sample in flat arrays. Values are
+decoded to engineering units only when a query asks for them, using the
+scaling configuration in effect at query time, so a scaling correction
+applies retroactively to everything already stored.
+"""
+import bisect
+import logging
+import os
+import struct
+import threading
+from array import array
+
+from core.reader import FREQUENCY_FIXES, FREQUENCY_RANGE, fix_frequency, value_limit
+from modbus.registers import DETAILED_BLOCK_SIZE, DETAILED_LAYOUT
+from storage.fields import resolve_fields
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional - decoding falls back to plain Python
+    np = None
+
+logger = logging.getLogger('powermeter.storage.raw_history')
+
+# Words stored per sample: data scalar followed by the detailed block
+ROW_WORDS = DETAILED_BLOCK_SIZE + 1
+
+# On-disk record: timestamp, scalar, registers
+_RECORD = struct.Struct('<d' + 'H' * ROW_WORDS)
+
+class RawRegisterHistory:
+    """History that stores raw register frames and decodes on demand"""
+    
+    def __init__(self, reader, capacity=100000, path=None):
+        """
+        Initialize the raw-register history
+        
+        Parameters:
+        - reader: PowerMeterReader whose last_frame backs each snapshot
+        - capacity: Number of samples kept in memory
+        - path: Optional file that frames are appended to and reloaded from
+        """
+        self.reader = reader
+        self.capacity = capacity
+        self.path = path
+        
+        self._lock = threading.Lock()
+        self._times = array('d')
+        self._words = array('H')
+        self._file = None
+        self._file_records = 0
+        
+        if path:
+            self._load()
+            self._file = open(path, 'ab')
+    
+    @property
+    def record_size(self):
+        """Size of one stored sample in bytes"""
+        return _RECORD.size
+    
+    def __len__(self):
+        return len(self._times)
+    
+    def _load(self):
+        """Reload the most recent frames from the history file"""
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        records = size // _RECORD.size
+        if records * _RECORD.size != size:
+            logger.warning(f"Truncating partial record in {self.path}")
+            os.truncate(self.path, records * _RECORD.size)
+        
+        keep = min(records, self.capacity)
+        with open(self.path, 'rb') as f:
+            f.seek((records - keep) * _RECORD.size)
+            buf = f.read(keep * _RECORD.size)
+        for row in _RECORD.iter_unpack(buf):
+            self._times.append(row[0])
+            self._words.extend(row[1:])
+        self._file_records = records
+        
+        if records > keep:
+            self._compact()
+        logger.info(f"Loaded {keep} raw register frames from {self.path}")
+    
+    def _compact(self):
+        """Rewrite the history file with only the samples kept in memory"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for i, timestamp in enumerate(self._times):
+                f.write(_RECORD.pack(timestamp, *self._words[i * ROW_WORDS:(i + 1) * ROW_WORDS]))
+        if self._file is not None:
+            self._file.close()
+        os.replace(tmp_path, self.path)
+        if self._file is not None:
+            self._file = open(self.path, 'ab')
+        self._file_records = len(self._times)
+    
+    def capture(self, data):
+        """
+        Get the register frame behind a published snapshot
+        
+        Called by the sink pipeline on the poll thread, before the reader
+        moves on to the next frame.
+        
+        Parameters:
+        - data: Snapshot published by the data manager
+        
+        Returns:
+        - RegisterFrame, or None if the snapshot has no frame
+        """
+        frame = getattr(self.reader, 'last_frame', None)
+        if frame is None or frame.timestamp != data.get('timestamp'):
+            # Basic reads (or readers without frames) have nothing to store
+            return None
+        return frame
+    
+    def write(self, data):
+        """
+        Store the register frame behind a published snapshot
+        
+        Parameters:
+        - data: RegisterFrame from capture(), or a published snapshot
+        """
+        frame = data if isinstance(data, tuple) else self.capture(data)
+        if frame is not None:
+            self.append(frame.timestamp, frame.scalar, frame.registers)
+    
+    def append(self, timestamp, scalar, registers):
+        """
+        Store a single register frame
+        
+        Parameters:
+        - timestamp: Sample time in seconds since the epoch
+        - scalar: Data scalar in effect for the frame
+        - registers: The DETAILED_BLOCK_SIZE registers of the detailed block
+        """
+        if len(registers) < DETAILED_BLOCK_SIZE:
+            return
+        with self._lock:
+            if self._times and timestamp < self._times[-1]:
+                logger.debug(f"Dropping out-of-order frame at {timestamp}")
+                return
+            self._times.append(timestamp)
+            self._words.append(scalar & 0xFFFF)
+            self._words.extend(registers[:DETAILED_BLOCK_SIZE])
+            
+            # Trim in batches so the ring stays amortized O(1)
+            excess = len(self._times) - self.capacity
+            if excess > self.capacity // 4:
+                del self._times[:excess]
+                del self._words[:excess * ROW_WORDS]
+            
+            if self._file is not None:
+                self._file.write(_RECORD.pack(timestamp, scalar & 0xFFFF,
+                                              *registers[:DETAILED_BLOCK_SIZE]))
+                self._file.flush()
+                self._file_records += 1
+                if self._file_records > 2 * self.capacity:
+                    self._compact()
+    
+    def query(self, start, end, fields=None, limit=None):
+        """
+        Decode frames in a time range
+        
+        Parameters:
+        - start: Range start in seconds since the epoch (inclusive)
+        - end: Range end in seconds since the epoch (inclusive)
+        - fields: Field names to decode (defaults to all known fields)
+        - limit: Maximum number of samples to return
+        
+        Returns:
+        - Dictionary with 'timestamps' and per-field 'series' lists
+        """
+        names = [name for name in resolve_fields(fields)
+                 if name in DETAILED_LAYOUT or name == 'data_scalar']
+        
+        with self._lock:
+            first = bisect.bisect_left(self._times, start)
+            last = bisect.bisect_right(self._times, end)
+            if limit is not None:
+                last = min(last, first + limit)
+            # Slices are copies, so decoding can run without holding the lock
+            times = self._times[first:last]
+            words = self._words[first * ROW_WORDS:last * ROW_WORDS]
+        
+        if np is not None:
+            series = self._decode_numpy(words, names)
+        else:
+            series = self._decode_python(words, names)
+        return {'timestamps': times.tolist(), 'series': series}
+    
+    def _multipliers(self, scalar):
+        """Get multipliers for a scalar using the current scaling configuration"""
+        return self.reader._get_scalar_multipliers(scalar)
+    
+    def _decode_numpy(self, words, names):
+        """Decode requested fields for all rows at once with NumPy"""
+        if not words:
+            return {name: [] for name in names}
+        rows = np.frombuffer(words, dtype=np.uint16).reshape(-1, ROW_WORDS)
+        scalars = rows[:, 0]
+        block = rows[:, 1:].astype(np.float64)
+        
+        # One multiplier lookup per distinct scalar, broadcast to rows
+        factors = {}
+        for scalar in np.unique(scalars):
+            mask = scalars == scalar
+            for kind, factor in self._multipliers(int(scalar)).items():
+                factors.setdefault(kind, np.ones(len(rows)))[mask] = factor
+        
+        series = {}
+        for name in names:
+            if name == 'data_scalar':
+                series[name] = scalars.astype(np.float64).tolist()
+                continue
+            lsw, msw, kind = DETAILED_LAYOUT[name]
+            raw = block[:, lsw]
+            if msw is not None:
+                raw = block[:, msw] * 65536.0 + raw
+            values = raw * factors[kind] if kind else raw
+            series[name] = _filter_numpy(name, values, block).tolist()
+        return series
+    
+    def _decode_python(self, words, names):
+        """Decode requested fields row by row"""
+        multipliers = {}
+        series = {name: [] for name in names}
+        for offset in range(0, len(words), ROW_WORDS):
+            scalar = words[offset]
+            if scalar not in multipliers:
+                multipliers[scalar] = self._multipliers(scalar)
+            factors = multipliers[scalar]
+            regs = words[offset + 1:offset + ROW_WORDS]
+            for name in names:
+                if name == 'data_scalar':
+                    series[name].append(float(scalar))
+                    continue
+                lsw, msw, kind = DETAILED_LAYOUT[name]
+                raw = regs[lsw] if msw is None else (regs[msw] << 16) | regs[lsw]
+                value = raw * factors[kind] if kind else float(raw)
+                series[name].append(_filter_value(name, value, regs))
+        return series
+    
+    def stats(self):
+        """
+        Get storage statistics
+        
+        Returns:
+        - Dictionary with sample count and memory use
+        """
+        return {
+            'backend': 'raw',
+            'samples': len(self._times),
+            'bytes': len(self._times) * _RECORD.size,
+            'record_size': _RECORD.size
+        }
+    
+    def close(self):
+        """Close the history file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def iter_frames(path):
+    """
+    Read the register frames of a raw history file without opening it for writing
+    
+    Parameters:
+    - path: History file written by RawRegisterHistory
+    
+    Returns:
+    - Iterator of (timestamp, scalar, registers) tuples, oldest first
+    """
+    with open(path, 'rb') as f:
+        buf = f.read()
+    usable = len(buf) - len(buf) % _RECORD.size
+    for row in _RECORD.iter_unpack(buf[:usable]):
+        yield row[0], row[1], list(row[2:])
+
+# Same plausibility fixes as PowerMeterReader._filter_unrealistic_values,
+# from the limits in core.reader
+
+def _filter_value(name, value, regs):
+    """Apply the reader's plausibility fixes to one decoded value"""
+    limit = value_limit(name)
+    if limit is not None:
+        return value / limit[1] if value > limit[0] else value
+    low, high = FREQUENCY_RANGE
+    if name == 'frequency' and not low <= value <= high:
+        frequency = fix_frequency(regs[DETAILED_LAYOUT['frequency'][0]])
+        return value if frequency is None else frequency
+    return value
+
+def _filter_numpy(name, values, block):
+    """Apply the reader's plausibility fixes to a column of decoded values"""
+    limit = value_limit(name)
+    if limit is not None:
+        return np.where(values > limit[0], values / limit[1], values)
+    if name == 'frequency':
+        raw = block[:, DETAILED_LAYOUT['frequency'][0]]
+        low, high = FREQUENCY_RANGE
+        bad = (values < low) | (values > high)
+        fixed = np.select(
+            [(raw > fix_low) & (raw < fix_high) for fix_low, fix_high, _ in FREQUENCY_FIXES],
+            [raw / divisor for _, _, divisor in FREQUENCY_FIXES],
+            default=values
+        )
+        return np.where(bad, fixed, values)
+    return values
\ No newline at end of file
@@ -0,0 +1,340 @@
+"""
+Incremental multi-resolution rollups of power meter snapshots
+
+Each tier keeps min/max/mean/last per interval. Only the finest tier is
+updated per sample; when one of its buckets closes it is merged into the
+next tier, so every sample costs O(1) regardless of how many tiers exist.
+"""
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import deque
+
+from storage.fields import extract_fields
+
+logger = logging.getLogger('powermeter.storage.rollups')
+
+# Fields rolled up by default - the quantities plotted on long-range charts
+ROLLUP_FIELDS = [
+    'system.power_kw',
+    'system.reactive_power_kvar',
+    'system.apparent_power_kva',
+    'system.demand_kw_now',
+    'system.displacement_pf',
+    'system.current_avg',
+    'system.voltage_ll_avg',
+    'system.voltage_ln_avg',
+    'system.energy_kwh',
+    'frequency',
+    'phase_1.power_kw',
+    'phase_2.power_kw',
+    'phase_3.power_kw',
+    'phase_1.current',
+    'phase_2.current',
+    'phase_3.current',
+]
+
+# (bucket seconds, finished buckets kept) for each tier, finest first
+DEFAULT_TIERS = [
+    (1, 3600),       # 1 second for an hour
+    (60, 2880),      # 1 minute for two days
+    (900, 2880),     # 15 minutes for a month
+    (3600, 8760),    # 1 hour for a year
+]
+
+class _Tier:
+    """Running aggregate and finished buckets for one resolution"""
+    
+    def __init__(self, seconds, capacity, field_count):
+        self.seconds = seconds
+        self.buckets = deque(maxlen=capacity)
+        self.n = field_count
+        self.start = None
+        self._reset()
+    
+    def _reset(self):
+        """Clear the running aggregate"""
+        n = self.n
+        self.mins = [math.inf] * n
+        self.maxs = [-math.inf] * n
+        self.sums = [0.0] * n
+        self.counts = [0] * n
+        self.lasts = [math.nan] * n
+    
+    def add_sample(self, values):
+        """Fold a single sample into the running aggregate"""
+        mins, maxs, sums, counts, lasts = self.mins, self.maxs, self.sums, self.counts, self.lasts
+        for i, value in enumerate(values):
+            if value != value:  # NaN - field missing from this snapshot
+                continue
+            if value < mins[i]:
+                mins[i] = value
+            if value > maxs[i]:
+                maxs[i] = value
+            sums[i] += value
+            counts[i] += 1
+            lasts[i] = value
+    
+    def add_bucket(self, row):
+        """Merge a finished bucket from the next finer tier"""
+        n = self.n
+        mins, maxs, sums, counts, lasts = self.mins, self.maxs, self.sums, self.counts, self.lasts
+        for i in range(n):
+            count = row[1 + 3 * n + i]
+            if not count:
+                continue
+            if row[1 + i] < mins[i]:
+                mins[i] = row[1 + i]
+            if row[1 + n + i] > maxs[i]:
+                maxs[i] = row[1 + n + i]
+            sums[i] += row[1 + 2 * n + i]
+            counts[i] += count
+            lasts[i] = row[1 + 4 * n + i]
+    
+    def snapshot(self):
+        """Pack the running aggregate into a bucket row"""
+        mins = [m if c else math.nan for m, c in zip(self.mins, self.counts)]
+        maxs = [m if c else math.nan for m, c in zip(self.maxs, self.counts)]
+        return array('d', [self.start] + mins + maxs + self.sums + self.counts + self.lasts)
+    
+    def close(self):
+        """Finish the current bucket, returning its row"""
+        row = self.snapshot()
+        self.buckets.append(row)
+        self._reset()
+        self.start = None
+        return row
+
+class RollupEngine:
+    """Multi-resolution rollup engine fed by PowerMeterDataManager"""
+    
+    def __init__(self, tiers=None, fields=None):
+        """
+        Initialize the rollup engine
+        
+        Parameters:
+        - tiers: List of (bucket_seconds, buckets_kept) tuples, finest first
+        - fields: Dotted snapshot fields to roll up (defaults to ROLLUP_FIELDS)
+        """
+        self.fields = list(fields or ROLLUP_FIELDS)
+        self._positions = {name: i for i, name in enumerate(self.fields)}
+        self._tiers = [_Tier(int(seconds), int(capacity), len(self.fields))
+                       for seconds, capacity in sorted(tiers or DEFAULT_TIERS)]
+        self._listeners = []
+        self._lock = threading.Lock()
+    
+    @property
+    def resolutions(self):
+        """Bucket size in seconds of each tier, finest first"""
+        return [tier.seconds for tier in self._tiers]
+    
+    def add_listener(self, callback):
+        """
+        Register a callback for finished buckets
+        
+        Parameters:
+        - callback: Called as callback(bucket_seconds, bucket_dict) when a bucket closes
+        """
+        self._listeners.append(callback)
+    
+    def write(self, data):
+        """
+        Add a meter snapshot
+        
+        Parameters:
+        - data: Snapshot from read_basic_data or read_detailed_data
+        """
+        timestamp = data.get('timestamp') or time.time()
+        self.add(timestamp, extract_fields(data, self.fields))
+    
+    def add(self, timestamp, values):
+        """
+        Add a single sample
+        
+        Parameters:
+        - timestamp: Sample time in seconds since the epoch
+        - values: Float values in the engine's field order
+        """
+        finished = []
+        with self._lock:
+            tier = self._tiers[0]
+            bucket_start = timestamp - timestamp % tier.seconds
+            if tier.start is not None and bucket_start != tier.start:
+                if bucket_start < tier.start:
+                    logger.debug(f"Dropping out-of-order sample at {timestamp}")
+                    return
+                self._close(0, finished)
+            if tier.start is None:
+                tier.start = bucket_start
+            tier.add_sample(values)
+        
+        for seconds, row in finished:
+            self._emit(seconds, row)
+    
+    def _close(self, level, finished):
+        """Close the open bucket of a tier and cascade it into the next tier"""
+        tier = self._tiers[level]
+        row = tier.close()
+        finished.append((tier.seconds, row))
+        
+        if level + 1 < len(self._tiers):
+            parent = self._tiers[level + 1]
+            parent_start = row[0] - row[0] % parent.seconds
+            if parent.start is not None and parent_start != parent.start:
+                self._close(level + 1, finished)
+            if parent.start is None:
+                parent.start = parent_start
+            parent.add_bucket(row)
+    
+    def _emit(self, seconds, row):
+        """Send a finished bucket to the listeners"""
+        if not self._listeners:
+            return
+        bucket = self._row_to_dict(row)
+        for callback in self._listeners:
+            try:
+                callback(seconds, bucket)
+            except Exception as e:
+                logger.error(f"Error in rollup listener: {str(e)}")
+    
+    def _row_to_dict(self, row):
+        """Convert a bucket row into a dictionary of per-field aggregates"""
+        n = len(self.fields)
+        result = {'start': row[0], 'fields': {}}
+        for i, name in enumerate(self.fields):
+            count = row[1 + 3 * n + i]
+            result['fields'][name] = {
+                'min': row[1 + i] if count else None,
+                'max': row[1 + n + i] if count else None,
+                'mean': row[1 + 2 * n + i] / count if count else None,
+                'last': row[1 + 4 * n + i] if count else None,
+                'count': int(count)
+            }
+        return result
+    
+    def select_tier(self, start, end, max_points):
+        """
+        Pick the tier to answer a query from
+        
+        Uses the finest tier that returns no more than max_points buckets for
+        the range and still holds data back to the range start, falling back
+        to the coarsest tier.
+        
+        Returns:
+        - Tier bucket size in seconds
+        """
+        span = max(end - start, 0)
+        for tier in self._tiers:
+            if max_points and span / tier.seconds > max_points:
+                continue
+            oldest = tier.buckets[0][0] if tier.buckets else tier.start
+            if tier.buckets and len(tier.buckets) == tier.buckets.maxlen and oldest > start:
+                continue
+            return tier.seconds
+        return self._tiers[-1].seconds
+    
+    def query(self, start, end, fields=None, max_points=500, resolution=None):
+        """
+        Read rolled-up buckets in a time range
+        
+        Parameters:
+        - start: Range start in seconds since the epoch (inclusive)
+        - end: Range end in seconds since the epoch (inclusive)
+        - fields: Field names to return (defaults to all rolled-up fields)
+        - max_points: Maximum number of buckets wanted
+        - resolution: Force a tier by bucket size in seconds
+        
+        Returns:
+        - Dictionary with 'resolution', bucket 'timestamps' and per-field
+          'series' of min/max/mean/last lists
+        """
+        names = [name for name in (fields or self.fields) if name in self._positions]
+        n = len(self.fields)
+        
+        with self._lock:
+            seconds = resolution or self.select_tier(start, end, max_points)
+            tier = next((t for t in self._tiers if t.seconds == seconds), self._tiers[-1])
+            rows = [row for row in tier.buckets if start <= row[0] + tier.seconds and row[0] <= end]
+            # Include the open bucket so charts reach the latest sample
+            if tier.start is not None and start <= tier.start + tier.seconds and tier.start <= end:
+                rows.append(tier.snapshot())
+        
+        series = {}
+        for name in names:
+            i = self._positions[name]
+            mins, maxs, means, lasts = [], [], [], []
+            for row in rows:
+                count = row[1 + 3 * n + i]
+                mins.append(row[1 + i] if count else None)
+                maxs.append(row[1 + n + i] if count else None)
+                means.append(row[1 + 2 * n + i] / count if count else None)
+                lasts.append(row[1 + 4 * n + i] if count else None)
+            series[name] = {'min': mins, 'max': maxs, 'mean': means, 'last': lasts}
+        
+        return {
+            'resolution': tier.seconds,
+            'timestamps': [row[0] for row in rows],
+            'series': series
+        }
+
+class MeterRollups:
+    """One RollupEngine per meter, for snapshots tagged with 'meter_id'"""
+    
+    def __init__(self, tiers=None, fields=None):
+        """
+        Initialize the per-meter rollups
+        
+        Parameters:
+        - tiers: List of (bucket_seconds, buckets_kept) tuples, finest first
+        - fields: Dotted snapshot fields to roll up (defaults to ROLLUP_FIELDS)
+        """
+        self.tiers = tiers
+        self.fields = list(fields or ROLLUP_FIELDS)
+        self._engines = {}
+        self._lock = threading.Lock()
+    
+    def engine(self, meter):
+        """
+        Get the rollup engine of a meter, creating it on first use
+        
+        Returns:
+        - RollupEngine
+        """
+        meter = str(meter)
+        with self._lock:
+            engine = self._engines.get(meter)
+            if engine is None:
+                engine = self._engines[meter] = RollupEngine(self.tiers, self.fields)
+            return engine
+    
+    @property
+    def meters(self):
+        """IDs of the meters rolled up so far"""
+        with self._lock:
+            return list(self._engines)
+    
+    def write(self, data):
+        """
+        Add a meter snapshot to the rollups of its meter
+        
+        Parameters:
+        - data: Snapshot carrying a 'meter_id'
+        """
+        self.engine(data.get('meter_id')).write(data)
+    
+    def query(self, start, end, fields=None, max_points=500, resolution=None, meter=None):
+        """
+        Read rolled-up buckets of one meter in a time range
+        
+        Parameters:
+        - meter: Meter identifier
+        - start, end, fields, max_points, resolution: As for RollupEngine.query
+        
+        Returns:
+        - Dictionary as returned by RollupEngine.query
+        """
+        if meter is None:
+            raise ValueError("A meter is required to query per-meter rollups")
+        return self.engine(meter).query(start, end, fields, max_points=max_points, resolution=resolution)
\ No newline at end of file
@@ -0,0 +1,410 @@
+"""
+Append-only on-disk time-series store for power meter snapshots
+
+Snapshots are written as fixed-width binary records into time-partitioned
+segment files. Each segment keeps a sparse in-memory index of record
+timestamps so range queries can seek straight to the right block, and
+reads go through mmap so whole segments are never loaded into memory.
+Retention drops whole segment files.
+"""
+import bisect
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+from storage.fields import HISTORY_FIELDS, extract_fields, resolve_fields
+
+logger = logging.getLogger('powermeter.storage.segment_store')
+
+# Segment file header: magic, version, field count, record size,
+# segment start time, CRC32 of the field layout
+SEGMENT_MAGIC = b'PMSG'
+SEGMENT_VERSION = 1
+_HEADER = struct.Struct('<4sHHIdI')
+HEADER_SIZE = 32
+
+_TIMESTAMP = struct.Struct('<d')
+_SEGMENT_NAME = re.compile(r'^seg-(\d+)\.dat$')
+
+class _Segment:
+    """Bookkeeping for a single segment file"""
+    
+    def __init__(self, start, path):
+        self.start = start
+        self.path = path
+        self.count = 0
+        self.index = []        # Timestamp of every index_stride-th record
+        self.last_timestamp = None
+
+class SegmentStore:
+    """Append-only segment store with sparse time indexes and mmap range reads"""
+    
+    def __init__(self, directory, segment_seconds=3600, retention_seconds=None,
+                 fields=None, index_stride=64):
+        """
+        Initialize the segment store
+        
+        Parameters:
+        - directory: Directory holding the segment files (created if missing)
+        - segment_seconds: Time span covered by each segment file
+        - retention_seconds: Drop segments older than this (None keeps everything)
+        - fields: Dotted snapshot fields to store (defaults to HISTORY_FIELDS)
+        - index_stride: Number of records between sparse index entries
+        """
+        self.directory = directory
+        self.segment_seconds = int(segment_seconds)
+        self.retention_seconds = retention_seconds
+        self.fields = list(fields or HISTORY_FIELDS)
+        self.index_stride = max(1, int(index_stride))
+        
+        self._record = struct.Struct('<d' + 'd' * len(self.fields))
+        self._layout_crc = zlib.crc32(','.join(self.fields).encode('utf-8'))
+        self._field_positions = {name: i + 1 for i, name in enumerate(self.fields)}
+        
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_file = None
+        self._index_cache = {}
+        self._restored_index = None
+        self._closed_index = None
+        
+        os.makedirs(self.directory, exist_ok=True)
+    
+    @property
+    def record_size(self):
+        """Size of one stored record in bytes"""
+        return self._record.size
+    
+    def _segment_start(self, timestamp):
+        """Get the start time of the segment that holds a timestamp"""
+        return int(timestamp // self.segment_seconds) * self.segment_seconds
+    
+    def _segment_path(self, start):
+        """Get the file path for a segment start time"""
+        return os.path.join(self.directory, f"seg-{start:010d}.dat")
+    
+    def list_segments(self):
+        """
+        List the segment files on disk
+        
+        Returns:
+        - Sorted list of (start_time, path) tuples
+        """
+        segments = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                segments.append((int(match.group(1)), os.path.join(self.directory, name)))
+        segments.sort()
+        return segments
+    
+    def _write_header(self, f, start):
+        """Write a fresh segment header"""
+        header = _HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, len(self.fields),
+                              self._record.size, float(start), self._layout_crc)
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+    
+    def _check_header(self, buf, path):
+        """Validate a segment header, returning True if the layout matches"""
+        if len(buf) < HEADER_SIZE:
+            return False
+        magic, version, field_count, record_size, _, layout_crc = _HEADER.unpack_from(buf, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            logger.warning(f"Ignoring segment with unknown format: {path}")
+            return False
+        if (field_count != len(self.fields) or record_size != self._record.size
+                or layout_crc != self._layout_crc):
+            logger.warning(f"Ignoring segment with a different field layout: {path}")
+            return False
+        return True
+    
+    def _build_index(self, buf, count):
+        """Build the sparse timestamp index for a mapped segment"""
+        record_size = self._record.size
+        return [_TIMESTAMP.unpack_from(buf, HEADER_SIZE + i * record_size)[0]
+                for i in range(0, count, self.index_stride)]
+    
+    def _open_active(self, start):
+        """Open (or create) the segment for appending"""
+        path = self._segment_path(start)
+        segment = _Segment(start, path)
+        
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE:
+            with open(path, 'rb') as f:
+                header = f.read(HEADER_SIZE)
+            if not self._check_header(header, path):
+                os.replace(path, path + '.bad')
+            else:
+                # Drop any partial record left behind by a crash mid-write
+                size = os.path.getsize(path)
+                segment.count = (size - HEADER_SIZE) // self._record.size
+                valid_size = HEADER_SIZE + segment.count * self._record.size
+                if valid_size != size:
+                    logger.warning(f"Truncating partial record in {path}")
+                    os.truncate(path, valid_size)
+                restored = self._restored_index
+                if (restored and restored.get('segment') == start
+                        and restored.get('count') == segment.count
+                        and restored.get('stride') == self.index_stride):
+                    # Checkpointed index still matches the file - skip the rescan
+                    segment.index = list(restored['index'])
+                    segment.last_timestamp = restored['last_timestamp']
+                elif segment.count:
+                    with open(path, 'rb') as f:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                            segment.index = self._build_index(buf, segment.count)
+                            last = HEADER_SIZE + (segment.count - 1) * self._record.size
+                            segment.last_timestamp = _TIMESTAMP.unpack_from(buf, last)[0]
+        
+        self._active_file = open(path, 'ab')
+        if segment.count == 0 and self._active_file.tell() < HEADER_SIZE:
+            self._active_file.truncate(0)
+            self._write_header(self._active_file, start)
+            self._active_file.flush()
+        
+        self._active = segment
+        self._restored_index = None
+        logger.info(f"Writing history segment {path}")
+    
+    def _close_active(self):
+        """Close the segment currently being written"""
+        if self._active_file is not None:
+            self._active_file.close()
+            self._active_file = None
+        if self._active is not None:
+            # Closed segments never change, so their index can be reused by queries
+            self._index_cache[self._active.start] = self._active.index
+            self._closed_index = self._index_state_locked()
+            self._active = None
+    
+    def index_state(self):
+        """
+        Get the sparse index of the segment being written, for checkpoints
+        
+        After close() this is the index of the segment that was last written.
+        
+        Returns:
+        - Dictionary describing the segment index, or None
+        """
+        with self._lock:
+            if self._active is None:
+                return self._closed_index
+            return self._index_state_locked()
+    
+    def _index_state_locked(self):
+        """Describe the active segment index (caller holds the lock)"""
+        segment = self._active
+        if segment is None or not segment.count:
+            return None
+        return {
+            'segment': segment.start,
+            'count': segment.count,
+            'stride': self.index_stride,
+            'last_timestamp': segment.last_timestamp,
+            'index': list(segment.index)
+        }
+    
+    def restore_index(self, state):
+        """
+        Reuse a checkpointed index when the active segment is reopened
+        
+        The index is only used if the segment still holds exactly the
+        checkpointed number of records.
+        
+        Parameters:
+        - state: Dictionary from index_state()
+        """
+        with self._lock:
+            if self._active is None:
+                self._restored_index = state
+    
+    def write(self, data):
+        """
+        Append a meter snapshot
+        
+        Parameters:
+        - data: Snapshot from read_basic_data or read_detailed_data
+        """
+        timestamp = data.get('timestamp') or time.time()
+        self.append(timestamp, extract_fields(data, self.fields))
+    
+    def append(self, timestamp, values):
+        """
+        Append a single record
+        
+        Parameters:
+        - timestamp: Sample time in seconds since the epoch
+        - values: Float values in the store's field order
+        
+        Returns:
+        - True if written, False if the sample was out of order
+        """
+        record = self._record.pack(timestamp, *values)
+        start = self._segment_start(timestamp)
+        
+        with self._lock:
+            if self._active is None or self._active.start != start:
+                if self._active is not None and start < self._active.start:
+                    logger.debug(f"Dropping out-of-order sample at {timestamp}")
+                    return False
+                self._close_active()
+                self._open_active(start)
+                self.enforce_retention(timestamp)
+            
+            segment = self._active
+            if segment.last_timestamp is not None and timestamp < segment.last_timestamp:
+                logger.debug(f"Dropping out-of-order sample at {timestamp}")
+                return False
+            
+            self._active_file.write(record)
+            # Flush to the OS so mmap readers see the record straight away
+            self._active_file.flush()
+            
+            if segment.count % self.index_stride == 0:
+                segment.index.append(timestamp)
+            segment.count += 1
+            segment.last_timestamp = timestamp
+            return True
+    
+    def query(self, start, end, fields=None, limit=None):
+        """
+        Read records in a time range
+        
+        Parameters:
+        - start: Range start in seconds since the epoch (inclusive)
+        - end: Range end in seconds since the epoch (inclusive)
+        - fields: Field names to return (defaults to all stored fields)
+        - limit: Maximum number of records to return
+        
+        Returns:
+        - Dictionary with 'timestamps' and per-field 'series' lists
+        """
+        names = [name for name in resolve_fields(fields) if name in self._field_positions]
+        positions = [self._field_positions[name] for name in names]
+        timestamps = []
+        columns = [[] for _ in names]
+        
+        for seg_start, path in self.list_segments():
+            if seg_start + self.segment_seconds <= start or seg_start > end:
+                continue
+            if limit is not None and len(timestamps) >= limit:
+                break
+            self._scan_segment(seg_start, path, start, end, positions,
+                               timestamps, columns, limit)
+        
+        return {
+            'timestamps': timestamps,
+            'series': dict(zip(names, columns))
+        }
+    
+    def _scan_segment(self, seg_start, path, start, end, positions, timestamps, columns, limit):
+        """Collect matching records from one segment through mmap"""
+        with self._lock:
+            if self._active is not None and self._active.start == seg_start:
+                count = self._active.count
+                index = list(self._active.index)
+            else:
+                count = None
+                index = self._index_cache.get(seg_start)
+        
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size <= HEADER_SIZE:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    if not self._check_header(buf, path):
+                        return
+                    available = (len(buf) - HEADER_SIZE) // self._record.size
+                    if count is None:
+                        count = available
+                        if index is None:
+                            index = self._build_index(buf, count)
+                            with self._lock:
+                                self._index_cache[seg_start] = index
+                    count = min(count, available)
+                    
+                    # Seek to the index block that can hold the range start
+                    block = max(bisect.bisect_right(index, start) - 1, 0)
+                    record_size = self._record.size
+                    unpack = self._record.unpack_from
+                    offset = HEADER_SIZE + block * self.index_stride * record_size
+                    stop = HEADER_SIZE + count * record_size
+                    
+                    while offset < stop:
+                        timestamp = _TIMESTAMP.unpack_from(buf, offset)[0]
+                        if timestamp > end:
+                            break
+                        if timestamp >= start:
+                            row = unpack(buf, offset)
+                            timestamps.append(timestamp)
+                            for column, position in zip(columns, positions):
+                                value = row[position]
+                                column.append(None if math.isnan(value) else value)
+                            if limit is not None and len(timestamps) >= limit:
+                                break
+                        offset += record_size
+        except FileNotFoundError:
+            # Segment removed by retention while we were scanning
+            return
+    
+    def enforce_retention(self, now=None):
+        """
+        Drop segments that fall entirely outside the retention window
+        
+        Parameters:
+        - now: Reference time (defaults to the current time)
+        
+        Returns:
+        - Number of segments removed
+        """
+        if not self.retention_seconds:
+            return 0
+        
+        cutoff = (now if now is not None else time.time()) - self.retention_seconds
+        removed = 0
+        for seg_start, path in self.list_segments():
+            if seg_start + self.segment_seconds > cutoff:
+                break
+            if self._active is not None and self._active.start == seg_start:
+                continue
+            try:
+                os.remove(path)
+                self._index_cache.pop(seg_start, None)
+                removed += 1
+                logger.info(f"Removed expired history segment {path}")
+            except OSError as e:
+                logger.warning(f"Could not remove history segment {path}: {str(e)}")
+        return removed
+    
+    def stats(self):
+        """
+        Get storage statistics
+        
+        Returns:
+        - Dictionary with segment count, byte usage and record size
+        """
+        segments = self.list_segments()
+        total_bytes = 0
+        for _, path in segments:
+            try:
+                total_bytes += os.path.getsize(path)
+            except OSError:
+                pass
+        return {
+            'backend': 'segments',
+            'segments': len(segments),
+            'bytes': total_bytes,
+            'record_size': self._record.size
+        }
+    
+    def close(self):
+        """Close the active segment"""
+        with self._lock:
+            self._close_active()
\ No newline at end of file
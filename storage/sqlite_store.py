@@ -0,0 +1,246 @@
+"""
+SQLite history backend for power meter snapshots
+
+Snapshots are queued by the poll thread and inserted in batches by a
+dedicated writer thread, so slow storage never delays the next meter read.
+The database runs in WAL mode so API range queries can read while the
+writer commits.
+"""
+import logging
+import math
+import queue
+import sqlite3
+import threading
+import time
+
+from storage.fields import HISTORY_FIELDS, extract_fields, resolve_fields
+
+logger = logging.getLogger('powermeter.storage.sqlite_store')
+
+# Sentinel telling the writer thread to flush and exit
+_STOP = object()
+
+def _column_name(field):
+    """Convert a dotted field path into a SQL column name"""
+    return field.replace('.', '__')
+
+class SQLiteHistoryStore:
+    """SQLite history store with WAL mode and batched background inserts"""
+    
+    def __init__(self, path, meter_id='1', fields=None, batch_size=200,
+                 flush_interval=2.0, retention_seconds=None, max_queue=10000):
+        """
+        Initialize the SQLite history store
+        
+        Parameters:
+        - path: Database file path
+        - meter_id: Meter identifier stored with snapshots that don't carry one
+        - fields: Dotted snapshot fields to store (defaults to HISTORY_FIELDS)
+        - batch_size: Number of rows per insert transaction
+        - flush_interval: Maximum seconds a queued row waits before being committed
+        - retention_seconds: Delete rows older than this (None keeps everything)
+        - max_queue: Maximum queued snapshots before new ones are dropped
+        """
+        self.path = path
+        self.meter_id = str(meter_id)
+        self.fields = list(fields or HISTORY_FIELDS)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_seconds = retention_seconds
+        
+        self.rows_written = 0
+        self.dropped = 0
+        self.last_flush_seconds = 0.0
+        
+        self._columns = [_column_name(f) for f in self.fields]
+        self._insert_sql = "INSERT OR REPLACE INTO samples (meter, ts, {}) VALUES (?, ?, {})".format(
+            ', '.join(self._columns), ', '.join('?' * len(self._columns))
+        )
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        
+        self._create_schema()
+        
+        self._thread = threading.Thread(target=self._writer_loop, name='sqlite-history-writer')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def _create_schema(self):
+        """Create the database schema if needed"""
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # The table is clustered on (meter, ts), so the primary key is a
+            # covering index for every range query
+            conn.execute("CREATE TABLE IF NOT EXISTS samples (meter TEXT NOT NULL, ts REAL NOT NULL, {}, "
+                         "PRIMARY KEY (meter, ts)) WITHOUT ROWID".format(
+                             ', '.join(f"{c} REAL" for c in self._columns)))
+            
+            # Add columns for fields introduced after the database was created
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(samples)")}
+            for column in self._columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE samples ADD COLUMN {column} REAL")
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _connect_writer(self):
+        """Open the writer connection"""
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL only fsyncs at checkpoints
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def _acquire_reader(self):
+        """Take a query connection from the pool (HTTP requests run on short-lived threads)"""
+        with self._readers_lock:
+            if self._readers:
+                return self._readers.pop()
+        return sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+    
+    def _release_reader(self, conn):
+        """Return a query connection to the pool"""
+        with self._readers_lock:
+            if len(self._readers) < 4:
+                self._readers.append(conn)
+                return
+        conn.close()
+    
+    def write(self, data):
+        """
+        Queue a meter snapshot for insertion
+        
+        Parameters:
+        - data: Snapshot from read_basic_data or read_detailed_data
+        """
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"History queue full, dropped {self.dropped} snapshots so far")
+    
+    def _row(self, data):
+        """Build an insert row from a snapshot"""
+        values = [None if math.isnan(v) else v for v in extract_fields(data, self.fields)]
+        return [str(data.get('meter_id', self.meter_id)), data.get('timestamp') or time.time()] + values
+    
+    def _flush(self, conn, batch):
+        """Insert a batch of rows in one transaction"""
+        started = time.perf_counter()
+        with conn:
+            conn.executemany(self._insert_sql, batch)
+        self.last_flush_seconds = time.perf_counter() - started
+        self.rows_written += len(batch)
+    
+    def _writer_loop(self):
+        """Background thread that drains the queue in batches"""
+        conn = self._connect_writer()
+        batch = []
+        deadline = None
+        last_retention = 0
+        stopping = False
+        
+        try:
+            while not stopping:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                    if item is _STOP:
+                        stopping = True
+                    else:
+                        batch.append(self._row(item))
+                        if deadline is None:
+                            deadline = time.monotonic() + self.flush_interval
+                except queue.Empty:
+                    pass
+                
+                if batch and (stopping or len(batch) >= self.batch_size
+                              or time.monotonic() >= deadline):
+                    try:
+                        self._flush(conn, batch)
+                    except sqlite3.Error as e:
+                        logger.error(f"Error writing history batch of {len(batch)} rows: {str(e)}")
+                    batch = []
+                    deadline = None
+                    
+                    if self.retention_seconds and time.time() - last_retention > 3600:
+                        self._enforce_retention(conn)
+                        last_retention = time.time()
+        finally:
+            conn.close()
+    
+    def _enforce_retention(self, conn):
+        """Delete rows older than the retention window"""
+        cutoff = time.time() - self.retention_seconds
+        try:
+            with conn:
+                deleted = conn.execute("DELETE FROM samples WHERE ts < ?", (cutoff,)).rowcount
+            if deleted:
+                logger.info(f"Removed {deleted} expired history rows")
+        except sqlite3.Error as e:
+            logger.error(f"Error removing expired history rows: {str(e)}")
+    
+    def query(self, start, end, fields=None, limit=None, meter=None):
+        """
+        Read rows in a time range
+        
+        Parameters:
+        - start: Range start in seconds since the epoch (inclusive)
+        - end: Range end in seconds since the epoch (inclusive)
+        - fields: Field names to return (defaults to all stored fields)
+        - limit: Maximum number of rows to return
+        - meter: Meter identifier (defaults to the store's meter_id)
+        
+        Returns:
+        - Dictionary with 'timestamps' and per-field 'series' lists
+        """
+        names = [name for name in resolve_fields(fields) if name in self.fields]
+        columns = ['ts'] + [_column_name(name) for name in names]
+        
+        # The SQL text only depends on the column list, so sqlite3's statement
+        # cache reuses the prepared statement for repeated chart queries
+        sql = "SELECT {} FROM samples WHERE meter = ? AND ts BETWEEN ? AND ? ORDER BY ts LIMIT ?".format(
+            ', '.join(columns))
+        conn = self._acquire_reader()
+        try:
+            rows = conn.execute(
+                sql, (str(meter) if meter is not None else self.meter_id, start, end,
+                      limit if limit is not None else -1)
+            ).fetchall()
+        finally:
+            self._release_reader(conn)
+        
+        series = list(zip(*rows)) if rows else [()] * len(columns)
+        return {
+            'timestamps': list(series[0]),
+            'series': {name: list(values) for name, values in zip(names, series[1:])}
+        }
+    
+    def stats(self):
+        """
+        Get storage statistics
+        
+        Returns:
+        - Dictionary with queue depth, rows written, drops and flush latency
+        """
+        return {
+            'backend': 'sqlite',
+            'queued': self._queue.qsize(),
+            'rows_written': self.rows_written,
+            'dropped': self.dropped,
+            'last_flush_seconds': self.last_flush_seconds
+        }
+    
+    def close(self):
+        """Flush queued snapshots and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=10)
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
\ No newline at end of file
@@ -0,0 +1,26 @@
+"""
+Telemetry package: in-process metrics, tracing and profiling for the poller, bus and HTTP API
+"""
+
+__version__ = '0.1.0'
+
+# Import key components for easier access
+from .metrics import MetricsRegistry, Counter, Gauge, Histogram, REGISTRY
+from .tracing import Tracer, TRACER, chrome_trace
+from .profiler import StackSampler, MemoryProfiler, ProfilerBusy, MEMORY
+
+# Define package exports
+__all__ = [
+    'MetricsRegistry',
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'REGISTRY',
+    'Tracer',
+    'TRACER',
+    'chrome_trace',
+    'StackSampler',
+    'MemoryProfiler',
+    'ProfilerBusy',
+    'MEMORY'
+]
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""
+In-process metrics: counters, gauges and fixed-bucket histograms
+
+Instrumented code looks up its labelled series once and keeps it, so
+recording a value is a lock and an addition (a bisect more for histograms).
+The registry renders everything in the Prometheus text exposition format
+for the /metrics endpoint.
+"""
+import bisect
+import math
+import threading
+import weakref
+
+# Default histogram buckets in seconds, from fast register reads to slow polls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_value(value):
+    """Format a sample value the way Prometheus expects"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    """Value that only goes up"""
+    
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class Gauge:
+    """Value that goes up and down, or is computed when scraped"""
+    
+    def __init__(self):
+        self.value = 0.0
+        self._function = None
+        self._lock = threading.Lock()
+    
+    def set(self, value):
+        self.value = value
+    
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+    
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+    
+    def set_function(self, function):
+        """Compute the value with function() whenever the gauge is read"""
+        self._function = function
+    
+    def get(self):
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception:
+                return None
+        return self.value
+
+class Histogram:
+    """Distribution of observations over fixed buckets"""
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+    
+    def snapshot(self):
+        """
+        Get cumulative bucket counts
+        
+        Returns:
+        - (list of (upper bound, cumulative count), sum, count)
+        """
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = []
+        running = 0
+        for bound, bucket in zip(self.buckets + (math.inf,), counts):
+            running += bucket
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+class MetricFamily:
+    """A named metric and its series, one per combination of label values"""
+    
+    def __init__(self, name, help_text, kind, labelnames=(), factory=None):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def labels(self, *values, **kwargs):
+        """
+        Get the series for a combination of label values
+        
+        Look it up once and keep it on hot paths.
+        
+        Returns:
+        - Counter, Gauge or Histogram
+        """
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        series = self._series.get(key)
+        if series is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {key}")
+            with self._lock:
+                series = self._series.setdefault(key, self._factory())
+        return series
+    
+    def series(self):
+        """Current series as (label values, metric) pairs"""
+        with self._lock:
+            return list(self._series.items())
+    
+    def remove(self, *values):
+        """Stop reporting a series, e.g. of a meter that was removed"""
+        with self._lock:
+            self._series.pop(tuple(str(value) for value in values), None)
+    
+    def render(self):
+        """Render the family in the Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, metric in sorted(self.series()):
+            if self.kind == 'histogram':
+                buckets, total, count = metric.snapshot()
+                for bound, cumulative in buckets:
+                    le = f'le="{_format_value(float(bound))}"'
+                    lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}")
+                labels = _label_text(self.labelnames, values)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+            else:
+                value = metric.get() if self.kind == 'gauge' else metric.value
+                lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_format_value(value)}")
+        return '\n'.join(lines)
+
+class MetricsRegistry:
+    """Collection of metric families rendered together"""
+    
+    def __init__(self):
+        self._families = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+    
+    def _family(self, name, help_text, kind, labelnames, factory):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = MetricFamily(name, help_text, kind, labelnames, factory)
+            elif family.kind != kind or family.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a different {family.kind}")
+            return family
+    
+    def counter(self, name, help_text, labelnames=()):
+        """Get or create a counter family"""
+        return self._family(name, help_text, 'counter', labelnames, Counter)
+    
+    def gauge(self, name, help_text, labelnames=()):
+        """Get or create a gauge family"""
+        return self._family(name, help_text, 'gauge', labelnames, Gauge)
+    
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Get or create a histogram family with fixed buckets"""
+        return self._family(name, help_text, 'histogram', labelnames, lambda: Histogram(buckets))
+    
+    def register_collector(self, collector):
+        """
+        Call a function before every scrape, e.g. to update gauges
+        
+        Bound methods are held weakly, so registering doesn't keep their
+        object alive.
+        """
+        if hasattr(collector, '__self__'):
+            reference = weakref.WeakMethod(collector)
+        else:
+            reference = lambda: collector
+        with self._lock:
+            self._collectors.append(reference)
+    
+    def collect(self):
+        """Run the collectors, dropping those whose object is gone"""
+        with self._lock:
+            collectors = list(self._collectors)
+        dead = []
+        for reference in collectors:
+            collector = reference()
+            if collector is None:
+                dead.append(reference)
+                continue
+            try:
+                collector()
+            except Exception:
+                pass
+        if dead:
+            with self._lock:
+                self._collectors = [reference for reference in self._collectors if reference not in dead]
+    
+    def render(self):
+        """
+        Render every family in the Prometheus text exposition format
+        
+        Returns:
+        - Text for a /metrics response
+        """
+        self.collect()
+        with self._lock:
+            families = sorted(self._families.values(), key=lambda family: family.name)
+        return '\n'.join(family.render() for family in families) + '\n'
+
+# Registry shared by the whole process
+REGISTRY = MetricsRegistry()
\ No newline at end of file
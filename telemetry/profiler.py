@@ -0,0 +1,249 @@
+"""
+On-demand CPU sampling and memory snapshots of the running process
+
+StackSampler looks at the stack of every thread (sys._current_frames())
+at a fixed interval for a bounded time and counts identical stacks, in the
+collapsed format flamegraph.pl and speedscope read. It is a wall-clock
+profile: threads waiting on the serial line or a socket show up waiting.
+MemoryProfiler wraps tracemalloc - the first snapshot starts tracing, later
+ones report the top allocators and what grew since the previous snapshot.
+Neither costs anything until it is asked for.
+"""
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Names Python gives unnamed threads, e.g. HTTP request threads
+_NUMBERED_THREAD = re.compile(r'^Thread-\d+ \((.+)\)$')
+
+# Frames of the import machinery and of tracemalloc itself
+_MEMORY_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>')
+)
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+def thread_label(thread):
+    """Name of a thread in stacks, without the numbering of pool threads"""
+    match = _NUMBERED_THREAD.match(thread.name)
+    return match.group(1) if match else thread.name
+
+class StackSampler:
+    """Counts the stacks of the process's threads over a bounded time"""
+    
+    # One sampling run at a time, whoever asks for it
+    _running = threading.Lock()
+    
+    def __init__(self, interval=0.01, threads=None, lines=False):
+        """
+        Initialize the sampler
+        
+        Parameters:
+        - interval: Seconds between samples
+        - threads: Only sample threads whose name contains one of these strings
+        - lines: Tell frames apart by line number, not only by function
+        """
+        self.interval = interval
+        self.threads = tuple(threads) if threads else None
+        self.lines = lines
+        self._labels = {}
+    
+    def _frame_label(self, frame):
+        code = frame.f_code
+        key = (code, frame.f_lineno) if self.lines else code
+        label = self._labels.get(key)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}"
+            label += f":{frame.f_lineno})" if self.lines else ")"
+            self._labels[key] = label
+        return label
+    
+    def run(self, duration):
+        """
+        Sample the threads for a while
+        
+        Parameters:
+        - duration: Seconds to sample for
+        
+        Returns:
+        - Dictionary with the samples taken, samples per thread and a Counter
+          of collapsed stacks ("thread;outer;...;inner")
+        """
+        if not StackSampler._running.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(duration)
+        finally:
+            StackSampler._running.release()
+    
+    def _sample(self, duration):
+        own = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        per_thread = Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + duration
+        next_sample = started
+        while True:
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                name = names.get(ident)
+                if name is None:
+                    names = {thread.ident: thread_label(thread) for thread in threading.enumerate()}
+                    name = names.get(ident, f'thread-{ident}')
+                if self.threads and not any(part in name for part in self.threads):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_label(frame))
+                    frame = frame.f_back
+                stack.append(name)
+                stacks[';'.join(reversed(stack))] += 1
+                per_thread[name] += 1
+            frames = frame = None
+            samples += 1
+            next_sample += self.interval
+            now = time.monotonic()
+            if next_sample >= deadline:
+                break
+            if next_sample > now:
+                time.sleep(next_sample - now)
+        return {
+            'duration': time.monotonic() - started,
+            'interval': self.interval,
+            'samples': samples,
+            'threads': dict(per_thread),
+            'stacks': stacks
+        }
+
+def collapsed(stacks):
+    """
+    Render stack counts in the collapsed format of flamegraph.pl
+    
+    Returns:
+    - Text with one "stack count" line per stack, most frequent first
+    """
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def top_frames(stacks, limit=20):
+    """
+    Find the functions the threads were in most often
+    
+    Parameters:
+    - stacks: Counter of collapsed stacks
+    - limit: Number of functions
+    
+    Returns:
+    - List of {'frame', 'thread', 'samples'} dictionaries, innermost frames
+      of the stacks counted per thread
+    """
+    leaves = Counter()
+    for stack, count in stacks.items():
+        parts = stack.split(';')
+        leaves[(parts[-1], parts[0])] += count
+    return [{'frame': frame, 'thread': thread, 'samples': count}
+            for (frame, thread), count in leaves.most_common(limit)]
+
+class MemoryProfiler:
+    """tracemalloc snapshots compared to the previous one"""
+    
+    def __init__(self, frames=1):
+        """
+        Initialize the profiler
+        
+        Parameters:
+        - frames: Frames of traceback stored per allocation when tracing starts
+        """
+        self.frames = frames
+        self._previous = None
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_config(cls, config=None):
+        """Create a memory profiler from the TRACEMALLOC_FRAMES setting in CONFIG"""
+        if config is None:
+            from config.settings import CONFIG as config
+        return cls(config.get('TRACEMALLOC_FRAMES', 1))
+    
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+    
+    def _take(self):
+        return tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+    
+    @staticmethod
+    def _stat(stat, group):
+        entry = {
+            'location': str(stat.traceback[0]),
+            'size_kb': stat.size / 1024,
+            'count': stat.count
+        }
+        if hasattr(stat, 'size_diff'):
+            entry['size_diff_kb'] = stat.size_diff / 1024
+            entry['count_diff'] = stat.count_diff
+        if group == 'traceback':
+            entry['traceback'] = [str(frame) for frame in stat.traceback]
+        return entry
+    
+    def snapshot(self, top=20, group='lineno'):
+        """
+        Take a snapshot of the traced allocations
+        
+        The first snapshot starts tracing and has nothing to report yet;
+        allocations made before tracing started are not seen.
+        
+        Parameters:
+        - top: Number of allocation sites in each list
+        - group: 'lineno', 'filename' or 'traceback'
+        
+        Returns:
+        - Dictionary with traced and peak memory, the top allocation sites and
+          the sites that changed most since the previous snapshot
+        """
+        if group not in ('lineno', 'filename', 'traceback'):
+            raise ValueError(f"Unknown grouping: {group}")
+        with self._lock:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start(self.frames)
+                self._previous = None
+            snapshot = self._take()
+            previous, self._previous = self._previous, snapshot
+            current, peak = tracemalloc.get_traced_memory()
+            result = {
+                'tracing': True,
+                'started': started,
+                'traced_kb': current / 1024,
+                'peak_kb': peak / 1024,
+                'overhead_kb': tracemalloc.get_tracemalloc_memory() / 1024,
+                'top': [],
+                'diff': None
+            }
+            if not started:
+                result['top'] = [self._stat(stat, group) for stat in snapshot.statistics(group)[:top]]
+            if previous is not None:
+                changes = snapshot.compare_to(previous, group)
+                result['diff'] = [self._stat(stat, group) for stat in changes[:top] if stat.size_diff]
+            return result
+    
+    def stop(self):
+        """Stop tracing and forget the previous snapshot"""
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self._previous = None
+
+# Memory profiler shared by the whole process
+MEMORY = MemoryProfiler.from_config()
\ No newline at end of file
@@ -0,0 +1,265 @@
+"""
+Lightweight tracing of poll cycles and API requests
+
+A trace covers one poll or one HTTP request; spans inside it time the
+stages - building a request, waiting for the line, transmitting, waiting
+for the response, decoding, filtering, publishing. Spans are opened with
+TRACER.span(name) in a with block, or kept and closed with .end() where a
+block would not fit. Outside a trace, span() returns a shared no-op span,
+so instrumented code costs next to nothing when it is not being traced.
+Finished traces are kept in a ring buffer and can be exported in the
+Chrome trace-event format (chrome://tracing, Perfetto).
+"""
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+class _NullSpan:
+    """Span returned when nothing is being traced"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+    
+    def set(self, **attrs):
+        pass
+    
+    def end(self):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    """A timed stage of a trace"""
+    
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'start', 'duration', 'attrs')
+    
+    def __init__(self, trace, span_id, parent_id, name, attrs):
+        self.trace = trace
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.duration = None
+        self.start = time.perf_counter()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.end()
+        return False
+    
+    def set(self, **attrs):
+        """Add attributes, e.g. the unit or the number of registers"""
+        self.attrs.update(attrs)
+    
+    def end(self):
+        """Close the span (closing it again does nothing)"""
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.start
+            self.trace._closed(self)
+    
+    def to_dict(self):
+        """Convert to a dictionary with times in milliseconds from the trace start"""
+        return {
+            'id': self.span_id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'offset_ms': (self.start - self.trace.root.start) * 1000,
+            'duration_ms': self.duration * 1000 if self.duration is not None else None,
+            'attrs': self.attrs
+        }
+
+class Trace:
+    """Spans recorded for one poll or request on one thread"""
+    
+    def __init__(self, tracer, trace_id, name, attrs):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.thread = threading.current_thread().name
+        self.thread_id = threading.get_ident()
+        self.started_at = time.time()
+        self.spans = []
+        self.open = []
+        self.dropped = 0
+        self.root = self._open(name, attrs)
+    
+    def _open(self, name, attrs):
+        if len(self.spans) >= self.tracer.max_spans:
+            self.dropped += 1
+            return NULL_SPAN
+        span = Span(self, len(self.spans), self.open[-1].span_id if self.open else None, name, attrs)
+        self.spans.append(span)
+        self.open.append(span)
+        return span
+    
+    def _closed(self, span):
+        if self.open and self.open[-1] is span:
+            self.open.pop()
+        elif span in self.open:
+            self.open.remove(span)
+        if span is self.root:
+            self.tracer._finish(self)
+    
+    @property
+    def duration(self):
+        """Seconds the trace took, or None while it is running"""
+        return self.root.duration
+    
+    def to_dict(self):
+        """Convert to a dictionary for the API"""
+        return {
+            'id': self.trace_id,
+            'name': self.root.name,
+            'start': self.started_at,
+            'duration_ms': self.duration * 1000 if self.duration is not None else None,
+            'thread': self.thread,
+            'attrs': self.root.attrs,
+            'dropped_spans': self.dropped,
+            'spans': [span.to_dict() for span in self.spans[1:]]
+        }
+
+class Tracer:
+    """Creates traces and keeps the most recent finished ones"""
+    
+    def __init__(self, capacity=200, max_spans=500, enabled=True):
+        """
+        Initialize the tracer
+        
+        Parameters:
+        - capacity: Finished traces kept in the ring buffer
+        - max_spans: Spans recorded per trace before further ones are dropped
+        - enabled: Record traces at all
+        """
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.finished = 0
+        self._traces = deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_config(cls, config=None):
+        """Create a tracer from the TRACE_* settings in CONFIG"""
+        if config is None:
+            from config.settings import CONFIG as config
+        return cls(config.get('TRACE_BUFFER', 200), config.get('TRACE_MAX_SPANS', 500),
+                   config.get('TRACING_ENABLED', True))
+    
+    @property
+    def capacity(self):
+        return self._traces.maxlen
+    
+    def current(self):
+        """The trace running on this thread, or None"""
+        return getattr(self._local, 'trace', None)
+    
+    def trace(self, name, **attrs):
+        """
+        Start a trace on this thread
+        
+        Inside a running trace this opens a span instead, so a traced
+        request that polls a meter yields one trace.
+        
+        Returns:
+        - Root span of the trace (a context manager)
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            return trace._open(name, attrs)
+        trace = Trace(self, next(self._ids), name, attrs)
+        self._local.trace = trace
+        return trace.root
+    
+    def span(self, name, **attrs):
+        """
+        Open a span in the trace running on this thread
+        
+        Returns:
+        - Span (a context manager), or a no-op span outside a trace
+        """
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return NULL_SPAN
+        return trace._open(name, attrs)
+    
+    def _finish(self, trace):
+        if getattr(self._local, 'trace', None) is trace:
+            self._local.trace = None
+        with self._lock:
+            self._traces.append(trace)
+            self.finished += 1
+    
+    def traces(self, name=None, min_duration=None, limit=None):
+        """
+        Get recent finished traces, newest first
+        
+        Parameters:
+        - name: Only traces with this root name ('poll', 'http', ...)
+        - min_duration: Only traces that took at least this many seconds
+        - limit: Maximum number of traces
+        
+        Returns:
+        - List of Trace objects
+        """
+        with self._lock:
+            traces = list(self._traces)
+        selected = []
+        for trace in reversed(traces):
+            if name is not None and trace.root.name != name:
+                continue
+            if min_duration is not None and trace.duration < min_duration:
+                continue
+            selected.append(trace)
+            if limit is not None and len(selected) >= limit:
+                break
+        return selected
+    
+    def clear(self):
+        """Forget the finished traces"""
+        with self._lock:
+            self._traces.clear()
+
+def chrome_trace(traces):
+    """
+    Export traces in the Chrome trace-event format
+    
+    Parameters:
+    - traces: Trace objects
+    
+    Returns:
+    - Dictionary to serialize as JSON and open in chrome://tracing or Perfetto
+    """
+    pid = os.getpid()
+    events = []
+    for trace in traces:
+        origin = trace.started_at * 1e6 - trace.root.start * 1e6
+        for span in trace.spans:
+            if span.duration is None:
+                continue
+            events.append({
+                'name': span.name,
+                'cat': trace.root.name,
+                'ph': 'X',
+                'ts': origin + span.start * 1e6,
+                'dur': span.duration * 1e6,
+                'pid': pid,
+                'tid': trace.thread_id,
+                'args': dict(span.attrs, trace=trace.trace_id)
+            })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+# Tracer shared by the whole process
+TRACER = Tracer.from_config()
\ No newline at end of file
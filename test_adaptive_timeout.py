@@ -0,0 +1,105 @@
+"""
+Test script for learned response times and adaptive response timeouts
+"""
+
+import sys
+import os
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from modbus import ModbusClient, TransactionPolicy, calculate_crc
+
+class TimedPort:
+    """Serial port stand-in that answers after a wire time plus a device latency"""
+    
+    def __init__(self, baud_rate, latency):
+        self.char_time = 10 / baud_rate
+        self.latency = latency
+        self.timeout = 1
+        self.is_open = True
+        self.timeouts_seen = []
+        self._pending = b''
+    
+    def reset_input_buffer(self):
+        self._pending = b''
+    
+    def write(self, command):
+        self.timeouts_seen.append(self.timeout)
+        if self.latency is None:
+            return
+        count = (command[4] << 8) | command[5]
+        frame = bytes([command[0], 3, count * 2]) + bytes(count * 2)
+        self._pending = frame + calculate_crc(frame)
+        self._request_length = len(command)
+    
+    def read(self, size):
+        # Block like pyserial: until the frame is complete or the timeout expires
+        if not self._pending:
+            time.sleep(self.timeout)
+            return b''
+        ready = (self._request_length + len(self._pending)) * self.char_time + self.latency
+        if ready > self.timeout:
+            time.sleep(self.timeout)
+            self._pending = b''
+            return b''
+        time.sleep(ready)
+        response, self._pending = self._pending[:size], self._pending[size:]
+        return response
+    
+    def close(self):
+        self.is_open = False
+
+def test_adaptive_timeout():
+    """Timeouts follow each device's learned response times"""
+    
+    print("Testing Adaptive Timeouts")
+    print("=" * 40)
+    
+    policy = TransactionPolicy(retries=1, retry_backoff=0.0, failure_threshold=100)
+    client = ModbusClient('TEST', 38400, timeout=1, policy=policy)
+    port = client.serial = TimedPort(38400, latency=0.002)
+    
+    # The static timeout is used until enough responses have been timed
+    for _ in range(12):
+        assert client.read_registers(44001, 2) is not None
+    assert port.timeouts_seen[0] == 1
+    learned = port.timeouts_seen[-1]
+    assert learned < 0.1
+    stats = client.unit_status(1)['response_times'][9]
+    assert stats['samples'] == 12 and stats['margin_p99_ms'] is not None
+    print(f"   ✓ Learned a {learned * 1000:.1f} ms timeout from {stats['samples']} responses")
+    
+    # Larger requests get their wire time on top of the learned margin
+    for _ in range(12):
+        assert client.read_registers(44001, 64) is not None
+    assert port.timeouts_seen[-1] > learned
+    print(f"   ✓ 64-register reads use {port.timeouts_seen[-1] * 1000:.1f} ms")
+    
+    # A dead device fails fast instead of waiting the full second
+    port.latency = None
+    attempts = len(port.timeouts_seen)
+    assert client.read_registers(44001, 2) is None
+    first, retry = port.timeouts_seen[attempts:]
+    expected = client.response_times.timeout(1, 9, (8 + 9) * client.char_time)
+    assert first == expected and retry == min(client.timeout, 2 * expected)
+    assert first + retry < client.timeout / 2
+    print(f"   ✓ Silent device given {first * 1000:.1f} + {retry * 1000:.1f} ms instead of two full seconds")
+    
+    # A healthy but slower device gets through on the doubled retry timeout and is learned
+    port.latency = learned * 1.5
+    assert client.read_registers(44001, 2) is not None
+    for _ in range(12):
+        assert client.read_registers(44001, 2) is not None
+    assert port.timeouts_seen[-1] > learned
+    print(f"   ✓ Slower device not cut off (timeout now {port.timeouts_seen[-1] * 1000:.1f} ms)")
+    
+    # The floor and ceiling bound the timeout
+    assert min(port.timeouts_seen) >= client.response_times.floor
+    assert max(port.timeouts_seen) <= client.timeout
+    print("   ✓ Timeouts stay between floor and ceiling")
+
+if __name__ == "__main__":
+    test_adaptive_timeout()
\ No newline at end of file
@@ -34,7 +34,7 @@ def main():
                 try:
                     data = self.reader.read_data()
                     if data is not None:
-                        self.meter_data = data
+                        self._publish(data)
                         power = data.get('system', {}).get('power_kw', data.get('power_kw', 'N/A'))
                         logger.info(f"Updated readings: Power={power}kW (Simulated)")
                 except Exception as e:
@@ -0,0 +1,84 @@
+"""
+Test script for serial line utilization accounting and poll capacity estimates
+"""
+
+import sys
+import os
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from core.reader import PowerMeterReader
+from modbus import ModbusClient, TransactionPolicy, calculate_crc
+from modbus.utilization import CapacityWatch
+
+class InstantMeter:
+    """Serial port stand-in that answers at once, unless silenced"""
+    
+    def __init__(self):
+        self.is_open = True
+        self.silent = False
+        self._pending = b''
+    
+    def reset_input_buffer(self):
+        self._pending = b''
+    
+    def write(self, command):
+        if not self.silent:
+            count = (command[4] << 8) | command[5]
+            frame = bytes([command[0], 3, count * 2]) + bytes(count * 2)
+            self._pending = frame + calculate_crc(frame)
+    
+    def read(self, size):
+        response, self._pending = self._pending[:size], self._pending[size:]
+        return response
+    
+    def close(self):
+        self.is_open = False
+
+def test_bus_utilization():
+    """Line time is accounted by category and the poll capacity is estimated"""
+    
+    print("Testing Bus Utilization")
+    print("=" * 40)
+    
+    client = ModbusClient('TEST', 9600, policy=TransactionPolicy(retries=0, failure_threshold=100))
+    port = client.serial = InstantMeter()
+    
+    # Bytes and wire time of two reads and one timeout
+    client.read_registers(44001, 64)
+    client.read_registers(44001, 2)
+    port.silent = True
+    client.read_registers(44001, 2)
+    usage = client.usage.stats()
+    assert usage['transactions'] == 3 and usage['timeouts'] == 1
+    assert usage['bytes_out'] == 24 and usage['bytes_in'] == (5 + 128) + (5 + 4)
+    expected_wire = (24 + 133 + 9) * client.char_time
+    assert abs(usage['wire_seconds'] - expected_wire) < 1e-9
+    assert abs(usage['turnaround_seconds'] - 3 * client.inter_frame_delay) < 1e-9
+    print(f"   ✓ {usage['bytes_out']} bytes out, {usage['bytes_in']} in, "
+          f"{usage['wire_seconds'] * 1000:.1f} ms on the wire")
+    
+    # A poll's line time follows the read plan
+    port.silent = False
+    reader = PowerMeterReader('TEST', 9600, modbus_client=client)
+    reader.block_reader.max_block = 40
+    whole = reader.poll_time(detailed=True)
+    assert len(reader.block_reader.blocks(44001, 64)) == 2
+    assert whole > reader.poll_time(detailed=False)
+    print(f"   ✓ Detailed poll needs {whole * 1000:.1f} ms of line time in two blocks")
+    
+    # Intervals tighter than the line can carry are flagged, with hysteresis
+    watch = CapacityWatch('TEST')
+    capacity = watch.update([(whole, whole / 2), (whole, 60)])
+    assert watch.overloaded and not capacity['sustainable']
+    assert abs(capacity['max_poll_rate'] - 1 / (2 * whole)) < 1e-9
+    watch.update([(whole, whole * 1.05)])
+    assert watch.overloaded
+    watch.update([(whole, 60)])
+    assert not watch.overloaded
+    print(f"   ✓ Overload detected (max {capacity['max_poll_rate']:.1f} rounds/s) and cleared")
+
+if __name__ == "__main__":
+    test_bus_utilization()
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Test script for warm restarts from the state checkpoint
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+import core.checkpoint
+from core import PowerMeterDataManager, SinkPipeline, StateCheckpoint
+from storage import SegmentStore
+
+class FakeReader:
+    """Reader stand-in that only carries a data scalar"""
+    
+    def __init__(self, data_scalar=None):
+        self.data_scalar = data_scalar
+
+class BootedTime:
+    """Stand-in for the time module on a host that booted seconds ago"""
+    
+    def __init__(self, uptime):
+        self.uptime = uptime
+    
+    def monotonic(self):
+        return self.uptime
+    
+    def time(self):
+        return time.time()
+
+def test_warm_restart():
+    """State saved before a restart is served, marked stale, after it"""
+    
+    print("Testing Warm Restart")
+    print("=" * 40)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'state.json')
+        segments = os.path.join(directory, 'segments')
+        base = 1700000000 - 1700000000 % 3600
+        
+        # First run: publish some snapshots and shut down
+        history = SegmentStore(segments, index_stride=4)
+        manager = PowerMeterDataManager(FakeReader(3), history=history,
+                                        pipeline=SinkPipeline(flush_interval=0.01),
+                                        checkpoint=StateCheckpoint(path, interval=3600))
+        assert manager.get_data() == {}
+        for i in range(10):
+            manager._publish({'timestamp': base + i, 'power_kw': float(i)})
+        manager.stop()
+        expected_index = history.index_state()
+        assert expected_index['count'] == 10
+        
+        # Second run: the last snapshot is available before any poll
+        reader = FakeReader()
+        history = SegmentStore(segments, index_stride=4)
+        manager = PowerMeterDataManager(reader, history=history,
+                                        pipeline=SinkPipeline(flush_interval=0.01),
+                                        checkpoint=StateCheckpoint(path))
+        data = manager.get_data()
+        assert data['power_kw'] == 9.0 and data['stale'] is True
+        assert reader.data_scalar == 3
+        print("   ✓ Last snapshot restored and marked stale")
+        
+        # The checkpointed segment index is reused when the segment reopens
+        assert history._restored_index == expected_index
+        manager._publish({'timestamp': base + 10, 'power_kw': 10.0})
+        assert 'stale' not in manager.get_data()
+        manager.pipeline.flush(timeout=5)
+        assert history.index_state()['count'] == 11
+        assert history.query(base, base + 10)['timestamps'] == [base + i for i in range(11)]
+        print("   ✓ Segment index reused without rescanning")
+        manager.stop()
+        
+        # A corrupt checkpoint is ignored
+        with open(path, 'w') as f:
+            f.write('{not json')
+        assert StateCheckpoint(path).load() is None
+
+def test_first_save_after_boot():
+    """The first snapshot is checkpointed at once even right after boot"""
+    
+    print("\nTesting First Checkpoint After Boot")
+    print("=" * 40)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'state.json')
+        checkpoint = StateCheckpoint(path, interval=10)
+        real_time, core.checkpoint.time = core.checkpoint.time, BootedTime(2.0)
+        try:
+            checkpoint.write(checkpoint.capture({'timestamp': 1700000000, 'power_kw': 1.0}))
+            assert checkpoint.saves == 1 and checkpoint.load()['snapshot']['power_kw'] == 1.0
+            core.checkpoint.time.uptime = 5.0
+            checkpoint.write(checkpoint.capture({'timestamp': 1700000003, 'power_kw': 2.0}))
+            assert checkpoint.saves == 1
+            core.checkpoint.time.uptime = 12.0
+            checkpoint.write(checkpoint.capture({'timestamp': 1700000010, 'power_kw': 3.0}))
+            assert checkpoint.saves == 2 and checkpoint.load()['snapshot']['power_kw'] == 3.0
+        finally:
+            core.checkpoint.time = real_time
+        print("   ✓ Saved at once 2 s after boot, then at most once per interval")
+
+if __name__ == "__main__":
+    test_warm_restart()
+    test_first_save_after_boot()
\ No newline at end of file
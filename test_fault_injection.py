@@ -0,0 +1,156 @@
+"""
+Test script for fault injection into the transport and the simulators
+"""
+
+import sys
+import os
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from core import PowerMeterDataManager, PowerMeterSimulator, SimulatedClock, SinkPipeline
+from modbus import ModbusClient, FaultInjector, FaultProfile, FaultScenario
+from modbus.emulator import RTUSlaveEmulator, tty
+
+class ListSink:
+    """Sink that keeps every snapshot"""
+
+    def __init__(self):
+        self.items = []
+
+    def write(self, data):
+        self.items.append(data)
+
+def meter_image(unit):
+    """Register image with recognisable values per unit"""
+    image = {44001 + offset: unit * 100 + offset for offset in range(64)}
+    image[44602] = 3
+    return image
+
+def test_fault_decisions():
+    """Seeded profiles and scripted scenarios"""
+
+    print("Testing Fault Decisions")
+    print("=" * 40)
+
+    profile = FaultProfile('test', latency=('uniform', 0.01, 0.02), crc=0.1, timeout=0.2)
+    first = FaultInjector(profile, seed=7)
+    second = FaultInjector(profile, seed=7)
+    decisions = [first.decide(1) for _ in range(2000)]
+    assert decisions == [second.decide(1) for _ in range(2000)]
+    print("   ✓ Same seed, same faults and latencies")
+
+    stats = first.stats()
+    assert 150 <= stats['injected']['crc'] <= 250, stats
+    assert 330 <= stats['injected']['timeout'] <= 470, stats
+    assert stats['injected']['disconnect'] == 0
+    assert 10 <= stats['avg_added_latency_ms'] <= 20
+    print(f"   ✓ Profile rates respected: {stats['injected']}")
+
+    clock = SimulatedClock(start=0)
+    scenario = FaultScenario().add('stall', at=60, duration=30, unit=3)
+    injector = FaultInjector(scenario=scenario, seed=1, clock=clock)
+    assert injector.decide(3) == (None, 0.0)
+    clock.advance(70)
+    assert injector.decide(3)[0] == 'timeout'
+    assert injector.decide(2)[0] is None
+    clock.advance(20)
+    assert injector.decide(3)[0] is None
+    print("   ✓ Scenario: unit 3 stalls from 60 s to 90 s only")
+
+    scenario = FaultScenario.from_list([{'at': 0, 'for': 5, 'latency': 0.5}])
+    assert scenario.active(1, 4)[0].latency == 0.5 and not scenario.active(5, 4)
+    for bad in (lambda: FaultProfile(crc=0.7, timeout=0.5), lambda: FaultProfile(jitter=0.1),
+                lambda: FaultScenario().add('melt', 0, 1)):
+        try:
+            bad()
+            assert False, "invalid fault configuration accepted"
+        except ValueError:
+            pass
+    print("   ✓ Scenarios from dictionaries, invalid configurations rejected")
+
+def test_simulator_faults():
+    """A stalled meter shows up as missing snapshots on a simulated clock"""
+
+    print("\nTesting Simulator Faults")
+    print("=" * 40)
+
+    start = 1700000000
+    clock = SimulatedClock(start=start)
+    scenario = FaultScenario().add('stall', at=60, duration=30, unit=3)
+    injector = FaultInjector(scenario=scenario, seed=3, clock=clock)
+    simulator = PowerMeterSimulator(seed=3, device_address=3, clock=clock, faults=injector)
+    manager = PowerMeterDataManager(simulator, poll_interval=5, pipeline=SinkPipeline(flush_interval=0.01),
+                                    clock=clock)
+    snapshots = ListSink()
+    manager.add_sink(snapshots, policy='block')
+    manager.start()
+    deadline = time.monotonic() + 30
+    while clock.time() < start + 180 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    manager.stop()
+
+    times = [data['timestamp'] - start for data in snapshots.items if data['timestamp'] < start + 180]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert not [t for t in times if 61 <= t < 90], times
+    assert max(gaps) >= 30 and times[-1] >= 170
+    assert manager.failed_polls >= 5 and manager.polls > manager.failed_polls
+    print(f"   ✓ {len(times)} snapshots, longest gap {max(gaps):.0f} s during the stall")
+
+def test_transport_faults():
+    """Faults at the pyserial level go through the client's retry and reconnect logic"""
+
+    print("\nTesting Transport Faults")
+    print("=" * 40)
+
+    if tty is None:
+        print("   - Skipped: pseudo-terminals are not available on this platform")
+        return
+
+    emulator = RTUSlaveEmulator({1: meter_image(1)}, baud_rate=38400)
+    emulator.start()
+    try:
+        client = ModbusClient(emulator.port, 38400, device_address=1, timeout=0.2)
+        scenario = (FaultScenario()
+                    .add('crc', at=0, duration=0.3)
+                    .add('exception', at=0.6, duration=0.3)
+                    .add('disconnect', at=1.2, duration=0.3))
+        # The scenario runs on its own clock, moved by hand from window to window
+        clock = SimulatedClock(start=0)
+        injector = FaultInjector(scenario=scenario, seed=1, clock=clock)
+        injector.attach(client)
+
+        client.policy.retries = 1
+        assert client.read_registers(44001, 2) is None
+        assert client.unit_status(1)['retries'] == 1
+        print("   ✓ Corrupted CRC discarded and retried")
+
+        clock.advance(0.65)
+        assert client.read_registers(44001, 2) is None
+        assert client.last_exception == 6
+        print("   ✓ Injected exception response decoded")
+
+        clock.advance(0.6)
+        reconnects = client.reconnects
+        assert client.read_registers(44001, 2) is None
+        assert client.reconnects > reconnects
+        clock.advance(0.3)
+        assert client.read_registers(44001, 2) == [100, 101]
+        print("   ✓ Dropped connection reopened with the faults still injected")
+
+        client.policy.retries = 3
+        truncating = FaultInjector(FaultProfile(truncate=0.5), seed=2)
+        truncating.attach(client)
+        assert all(client.read_registers(44001, 4) == [100, 101, 102, 103] for _ in range(10))
+        assert truncating.stats()['injected']['truncate'] > 0
+        print(f"   ✓ Truncated frames recovered by retries: {truncating.stats()['injected']}")
+        client.disconnect()
+    finally:
+        emulator.stop()
+
+if __name__ == "__main__":
+    test_fault_decisions()
+    test_simulator_faults()
+    test_transport_faults()
\ No newline at end of file
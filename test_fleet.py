@@ -0,0 +1,163 @@
+"""
+Test script for the multi-meter fleet manager
+"""
+
+import sys
+import os
+import json
+import tempfile
+import threading
+import time
+import urllib.request
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from api import PowerMeterHTTPServer
+from api.endpoints import auth_manager
+from core import MeterFleetManager, SinkPipeline
+from storage import MeterRollups, SQLiteHistoryStore
+
+class FakeReader:
+    """Reader stand-in that records when and where it was polled"""
+    
+    def __init__(self, definition, log, fail=False, barrier=None):
+        self.definition = definition
+        self.log = log
+        self.fail = fail
+        self.barrier = barrier
+    
+    def read_detailed_data(self):
+        self.log.append((self.definition.meter_id, threading.current_thread().name))
+        if self.barrier is not None:
+            # Only passes if the other bus is polling at the same time
+            self.barrier.wait(5)
+        if self.fail:
+            return None
+        return {'timestamp': time.time(), 'system': {'power_kw': float(self.definition.unit_id)}}
+    
+    read_basic_data = read_detailed_data
+
+def test_fleet_manager():
+    """Meters on one bus poll in order, separate buses poll in parallel"""
+    
+    print("Testing Meter Fleet Manager")
+    print("=" * 40)
+    
+    meters = [
+        {'id': 'a1', 'port': 'BUS_A', 'unit_id': 1, 'poll_interval': 60},
+        {'id': 'a2', 'port': 'BUS_A', 'unit_id': 2, 'poll_interval': 60},
+        {'id': 'b1', 'gateway': '127.0.0.1:4001', 'unit_id': 3, 'poll_interval': 60, 'profile': 'basic'},
+        {'id': 'dead', 'gateway': '127.0.0.1:4001', 'unit_id': 4, 'poll_interval': 60},
+    ]
+    
+    # The default factory shares one client per bus
+    fleet = MeterFleetManager(meters, pipeline=SinkPipeline(flush_interval=0.01))
+    assert len(fleet.buses) == 2
+    assert fleet.meters['a1'].reader.modbus_client is fleet.meters['a2'].reader.modbus_client
+    assert fleet.meters['b1'].reader.modbus_client.port == 'socket://127.0.0.1:4001'
+    assert fleet.meters['a2'].reader.device_address == 2
+    fleet.stop()
+    print("   ✓ Meters grouped into buses with shared clients")
+    
+    log = []
+    # The first meter of each bus waits for the first meter of the other bus
+    barrier = threading.Barrier(2)
+    fleet = MeterFleetManager(
+        meters, pipeline=SinkPipeline(flush_interval=0.01),
+        reader_factory=lambda definition, client: FakeReader(
+            definition, log, fail=definition.meter_id == 'dead',
+            barrier=barrier if definition.meter_id in ('a1', 'b1') else None)
+    )
+    published = []
+    fleet.add_sink(type('Sink', (), {'write': lambda self, data: published.append(data['meter_id'])})())
+    
+    fleet.start()
+    deadline = time.monotonic() + 10
+    while len(log) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    fleet.stop()
+    
+    assert not barrier.broken
+    order = {}
+    for meter_id, thread in log:
+        order.setdefault(thread, []).append(meter_id)
+    assert sorted(order.values()) == [['a1', 'a2'], ['b1', 'dead']]
+    print("   ✓ Buses polled in parallel, meters in order on each bus")
+    
+    assert fleet.get_meter_data('a2')['system']['power_kw'] == 2.0
+    assert fleet.get_meter_data('a2')['meter_id'] == 'a2'
+    assert fleet.get_meter_data('dead') == {}
+    assert fleet.get_meter_data('missing') is None
+    assert fleet.get_data() is fleet.get_meter_data('a1')
+    assert sorted(published) == ['a1', 'a2', 'b1']
+    
+    status = {meter['id']: meter for meter in fleet.get_meters()}
+    assert status['a1']['online'] and not status['dead']['online']
+    assert status['dead']['consecutive_failures'] == 1 and status['dead']['last_error'] == 'No response'
+    print("   ✓ Per-meter snapshots and poll health")
+
+def test_fleet_history():
+    """Each fleet meter's history is queried through /api/history"""
+    
+    print("\nTesting Fleet History")
+    print("=" * 40)
+    
+    meters = [
+        {'id': 'm1', 'port': 'BUS_A', 'unit_id': 1, 'poll_interval': 0.05},
+        {'id': 'm2', 'port': 'BUS_A', 'unit_id': 2, 'poll_interval': 0.05},
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        log = []
+        history = SQLiteHistoryStore(os.path.join(directory, 'history.sqlite3'), flush_interval=0.05)
+        fleet = MeterFleetManager(
+            meters, pipeline=SinkPipeline(flush_interval=0.01),
+            reader_factory=lambda definition, client: FakeReader(definition, log),
+            history=history, rollups=MeterRollups()
+        )
+        assert fleet.history is history
+        fleet.start()
+        deadline = time.monotonic() + 5
+        while len(log) < 6 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        fleet.stop()
+        assert sorted(fleet.rollups.meters) == ['m1', 'm2']
+        
+        server = PowerMeterHTTPServer(0, fleet)
+        server.start()
+        session = auth_manager.authenticate('admin', 'admin')
+        try:
+            if session is None:
+                print("   - Skipped: default admin password has been changed")
+                return
+            base = f"http://127.0.0.1:{server.server.server_address[1]}/api/history"
+            headers = {'Authorization': f"Bearer {session['token']}"}
+            
+            def get(query):
+                request = urllib.request.Request(base + query, headers=headers)
+                try:
+                    with urllib.request.urlopen(request) as response:
+                        return response.status, json.loads(response.read())
+                except urllib.error.HTTPError as e:
+                    return e.code, json.loads(e.read())
+            
+            status, result = get('?meter=m2&fields=system.power_kw')
+            assert status == 200 and result['meter'] == 'm2'
+            assert result['timestamps'] and set(result['series']['system.power_kw']) == {2.0}
+            status, result = get('?meter=m1&fields=system.power_kw&resolution=1')
+            assert status == 200 and result['series']['system.power_kw']['last'][-1] == 1.0
+            print("   ✓ Raw history and rollups of one fleet meter")
+            
+            assert get('')[0] == 400
+            assert get('?meter=missing')[0] == 404
+            print("   ✓ Meter required with several meters, unknown meters rejected")
+        finally:
+            if session is not None:
+                auth_manager.logout(session['token'])
+            server.stop()
+            history.close()
+
+if __name__ == "__main__":
+    test_fleet_manager()
+    test_fleet_history()
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+Test script for the history storage backends
+"""
+
+import sys
+import os
+import tempfile
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+import math
+
+from storage import SegmentStore, SQLiteHistoryStore, CompressedHistoryStore, HISTORY_FIELDS
+from storage import gorilla
+from core.simulator import PowerMeterSimulator
+
+def test_segment_store():
+    """Test writing, querying and retention of the segment store"""
+    
+    print("Testing Segment History Store")
+    print("=" * 40)
+    
+    simulator = PowerMeterSimulator()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = SegmentStore(directory, segment_seconds=60, retention_seconds=300, index_stride=8)
+        
+        # Write 10 minutes of 1-second samples
+        base = 1700000000
+        for i in range(600):
+            data = simulator.read_detailed_data()
+            data['timestamp'] = base + i
+            store.write(data)
+        
+        print(f"   Record size: {store.record_size} bytes for {len(HISTORY_FIELDS)} fields")
+        
+        # Range query within the retained window
+        result = store.query(base + 400, base + 449, ['system.power_kw', 'frequency'])
+        assert result['timestamps'][0] == base + 400
+        assert len(result['timestamps']) == 50
+        assert len(result['series']['system.power_kw']) == 50
+        assert 59 < result['series']['frequency'][0] < 61
+        print("   ✓ Range query returned the expected records")
+        
+        # Old segments are dropped whole when new segments are opened
+        segments = store.list_segments()
+        assert segments[0][0] >= base + 600 - 300 - 60
+        assert store.query(base, base + 100)['timestamps'] == []
+        print(f"   ✓ Retention kept {len(segments)} segments")
+        
+        # Reopening the store continues the existing segment
+        store.close()
+        reopened = SegmentStore(directory, segment_seconds=60, index_stride=8)
+        assert reopened.append(base + 600, [0.0] * len(HISTORY_FIELDS))
+        assert not reopened.append(base + 599, [0.0] * len(HISTORY_FIELDS))
+        assert len(reopened.query(base + 540, base + 600)['timestamps']) == 61
+        reopened.close()
+        print("   ✓ Reopened store appends to the active segment")
+
+def test_sqlite_store():
+    """Test batched writes and range queries of the SQLite backend"""
+    
+    print("Testing SQLite History Store")
+    print("=" * 40)
+    
+    simulator = PowerMeterSimulator()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteHistoryStore(os.path.join(directory, 'history.sqlite3'),
+                                   batch_size=50, flush_interval=0.1)
+        
+        base = 1700000000
+        for i in range(120):
+            data = simulator.read_detailed_data()
+            data['timestamp'] = base + i
+            store.write(data)
+        for i in range(5):
+            # Fleet snapshots carry string meter IDs
+            store.write(dict(simulator.read_detailed_data(), timestamp=base + i, meter_id='m1'))
+        
+        # Closing flushes everything still queued
+        store.close()
+        assert store.rows_written == 125
+        print(f"   ✓ Wrote {store.rows_written} rows in batches")
+        
+        reopened = SQLiteHistoryStore(os.path.join(directory, 'history.sqlite3'))
+        result = reopened.query(base + 10, base + 19, ['system.power_kw', 'phase_1.voltage_ln'])
+        assert result['timestamps'] == [float(base + i) for i in range(10, 20)]
+        assert len(result['series']['phase_1.voltage_ln']) == 10
+        assert reopened.query(base + 10, base + 19, limit=3)['timestamps'][-1] == base + 12
+        assert reopened.query(base, base + 200, meter=99)['timestamps'] == []
+        assert len(reopened.query(base, base + 200, meter='m1')['timestamps']) == 5
+        assert len(reopened.query(base, base + 200, meter=1)['timestamps']) == 120
+        reopened.close()
+        print("   ✓ Range queries return the expected rows")
+
+def test_gorilla_codec():
+    """Test that chunks round-trip exactly with and without NumPy"""
+    
+    print("Testing Gorilla Chunk Codec")
+    print("=" * 40)
+    
+    fields = ['voltage', 'frequency', 'missing', 'energy']
+    timestamps = [1700000000 + i + (i % 7) * 0.001 for i in range(500)]
+    columns = [
+        [230.0 + (i % 13) * 0.1 for i in range(500)],
+        [60.0] * 500,
+        [math.nan] * 500,
+        [1000000.0 + i * 0.05 for i in range(500)],
+    ]
+    chunk = gorilla.encode_chunk(timestamps, columns, fields)
+    assert len(chunk) < 500 * 8 * 5 / 2
+    
+    header = gorilla.read_chunk_header(chunk)
+    assert header['count'] == 500 and header['mins'][0] == 230.0 and header['maxs'][1] == 60.0
+    
+    numpy_module = gorilla.np
+    try:
+        for np_module in (numpy_module, None):
+            gorilla.np = np_module
+            times, values = gorilla.decode_chunk(chunk, fields)
+            assert [round(t, 3) for t in times] == [round(t, 3) for t in timestamps]
+            assert list(values['voltage']) == columns[0]
+            assert list(values['energy']) == columns[3]
+            assert all(math.isnan(v) for v in values['missing'])
+    finally:
+        gorilla.np = numpy_module
+    print(f"   ✓ Chunk of 500 samples round-trips in {len(chunk)} bytes")
+
+def test_compressed_store():
+    """Test chunked writes and range queries of the compressed backend"""
+    
+    print("Testing Compressed History Store")
+    print("=" * 40)
+    
+    simulator = PowerMeterSimulator()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = CompressedHistoryStore(directory, chunk_size=100)
+        base = 1700000000
+        for i in range(450):
+            data = simulator.read_detailed_data()
+            data['timestamp'] = base + i
+            store.write(data)
+        
+        # Four chunks on disk, the rest still buffered
+        assert store.stats()['pending'] == 50
+        result = store.query(base + 95, base + 104, ['system.power_kw'])
+        assert result['timestamps'] == [float(base + i) for i in range(95, 105)]
+        assert len(store.query(base + 420, base + 449)['timestamps']) == 30
+        store.close()
+        
+        reopened = CompressedHistoryStore(directory, chunk_size=100)
+        assert len(reopened.query(base, base + 449)['timestamps']) == 450
+        print(f"   ✓ Compression ratio {store.stats()['compression_ratio']:.2f}x")
+
+if __name__ == "__main__":
+    test_segment_store()
+    test_sqlite_store()
+    test_gorilla_codec()
+    test_compressed_store()
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+Test script for queued, rate-limited and JSON logging
+"""
+
+import sys
+import os
+import json
+import logging
+import tempfile
+import threading
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from config.log_setup import JsonFormatter, RateLimitFilter, setup_logging
+
+class ListHandler(logging.Handler):
+    """Handler that keeps formatted records"""
+    
+    def __init__(self, gate=None):
+        super().__init__()
+        self.gate = gate
+        self.lines = []
+        self.threads = set()
+    
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.threads.add(threading.get_ident())
+        self.lines.append(self.format(record))
+
+def make_logger(name, *handlers):
+    """Logger that only writes to the given handlers"""
+    logger = logging.getLogger(name)
+    logger.handlers = list(handlers)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+def test_rate_limit_and_json():
+    """Repeated messages are summarized, records format as JSON lines"""
+    
+    print("Testing Rate Limit and JSON Format")
+    print("=" * 40)
+    
+    rate_limit = RateLimitFilter(burst=3, interval=0.2)
+    first, second = ListHandler(), ListHandler()
+    for handler in (first, second):
+        handler.addFilter(rate_limit)
+    logger = make_logger('powermeter.test.rate', first, second)
+    for index in range(10):
+        logger.info("Updated readings: Power=%skW", index)
+    logger.warning("Something else")
+    assert first.lines == second.lines
+    assert first.lines == ["Updated readings: Power=0kW", "Updated readings: Power=1kW",
+                           "Updated readings: Power=2kW", "Something else"]
+    time.sleep(0.25)
+    logger.info("Updated readings: Power=%skW", 10)
+    assert first.lines[-1] == "Updated readings: Power=10kW (suppressed 7 similar messages)"
+    assert rate_limit.suppressed_total == 7
+    print("   ✓ Burst of 3 per interval, 7 repeats summarized, one decision per record")
+    
+    handler = ListHandler()
+    handler.setFormatter(JsonFormatter())
+    logger = make_logger('powermeter.test.json', handler)
+    logger.info("Polled %d registers", 64, extra={'unit': 3})
+    try:
+        raise ValueError("bad frame")
+    except ValueError:
+        logger.exception("Poll failed")
+    entries = [json.loads(line) for line in handler.lines]
+    assert entries[0]['message'] == "Polled 64 registers" and entries[0]['unit'] == 3
+    assert entries[0]['level'] == 'INFO' and entries[0]['logger'] == 'powermeter.test.json'
+    assert entries[0]['time'].endswith('+00:00')
+    assert 'ValueError: bad frame' in entries[1]['exception']
+    print("   ✓ JSON lines with extra fields and exceptions")
+
+def test_queued_logging():
+    """Records are written by the listener thread, not the logging thread"""
+    
+    print("\nTesting Queued Logging")
+    print("=" * 40)
+    
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'powermeter.log')
+        config = {'LOG_FORMAT': 'json', 'LOG_FILE': path, 'LOG_QUEUE': True, 'LOG_RATE_LIMIT': None}
+        try:
+            listener = setup_logging(config, None, force=True)
+            assert listener is not None
+            # A disk that stalls until the gate opens
+            slow = ListHandler(gate=threading.Event())
+            listener.handlers = listener.handlers + (slow,)
+            logger = logging.getLogger('powermeter.test.queue')
+            for index in range(200):
+                logger.info("Updated readings: Power=%skW", index)
+            # Everything but the record the stalled handler holds is still queued
+            queued = listener.queue.qsize()
+            written = len(slow.lines)
+            slow.gate.set()
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+        finally:
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            root.handlers, root.level = saved
+        
+        assert written == 0 and queued >= 199, (written, queued)
+        assert len(slow.lines) == 200 and threading.get_ident() not in slow.threads
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == 200 and lines[-1]['message'] == "Updated readings: Power=199kW"
+        print("   ✓ 200 records queued while the disk stalled, written by the listener thread")
+
+if __name__ == "__main__":
+    test_rate_limit_and_json()
+    test_queued_logging()
\ No newline at end of file
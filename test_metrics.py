@@ -0,0 +1,153 @@
+"""
+Test script for the metrics registry and the /metrics endpoint
+"""
+
+import sys
+import os
+import time
+import urllib.request
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from api import PowerMeterHTTPServer
+from api.endpoints import auth_manager
+from core import PowerMeterDataManager, PowerMeterSimulator, SinkPipeline
+from modbus import ModbusClient
+from modbus.emulator import RTUSlaveEmulator, tty
+from telemetry.metrics import MetricsRegistry, REGISTRY
+
+def sample(text, line_start):
+    """Value of the first exposition line starting with line_start"""
+    for line in text.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+def increase(before, after, line_start):
+    """Growth of a series between two scrapes of the process-wide registry"""
+    return sample(after, line_start) - (sample(before, line_start) or 0)
+
+def test_registry():
+    """Counters, gauges and histograms in the Prometheus text format"""
+    
+    print("Testing Metrics Registry")
+    print("=" * 40)
+    
+    registry = MetricsRegistry()
+    requests = registry.counter('test_requests_total', 'Requests', ('port', 'outcome'))
+    ok = requests.labels('/dev/ttyUSB0', 'ok')
+    ok.inc()
+    ok.inc(2)
+    requests.labels(port='COM"3', outcome='timeout').inc()
+    depth = registry.gauge('test_depth', 'Queue depth')
+    depth.labels().set(4)
+    registry.gauge('test_computed', 'Computed').labels().set_function(lambda: 1.5)
+    latency = registry.histogram('test_seconds', 'Latency', ('port',), buckets=(0.01, 0.1))
+    for value in (0.005, 0.01, 0.05, 2.0):
+        latency.labels('a').observe(value)
+    
+    text = registry.render()
+    assert '# TYPE test_requests_total counter' in text
+    assert 'test_requests_total{port="/dev/ttyUSB0",outcome="ok"} 3' in text
+    assert 'test_requests_total{port="COM\\"3",outcome="timeout"} 1' in text
+    assert 'test_depth 4' in text and 'test_computed 1.5' in text
+    assert 'test_seconds_bucket{port="a",le="0.01"} 2' in text
+    assert 'test_seconds_bucket{port="a",le="0.1"} 3' in text
+    assert 'test_seconds_bucket{port="a",le="+Inf"} 4' in text
+    assert 'test_seconds_count{port="a"} 4' in text and sample(text, 'test_seconds_sum') == 2.065
+    print("   ✓ Labelled counters, gauges and cumulative histogram buckets")
+    
+    try:
+        registry.gauge('test_requests_total', 'Requests')
+        assert False, "metric registered twice with a different type"
+    except ValueError:
+        pass
+    
+    count = 100000
+    started = time.perf_counter()
+    for _ in range(count):
+        ok.inc()
+    inc_cost = (time.perf_counter() - started) / count
+    series = latency.labels('a')
+    started = time.perf_counter()
+    for _ in range(count):
+        series.observe(0.02)
+    observe_cost = (time.perf_counter() - started) / count
+    assert inc_cost < 5e-6 and observe_cost < 5e-6
+    print(f"   ✓ {inc_cost * 1e9:.0f} ns per increment, {observe_cost * 1e9:.0f} ns per observation")
+
+def test_metrics_endpoint():
+    """Poll, bus and HTTP metrics served on /metrics"""
+    
+    print("\nTesting /metrics Endpoint")
+    print("=" * 40)
+    
+    manager = PowerMeterDataManager(PowerMeterSimulator(seed=1), poll_interval=0.05,
+                                    pipeline=SinkPipeline(flush_interval=0.01))
+    server = PowerMeterHTTPServer(0, manager)
+    emulator = None
+    manager.start()
+    server.start()
+    try:
+        if tty is not None:
+            emulator = RTUSlaveEmulator({1: {44001 + offset: offset for offset in range(4)}}, baud_rate=38400)
+            emulator.start()
+        before = REGISTRY.render()
+        if emulator is not None:
+            client = ModbusClient(emulator.port, 38400, device_address=1, timeout=0.2)
+            client.policy.retries = 0
+            assert client.read_registers(44001, 4) == [0, 1, 2, 3]
+            assert client.read_registers(45000, 1) is None
+            client.disconnect()
+        
+        time.sleep(0.3)
+        base = f"http://127.0.0.1:{server.server.server_address[1]}"
+        try:
+            urllib.request.urlopen(base + '/api/register/44001')
+        except urllib.error.HTTPError as e:
+            assert e.code == 401
+        try:
+            urllib.request.urlopen(base + '/metrics')
+            assert False, "metrics served without a token"
+        except urllib.error.HTTPError as e:
+            assert e.code == 401
+        
+        session = auth_manager.authenticate('admin', 'admin')
+        if session is None:
+            print("   - Skipped: default admin password has been changed")
+            return
+        request = urllib.request.Request(base + '/metrics',
+                                         headers={'Authorization': f"Bearer {session['token']}"})
+        with urllib.request.urlopen(request) as response:
+            assert response.headers['Content-type'].startswith('text/plain; version=0.0.4')
+            text = response.read().decode('utf-8')
+        auth_manager.logout(session['token'])
+    finally:
+        server.stop()
+        manager.stop()
+        if emulator is not None:
+            emulator.stop()
+    
+    assert sample(text, 'powermeter_polls_total{port="simulator",result="ok"}') >= 3
+    assert sample(text, 'powermeter_poll_seconds_count{port="simulator"}') >= 3
+    assert 0 <= sample(text, 'powermeter_sample_age_seconds{port="simulator"}') < 5
+    assert sample(text, 'powermeter_reads_total{kind="detailed",result="ok"}') >= 3
+    print("   ✓ Scrapes need a token; poll results, poll latency, sample age and read counts")
+    
+    assert increase(before, text, 'powermeter_http_requests_total{method="GET",'
+                                  'route="/api/register/{register}",status="401"}') == 1
+    print("   ✓ HTTP requests by bounded route and status")
+    
+    if emulator is not None:
+        port = emulator.port
+        assert increase(before, text, f'powermeter_modbus_transactions_total{{port="{port}",outcome="ok"}}') == 1
+        assert increase(before, text,
+                        f'powermeter_modbus_transactions_total{{port="{port}",outcome="exception"}}') == 1
+        assert increase(before, text, f'powermeter_modbus_response_seconds_count{{port="{port}"}}') == 2
+        print("   ✓ Modbus transaction outcomes and response times per port")
+
+if __name__ == "__main__":
+    test_registry()
+    test_metrics_endpoint()
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Test script for the Modbus TCP server fed from the register image
+"""
+
+import sys
+import os
+import socket
+import struct
+import threading
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from api import ModbusTCPServer
+from core.reader import PowerMeterReader
+
+class CountingClient:
+    """Modbus client stand-in that counts every request reaching the serial line"""
+    
+    def __init__(self):
+        self.reads = 0
+        self.writes = []
+        self.last_exception = None
+    
+    def read_registers(self, register_address, register_count=1, unit=None):
+        self.reads += 1
+        return [(register_address + i) % 65536 for i in range(register_count)]
+    
+    def write_register(self, register_address, value, unit=None):
+        self.writes.append((unit, register_address, [value]))
+        return True
+    
+    def write_registers(self, register_address, values, unit=None):
+        self.writes.append((unit, register_address, list(values)))
+        return True
+
+class FakeManager:
+    """Single-meter data manager stand-in"""
+    
+    def __init__(self, reader):
+        self.reader = reader
+
+def request(sock, transaction_id, unit, pdu):
+    """Send one MBAP request and return the response PDU"""
+    sock.sendall(struct.pack('>HHHB', transaction_id, 0, len(pdu) + 1, unit) + pdu)
+    header = sock.recv(7, socket.MSG_WAITALL)
+    tid, _, length, _ = struct.unpack('>HHHB', header)
+    assert tid == transaction_id
+    return sock.recv(length - 1, socket.MSG_WAITALL)
+
+def test_modbus_tcp_server():
+    """Reads come from the register image, writes are forwarded"""
+    
+    print("Testing Modbus TCP Server")
+    print("=" * 40)
+    
+    client = CountingClient()
+    reader = PowerMeterReader('TEST', 9600, device_address=7, modbus_client=client)
+    reader.data_scalar = 3
+    server = ModbusTCPServer(0, FakeManager(reader), host='127.0.0.1', allow_writes=True)
+    server.start()
+    port = server.server.server_address[1]
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+            # Nothing has been polled yet
+            assert request(sock, 1, 7, struct.pack('>BHH', 3, 4000, 2)) == bytes([0x83, 0x0B])
+            
+            assert reader.read_detailed_data() is not None
+            polled = client.reads
+            
+            # FC3 and FC4 of the detailed block (44001 is offset 4000)
+            response = request(sock, 2, 7, struct.pack('>BHH', 3, 4000, 64))
+            assert response[:2] == bytes([3, 128])
+            assert list(struct.unpack('>64H', response[2:])) == list(range(44001, 44065))
+            response = request(sock, 3, 0, struct.pack('>BHH', 4, 4060, 4))
+            assert list(struct.unpack('>4H', response[2:])) == [44061, 44062, 44063, 44064]
+            print("   ✓ FC3/FC4 served from the register image")
+            
+            # Registers that were never polled, unknown units and functions
+            assert request(sock, 4, 7, struct.pack('>BHH', 3, 4060, 8)) == bytes([0x83, 0x02])
+            assert request(sock, 5, 9, struct.pack('>BHH', 3, 4000, 2)) == bytes([0x83, 0x0A])
+            assert request(sock, 6, 7, bytes([0x2B, 0x0E, 0x01, 0x00])) == bytes([0xAB, 0x01])
+            print("   ✓ Exception responses for unknown registers, units and functions")
+        
+        # Many clients at once, without a single extra serial request
+        results = []
+        def poll_client():
+            with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+                for i in range(20):
+                    results.append(request(sock, i, 7, struct.pack('>BHH', 3, 4000, 22))[1] == 44)
+        threads = [threading.Thread(target=poll_client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(results) == 160 and all(results)
+        assert client.reads == polled
+        print("   ✓ 8 concurrent clients, 160 reads, no serial traffic")
+        
+        # Writes go through the queue to the meter
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+            pdu = struct.pack('>BHH', 6, 4010, 1234)
+            assert request(sock, 7, 7, pdu) == pdu
+            pdu = struct.pack('>BHHB2H', 16, 4020, 2, 4, 1, 2)
+            assert request(sock, 8, 7, pdu) == pdu[:5]
+        assert client.writes == [(7, 44011, [1234]), (7, 44021, [1, 2])]
+        assert server.stats()['writes_forwarded'] == 2
+        print("   ✓ FC6/FC16 forwarded to the meter")
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    test_modbus_tcp_server()
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Test script for the write-behind sink pipeline
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from core.data_manager import PowerMeterDataManager
+from core.pipeline import SinkPipeline, BLOCK
+
+class SlowSink:
+    """Sink that takes a long time per batch until released"""
+    
+    def __init__(self):
+        self.release = threading.Event()
+        self.batches = []
+        self.closed = False
+    
+    def write_batch(self, items):
+        self.release.wait(5)
+        self.batches.append(list(items))
+    
+    def close(self):
+        self.closed = True
+
+class ListSink:
+    """Sink that records every snapshot"""
+    
+    def __init__(self):
+        self.items = []
+    
+    def write(self, data):
+        self.items.append(data)
+
+def test_sink_pipeline():
+    """Slow sinks must not delay publishing"""
+    
+    print("Testing Sink Pipeline")
+    print("=" * 40)
+    
+    # A slow sink never delays the publisher, and the oldest snapshots are dropped
+    pipeline = SinkPipeline(queue_size=10, batch_size=5, flush_interval=0.05)
+    slow = SlowSink()
+    fast = ListSink()
+    pipeline.add_sink(slow, name='slow')
+    pipeline.add_sink(fast, name='fast', queue_size=1000)
+    
+    started = time.perf_counter()
+    for i in range(100):
+        pipeline.publish({'timestamp': i})
+    assert time.perf_counter() - started < 0.5
+    
+    stats = pipeline.stats()
+    assert stats['slow']['dropped'] > 0
+    assert stats['slow']['queued'] <= 10
+    slow.release.set()
+    assert pipeline.flush(timeout=5)
+    
+    # The newest snapshots survive and batches respect the batch size
+    written = [item['timestamp'] for batch in slow.batches for item in batch]
+    assert written[-1] == 99 and written == sorted(written)
+    assert all(len(batch) <= 5 for batch in slow.batches)
+    assert [item['timestamp'] for item in fast.items] == list(range(100))
+    stats = pipeline.stats()
+    assert stats['slow']['written'] + stats['slow']['dropped'] == 100
+    assert stats['slow']['max_flush_seconds'] > 0
+    print(f"   ✓ Slow sink dropped {stats['slow']['dropped']} oldest snapshots, fast sink got all")
+    
+    pipeline.close()
+    assert slow.closed
+    
+    # The block policy applies backpressure instead of dropping
+    pipeline = SinkPipeline(queue_size=2, batch_size=1, flush_interval=0.01, policy=BLOCK)
+    sink = ListSink()
+    pipeline.add_sink(sink)
+    for i in range(50):
+        pipeline.publish({'timestamp': i})
+    pipeline.close()
+    assert len(sink.items) == 50
+    print("   ✓ Block policy keeps every snapshot")
+    
+    # capture() runs on the publishing thread and feeds write()
+    pipeline = SinkPipeline(flush_interval=0.01)
+    sink = ListSink()
+    sink.capture = lambda data: data['timestamp'] * 2 if data['timestamp'] % 2 else None
+    pipeline.add_sink(sink)
+    for i in range(10):
+        pipeline.publish({'timestamp': i})
+    pipeline.close()
+    assert sink.items == [2, 6, 10, 14, 18]
+    print("   ✓ Capture hook filters and transforms snapshots")
+
+def test_data_manager_publish():
+    """The data manager publishes through its pipeline"""
+    
+    sink = ListSink()
+    manager = PowerMeterDataManager(None, pipeline=SinkPipeline(flush_interval=0.01))
+    manager.add_sink(sink, name='list')
+    manager._publish({'timestamp': 1.0, 'power_kw': 2.0})
+    assert manager.get_data()['power_kw'] == 2.0
+    manager.pipeline.flush(timeout=5)
+    assert sink.items and manager.get_pipeline_stats()['list']['written'] == 1
+    manager.stop()
+
+if __name__ == "__main__":
+    test_sink_pipeline()
+    test_data_manager_publish()
\ No newline at end of file
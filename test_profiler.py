@@ -0,0 +1,171 @@
+"""
+Test script for the stack sampler, memory snapshots and their admin endpoints
+"""
+
+import sys
+import os
+import json
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from api import PowerMeterHTTPServer
+from api.endpoints import auth_manager
+from telemetry.profiler import MemoryProfiler, ProfilerBusy, StackSampler, collapsed, top_frames
+
+def spin_for(seconds):
+    """Keep a thread busy in a function the sampler can find"""
+    deadline = time.monotonic() + seconds
+    total = 0
+    while time.monotonic() < deadline:
+        total += sum(range(200))
+    return total
+
+def retained_buffers(leak):
+    """Allocate memory that stays alive"""
+    leak.extend(bytearray(1024) for _ in range(2000))
+
+def test_stack_sampler():
+    """Collapsed stacks of a busy thread"""
+    
+    print("Testing Stack Sampler")
+    print("=" * 40)
+    
+    worker = threading.Thread(target=spin_for, args=(1.0,), name='meter-poll-test')
+    worker.start()
+    try:
+        profile = StackSampler(interval=0.005, threads=['meter-poll-test']).run(0.3)
+    finally:
+        worker.join()
+    
+    assert profile['samples'] >= 10
+    assert list(profile['threads']) == ['meter-poll-test']
+    stacks = profile['stacks']
+    assert all(stack.startswith('meter-poll-test;') for stack in stacks)
+    assert any('spin_for (test_profiler.py)' in stack for stack in stacks)
+    print(f"   ✓ {profile['samples']} samples of the selected thread")
+    
+    text = collapsed(stacks)
+    stack, count = text.splitlines()[0].rsplit(' ', 1)
+    assert stacks[stack] == int(count) == max(stacks.values())
+    top = top_frames(stacks, limit=3)
+    assert top[0]['thread'] == 'meter-poll-test' and top[0]['samples'] <= profile['samples']
+    print("   ✓ Collapsed stack text and hottest frames")
+    
+    StackSampler._running.acquire()
+    try:
+        StackSampler().run(0.1)
+        assert False, "second profile allowed while one is running"
+    except ProfilerBusy:
+        print("   ✓ Only one profile runs at a time")
+    finally:
+        StackSampler._running.release()
+
+def test_memory_profiler():
+    """tracemalloc snapshots and the growth between them"""
+    
+    print("\nTesting Memory Profiler")
+    print("=" * 40)
+    
+    if tracemalloc.is_tracing():
+        print("   - Skipped: tracemalloc is already tracing")
+        return
+    
+    profiler = MemoryProfiler()
+    leak = []
+    try:
+        first = profiler.snapshot()
+        assert first['started'] and first['diff'] is None and profiler.tracing
+        print("   ✓ First snapshot starts tracing")
+        
+        retained_buffers(leak)
+        second = profiler.snapshot(top=5)
+        assert not second['started'] and len(second['top']) <= 5
+        assert second['traced_kb'] >= 2000 and second['peak_kb'] >= second['traced_kb']
+        growth = [entry for entry in second['diff'] if 'test_profiler.py' in entry['location']]
+        assert growth and growth[0]['size_diff_kb'] >= 2000 and growth[0]['count_diff'] >= 2000
+        print(f"   ✓ Growth since the previous snapshot found at {growth[0]['location']}")
+        
+        try:
+            profiler.snapshot(group='module')
+            assert False, "unknown grouping accepted"
+        except ValueError:
+            print("   ✓ Unknown grouping rejected")
+    finally:
+        profiler.stop()
+    assert not profiler.tracing
+    print("   ✓ Stopping ends tracing")
+
+def test_debug_endpoints():
+    """Profile and memory endpoints are for admins only"""
+    
+    print("\nTesting /api/debug/profile and /api/debug/memory Endpoints")
+    print("=" * 40)
+    
+    server = PowerMeterHTTPServer(0, None)
+    server.start()
+    try:
+        base = f"http://127.0.0.1:{server.server.server_address[1]}"
+        for path in ('/api/debug/profile', '/api/debug/memory'):
+            try:
+                urllib.request.urlopen(base + path)
+                assert False, f"{path} served without a token"
+            except urllib.error.HTTPError as e:
+                assert e.code == 401
+        print("   ✓ Rejected without a token")
+        
+        session = auth_manager.authenticate('admin', 'admin')
+        if session is None:
+            print("   - Skipped: default admin password has been changed")
+            return
+        headers = {'Authorization': f"Bearer {session['token']}"}
+        
+        request = urllib.request.Request(base + '/api/debug/profile?seconds=0.2&interval_ms=5', headers=headers)
+        with urllib.request.urlopen(request) as response:
+            result = json.loads(response.read())
+        assert result['samples'] >= 5 and 'http-api' in result['threads']
+        assert result['top'] and result['stacks']
+        print("   ✓ JSON profile of the HTTP server threads")
+        
+        request = urllib.request.Request(base + '/api/debug/profile?seconds=0.1&threads=http-api&format=collapsed',
+                                         headers=headers)
+        with urllib.request.urlopen(request) as response:
+            assert response.headers['Content-type'].startswith('text/plain')
+            lines = response.read().decode('utf-8').splitlines()
+        assert lines and all(line.startswith('http-api;') for line in lines)
+        print("   ✓ Collapsed stacks filtered by thread")
+        
+        request = urllib.request.Request(base + '/api/debug/profile?seconds=3600', headers=headers)
+        try:
+            urllib.request.urlopen(request)
+            assert False, "overlong profile accepted"
+        except urllib.error.HTTPError as e:
+            assert e.code == 400
+        print("   ✓ Profiles longer than PROFILE_MAX_SECONDS rejected")
+        
+        if not tracemalloc.is_tracing():
+            request = urllib.request.Request(base + '/api/debug/memory', headers=headers)
+            with urllib.request.urlopen(request) as response:
+                assert json.loads(response.read())['started']
+            request = urllib.request.Request(base + '/api/debug/memory?top=3', headers=headers)
+            with urllib.request.urlopen(request) as response:
+                result = json.loads(response.read())
+            assert not result['started'] and len(result['top']) <= 3 and result['diff'] is not None
+            request = urllib.request.Request(base + '/api/debug/memory?stop=1', headers=headers)
+            with urllib.request.urlopen(request) as response:
+                assert json.loads(response.read()) == {'tracing': False}
+            assert not tracemalloc.is_tracing()
+            print("   ✓ Memory tracing started, compared and stopped on request")
+        auth_manager.logout(session['token'])
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    test_stack_sampler()
+    test_memory_profiler()
+    test_debug_endpoints()
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+Test script for adaptive block sizing of the detailed register read
+"""
+
+import sys
+import os
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from core.reader import PowerMeterReader, DETAILED_PAIRS
+
+class PickyMeter:
+    """Client stand-in for firmware with a block size limit and unmapped registers"""
+    
+    def __init__(self, max_block, holes):
+        self.max_block = max_block
+        self.holes = set(holes)
+        self.online = True
+        self.requests = []
+        self.last_exception = None
+    
+    def read_registers(self, register_address, register_count=1, unit=None):
+        self.requests.append((register_address, register_count))
+        self.last_exception = None
+        if not self.online:
+            return None
+        addresses = range(register_address, register_address + register_count)
+        if register_count > self.max_block:
+            self.last_exception = 3  # Illegal data value
+            return None
+        if self.holes.intersection(addresses):
+            self.last_exception = 2  # Illegal data address
+            return None
+        return [address - 44000 for address in addresses]
+
+def test_adaptive_block_read():
+    """Failed ranges are split down to the failing registers and the plan is reused"""
+    
+    print("Testing Adaptive Block Reads")
+    print("=" * 40)
+    
+    meter = PickyMeter(max_block=20, holes={44050})
+    reader = PowerMeterReader('TEST', 9600, modbus_client=meter)
+    reader.data_scalar = 3
+    
+    data = reader.read_detailed_data()
+    assert data is not None
+    assert data['missing_registers'] == [44050]
+    assert data['phase_1']['displacement_pf'] is None
+    assert data['phase_2']['displacement_pf'] is not None
+    assert data['time_since_reset'] == (63 << 16) | 62
+    assert reader.last_frame is None
+    assert reader.block_reader.max_block <= 20
+    print(f"   ✓ Learned a {reader.block_reader.max_block}-register limit and isolated 44050 "
+          f"in {len(meter.requests)} requests")
+    
+    # 32-bit values always come back from a single request
+    for address, count in meter.requests:
+        for lsw in DETAILED_PAIRS:
+            assert (address <= lsw < address + count) == (address <= lsw + 1 < address + count)
+    print("   ✓ No request splits an LSW/MSW pair")
+    
+    # The cached plan goes straight to the working blocks
+    status = reader.block_reader.plan_status()
+    blocks = status['plans']['44001+64']['blocks']
+    assert status['plans']['44001+64']['unreadable'] == [44050]
+    meter.requests.clear()
+    assert reader.read_detailed_data()['missing_registers'] == [44050]
+    assert meter.requests == [tuple(block) for block in blocks]
+    print(f"   ✓ Later polls use the cached plan ({len(blocks)} requests)")
+    
+    # A silent device fails the poll without throwing the plan away
+    meter.online = False
+    assert reader.read_detailed_data() is None
+    assert reader.block_reader.plan_status()['plans']['44001+64']['blocks'] == blocks
+    print("   ✓ Timeouts do not trigger relearning")
+    
+    # A device that starts refusing part of the plan is relearned
+    meter.online = True
+    meter.holes.add(44010)
+    data = reader.read_detailed_data()
+    assert data['missing_registers'] == [44010, 44050]
+    assert data['system']['reactive_power_kvar'] is None
+    assert reader.block_reader.relearns == 1
+    print("   ✓ Plan relearned after the device changed")
+
+if __name__ == "__main__":
+    test_adaptive_block_read()
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Test script for the multi-resolution rollup engine
+"""
+
+import sys
+import os
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from storage import RollupEngine
+
+def test_rollup_tiers():
+    """Test bucket aggregation, cascading and tier selection"""
+    
+    print("Testing Rollup Engine")
+    print("=" * 40)
+    
+    engine = RollupEngine(tiers=[(1, 7200), (60, 1000), (900, 1000), (3600, 1000)],
+                          fields=['system.power_kw'])
+    closed = []
+    engine.add_listener(lambda seconds, bucket: closed.append((seconds, bucket['start'])))
+    
+    # Two hours of 1-second samples with a ramp inside every minute
+    base = 1700000000 - 1700000000 % 3600
+    for i in range(7200):
+        engine.add(base + i, [float(i % 60)])
+    
+    assert (60, base) in closed and (3600, base) in closed
+    print(f"   ✓ {len(closed)} buckets emitted across tiers")
+    
+    # Minute buckets carry min/max/mean/last of the ramp
+    result = engine.query(base, base + 599, resolution=60)
+    power = result['series']['system.power_kw']
+    assert result['timestamps'][0] == base
+    assert power['min'][0] == 0.0 and power['max'][0] == 59.0
+    assert power['mean'][0] == 29.5 and power['last'][0] == 59.0
+    print("   ✓ Minute buckets aggregate min/max/mean/last")
+    
+    # The hour tier merges minute buckets without rescanning samples
+    hourly = engine.query(base, base + 3599, resolution=3600)
+    assert hourly['series']['system.power_kw']['mean'][0] == 29.5
+    
+    # Tier selection honours the requested point count
+    assert engine.select_tier(base, base + 7200, 10000) == 1
+    assert engine.select_tier(base, base + 7200, 500) == 60
+    assert engine.select_tier(base, base + 7200, 10) == 900
+    assert engine.query(base, base + 7200, max_points=3)['resolution'] == 3600
+    print("   ✓ Query picks the tier matching max_points")
+
+if __name__ == "__main__":
+    test_rollup_tiers()
\ No newline at end of file
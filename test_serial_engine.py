@@ -0,0 +1,204 @@
+"""
+Test script for the selector-driven serial engine using pseudo-terminals
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+try:
+    import termios
+except ImportError:  # The termios engine is Linux/POSIX only
+    termios = None
+
+from modbus import SharedBusClient, calculate_crc
+from modbus.serial_engine import SerialEngine, open_raw_port
+
+def _responder(master, stop, delay=0.01):
+    """Answer read-register requests written to the slave side of a pty"""
+    buffer = b''
+    while not stop.is_set():
+        try:
+            data = os.read(master, 256)
+        except BlockingIOError:
+            time.sleep(0.001)
+            continue
+        except OSError:
+            return
+        buffer += data
+        while len(buffer) >= 8:
+            request, buffer = buffer[:8], buffer[8:]
+            count = (request[4] << 8) | request[5]
+            frame = bytes([request[0], 3, count * 2]) + bytes(count * 2)
+            time.sleep(delay)
+            os.write(master, frame + calculate_crc(frame))
+
+def _open_pty():
+    """Create a pty pair, returning (master fd, slave path)"""
+    master, slave = os.openpty()
+    path = os.ttyname(slave)
+    os.set_blocking(master, False)
+    # The engine opens the slave by path; keep our fd open so the pty stays alive
+    return master, slave, path
+
+def test_serial_engine_ptys():
+    """Many ports run from one engine thread with per-port timeouts"""
+    
+    print("Testing Serial Engine")
+    print("=" * 40)
+    
+    if termios is None:
+        print("   - Skipped: termios is not available on this platform")
+        return
+    
+    engine = SerialEngine()
+    engine.start()
+    stop = threading.Event()
+    ptys = [_open_pty() for _ in range(4)]
+    silent = _open_pty()
+    threads = []
+    try:
+        for i, (master, _, path) in enumerate(ptys):
+            engine.open_port(f'port{i}', path, 9600)
+            thread = threading.Thread(target=_responder, args=(master, stop, 0.05))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        engine.open_port('silent', silent[2], 9600)
+        
+        # Raw mode is applied to the device
+        fd = open_raw_port(ptys[0][2], 19200)
+        attrs = termios.tcgetattr(fd)
+        assert not attrs[3] & termios.ICANON and attrs[6][termios.VMIN] == 0
+        os.close(fd)
+        
+        request = bytes([1, 3, 0, 0, 0, 4])
+        request += calculate_crc(request)
+        transactions = [engine.submit(f'port{i}', request, 13, timeout=1.0) for i in range(4)]
+        timed_out = engine.submit('silent', request, 13, timeout=0.2)
+        for transaction in transactions:
+            assert len(transaction.wait(5)) == 13 and transaction.error is None
+        stats = engine.stats()
+        for i in range(4):
+            port = stats[f'port{i}']
+            assert port['transactions'] == 1 and port['errors'] == 0 and port['timeouts'] == 0
+            assert port['bytes_out'] == 8 and port['bytes_in'] == 13
+        # Every request went out before the first 50 ms response came back
+        assert max(t.sent for t in transactions) < min(t.finished for t in transactions)
+        print("   ✓ Four ports had their requests in flight together on one engine thread")
+        
+        assert timed_out.wait(5) == b'' and timed_out.error == 'timeout'
+        assert engine.stats()['silent']['timeouts'] == 1
+        print("   ✓ Silent port timed out without holding up the others")
+        
+        # ModbusClient routes its I/O through the engine
+        client = SharedBusClient('port0', 9600, engine=engine)
+        client.inter_frame_delay = 0.001
+        client.connect = lambda: True
+        assert client.read_registers(44001, 4, unit=1) == [0, 0, 0, 0]
+        assert client.read_registers(44001, 4, unit=2) == [0, 0, 0, 0]
+        print("   ✓ Modbus client reads through the engine")
+    finally:
+        stop.set()
+        engine.stop()
+        for master, slave, _ in ptys + [silent]:
+            os.close(master)
+            os.close(slave)
+
+def test_serial_engine_lost_device():
+    """A device that goes away is dropped and its transaction failed"""
+    
+    print("\nTesting Serial Engine Lost Device")
+    print("=" * 40)
+    
+    if termios is None:
+        print("   - Skipped: termios is not available on this platform")
+        return
+    
+    engine = SerialEngine()
+    engine.start()
+    master, slave, path = _open_pty()
+    try:
+        engine.open_port('gone', path, 9600)
+        request = bytes([1, 3, 0, 0, 0, 4])
+        request += calculate_crc(request)
+        transaction = engine.submit('gone', request, 13, timeout=30.0)
+        while transaction.sent is None and not transaction.done:
+            time.sleep(0.01)
+        
+        # Reads of the slave side fail with EIO or hit end of file once the master is closed
+        os.close(master)
+        master = None
+        assert transaction.wait(5) == b'', transaction.response
+        error = transaction.error
+        assert error == 'device closed' or error.startswith('read failed'), error
+        assert not engine.has_port('gone') and not engine.failed
+        print("   ✓ Pending transaction failed and the port removed instead of waiting 30 s")
+    finally:
+        engine.stop()
+        if master is not None:
+            os.close(master)
+        os.close(slave)
+
+def test_serial_engine_failure():
+    """An engine that crashes fails its transactions and clients fall back"""
+    
+    print("\nTesting Serial Engine Failure")
+    print("=" * 40)
+    
+    if termios is None:
+        print("   - Skipped: termios is not available on this platform")
+        return
+    
+    engine = SerialEngine()
+    engine.start()
+    stop = threading.Event()
+    silent = _open_pty()
+    answering = _open_pty()
+    thread = threading.Thread(target=_responder, args=(answering[0], stop, 0.001))
+    thread.daemon = True
+    thread.start()
+    try:
+        engine.open_port('silent', silent[2], 9600)
+        request = bytes([1, 3, 0, 0, 0, 4])
+        request += calculate_crc(request)
+        transaction = engine.submit('silent', request, 13, timeout=30.0)
+        while transaction.sent is None and not transaction.done:
+            time.sleep(0.01)
+        
+        def broken(port, now):
+            raise RuntimeError("bug in the state machine")
+        engine._advance = broken
+        engine._wake()
+        
+        assert transaction.wait(5) == b'' and transaction.done
+        assert transaction.error == 'engine failed: bug in the state machine', transaction.error
+        assert engine.failed and engine.stats() == {}
+        try:
+            engine.submit('silent', request, 13)
+            assert False, "submission accepted by a dead engine"
+        except OSError:
+            pass
+        print("   ✓ Pending transaction failed and new ones refused")
+        
+        client = SharedBusClient(answering[2], 9600, engine=engine)
+        assert client.read_registers(44001, 4, unit=1) == [0, 0, 0, 0]
+        assert client.engine is None
+        client.disconnect()
+        print("   ✓ Modbus client fell back to the port itself")
+    finally:
+        stop.set()
+        engine.stop()
+        for master, slave, _ in (silent, answering):
+            os.close(master)
+            os.close(slave)
+
+if __name__ == "__main__":
+    test_serial_engine_ptys()
+    test_serial_engine_lost_device()
+    test_serial_engine_failure()
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Test script for multi-drop polling on a shared RS-485 bus
+"""
+
+import sys
+import os
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from modbus import SharedBusClient, calculate_crc, inter_frame_delay
+
+class FakeBus:
+    """Serial port stand-in where only some unit IDs answer"""
+    
+    def __init__(self, live_units):
+        self.live_units = live_units
+        self.is_open = True
+        self.requests = []
+        self._pending = b''
+    
+    def reset_input_buffer(self):
+        self._pending = b''
+    
+    def write(self, command):
+        self.requests.append((command[0], time.monotonic()))
+        if command[0] in self.live_units:
+            count = (command[4] << 8) | command[5]
+            frame = bytes([command[0], 3, count * 2]) + bytes(range(count * 2))
+            self._pending = frame + calculate_crc(frame)
+    
+    def read(self, size):
+        response, self._pending = self._pending[:size], self._pending[size:]
+        return response
+    
+    def close(self):
+        self.is_open = False
+
+def test_shared_bus_quarantine():
+    """Dead units are quarantined and probed with backoff"""
+    
+    print("Testing Shared Bus Client")
+    print("=" * 40)
+    
+    client = SharedBusClient('BUS', 9600, quarantine_after=2, backoff=0.05, max_backoff=0.2)
+    bus = FakeBus(live_units={1, 2})
+    client.serial = bus
+    
+    # Several units answer over the same open port, separated by t3.5
+    assert client.read_registers(44001, 2, unit=1) == [0x0001, 0x0203]
+    assert client.read_registers(44001, 2, unit=2) is not None
+    gap = bus.requests[1][1] - bus.requests[0][1]
+    assert gap >= inter_frame_delay(9600) * 0.9
+    print(f"   ✓ Back-to-back requests to two units ({gap * 1000:.1f} ms apart)")
+    
+    # A dead unit is quarantined after two misses and then skipped
+    assert client.read_registers(44001, 2, unit=3) is None
+    assert client.read_registers(44001, 2, unit=3) is None
+    assert client.is_quarantined(3)
+    sent = len(bus.requests)
+    assert client.read_registers(44001, 2, unit=3) is None
+    assert len(bus.requests) == sent
+    assert client.unit_status(3)['skipped'] == 1
+    assert client.read_registers(44001, 2, unit=1) is not None
+    print("   ✓ Dead unit quarantined without blocking the others")
+    
+    # Probes go out when the backoff expires, and the backoff doubles
+    time.sleep(0.06)
+    assert not client.is_quarantined(3)
+    client.read_registers(44001, 2, unit=3)
+    assert len(bus.requests) == sent + 2
+    assert client.is_quarantined(3)
+    assert abs(client._health(3).backoff - 0.1) < 1e-9
+    
+    # A successful probe releases the unit
+    bus.live_units.add(3)
+    time.sleep(0.11)
+    assert client.read_registers(44001, 2, unit=3) is not None
+    status = client.unit_status(3)
+    assert not status['quarantined'] and status['quarantines'] == 1
+    print("   ✓ Quarantined unit probed with backoff and released")
+
+if __name__ == "__main__":
+    test_shared_bus_quarantine()
\ No newline at end of file
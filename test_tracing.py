@@ -0,0 +1,200 @@
+"""
+Test script for poll and request tracing and the /api/debug/traces endpoint
+"""
+
+import sys
+import os
+import json
+import time
+import urllib.request
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from api import PowerMeterHTTPServer
+from api.endpoints import auth_manager
+from core import PowerMeterDataManager, PowerMeterReader, PowerMeterSimulator, SinkPipeline
+from modbus import ModbusClient
+from modbus.emulator import RTUSlaveEmulator, tty
+from telemetry.tracing import Tracer, TRACER, NULL_SPAN, chrome_trace
+
+def span_names(trace):
+    return [span.name for span in trace.spans]
+
+def test_tracer():
+    """Span nesting, the no-op span and the ring buffer"""
+    
+    print("Testing Tracer")
+    print("=" * 40)
+    
+    tracer = Tracer(capacity=3, max_spans=4)
+    assert tracer.span('orphan') is NULL_SPAN
+    with tracer.span('orphan') as span:
+        span.set(ignored=True)
+    print("   ✓ Spans outside a trace are a shared no-op")
+    
+    with tracer.trace('poll', port='/dev/ttyUSB0') as root:
+        with tracer.span('build'):
+            pass
+        with tracer.span('transaction', unit=1) as transaction:
+            with tracer.span('transmit'):
+                pass
+            transaction.set(outcome='ok')
+        decode = tracer.span('decode')
+        decode.end()
+        with tracer.span('filter'):
+            pass
+        root.set(done=True)
+    assert tracer.current() is None
+    trace = tracer.traces()[0]
+    assert span_names(trace) == ['poll', 'build', 'transaction', 'transmit']
+    assert trace.dropped == 2
+    spans = {span.name: span for span in trace.spans}
+    assert spans['transmit'].parent_id == spans['transaction'].span_id
+    assert spans['build'].parent_id == spans['poll'].span_id == 0
+    assert spans['transaction'].attrs == {'unit': 1, 'outcome': 'ok'}
+    info = trace.to_dict()
+    assert info['name'] == 'poll' and info['attrs'] == {'port': '/dev/ttyUSB0', 'done': True}
+    assert info['dropped_spans'] == 2 and len(info['spans']) == 3
+    print("   ✓ Stages nest under the open span; spans past max_spans are dropped and counted")
+    
+    with tracer.trace('http', route='/api/power'):
+        with tracer.trace('poll'):
+            pass
+    assert span_names(tracer.traces()[0]) == ['http', 'poll']
+    print("   ✓ A trace started inside another becomes a span of it")
+    
+    try:
+        with tracer.trace('poll'):
+            with tracer.span('receive'):
+                raise OSError("unplugged")
+    except OSError:
+        pass
+    assert tracer.current() is None
+    assert tracer.traces()[0].spans[1].attrs == {'error': 'OSError'}
+    print("   ✓ Exceptions close the spans and are recorded")
+    
+    for index in range(5):
+        with tracer.trace('http' if index % 2 else 'poll', index=index):
+            pass
+    recent = tracer.traces()
+    assert len(recent) == 3 and tracer.finished == 8
+    assert [trace.root.attrs['index'] for trace in recent] == [4, 3, 2]
+    assert [trace.root.attrs['index'] for trace in tracer.traces(name='poll')] == [4, 2]
+    assert len(tracer.traces(limit=1)) == 1
+    assert tracer.traces(min_duration=60) == []
+    print("   ✓ Ring buffer keeps the newest traces; name, duration and limit filters")
+    
+    events = chrome_trace(tracer.traces(name='http'))['traceEvents']
+    assert len(events) == 1 and events[0]['ph'] == 'X' and events[0]['cat'] == 'http'
+    assert events[0]['dur'] >= 0 and events[0]['args']['index'] == 3
+    print("   ✓ Chrome trace-event export")
+    
+    disabled = Tracer(enabled=False)
+    assert disabled.trace('poll') is NULL_SPAN and disabled.span('build') is NULL_SPAN
+    print("   ✓ Disabled tracer records nothing")
+
+def test_poll_stages():
+    """Stages of a simulated poll and of a real transaction on the wire"""
+    
+    print("\nTesting Poll Stage Tracing")
+    print("=" * 40)
+    
+    manager = PowerMeterDataManager(PowerMeterSimulator(seed=1), poll_interval=0.05,
+                                    pipeline=SinkPipeline(flush_interval=0.01))
+    manager.start()
+    try:
+        deadline = time.time() + 5
+        while manager.polls < 3 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        manager.stop()
+    
+    polls = TRACER.traces(name='poll')
+    assert polls, "no poll traces recorded"
+    trace = next(trace for trace in polls if trace.root.attrs.get('port') == 'simulator')
+    assert trace.duration is not None and trace.thread == trace.to_dict()['thread']
+    print(f"   ✓ Poll traced: {' > '.join(span_names(trace))}")
+    
+    if tty is None:
+        print("   - Skipped: no pty support for the RTU emulator")
+        return
+    
+    emulator = RTUSlaveEmulator({1: {44001 + offset: offset for offset in range(22)}}, baud_rate=38400)
+    emulator.start()
+    try:
+        client = ModbusClient(emulator.port, 38400, device_address=1, timeout=0.2)
+        reader = PowerMeterReader(emulator.port, 38400, modbus_client=client)
+        reader.data_scalar = 4
+        with TRACER.trace('poll', port=emulator.port):
+            data = reader.read_basic_data()
+        client.disconnect()
+    finally:
+        emulator.stop()
+    
+    assert data is not None
+    trace = TRACER.traces(name='poll')[0]
+    names = span_names(trace)
+    for stage in ('read_basic', 'build', 'transaction', 'transmit', 'receive', 'decode', 'filter'):
+        assert stage in names, (stage, names)
+    spans = {span.name: span for span in trace.spans}
+    assert spans['receive'].parent_id == spans['transaction'].span_id
+    assert spans['transaction'].attrs['outcome'] == 'ok'
+    assert spans['receive'].attrs['bytes'] == 5 + 2 * 22
+    print("   ✓ Build, transmit, receive, decode and filter stages of a wire read")
+
+def test_traces_endpoint():
+    """Traces are served to admins only, as JSON or Chrome trace events"""
+    
+    print("\nTesting /api/debug/traces Endpoint")
+    print("=" * 40)
+    
+    server = PowerMeterHTTPServer(0, None)
+    server.start()
+    try:
+        base = f"http://127.0.0.1:{server.server.server_address[1]}"
+        try:
+            urllib.request.urlopen(base + '/api/debug/traces')
+            assert False, "traces served without a token"
+        except urllib.error.HTTPError as e:
+            assert e.code == 401
+        print("   ✓ Rejected without a token")
+        # The handler thread closes its trace after the response is sent
+        time.sleep(0.1)
+        
+        session = auth_manager.authenticate('admin', 'admin')
+        if session is None:
+            print("   - Skipped: default admin password has been changed")
+            return
+        headers = {'Authorization': f"Bearer {session['token']}"}
+        request = urllib.request.Request(base + '/api/debug/traces?name=http&limit=5', headers=headers)
+        with urllib.request.urlopen(request) as response:
+            result = json.loads(response.read())
+        assert 0 < len(result['traces']) <= 5
+        latest = result['traces'][0]
+        assert latest['name'] == 'http'
+        assert latest['attrs'] == {'method': 'GET', 'route': '/api/debug/traces', 'status': 401}
+        print("   ✓ Recent HTTP traces with method, route and status")
+        
+        request = urllib.request.Request(base + '/api/debug/traces?format=chrome&name=http', headers=headers)
+        with urllib.request.urlopen(request) as response:
+            result = json.loads(response.read())
+        assert result['traceEvents'] and all(event['ph'] == 'X' for event in result['traceEvents'])
+        print("   ✓ Chrome trace-event export")
+        
+        request = urllib.request.Request(base + '/api/debug/traces?min_ms=abc', headers=headers)
+        try:
+            urllib.request.urlopen(request)
+            assert False, "invalid query accepted"
+        except urllib.error.HTTPError as e:
+            assert e.code == 400
+        print("   ✓ Invalid query parameters rejected")
+        auth_manager.logout(session['token'])
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    test_tracer()
+    test_poll_stages()
+    test_traces_endpoint()
\ No newline at end of file
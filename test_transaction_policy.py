@@ -0,0 +1,101 @@
+"""
+Test script for Modbus transaction retries, backoff and circuit breaking
+"""
+
+import sys
+import os
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from modbus import ModbusClient, TransactionPolicy, calculate_crc
+
+class FlakyPort:
+    """Serial port stand-in that fails in scripted ways before answering"""
+    
+    def __init__(self, script=()):
+        # Per request: 'ok', 'silent', 'corrupt' or 'error' (raises like an unplugged adapter)
+        self.script = list(script)
+        self.is_open = True
+        self.requests = 0
+        self._pending = b''
+    
+    def reset_input_buffer(self):
+        self._pending = b''
+    
+    def write(self, command):
+        self.requests += 1
+        action = self.script.pop(0) if self.script else 'ok'
+        if action == 'error':
+            raise OSError("device reports readiness to read but returned no data")
+        if action == 'silent':
+            return
+        count = (command[4] << 8) | command[5]
+        frame = bytes([command[0], 3, count * 2]) + bytes(count * 2)
+        crc = calculate_crc(frame)
+        self._pending = frame + (crc if action == 'ok' else bytes([crc[0] ^ 0xFF, crc[1]]))
+    
+    def read(self, size):
+        response, self._pending = self._pending[:size], self._pending[size:]
+        return response
+    
+    def close(self):
+        self.is_open = False
+
+def test_transaction_policy():
+    """Transient errors are retried, dead units trip the circuit, I/O errors reconnect"""
+    
+    print("Testing Transaction Policy")
+    print("=" * 40)
+    
+    policy = TransactionPolicy(retries=3, retry_backoff=0.01, failure_threshold=2, open_backoff=0.05)
+    client = ModbusClient('TEST', 9600, policy=policy)
+    port = client.serial = FlakyPort(['silent', 'corrupt', 'ok'])
+    
+    # A lost frame and a bad CRC are retried within the same transaction
+    assert client.read_registers(44001, 2) == [0, 0]
+    status = client.unit_status(1)
+    assert port.requests == 3 and status['retries'] == 2
+    assert status['success_rate'] == 1.0 and status['latency_ms']['last'] is not None
+    print("   ✓ Lost and corrupt frames retried into a good read")
+    
+    # Retries back off exponentially after the first immediate one
+    port.script = ['silent'] * 4
+    started = time.monotonic()
+    assert client.read_registers(44001, 2) is None
+    elapsed = time.monotonic() - started
+    assert port.requests == 7 and elapsed >= 0.01 + 0.02
+    print(f"   ✓ Four attempts with backoff in {elapsed * 1000:.0f} ms")
+    
+    # A second failed transaction opens the circuit, so the dead meter isn't hammered
+    port.script = ['silent'] * 4
+    assert client.read_registers(44001, 2) is None
+    assert client.is_quarantined(1)
+    sent = port.requests
+    assert client.read_registers(44001, 2) is None
+    assert port.requests == sent
+    status = client.unit_status(1)
+    assert status['skipped'] == 1 and abs(status['success_rate'] - 1 / 3) < 1e-9
+    print("   ✓ Circuit opened after two failed transactions")
+    
+    # The probe gets a single attempt and closes the circuit when it succeeds
+    time.sleep(0.06)
+    assert client.read_registers(44001, 2) == [0, 0]
+    assert port.requests == sent + 1 and not client.unit_status(1)['quarantined']
+    print("   ✓ Probe closed the circuit")
+    
+    # An I/O error drops the port and the retry reconnects
+    replacement = FlakyPort()
+    def reconnect():
+        client.serial = replacement
+        return True
+    client.connect = reconnect
+    port.script = ['error']
+    assert client.read_registers(44001, 2) == [0, 0]
+    assert client.reconnects == 1 and replacement.requests == 1
+    print("   ✓ Reconnected after an I/O error")
+
+if __name__ == "__main__":
+    test_transaction_policy()
\ No newline at end of file
@@ -65,7 +65,7 @@ def start_static_server(port=8000):
     Returns:
     - Thread object for the server
     """
-    server_thread = threading.Thread(target=serve_static_files, args=(port,))
+    server_thread = threading.Thread(target=serve_static_files, args=(port,), name='static-http')
     server_thread.daemon = True
     server_thread.start()
     return server_thread
\ No newline at end of file
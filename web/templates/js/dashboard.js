@@ -88,7 +88,8 @@ function updateUIWithData(data) {
     
     // Update timestamp
     const date = new Date(data.timestamp * 1000);
-    document.getElementById('timestamp').textContent = date.toLocaleString();
+    document.getElementById('timestamp').textContent = date.toLocaleString() +
+        (data.stale ? ' (last known reading, waiting for meter)' : '');
 }
 
 /**
@@ -123,7 +123,8 @@ function updateUIWithData(data) {
     
     // Update timestamp
     const date = new Date(data.timestamp * 1000);
-    document.getElementById('timestamp').textContent = date.toLocaleString();
+    document.getElementById('timestamp').textContent = date.toLocaleString() +
+        (data.stale ? ' (last known reading, waiting for meter)' : '');
 }
 
 // Format a value to 2 decimal places or show '--' if undefined